@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Compares InterimTaxonomyData.del_ids with a list.remove for each deleted ID
+(the old del_ids) and with the one-pass compaction of each child list.
+
+Usage: bench_del_ids.py [# of children] [# of genera]
+
+Each genus has the given number of species and every other species is
+deleted, as when GBIF tips are pruned (remove_if_tips, prune_ignored).
+"""
+import sys
+import time
+
+from taxalotl.ott_schema import InterimTaxonomyData
+
+
+class OldDelIdsData(InterimTaxonomyData):
+    def del_ids(self, id_list):
+        to_name = self.to_name
+        to_par = self.to_par
+        to_children = self.to_children
+        for taxon_id in id_list:
+            if taxon_id in to_name:
+                del to_name[taxon_id]
+            if taxon_id in to_children:
+                del to_children[taxon_id]
+            pid = to_par.get(taxon_id)
+            if pid:
+                del to_par[taxon_id]
+                pc = to_children.get(pid)
+                try:
+                    if pc:
+                        pc.remove(taxon_id)
+                except:
+                    pass
+
+
+def fill(itd, num_children, num_genera):
+    uid = num_genera + 1
+    for genus_id in range(1, num_genera + 1):
+        itd.to_par[genus_id] = None
+        itd.to_name[genus_id] = "G{}".format(genus_id)
+        for i in range(num_children):
+            itd.to_par[uid] = genus_id
+            itd.to_name[uid] = "G{} sp{}".format(genus_id, uid)
+            itd.to_children.setdefault(genus_id, []).append(uid)
+            uid += 1
+    return [i for i in range(num_genera + 1, uid) if i % 2]
+
+
+def _timed(itd, to_del):
+    start = time.perf_counter()
+    itd.del_ids(to_del)
+    return time.perf_counter() - start
+
+
+def main(num_children, num_genera):
+    old, new = OldDelIdsData(), InterimTaxonomyData()
+    to_del = fill(old, num_children, num_genera)
+    fill(new, num_children, num_genera)
+    m = "deleting {} of {} species in {} genera"
+    print(m.format(len(to_del), num_children * num_genera, num_genera))
+    old_t, new_t = _timed(old, to_del), _timed(new, to_del)
+    assert old.to_children == new.to_children and old.to_par == new.to_par
+    m = "  del_ids  old {:.3f} s  new {:.3f} s  ({:.1f}x)"
+    print(m.format(old_t, new_t, old_t / new_t))
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:3]]
+    main(a[0] if a else 40000, a[1] if len(a) > 1 else 2)
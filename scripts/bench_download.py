@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Compares the old FTP download (the whole response read into memory) with the
+streaming downloads of taxalotl.download, against local stand-in HTTP and FTP
+servers.
+
+Usage: bench_download.py [size of the file in MiB] [# of files] [# of jobs]
+
+Reports the peak memory allocated by each download and times fetching the files
+one at a time and with the jobs. Each server connection is throttled (as a remote
+server would be), so the concurrent fetch is faster even on a single CPU. The
+stand-in servers are those of tests/test_download.py, which also checks resuming
+and checksums.
+"""
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+_TESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+sys.path.insert(0, _TESTS)
+from test_download import start_servers  # noqa: E402
+
+from taxalotl.download import download_file, fetch_resources  # noqa: E402
+
+BYTES_PER_SECOND = 16 << 20  # per connection
+
+
+def old_download(url, dest):
+    with urllib.request.urlopen(url) as req:
+        with open(dest, "wb") as outp:
+            outp.write(req.read())
+
+
+def _peak_mib(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / float(1 << 20), elapsed
+
+
+class _Resource(object):
+    def __init__(self, rid, tasks):
+        self.id = rid
+        self.tasks = tasks
+
+    def download_tasks(self):
+        return self.tasks
+
+    def finish_download(self):
+        pass
+
+
+def main(size_mib, num_files, num_jobs):
+    tmp = tempfile.mkdtemp()
+    try:
+        src, dest = os.path.join(tmp, "src"), os.path.join(tmp, "dest")
+        os.mkdir(src)
+        os.mkdir(dest)
+        names = ["f{}.tar.gz".format(i) for i in range(num_files)]
+        for n in names:
+            with open(os.path.join(src, n), "wb") as outp:
+                outp.write(os.urandom(size_mib << 20))
+        servers = start_servers(src, bytes_per_second=BYTES_PER_SECOND)
+        http_pref, ftp_pref = [s.url for s in servers]
+        print("{} file(s) of {} MiB".format(num_files, size_mib))
+        for label, pref in (("http", http_pref), ("ftp", ftp_pref)):
+            url = pref + names[0]
+            out = os.path.join(dest, label)
+            m = "  {:4} {:9} peak {:7.1f} MiB  {:6.2f} s"
+            print(m.format(label, "old", *_peak_mib(old_download, url, out)))
+            os.unlink(out)
+            print(m.format(label, "streaming", *_peak_mib(download_file, url, out)))
+            assert filecmp.cmp(out, os.path.join(src, names[0]), shallow=False)
+            os.unlink(out)
+        for jobs in (1, num_jobs):
+            d = os.path.join(dest, "jobs{}".format(jobs))
+            tasks = [(http_pref + n, os.path.join(d, n), None) for n in names]
+            res = [_Resource("r{}".format(i), [t]) for i, t in enumerate(tasks)]
+            start = time.perf_counter()
+            fetch_resources(res, num_workers=jobs)
+            elapsed = time.perf_counter() - start
+            print("  fetch_resources --jobs {:<3} {:6.2f} s".format(jobs, elapsed))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:4]]
+    main(
+        a[0] if a else 64,
+        a[1] if len(a) > 1 else 4,
+        a[2] if len(a) > 2 else 4,
+    )
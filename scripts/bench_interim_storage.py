@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Compares the peak memory and time of normalizing a GBIF-like Darwin Core
+backbone with the dicts of InterimTaxonomyData and with its compact storage
+(the compact_normalize_storage config option).
+
+Usage: bench_interim_storage.py [# of rows]
+
+The backbone is 7 ranked levels of accepted taxa with species under random
+genera; most species also have a synonym row. Each layout is normalized in
+its own process (peak RSS); the outputs of the two runs must be identical.
+"""
+import filecmp
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+META_XML = """<archive xmlns="http://rs.tdwg.org/dwc/text/">
+<core rowType="http://rs.tdwg.org/dwc/terms/Taxon">
+<files><location>Taxon.tsv</location></files><id index="0"/>
+<field index="1" term="http://rs.tdwg.org/dwc/terms/parentNameUsageID"/>
+<field index="2" term="http://rs.tdwg.org/dwc/terms/acceptedNameUsageID"/>
+<field index="3" term="http://rs.tdwg.org/dwc/terms/scientificName"/>
+<field index="4" term="http://rs.tdwg.org/dwc/terms/taxonRank"/>
+<field index="5" term="http://rs.tdwg.org/dwc/terms/taxonomicStatus"/>
+<field index="6" term="http://rs.tdwg.org/dwc/terms/nameAccordingTo"/>
+</core></archive>
+"""
+LEVELS = (
+    ("kingdom", 8),
+    ("phylum", 10),
+    ("class", 5),
+    ("order", 6),
+    ("family", 8),
+    ("genus", 12),
+)
+
+
+def write_backbone(dir_path, num_rows):
+    with open(os.path.join(dir_path, "meta.xml"), "w") as out:
+        out.write(META_XML)
+    rng = random.Random(1)
+    row = "{}\t{}\t{}\t{}\t{}\t{}\t\n"
+    with open(os.path.join(dir_path, "Taxon.tsv"), "w") as out:
+        header = ("id", "parentNameUsageID", "acceptedNameUsageID", "", "", "")
+        out.write(row.format(*header))
+        uid, pars = 1, [""]
+        for rank, k in LEVELS:
+            new = []
+            for p in pars:
+                for i in range(k):
+                    name = "{}{} L.".format(rank.capitalize(), uid)
+                    out.write(row.format(uid, p, "", name, rank, "accepted"))
+                    new.append(uid)
+                    uid += 1
+            pars = new
+        while uid < num_rows:
+            g = rng.choice(pars)
+            name = "Genus{} species{} Smith, 1901".format(g, uid)
+            out.write(row.format(uid, g, "", name, "species", "accepted"))
+            uid += 1
+            if rng.random() < 0.8:
+                name = "Genus{} oldsp{} Jones, 1850".format(g, uid)
+                out.write(row.format(uid, "", uid - 1, name, "species", "synonym"))
+                uid += 1
+
+
+class _Config(object):
+    def __init__(self, compact):
+        self.compact_normalize_storage = compact
+
+
+class _Resource(object):
+    def __init__(self, compact):
+        self.config = _Config(compact)
+
+    def post_process_interim_tax_data(self, itd):
+        pass
+
+
+def run_layout(layout, source, destination):
+    from taxalotl.parsing.darwin_core import normalize_darwin_core_taxonomy
+
+    start = time.perf_counter()
+    res = _Resource(layout == "compact")
+    normalize_darwin_core_taxonomy(source, destination, res)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("{}\t{}".format(elapsed, peak_kb))
+
+
+def main(num_rows):
+    tmp = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmp, "dwc")
+        os.mkdir(source)
+        write_backbone(source, num_rows)
+        print("{} rows".format(num_rows))
+        res = {}
+        for layout in ("dicts", "compact"):
+            dest = os.path.join(tmp, layout)
+            out = subprocess.run(
+                [sys.executable, __file__, "--layout", layout, source, dest],
+                stdout=subprocess.PIPE,
+                check=True,
+                universal_newlines=True,
+            ).stdout
+            elapsed, peak_kb = out.strip().split("\n")[-1].split("\t")
+            res[layout] = int(peak_kb)
+            m = "  {:8} peak RSS {:8.1f} MiB  {:6.1f} s"
+            print(m.format(layout, int(peak_kb) / 1024.0, float(elapsed)))
+        for fn in ("taxonomy.tsv", "synonyms.tsv", "details.json"):
+            a, b = [os.path.join(tmp, i, fn) for i in ("dicts", "compact")]
+            if not filecmp.cmp(a, b, shallow=False):
+                raise RuntimeError("{} differs between the layouts".format(fn))
+        saved = 1.0 - float(res["compact"]) / res["dicts"]
+        print("  identical output, {:.0f}% lower peak RSS".format(100.0 * saved))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--layout":
+        run_layout(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Compares normalizing an NCBI-like taxdump.tar.gz after unpacking all of it
+(the old unpack + normalize) with normalizing it straight from the archive
+(the normalize_from_archive config option).
+
+Usage: bench_normalize_from_archive.py [# of taxa] [# of decompress threads]
+
+The archive holds nodes.dmp, names.dmp and merged.dmp plus a citations.dmp that
+normalize does not read, in the order of NCBI's taxdump. Both runs must write
+the same files.
+"""
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+from taxalotl.archive import ArchiveMembers
+from taxalotl.parsing.ncbi import NCBI_ARCHIVE_MEMBERS, normalize_ncbi
+
+RANKS = ("no rank", "family", "genus", "species")
+
+
+def write_taxdump(archive_fp, num_taxa):
+    rng = random.Random(1)
+    tmp = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tmp, "citations.dmp"), "w") as out:
+            for i in range(num_taxa // 2):
+                out.write("{}\t|\tCitation {} of some paper\t|\t\t|\n".format(i, i))
+        with open(os.path.join(tmp, "merged.dmp"), "w") as out:
+            for i in range(num_taxa // 100):
+                to_id = rng.randint(1, num_taxa)
+                out.write("{}\t|\t{}\t|\n".format(num_taxa + i, to_id))
+        nodes = open(os.path.join(tmp, "nodes.dmp"), "w")
+        names = open(os.path.join(tmp, "names.dmp"), "w")
+        with nodes, names:
+            for i in range(1, num_taxa + 1):
+                par = 1 if i < 3 else rng.randint(max(1, i - 1000), i - 1)
+                rank = RANKS[min(3, i.bit_length() // 5)]
+                nodes.write("{}\t|\t{}\t|\t{}\t|\tXX\t|\n".format(i, par, rank))
+                name = "root" if i == 1 else "Taxon{}".format(i)
+                names.write("{}\t|\t{}\t|\t\t|\tscientific name\t|\n".format(i, name))
+                if rng.random() < 0.5:
+                    syn = "Oldname{} L.".format(i)
+                    names.write("{}\t|\t{}\t|\t\t|\tsynonym\t|\n".format(i, syn))
+        with tarfile.open(archive_fp, "w:gz") as tar:
+            for fn in ("citations.dmp", "merged.dmp", "names.dmp", "nodes.dmp"):
+                tar.add(os.path.join(tmp, fn), fn)
+    finally:
+        shutil.rmtree(tmp)
+
+
+class _Config(object):
+    compact_normalize_storage = False
+    normalize_write_workers = 1
+
+
+class _Resource(object):
+    url = "https://ftp.ncbi.nlm.nih.gov/pub/taxonomy/taxdump.tar.gz"
+    config = _Config()
+
+    def post_process_interim_tax_data(self, itd):
+        pass
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, i)) for i in os.listdir(path))
+
+
+def main(num_taxa, threads):
+    tmp = tempfile.mkdtemp()
+    try:
+        archive_fp = os.path.join(tmp, "taxdump.tar.gz")
+        write_taxdump(archive_fp, num_taxa)
+        m = "{} taxa, archive of {:.1f} MiB"
+        print(m.format(num_taxa, os.path.getsize(archive_fp) / float(1 << 20)))
+        unpacked, old_out = os.path.join(tmp, "unpacked"), os.path.join(tmp, "old")
+        start = time.perf_counter()
+        with tarfile.open(archive_fp, "r:gz") as tar:
+            tar.extractall(unpacked)
+        normalize_ncbi(unpacked, old_out, _Resource())
+        old_t = time.perf_counter() - start
+        m = "  unpack + normalize  {:6.2f} s  ({:.1f} MiB unpacked)"
+        print(m.format(old_t, _dir_bytes(unpacked) / float(1 << 20)))
+        # about.json records the date of nodes.dmp, which unpacking preserves.
+        new_out = os.path.join(tmp, "new")
+        start = time.perf_counter()
+        members = ArchiveMembers(
+            archive_fp, "tar+gzip", NCBI_ARCHIVE_MEMBERS, decompress_threads=threads
+        )
+        normalize_ncbi(members, new_out, _Resource())
+        new_t = time.perf_counter() - start
+        m = "  from the archive    {:6.2f} s  ({:.2f}x)"
+        print(m.format(new_t, old_t / new_t))
+        for fn in sorted(os.listdir(old_out)):
+            if not filecmp.cmp(
+                os.path.join(old_out, fn), os.path.join(new_out, fn), shallow=False
+            ):
+                raise RuntimeError("{} differs".format(fn))
+        print("  identical output")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:3]]
+    main(a[0] if a else 1000000, a[1] if len(a) > 1 else 1)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Compares the old normalization of OTT-format resources (each taxonomy.tsv and
+synonyms.tsv read into memory before it is written out) with the streaming one.
+
+Usage: bench_ott_header_copy.py [# of taxa]
+
+Times copy_and_add_ott_headers and normalize_tab_sep_ott and reports the peak
+memory allocated by each. The old and new outputs must be identical.
+"""
+import filecmp
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from taxalotl.resource_wrapper import (
+    INP_OTT_SYNONYMS_HEADER,
+    INP_OTT_TAXONOMY_HEADER,
+    copy_and_add_ott_headers,
+    normalize_tab_sep_ott,
+)
+from taxalotl.util import OutFile
+
+
+def old_copy_and_add_ott_headers(unpacked_dirp, normalized_dirp, resource_wrapper):
+    for fn, header in (
+        ("taxonomy.tsv", INP_OTT_TAXONOMY_HEADER),
+        ("synonyms.tsv", INP_OTT_SYNONYMS_HEADER),
+    ):
+        tf = os.path.join(unpacked_dirp, fn)
+        content = io.open(tf, "r", encoding="utf-8").read()
+        with OutFile(os.path.join(normalized_dirp, fn)) as out:
+            out.write(header)
+            out.write(content)
+
+
+def old_normalize_tab_sep_ott(unpacked_dirp, normalized_dirp, resource_wrapper):
+    tf = os.path.join(unpacked_dirp, "taxonomy.tsv")
+    with io.open(tf, "r", encoding="utf-8") as inp:
+        with OutFile(os.path.join(normalized_dirp, "taxonomy.tsv")) as out:
+            for line in inp:
+                ls = line.split("\t")
+                out.write("\t|\t".join(ls))
+
+
+def write_input(dirp, num_taxa, sep):
+    os.makedirs(dirp)
+    with io.open(os.path.join(dirp, "taxonomy.tsv"), "w", encoding="utf-8") as out:
+        for i in range(1, num_taxa + 1):
+            row = (str(i), str(i // 3), "Taxon {} L.".format(i), "species", "")
+            out.write(sep.join(row) + sep + "\n")
+    with io.open(os.path.join(dirp, "synonyms.tsv"), "w", encoding="utf-8") as out:
+        for i in range(1, num_taxa + 1, 2):
+            row = (str(i), "Oldname {}".format(i), "synonym")
+            out.write(sep.join(row) + sep + "\n")
+
+
+def _run(func, unpacked, out_dir):
+    """Times func, then runs it again (into a scratch dir) to trace its memory."""
+    os.makedirs(out_dir)
+    start = time.perf_counter()
+    func(unpacked, out_dir, None)
+    elapsed = time.perf_counter() - start
+    traced_dir = out_dir + "_traced"
+    os.makedirs(traced_dir)
+    tracemalloc.start()
+    func(unpacked, traced_dir, None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    shutil.rmtree(traced_dir)
+    return elapsed, peak / float(1 << 20)
+
+
+def _check_same(old_dir, new_dir):
+    for fn in os.listdir(old_dir):
+        a, b = os.path.join(old_dir, fn), os.path.join(new_dir, fn)
+        if not filecmp.cmp(a, b, shallow=False):
+            raise RuntimeError("{} differs".format(fn))
+
+
+def main(num_taxa):
+    tmp = tempfile.mkdtemp()
+    try:
+        m = "  {:28} {:6.2f} s  peak {:7.1f} MiB"
+        for label, sep, old, new in (
+            (
+                "ott headers",
+                "\t|\t",
+                old_copy_and_add_ott_headers,
+                copy_and_add_ott_headers,
+            ),
+            (
+                "tab-separated",
+                "\t",
+                old_normalize_tab_sep_ott,
+                normalize_tab_sep_ott,
+            ),
+        ):
+            unpacked = os.path.join(tmp, label.replace(" ", "_"))
+            write_input(unpacked, num_taxa, sep)
+            size = os.path.getsize(os.path.join(unpacked, "taxonomy.tsv"))
+            mib = size / float(1 << 20)
+            print("{} ({} taxa, {:.1f} MiB)".format(label, num_taxa, mib))
+            old_dir, new_dir = unpacked + "_old", unpacked + "_new"
+            print(m.format("old", *_run(old, unpacked, old_dir)))
+            print(m.format("streaming", *_run(new, unpacked, new_dir)))
+            _check_same(old_dir, new_dir)
+            print("  identical output")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000000)
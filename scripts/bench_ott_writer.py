@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Compares the old taxonomy.tsv and synonyms.tsv writers (a write call per
+row) with the batched writers of ott_schema, serially and with worker
+processes.
+
+Usage: bench_ott_writer.py [# of taxa] [# of worker processes]
+
+The taxa form a tree of 5 ranked levels below a root with species under
+random genera; 3 in 5 taxa have a synonym. Every run must write the same
+bytes.
+"""
+import filecmp
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from taxalotl.ott_schema import (
+    INP_FLAGGED_OTT_TAXONOMY_HEADER,
+    INP_OTT_SYNONYMS_HEADER,
+    write_ott_synonyms_tsv,
+    write_ott_taxonomy_tsv,
+)
+from taxalotl.util import OutFile
+
+FANOUT = (("kingdom", 6), ("phylum", 8), ("class", 6), ("order", 8), ("genus", 10))
+
+
+def gen_tables(num_taxa):
+    rng = random.Random(1)
+    to_par, to_children, to_rank, to_name = {0: None}, {}, {0: ""}, {0: "life"}
+    synonyms, to_flags = {}, {}
+    pars, uid = [0], 1
+    for rank, k in FANOUT:
+        new = []
+        for p in pars:
+            for i in range(k):
+                to_par[uid], to_rank[uid] = p, rank
+                to_name[uid] = "{}{}".format(rank.capitalize(), uid)
+                to_children.setdefault(p, []).append(uid)
+                new.append(uid)
+                uid += 1
+        pars = new
+    while uid < num_taxa:
+        g = rng.choice(pars)
+        to_par[uid], to_rank[uid] = g, "species"
+        to_name[uid] = "{} sp{}".format(to_name[g], uid)
+        to_children.setdefault(g, []).append(uid)
+        if rng.random() < 0.6:
+            synonyms[uid] = [("{} old{}".format(to_name[g], uid), "synonym", None)]
+        if rng.random() < 0.1:
+            to_flags[uid] = ["sibling_higher"]
+        uid += 1
+    return to_par, to_children, to_rank, to_name, to_flags, synonyms
+
+
+def old_write_taxonomy(out_fp, tables):
+    to_par, to_children, to_rank, to_name, to_flags, synonyms = tables
+    extinct_known = {}
+    syn_id_order = []
+    with OutFile(out_fp) as out:
+        out.write(INP_FLAGGED_OTT_TAXONOMY_HEADER)
+        stack = [0]
+        while stack:
+            curr_id = stack.pop()
+            if curr_id in synonyms:
+                syn_id_order.append(curr_id)
+            name = to_name[curr_id]
+            par_id = to_par.get(curr_id)
+            spar_id = "" if par_id is None else str(par_id)
+            rank = to_rank.get(curr_id, "")
+            children = to_children.get(curr_id)
+            if children:
+                stack.extend(children)
+            flags = to_flags.get(curr_id, "")
+            if flags and not isinstance(flags, str):
+                flags = ",".join(flags)
+            if extinct_known.get(curr_id):
+                flags = "{},extinct".format(flags) if flags else "extinct"
+            fields = [str(curr_id), spar_id, name, rank, flags, ""]
+            out.write("{}\n".format("\t|\t".join(fields)))
+    return syn_id_order
+
+
+def old_write_synonyms(out_fp, synonyms, id_order):
+    with OutFile(out_fp) as out:
+        out.write(INP_OTT_SYNONYMS_HEADER)
+        for nd_id in id_order:
+            for name, name_type, syn_id in synonyms[nd_id]:
+                out.write(
+                    "{}\n".format("\t|\t".join([str(nd_id), name, name_type, ""]))
+                )
+
+
+def new_write(dir_path, tables, num_workers):
+    to_par, to_children, to_rank, to_name, to_flags, synonyms = tables
+    order = write_ott_taxonomy_tsv(
+        os.path.join(dir_path, "taxonomy.tsv"),
+        [0],
+        to_par,
+        to_children,
+        to_rank,
+        to_name,
+        to_flags,
+        synonyms,
+        {},
+        num_workers=num_workers,
+    )
+    write_ott_synonyms_tsv(
+        os.path.join(dir_path, "synonyms.tsv"),
+        synonyms,
+        order,
+        {},
+        num_workers=num_workers,
+    )
+
+
+def old_write(dir_path, tables):
+    order = old_write_taxonomy(os.path.join(dir_path, "taxonomy.tsv"), tables)
+    old_write_synonyms(os.path.join(dir_path, "synonyms.tsv"), tables[-1], order)
+
+
+def main(num_taxa, num_workers):
+    tables = gen_tables(num_taxa)
+    tmp = tempfile.mkdtemp()
+    try:
+        runs = [("old", lambda d: old_write(d, tables))]
+        runs.append(("batched", lambda d: new_write(d, tables, 1)))
+        if num_workers > 1:
+            label = "{} workers".format(num_workers)
+            runs.append((label, lambda d: new_write(d, tables, num_workers)))
+        print("{} taxa".format(num_taxa))
+        for label, func in runs:
+            d = os.path.join(tmp, label.replace(" ", "_"))
+            os.mkdir(d)
+            start = time.perf_counter()
+            func(d)
+            print("  {:12} {:6.2f} s".format(label, time.perf_counter() - start))
+            for fn in ("taxonomy.tsv", "synonyms.tsv"):
+                ref = os.path.join(tmp, "old", fn)
+                if not filecmp.cmp(ref, os.path.join(d, fn), shallow=False):
+                    raise RuntimeError("{} of {} differs".format(fn, label))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:3]]
+    main(a[0] if a else 2000000, a[1] if len(a) > 1 else os.cpu_count() or 1)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""Measures the cost of the command profiles (see taxalotl/profiling.py) and
+checks what they record.
+
+Usage: bench_profiling.py [# of files] [# of stage timers]
+
+Writes the files through OutFile with and without the byte counting (best of 5
+runs of each), and times a block with and without a StageTimer. The bytes
+counted must equal the sizes of the files, including those written by jobs in
+worker processes. The profile log must keep its size limit. A profile report is
+then written from made-up runs.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from taxalotl import profiling, util
+from taxalotl.jobs import Job, run_jobs
+from taxalotl.profiling import (
+    CommandProfile,
+    StageTimer,
+    get_profile_log,
+    write_profile_report,
+)
+from taxalotl.util import OutFile
+
+_LINE = "1\t|\t2\t|\tHomo sapiens\t|\tspecies\t|\t\t|\n"
+
+
+def write_files(dirpath, num_files, first=0):
+    total = 0
+    for i in range(first, first + num_files):
+        fp = os.path.join(dirpath, "{}.tsv".format(i))
+        with OutFile(fp) as out:
+            out.write(_LINE * (1 + i % 50))
+        total += os.path.getsize(fp)
+    return total
+
+
+def _write_job(dirpath, first, num_files):
+    with StageTimer("write"):
+        return write_files(dirpath, num_files, first)
+
+
+def _time_writes(dirpath, num_files, counted):
+    if not counted:
+        util.count_bytes_written = lambda n: None
+    try:
+        start = time.perf_counter()
+        write_files(dirpath, num_files)
+        return time.perf_counter() - start
+    finally:
+        util.count_bytes_written = profiling.count_bytes_written
+
+
+def _time_timers(num_timers, timed):
+    start = time.perf_counter()
+    for i in range(num_timers):
+        if timed:
+            with StageTimer("bench"):
+                pass
+    return time.perf_counter() - start
+
+
+def _made_up_history():
+    records = []
+    for i, wall in enumerate([60.0, 62.0, 58.0, 61.0, 75.0]):
+        profile = {
+            "wall_seconds": wall,
+            "cpu_seconds": wall * 0.9,
+            "peak_rss_bytes": (2 + i) * 1024**3,
+            "bytes_read": 3 * 1024**3,
+            "bytes_written": 2 * 1024**3,
+            "stages": {"parse": wall * 0.6, "write": wall * 0.3},
+        }
+        rec = {"command": "normalize", "started": "2024-01-0{}T00:00:00+00:00"}
+        rec["started"] = rec["started"].format(i + 1)
+        rec.update({"profile": profile, "res_ids": ["ncbi"]})
+        records.append(rec)
+    records.append({"command": "normalize", "res_id": "ncbi", "wrote_files": []})
+    return records
+
+
+def main(num_files, num_timers):
+    tmp = tempfile.mkdtemp()
+    log = get_profile_log()
+    log.filepath = os.path.join(tmp, "profiles")
+    try:
+        print("{} files written through OutFile".format(num_files))
+        write_files(tmp, num_files)  # so that both runs replace existing files
+        times = {False: [], True: []}
+        for i in range(5):  # alternated, as the file system is noisy
+            for counted in (False, True):
+                times[counted].append(_time_writes(tmp, num_files, counted))
+        old_t, new_t = min(times[False]), min(times[True])
+        print("  without counting  {:8.3f} s".format(old_t))
+        print("  with counting     {:8.3f} s".format(new_t))
+        print("{} empty blocks".format(num_timers))
+        old_t = _time_timers(num_timers, timed=False)
+        new_t = _time_timers(num_timers, timed=True)
+        print("  without a StageTimer  {:8.3f} s".format(old_t))
+        print("  with a StageTimer     {:8.3f} s".format(new_t))
+
+        with CommandProfile("bench", ["res"]) as cp:
+            expected = _write_job(tmp, 0, num_files)
+            jobs = [Job(i, _write_job, (tmp, i * num_files, num_files)) for i in (1, 2)]
+            done = run_jobs(jobs, num_workers=2)
+            expected += sum(done.values())
+            profile = cp.profile()
+        if profile["bytes_written"] != expected:
+            m = "{} bytes were counted instead of {}"
+            raise RuntimeError(m.format(profile["bytes_written"], expected))
+        print("  bytes written by this process and 2 workers counted")
+        print("  bytes read: {}".format(profile["bytes_read"]))
+        rec = log.read_records()[-1]
+        if rec["command"] != "bench" or "write" not in rec["profile"]["stages"]:
+            raise RuntimeError("the profile was not added to the log")
+        log.max_bytes = 4096
+        for rec in _made_up_history() * 50:
+            log.append(rec)
+        sizes = [os.path.getsize(fp) for fp in (log.filepath, log.rotated_filepath)]
+        if max(sizes) > log.max_bytes + 1024:
+            raise RuntimeError("the profile log was not rotated: {}".format(sizes))
+        print("  profile log rotated at {} bytes: {}".format(log.max_bytes, sizes))
+        out = io.StringIO()
+        write_profile_report(_made_up_history(), out)
+        if "(+24%)" not in out.getvalue():
+            raise RuntimeError("unexpected report:\n" + out.getvalue())
+        print("profile report of made-up runs:")
+        sys.stdout.write(out.getvalue())
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:3]]
+    main(a[0] if a else 2000, a[1] if len(a) > 1 else 100000)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Compares TaxonTree.add_best_guess_rank_sort_number when the rank bounds of
+each node come from walks down its subtree and up to its ranked ancestor (the
+old _get_highest_child_rank and _get_lowest_anc_rank_sorting_number) and when
+they come from the cached one-pass arrays of the current TaxonTree.
+
+Usage: bench_rank_bounds.py [depth] [# of tips per level]
+
+The tree is a ranked root above a chain of `depth` unranked clades, as in
+SILVA or Wikidata. Each clade also has the given number of tips, half of
+them species and half unranked.
+"""
+import sys
+import time
+
+from taxalotl.taxon import Taxon
+from taxalotl.tree import TaxonForest, TaxonTree
+
+
+def gen_taxa(depth, tips_per_level):
+    rows = [(1, "", "phylum")]
+    uid = 1
+    for level in range(depth):
+        clade_id = uid + 1
+        rows.append((clade_id, rows[-1 - tips_per_level if level else 0][0], ""))
+        for t in range(tips_per_level):
+            rank = "no rank - terminal" if t % 2 else "species"
+            rows.append((clade_id + 1 + t, clade_id, rank))
+        uid = clade_id + tips_per_level
+    id_to_taxon = {}
+    for uid, par_id, rank in rows:
+        fields = [str(uid), str(par_id), "n{}".format(uid), rank, "", "", "", "\n"]
+        t = Taxon("\t|\t".join(fields))
+        id_to_taxon[t.id] = t
+    return id_to_taxon
+
+
+class OldRankBoundsTree(TaxonTree):
+    def _get_highest_child_rank(self, nd):
+        if not nd.children_refs:
+            return None
+        hr = None
+        for c in nd.children_refs:
+            csn = c.rank_sorting_number()
+            if csn is None:
+                csn = self._get_highest_child_rank(c)
+            if csn is None:
+                continue
+            if hr is None or csn + 1 > hr:
+                hr = csn + 1
+        return hr
+
+    def _get_lowest_anc_rank_sorting_number(self, nd):
+        try:
+            par = self.id_to_taxon[nd.par_id]
+        except:
+            return None
+        psn = par.rank_sorting_number()
+        if psn is None:
+            return self._get_lowest_anc_rank_sorting_number(par) - 1
+        return psn
+
+
+def _timed(tree):
+    tree.best_rank_sort_number.clear()
+    tree.invalidate_traversal()
+    start = time.perf_counter()
+    tree.add_best_guess_rank_sort_number()
+    return time.perf_counter() - start
+
+
+def main(depth, tips_per_level):
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * depth))
+    tree = TaxonForest(gen_taxa(depth, tips_per_level)).trees[0]
+    id_to_children_ids = {}
+    for uid, taxon in tree.id_to_taxon.items():
+        if taxon.children_refs:
+            id_to_children_ids[uid] = [c.id for c in taxon.children_refs]
+    old_tree = OldRankBoundsTree(tree.root.id, id_to_children_ids, tree.id_to_taxon)
+    num_taxa = len(tree.id_to_taxon)
+    print("{} taxa, {} unranked levels".format(num_taxa, depth))
+    old_t = min(_timed(old_tree) for i in range(2))
+    new_t = min(_timed(tree) for i in range(2))
+    assert old_tree.best_rank_sort_number == tree.best_rank_sort_number
+    m = "  add_best_guess_rank_sort_number  old {:.3f} s  new {:.3f} s  ({:.1f}x)"
+    print(m.format(old_t, new_t, old_t / new_t))
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:3]]
+    main(a[0] if a else 100, a[1] if len(a) > 1 else 200)
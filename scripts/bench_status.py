@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Compares the old status command (which walks the partitioned tree for each
+resource) with status read from the state DB, and with `status --verify`.
+
+Usage: bench_status.py [# of resources] [# of partition dirs]
+
+Every resource is downloaded, unpacked and normalized (as empty stand-in files)
+and half of them are partitioned into each of the partition dirs. All three
+reports must be identical, also after the partitions of a resource are removed
+by hand.
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from taxalotl import commands
+from taxalotl.cmds.partitions import find_partition_dirs_for_taxonomy
+from taxalotl.resource_wrapper import TaxonomyWrapper
+from taxalotl.state_db import StateDB
+from taxalotl.tax_partition import INP_TAXONOMY_DIRNAME
+
+
+class _ResourcesManager(object):
+    def __init__(self, resources):
+        self.resources = resources
+
+
+class _Config(object):
+    def __init__(self, base, num_res):
+        self.raw_downloads_dir = os.path.join(base, "raw")
+        self.normalized_dir = os.path.join(base, "normalized")
+        self.partitioned_dir = os.path.join(base, "partitioned")
+        self.processed_dir = os.path.join(base, "processed")
+        res = {}
+        for i in range(num_res):
+            rid = "res{:04d}".format(i)
+            obj = {
+                "id": rid,
+                "url": "https://example.org/{}.tar.gz".format(rid),
+                "format": "tar+gzip",
+                "schema": "headerless ott",
+                "resource_type": "external taxonomy",
+                "version": "1",
+            }
+            res[rid] = TaxonomyWrapper(obj)
+            res[rid].config = self
+        self.resources_mgr = _ResourcesManager(res)
+        self._state_db = StateDB(self.processed_dir)
+
+    @property
+    def state_db(self):
+        return self._state_db
+
+    def get_resource_by_id(self, rid):
+        return self.resources_mgr.resources[rid]
+
+    def get_terminalized_res_by_id(self, rid, logging_action_str=None):
+        return self.resources_mgr.resources[rid]
+
+
+def _touch(fp):
+    par = os.path.dirname(fp)
+    if not os.path.isdir(par):
+        os.makedirs(par)
+    io.open(fp, "w").close()
+
+
+def make_store(cfg, num_dirs):
+    rws = sorted(cfg.resources_mgr.resources.values(), key=lambda r: r.id)
+    for rw in rws:
+        _touch(rw.download_filepath)
+        _touch(os.path.join(rw.unpacked_filepath, "taxonomy.tsv"))
+        _touch(rw.normalized_filepath)
+    for d in range(num_dirs):
+        frag = os.path.join(cfg.partitioned_dir, "Life", "G{}".format(d // 50), str(d))
+        for rw in rws[::2]:
+            _touch(os.path.join(frag, INP_TAXONOMY_DIRNAME, rw.id, "taxonomy.tsv"))
+    return rws
+
+
+def _report(cfg, old):
+    buf = io.StringIO()
+    commands.out_stream = buf
+    start = time.perf_counter()
+    if old:
+        for rw in sorted(cfg.resources_mgr.resources.values(), key=lambda r: r.id):
+            rw.write_status(buf)
+    else:
+        commands.status_of_resources(cfg, [], verify=old is None)
+    return time.perf_counter() - start, buf.getvalue()
+
+
+def main(num_res, num_dirs):
+    tmp = tempfile.mkdtemp()
+    try:
+        cfg = _Config(tmp, num_res)
+        rws = make_store(cfg, num_dirs)
+        print("{} resources, {} partition dirs".format(num_res, num_dirs))
+        old_t, old_out = _report(cfg, True)
+        print("  old (walk per resource)  {:8.3f} s".format(old_t))
+        build_t, build_out = _report(cfg, None)
+        print("  --verify (one walk)      {:8.3f} s".format(build_t))
+        db_t, db_out = _report(cfg, False)
+        print("  from the state DB        {:8.3f} s".format(db_t))
+        if not (old_out == build_out == db_out):
+            raise RuntimeError("the reports differ")
+        print("  identical reports")
+        # Remove the partitions of one resource without the clean command.
+        gone = rws[0]
+        for d in find_partition_dirs_for_taxonomy(cfg.partitioned_dir, gone.id):
+            shutil.rmtree(d)
+        db_t, db_out = _report(cfg, False)
+        print("  state DB, 1 removed      {:8.3f} s".format(db_t))
+        if db_out == old_out or db_out != _report(cfg, None)[1]:
+            raise RuntimeError("the removed partitions were not noticed")
+        print("  partitions removed by hand are noticed")
+    finally:
+        commands.out_stream = sys.stdout
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    a = [int(i) for i in sys.argv[1:3]]
+    main(a[0] if a else 100, a[1] if len(a) > 1 else 200)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""Compares the memory used by the taxa of an OTT-like Life partition with the
+rank, flags and source prefixes held in the string pool (the current Taxon)
+and with a new string for each of them on every taxon (the old parsing).
+
+Usage: bench_string_pool.py [# of taxa]
+
+Each layout is measured in its own process, by tracemalloc (the bytes held
+by the parsed taxa) and peak RSS.
+"""
+import random
+import resource
+import subprocess
+import sys
+import tracemalloc
+
+from taxalotl.ott_schema import full_ott_line_parser, int_or_str
+from taxalotl.taxon import Taxon
+
+RANKS = (
+    "species",
+    "species",
+    "species",
+    "subspecies",
+    "genus",
+    "family",
+    "no rank",
+    "no rank - terminal",
+    "varietas",
+    "order",
+)
+FLAGS = (
+    "",
+    "",
+    "",
+    "sibling_higher",
+    "extinct",
+    "barren,extinct",
+    "incertae_sedis_inherited,unplaced_inherited",
+    "hidden,extinct_inherited",
+)
+SOURCES = ("ncbi", "gbif", "irmng", "worms", "silva", "if")
+
+
+class _PlainTaxon(object):
+    """The old layout: the same slots, with the strings of the line stored as is."""
+
+    __slots__ = (
+        "id",
+        "par_id",
+        "name",
+        "rank",
+        "src_dict",
+        "flags",
+        "uniqname",
+        "children_refs",
+        "parent_ref",
+        "_synonyms",
+        "line_num",
+        "line",
+        "__dict__",
+    )
+
+
+def _plain_parser(taxon, line):
+    ls = line.split("\t|\t")
+    taxon.id = int_or_str(ls[0])
+    taxon.par_id = int_or_str(ls[1]) if ls[1] else None
+    taxon.name = ls[2]
+    taxon.rank = ls[3] if ls[3] else None
+    taxon.src_dict = None
+    if ls[4]:
+        d = {}
+        for el in ls[4].split(","):
+            src, sid = el.strip().split(":")
+            d.setdefault(src, set()).add(int_or_str(sid))
+        taxon.src_dict = d
+    taxon.uniqname = ls[5] if ls[5] else None
+    taxon.flags = set(ls[6].split(",")) if ls[6] else None
+
+
+def gen_lines(num_taxa):
+    rng = random.Random(1)
+    for uid in range(1, num_taxa + 1):
+        par_id = str(uid // 20) if uid >= 20 else ""
+        srcs = rng.sample(SOURCES, rng.randint(1, 3))
+        src = ",".join("{}:{}".format(s, rng.randint(1, 10000000)) for s in srcs)
+        fields = [
+            str(uid),
+            par_id,
+            "Genus{} species{}".format(uid // 20, uid),
+            rng.choice(RANKS),
+            src,
+            "",
+            rng.choice(FLAGS),
+            "\n",
+        ]
+        yield "\t|\t".join(fields)
+
+
+def run_layout(layout, num_taxa):
+    lines = list(gen_lines(num_taxa))
+    tracemalloc.start()
+    id_to_taxon = {}
+    if layout == "old":
+        for n, line in enumerate(lines):
+            t = _PlainTaxon()
+            t.line_num, t.line = n, line
+            t.children_refs, t._synonyms = None, None
+            _plain_parser(t, line)
+            id_to_taxon[t.id] = t
+    else:
+        for n, line in enumerate(lines):
+            t = Taxon(line, line_num=n, line_parser=full_ott_line_parser)
+            id_to_taxon[t.id] = t
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("{}\t{}\t{}".format(len(id_to_taxon), held, peak_kb))
+
+
+def main(num_taxa):
+    print("{} taxa".format(num_taxa))
+    res = {}
+    for layout in ("old", "pooled"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--layout", layout, str(num_taxa)],
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        ).stdout
+        num, held, peak_kb = [int(i) for i in out.strip().split("\t")]
+        res[layout] = held
+        m = "  {:6} taxa hold {:8.1f} MiB  (peak RSS {:8.1f} MiB)"
+        print(m.format(layout, held / 1048576.0, peak_kb / 1024.0))
+    saved = res["old"] - res["pooled"]
+    m = "  saved {:.1f} MiB ({:.0f}%, {:.0f} bytes per taxon)"
+    print(m.format(saved / 1048576.0, 100.0 * saved / res["old"], saved / num_taxa))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--layout":
+        run_layout(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
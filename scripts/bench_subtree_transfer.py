@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Times moving an Insecta-sized subtree between two LightTaxonomyHolder objects.
+
+Usage: bench_subtree_transfer.py [# of taxa in the subtree] [depth of one lineage]
+
+Compares LightTaxonomyHolder._transfer_subtree (preorder tour + bulk moves)
+with the node-by-node recursion that it replaced. The recursive version is
+skipped if the deep lineage would exceed the recursion limit.
+"""
+import random
+import sys
+import time
+
+from taxalotl.ott_schema import INP_OTT_TAXONOMY_HEADER
+from taxalotl.tax_partition import LightTaxonomyHolder
+
+ROOT_ID = 1
+
+
+def build_holder(num_taxa, lineage_depth, compact=False):
+    h = LightTaxonomyHolder("Life/Eukaryota/Metazoa/Arthropoda", compact)
+    h.taxon_header = INP_OTT_TAXONOMY_HEADER
+    rnd = random.Random(1)
+    par_ids = [ROOT_ID]
+    h.add_taxon(ROOT_ID, None, "1\t|\t\t|\tInsecta\t|\tclass\t|\t\n")
+    uid = ROOT_ID
+    for n in range(1, num_taxa):
+        uid += 1
+        if n < lineage_depth:
+            par_id = uid - 1
+        else:
+            par_id = par_ids[int(len(par_ids) * rnd.random() ** 0.5)]
+        line = "{}\t|\t{}\t|\tn{}\t|\t\t|\t\n".format(uid, par_id, n)
+        h.add_taxon(uid, par_id, line)
+        if n % 4:
+            par_ids.append(uid)
+    return h
+
+
+def recursive_transfer(src, par_id, dest_part):
+    """The node-by-node transfer that _transfer_subtree used to do."""
+    child_set = src._id_to_child_set.pop_children(par_id)
+    src._id_to_el[par_id] = dest_part
+    line = src._id_to_line.get(par_id)
+    if line is not None:
+        dest_part._id_to_line[par_id] = line
+        del src._id_to_line[par_id]
+    dest_part._id_to_child_set.add_children(par_id, child_set)
+    for child_id in child_set:
+        src._id_to_el[child_id] = dest_part
+        if child_id in src._id_to_child_set:
+            recursive_transfer(src, child_id, dest_part)
+        else:
+            line = src._id_to_line.get(child_id)
+            if line:
+                dest_part.add_taxon(child_id, par_id, line)
+                del src._id_to_line[child_id]
+
+
+def time_transfer(num_taxa, lineage_depth, compact, use_recursion):
+    src = build_holder(num_taxa, lineage_depth, compact)
+    dest = LightTaxonomyHolder("Life/Eukaryota/Metazoa/Arthropoda/Insecta", compact)
+    start = time.time()
+    if use_recursion:
+        recursive_transfer(src, ROOT_ID, dest)
+    else:
+        src._transfer_subtree(ROOT_ID, dest, as_root=True)
+    elapsed = time.time() - start
+    assert len(dest._id_to_line) == num_taxa
+    assert not src._id_to_line
+    return elapsed
+
+
+def main(num_taxa, lineage_depth):
+    print("{} taxa, one lineage of depth {}".format(num_taxa, lineage_depth))
+    for compact in (False, True):
+        storage = "compact" if compact else "dict"
+        t = time_transfer(num_taxa, lineage_depth, compact, False)
+        print("  {:8} preorder tour: {:.2f} s".format(storage, t))
+        if lineage_depth + 50 >= sys.getrecursionlimit():
+            print("  {:8} recursion: skipped (depth > recursion limit)".format(storage))
+            continue
+        t = time_transfer(num_taxa, lineage_depth, compact, True)
+        print("  {:8} recursion:     {:.2f} s".format(storage, t))
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+    )
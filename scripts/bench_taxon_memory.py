@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Compares the memory used by a forest of slotted Taxon objects (with the
+analysis results in side tables of the trees) and by the old layout (a
+__dict__ per taxon, with the results stored as attributes of the taxa).
+
+Usage: bench_taxon_memory.py [# of taxa]
+
+Each layout is measured in its own process. Peak RSS is reported after parsing
+the taxa, building the TaxonForest and running add_num_tips_below and
+add_best_guess_rank_sort_number on every tree.
+"""
+import resource
+import subprocess
+import sys
+import time
+
+from taxalotl.ott_schema import full_ott_line_parser
+from taxalotl.taxon import Taxon
+from taxalotl.tree import TaxonForest
+
+NUM_ORDERS = 10
+FAMILIES_PER_ORDER = 100
+GENERA_PER_FAMILY = 50
+
+# The old layout: the methods of Taxon, but no __slots__
+_DictTaxon = type(
+    "_DictTaxon",
+    (object,),
+    {
+        k: v
+        for k, v in Taxon.__dict__.items()
+        if k not in Taxon.__slots__ and k not in ("__slots__", "__weakref__")
+    },
+)
+
+
+def gen_lines(num_taxa):
+    uid = 0
+    pars = []
+    for rank, num_per_par in (
+        ("order", None),
+        ("family", FAMILIES_PER_ORDER),
+        ("genus", GENERA_PER_FAMILY),
+    ):
+        new_pars = []
+        for n in range(NUM_ORDERS if num_per_par is None else num_per_par * len(pars)):
+            uid += 1
+            par_id = "" if num_per_par is None else str(pars[n // num_per_par])
+            src = "ncbi:{},gbif:{}".format(uid, 10 * uid)
+            fields = [str(uid), par_id, "{} {}".format(rank, uid), rank, src, "", ""]
+            yield "\t|\t".join(fields + ["\n"])
+            new_pars.append(uid)
+        pars = new_pars
+    n = 0
+    while uid < num_taxa:
+        uid += 1
+        n += 1
+        par_id = pars[n % len(pars)]
+        name = "genus{} species{}".format(par_id, uid)
+        src = "ncbi:{},gbif:{}".format(uid, 10 * uid)
+        fields = [str(uid), str(par_id), name, "species", src, "", ""]
+        yield "\t|\t".join(fields + ["\n"])
+
+
+def run_layout(layout, num_taxa):
+    cls = _DictTaxon if layout == "old" else Taxon
+    start = time.time()
+    id_to_taxon = {}
+    for n, line in enumerate(gen_lines(num_taxa)):
+        t = cls(line, line_num=n, line_parser=full_ott_line_parser)
+        id_to_taxon[t.id] = t
+    forest = TaxonForest(id_to_taxon)
+    for tree in forest.trees:
+        tree.add_num_tips_below()
+        tree.add_best_guess_rank_sort_number()
+        if layout == "old":
+            # where the old analysis code left its results
+            for uid, v in tree.num_tips_below.items():
+                id_to_taxon[uid].num_tips_below = v
+            for uid, v in tree.best_rank_sort_number.items():
+                id_to_taxon[uid].best_rank_sort_number = v
+            tree.num_tips_below = {}
+            tree.best_rank_sort_number = {}
+    elapsed = time.time() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("{}\t{}\t{:.1f}".format(len(id_to_taxon), peak_kb, elapsed))
+
+
+def main(num_taxa):
+    print("{} taxa in {} trees".format(num_taxa, NUM_ORDERS))
+    for layout in ("old", "slots"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--layout", layout, str(num_taxa)],
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        ).stdout
+        num, peak_kb, elapsed = out.strip().split("\t")
+        m = "  {:6} peak RSS {:8.1f} MiB  ({} s)"
+        print(m.format(layout, int(peak_kb) / 1024.0, elapsed))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--layout":
+        run_layout(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
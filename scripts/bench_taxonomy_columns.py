@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Compares the per-line parsing of a taxonomy.tsv with the columnar parser
+of taxalotl.taxonomy_columns, in lines per second.
+
+Usage: bench_taxonomy_columns.py [# of taxa]
+
+The synthetic file uses FULL_OTT_HEADER. Each case reads the whole file:
+    columns: uid, parent_uid, name, rank, flags and sourceinfo offsets
+        (old: full_ott_line_parser, which is the only way to get them);
+    taxa: Taxon objects with every field parsed (old: Taxon(line) per line);
+    by uid: the uid -> Taxon mapping of read_taxonomy_to_get_id_to_fields, with
+        1% of the taxa looked up (old: a dict of Taxon(line) for every line).
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+from taxalotl.ott_schema import FULL_OTT_HEADER, read_taxonomy_to_get_id_to_fields
+from taxalotl.taxon import Taxon
+from taxalotl.taxonomy_columns import parse_taxonomy_columns
+
+RANKS = ("species", "genus", "no rank - terminal", "")
+FLAGS = ("", "", "sibling_higher", "extinct,hidden")
+
+
+def write_synthetic(fp, num_taxa):
+    with io.open(fp, "w", encoding="utf-8") as outp:
+        outp.write(FULL_OTT_HEADER)
+        for uid in range(1, num_taxa + 1):
+            par_id = str(uid // 10) if uid >= 10 else ""
+            src = "ncbi:{},gbif:{}".format(uid, 10 * uid)
+            fields = [
+                str(uid),
+                par_id,
+                "Genus{} species{}".format(uid // 10, uid),
+                RANKS[uid % 4],
+                src,
+                "",
+                FLAGS[uid % 4],
+                "\n",
+            ]
+            outp.write("\t|\t".join(fields))
+
+
+def old_taxa(fp):
+    r = []
+    with io.open(fp, "r", encoding="utf-8") as inp:
+        iinp = iter(inp)
+        next(iinp)
+        for n, line in enumerate(iinp):
+            r.append(Taxon(line, line_num=1 + n))
+    return len(r)
+
+
+def new_columns(fp):
+    cols = ("uid", "parent_uid", "name", "rank", "flags", "sourceinfo")
+    return len(parse_taxonomy_columns(fp, columns=cols))
+
+
+def new_taxa(fp):
+    cols = FULL_OTT_HEADER.split("\t|\t")[:-1] + ["line"]
+    return len(parse_taxonomy_columns(fp, columns=cols).taxa())
+
+
+def old_by_uid(fp):
+    id_to_obj = {}
+    with io.open(fp, "r", encoding="utf-8") as inp:
+        iinp = iter(inp)
+        next(iinp)
+        for n, line in enumerate(iinp):
+            obj = Taxon(line, line_num=1 + n)
+            id_to_obj[obj.id] = obj
+    return len(id_to_obj)
+
+
+def new_by_uid(fp):
+    by_uid = read_taxonomy_to_get_id_to_fields(os.path.dirname(fp))
+    for uid in range(1, len(by_uid) + 1, 100):
+        by_uid[uid]
+    return len(by_uid)
+
+
+CASES = (
+    ("columns", old_taxa, new_columns),
+    ("taxa", old_taxa, new_taxa),
+    ("by uid", old_by_uid, new_by_uid),
+)
+
+
+def _rate(func, fp):
+    start = time.perf_counter()
+    n = func(fp)
+    return n / (time.perf_counter() - start)
+
+
+def main(num_taxa):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fp = os.path.join(tmpdir, "taxonomy.tsv")
+        write_synthetic(fp, num_taxa)
+        print("{} taxa".format(num_taxa))
+        for name, old_func, new_func in CASES:
+            old_rate = max(_rate(old_func, fp) for i in range(2))
+            new_rate = max(_rate(new_func, fp) for i in range(2))
+            m = "  {:8} old {:10.0f} lines/s  new {:10.0f} lines/s  ({:.1f}x)"
+            print(m.format(name, old_rate, new_rate, new_rate / old_rate))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""Compares the old traversals of TaxonTree (list copies and list.pop(0) in
+preorder, recursion in write_indented_subtree, walks to the root for
+ancestor tests) with the cached preorder arrays of the current TaxonTree.
+
+Usage: bench_tree_traversal.py [# of tips]
+
+The tree is Life > family > one genus-like node with every tip as a child,
+which is the worst case for the old preorder (O(k^2) for k children).
+"""
+import io
+import sys
+import time
+
+from taxalotl.tree import TaxonForest, write_indented_subtree
+from taxalotl.taxon import Taxon
+
+
+def gen_taxa(num_tips):
+    rows = [("1", "", "Life", "no rank"), ("2", "1", "Fam", "family")]
+    rows.append(("3", "2", "Gen", "genus"))
+    for uid in range(4, num_tips + 4):
+        rows.append((str(uid), "3", "Gen sp{}".format(uid), "species"))
+    id_to_taxon = {}
+    for uid, par_id, name, rank in rows:
+        line = "\t|\t".join([uid, par_id, name, rank, "ncbi:" + uid, "", "", "\n"])
+        t = Taxon(line)
+        id_to_taxon[t.id] = t
+    return id_to_taxon
+
+
+def old_preorder(tree):
+    curr = tree.root
+    yield curr
+    to_process = []
+    if curr.children_refs:
+        to_process.append(list(curr.children_refs))
+    while to_process:
+        cl = to_process[-1]
+        if not cl:
+            to_process.pop(-1)
+        else:
+            curr = cl.pop(0)
+            if curr.children_refs:
+                to_process.append(list(curr.children_refs))
+            yield curr
+
+
+def old_postorder(tree):
+    for t in reversed(list(old_preorder(tree))):
+        yield t
+
+
+def old_write_indented_subtree(out, node, indent_level):
+    fmsd = node.formatted_src_dict()
+    f = "flags={}".format(", ".join(node.sorted_flags)) if node.sorted_flags else ""
+    s = "src={}".format(fmsd) if fmsd else ""
+    m = "{}{}\t|\tid={}\t|\trank={}\t|\t{}\t|\t{}\n"
+    out.write(
+        m.format(
+            "    " * indent_level, node.name_that_is_unique, node.id, node.rank, s, f
+        )
+    )
+    if node.children_refs:
+        sortable = []
+        for c in node.children_refs:
+            sortable.append((c.name_that_is_unique, c))
+        sortable.sort()
+        for el in sortable:
+            old_write_indented_subtree(out, el[1], indent_level=1 + indent_level)
+
+
+def old_contains(tree, anc, nd):
+    for a in tree.to_root_gen(nd):
+        if a is anc:
+            return True
+    return False
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(num_tips):
+    id_to_taxon = gen_taxa(num_tips)
+    tree = TaxonForest(id_to_taxon).trees[0]
+    print("{} tips under one genus".format(num_tips))
+    old_wide = min(num_tips, 100000)
+    wide_tree = TaxonForest(gen_taxa(old_wide)).trees[0]
+    m = "  old preorder on {} tips: {:.2f} s (quadratic; not run on the full tree)"
+    print(m.format(old_wide, _timed(lambda: sum(1 for i in old_preorder(wide_tree)))))
+    fam = tree.get_taxon(2)
+    tips = [t for t in tree.preorder() if not t.children_refs]
+    cases = (
+        (
+            "build arrays",
+            None,
+            lambda: (tree.invalidate_traversal(), tree.subtree_range(tree.root)),
+        ),
+        ("preorder", None, lambda: sum(1 for i in tree.preorder())),
+        ("postorder", None, lambda: sum(1 for i in tree.postorder())),
+        (
+            "contains",
+            lambda: sum(1 for t in tips if old_contains(tree, fam, t)),
+            lambda: sum(1 for t in tips if tree.does_first_contain_second(fam, t)),
+        ),
+        (
+            "write_indented",
+            lambda: old_write_indented_subtree(io.StringIO(), tree.root, 0),
+            lambda: write_indented_subtree(io.StringIO(), tree.root, 0),
+        ),
+    )
+    for name, old_func, new_func in cases:
+        new_t = min(_timed(new_func) for i in range(2))
+        if old_func is None:
+            print("  {:15} new {:8.3f} s".format(name, new_t))
+            continue
+        old_t = min(_timed(old_func) for i in range(2))
+        m = "  {:15} old {:8.3f} s  new {:8.3f} s  ({:.1f}x)"
+        print(m.format(name, old_t, new_t, old_t / new_t))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
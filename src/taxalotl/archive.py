@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""Reads the files that a normalizer needs from a downloaded archive, without
+unpacking the archive first.
+
+ArchiveMembers reads the members straight from the compressed archive;
+UnpackedMembers reads the same files from the dir that the archive was unpacked
+to (the fallback). Both have open, exists and mtime methods, and are context
+managers.
+"""
+import gzip
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from .util import open_input
+
+_LOG = logging.getLogger(__name__)
+
+STREAMABLE_FORMATS = frozenset(["gzip", "tar+gzip", "zip"])
+_BUFFER_SIZE = 1 << 20
+
+
+class _PipeReader(io.RawIOBase):
+    """The stdout of a subprocess. close() raises if the subprocess failed."""
+
+    def __init__(self, cmd):
+        io.RawIOBase.__init__(self)
+        self._cmd = cmd
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._proc.stdout.readinto(b)
+
+    def close(self):
+        if self.closed:
+            return
+        io.RawIOBase.close(self)
+        self._proc.stdout.close()
+        rc = self._proc.wait()
+        # a reader that stops early closes the pipe, which kills the subprocess
+        if rc not in (0, -13):
+            m = '"{}" exited with status {}'
+            raise RuntimeError(m.format(" ".join(self._cmd), rc))
+
+
+class _TarStreamMember(io.RawIOBase):
+    """A member of a tar read as a stream (tarfile's own file object for it raises
+    if it is asked whether it is seekable)."""
+
+    def __init__(self, member):
+        io.RawIOBase.__init__(self)
+        self._member = member
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._member.readinto(b)
+
+    def close(self):
+        if not self.closed:
+            io.RawIOBase.close(self)
+            self._member.close()
+
+
+def open_gzip(filepath, threads=1):
+    """Returns a binary file object of the decompressed content of `filepath`.
+
+    With threads > 1 the data are decompressed by rapidgzip (in parallel) if it
+    is installed, or else by a pigz subprocess (which runs alongside the reader)
+    if pigz is on the PATH. Otherwise the gzip module is used.
+    """
+    if threads > 1:
+        try:
+            import rapidgzip
+        except ImportError:
+            pass
+        else:
+            return rapidgzip.open(filepath, parallelization=threads)
+        pigz = shutil.which("pigz")
+        if pigz:
+            cmd = [pigz, "-d", "-c", "-p", str(threads), filepath]
+            return io.BufferedReader(_PipeReader(cmd), buffer_size=_BUFFER_SIZE)
+        m = "Neither rapidgzip nor pigz was found. Decompressing {} in one thread."
+        _LOG.info(m.format(filepath))
+    return gzip.open(filepath, "rb")
+
+
+def _member_name(name):
+    while name.startswith("./"):
+        name = name[2:]
+    return name
+
+
+def _as_text(binary, as_binary):
+    if as_binary:
+        return binary
+    # the text wrapper reads 8 KiB at a time; a large buffer below it keeps those
+    #   reads from going through each layer of file objects of the stream
+    if not isinstance(binary, io.BufferedReader):
+        binary = io.BufferedReader(binary, buffer_size=_BUFFER_SIZE)
+    return io.TextIOWrapper(binary, encoding="utf-8")
+
+
+class UnpackedMembers(object):
+    """The files in the dir that an archive was unpacked to."""
+
+    def __init__(self, unpacked_dir):
+        self.unpacked_dir = unpacked_dir
+
+    def path(self, name):
+        return os.path.join(self.unpacked_dir, name)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def mtime(self, name):
+        return os.path.getmtime(self.path(name))
+
+    def open(self, name, binary=False):
+        return open_input(self.path(name), "rb" if binary else "r")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArchiveMembers(object):
+    """The members `names` of an archive, read without unpacking it.
+
+    Zip members are read directly. The members of a tar+gzip archive are read in
+    one pass over the decompressed stream, so a member should be read before the
+    next one is opened. A needed member that is passed on the way to another one
+    is copied to a temporary file. The content of a gzip archive is its only
+    member, `local_filename` (or the archive's name without .gz).
+    """
+
+    def __init__(
+        self,
+        archive_fp,
+        archive_format,
+        names,
+        decompress_threads=1,
+        local_filename=None,
+    ):
+        self.archive_fp = archive_fp
+        self.archive_format = archive_format.lower()
+        self.names = frozenset(names)
+        self.decompress_threads = decompress_threads
+        self._mtimes = {}
+        self._zip = None
+        self._zip_info = {}
+        self._tar = None
+        self._tar_stream = None
+        self._tar_done = False
+        self._spooled = {}
+        self._spool_dir = None
+        if self.archive_format == "zip":
+            self._zip = zipfile.ZipFile(archive_fp)
+            for info in self._zip.infolist():
+                n = _member_name(info.filename)
+                if n in self.names:
+                    self._zip_info[n] = info
+                    self._mtimes[n] = time.mktime(info.date_time + (0, 0, -1))
+        elif self.archive_format == "gzip":
+            if local_filename:
+                self._gzip_name = local_filename
+            else:
+                self._gzip_name = os.path.split(archive_fp)[-1].rsplit(".", 1)[0]
+            self._mtimes[self._gzip_name] = os.path.getmtime(archive_fp)
+        elif self.archive_format != "tar+gzip":
+            m = 'Cannot read the members of "{}": unsupported archive format "{}"'
+            raise ValueError(m.format(archive_fp, archive_format))
+
+    def _check_name(self, name):
+        if name not in self.names:
+            m = '"{}" is not one of the archive members that were declared: {}'
+            raise KeyError(m.format(name, ", ".join(sorted(self.names))))
+
+    def exists(self, name):
+        self._check_name(name)
+        if self._zip is not None:
+            return name in self._zip_info
+        if self.archive_format == "gzip":
+            return name == self._gzip_name
+        if name in self._spooled:
+            return True
+        # Find it (spooling the members on the way) and keep it for open().
+        try:
+            member = self._next_tar_member(name)
+        except KeyError:
+            return False
+        self._spool(name, member)
+        return True
+
+    def mtime(self, name):
+        """Modification time of a member (of a tar member, once it has been opened)."""
+        return self._mtimes[name]
+
+    def open(self, name, binary=False):
+        self._check_name(name)
+        if self._zip is not None:
+            if name not in self._zip_info:
+                raise KeyError('"{}" is not in {}'.format(name, self.archive_fp))
+            return _as_text(self._zip.open(self._zip_info[name]), binary)
+        if self.archive_format == "gzip":
+            if name != self._gzip_name:
+                raise KeyError('"{}" is not in {}'.format(name, self.archive_fp))
+            return _as_text(open_gzip(self.archive_fp, self.decompress_threads), binary)
+        if name in self._spooled:
+            return _as_text(io.open(self._spooled.pop(name), "rb"), binary)
+        return _as_text(self._next_tar_member(name), binary)
+
+    def _next_tar_member(self, name):
+        if self._tar is None and not self._tar_done:
+            self._tar_stream = open_gzip(self.archive_fp, self.decompress_threads)
+            self._tar = tarfile.open(
+                fileobj=self._tar_stream, mode="r|", bufsize=_BUFFER_SIZE
+            )
+        while self._tar is not None:
+            info = self._tar.next()
+            if info is None:
+                self._close_tar()
+                break
+            n = _member_name(info.name)
+            if n not in self.names or not info.isfile():
+                continue
+            self._mtimes[n] = info.mtime
+            member = io.BufferedReader(
+                _TarStreamMember(self._tar.extractfile(info)), _BUFFER_SIZE
+            )
+            if n == name:
+                return member
+            self._spool(n, member)
+        raise KeyError('"{}" is not in {}'.format(name, self.archive_fp))
+
+    def _spool(self, name, member):
+        if self._spool_dir is None:
+            par = os.path.dirname(os.path.abspath(self.archive_fp))
+            self._spool_dir = tempfile.mkdtemp(prefix=".members-", dir=par)
+        fp = os.path.join(self._spool_dir, name.replace("/", "_"))
+        _LOG.debug("Copying archive member {} to {}".format(name, fp))
+        with io.open(fp, "wb") as out:
+            shutil.copyfileobj(member, out, _BUFFER_SIZE)
+        self._spooled[name] = fp
+
+    def _close_tar(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar_stream.close()
+            self._tar = None
+        self._tar_done = True
+
+    def close(self):
+        self._close_tar()
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._spool_dir is not None:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+            self._spool_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
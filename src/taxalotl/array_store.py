@@ -0,0 +1,757 @@
+#!/usr/bin/env python
+"""Compact, array-backed replacements for the per-taxon dicts of a LightTaxonomyHolder.
+
+A LightTaxonomyHolder for the "Life" slice of a large taxonomy holds millions of
+`str` lines, a `set` for every parent and a list of IDs. The classes here keep
+the same information in typed arrays:
+  * IdList - an append-only list of integer IDs (array('q')),
+  * PackedLineMap - uid -> line, with all of the text in one bytearray,
+  * CSRChildMap - parent uid -> children, as CSR offset arrays of the log of the
+    operations on the set of each parent.
+
+Integer IDs are stored in the arrays. Any other key (e.g. the '' parent of a
+root, or a string ID) is kept in a small plain dict so that the containers
+behave like the dicts that they replace.
+"""
+from array import array
+from bisect import bisect_left
+from itertools import chain, count, repeat
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from collections import MutableMapping
+
+_INT64_MIN = -(2**63)
+_INT64_MAX = 2**63 - 1
+# Marks a removed slot (PackedLineMap)
+_DEAD = _INT64_MIN
+
+
+def _is_array_key(k):
+    # bool is a subclass of int, but never an ID
+    return (
+        isinstance(k, int) and not isinstance(k, bool) and _DEAD < k <= _INT64_MAX
+    )
+
+
+class IdList(object):
+    """Append-only sequence of IDs. Uses an array('q') until a non-integer ID is added."""
+
+    def __init__(self, iterable=None):
+        self._ids = array("q")
+        if iterable is not None:
+            for i in iterable:
+                self.append(i)
+
+    def append(self, uid):
+        if isinstance(self._ids, array):
+            if _is_array_key(uid):
+                self._ids.append(uid)
+                return
+            self._ids = list(self._ids)
+        self._ids.append(uid)
+
+    def extend(self, uids):
+        for uid in uids:
+            self.append(uid)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, item):
+        return self._ids[item]
+
+
+class _SortedIntIndex(object):
+    """Maps integer keys to integer slots using sorted arrays plus a small dict of recent keys.
+
+    Recently added keys are held in a dict and merged into the sorted arrays when
+    that dict grows to a fraction of the sorted part, so n insertions cost
+    O(n log n) overall and a lookup is one dict probe and one binary search.
+    """
+
+    _MIN_PENDING = 4096
+
+    def __init__(self):
+        self._keys = array("q")
+        self._slots = array("q")
+        self._pending = {}
+        self._num_removed = 0
+
+    def get(self, key, default=None):
+        s = self._pending.get(key)
+        if s is not None:
+            return s
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            s = self._slots[i]
+            if s != _DEAD:
+                return s
+        return default
+
+    def __setitem__(self, key, slot):
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            if self._slots[i] == _DEAD:
+                self._num_removed -= 1
+            self._slots[i] = slot
+            return
+        self._pending[key] = slot
+        if len(self._pending) > max(self._MIN_PENDING, len(keys) // 4):
+            self._merge()
+
+    def remove(self, key):
+        if self._pending.pop(key, None) is not None:
+            return
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key and self._slots[i] != _DEAD:
+            self._slots[i] = _DEAD
+            self._num_removed += 1
+            if self._num_removed > max(self._MIN_PENDING, len(keys) // 2):
+                self._merge()
+            return
+        raise KeyError(key)
+
+    def _merge(self):
+        pairs = [(k, s) for k, s in zip(self._keys, self._slots) if s != _DEAD]
+        pairs.extend(self._pending.items())
+        pairs.sort()
+        self._keys = array("q", [i[0] for i in pairs])
+        self._slots = array("q", [i[1] for i in pairs])
+        self._pending = {}
+        self._num_removed = 0
+
+    def remap_slots(self, old_to_new):
+        """Replaces every slot `s` with `old_to_new[s]` (used when the owner compacts)."""
+        self._merge()
+        slots = self._slots
+        for n, s in enumerate(slots):
+            slots[n] = old_to_new[s]
+
+
+class PackedLineMap(MutableMapping):
+    """Dict-like uid -> line map with all of the line text in one contiguous buffer.
+
+    Lines are kept as UTF-8 bytes in a single bytearray. Each live entry costs
+    5 machine words of array storage (uid, start, end and two index columns)
+    rather than a dict entry and a `str` object.
+    Iteration follows insertion order, like a dict (for integer uids, which
+    are visited before any non-integer uids).
+    """
+
+    _COMPACT_MIN_GARBAGE = 1 << 20
+
+    def __init__(self, other=None):
+        self._uids = array("q")
+        self._starts = array("q")
+        self._ends = array("q")
+        self._buf = bytearray()
+        self._index = _SortedIntIndex()
+        self._num_live = 0
+        self._garbage = 0
+        self._other = {}
+        if other is not None:
+            self.update(other)
+
+    def __len__(self):
+        return self._num_live + len(self._other)
+
+    def __contains__(self, uid):
+        if _is_array_key(uid):
+            return self._index.get(uid) is not None
+        return uid in self._other
+
+    def _slot_text(self, slot):
+        return self._buf[self._starts[slot] : self._ends[slot]].decode("utf-8")
+
+    def __getitem__(self, uid):
+        if _is_array_key(uid):
+            slot = self._index.get(uid)
+            if slot is None:
+                raise KeyError(uid)
+            return self._slot_text(slot)
+        return self._other[uid]
+
+    def get(self, uid, default=None):
+        if _is_array_key(uid):
+            slot = self._index.get(uid)
+            if slot is None:
+                return default
+            return self._slot_text(slot)
+        return self._other.get(uid, default)
+
+    def __setitem__(self, uid, line):
+        if not _is_array_key(uid):
+            self._other[uid] = line
+            return
+        b = line.encode("utf-8")
+        start = len(self._buf)
+        self._buf.extend(b)
+        slot = self._index.get(uid)
+        if slot is not None:
+            self._garbage += self._ends[slot] - self._starts[slot]
+            self._starts[slot] = start
+            self._ends[slot] = start + len(b)
+            return
+        self._index[uid] = len(self._uids)
+        self._uids.append(uid)
+        self._starts.append(start)
+        self._ends.append(start + len(b))
+        self._num_live += 1
+
+    def __delitem__(self, uid):
+        if not _is_array_key(uid):
+            del self._other[uid]
+            return
+        slot = self._index.get(uid)
+        if slot is None:
+            raise KeyError(uid)
+        self._index.remove(uid)
+        self._garbage += self._ends[slot] - self._starts[slot]
+        self._starts[slot] = _DEAD
+        self._num_live -= 1
+        if self._garbage > max(self._COMPACT_MIN_GARBAGE, len(self._buf) // 2):
+            self.compact()
+
+    def __iter__(self):
+        starts = self._starts
+        for slot, uid in enumerate(self._uids):
+            if starts[slot] != _DEAD:
+                yield uid
+        for k in list(self._other.keys()):
+            yield k
+
+    def items(self):
+        starts, ends, buf = self._starts, self._ends, self._buf
+        for slot, uid in enumerate(self._uids):
+            s = starts[slot]
+            if s != _DEAD:
+                yield uid, buf[s : ends[slot]].decode("utf-8")
+        for k, v in list(self._other.items()):
+            yield k, v
+
+    def values(self):
+        for el in self.items():
+            yield el[1]
+
+    def clear(self):
+        self.__init__()
+
+    def compact(self):
+        """Drops the text and slots of deleted lines."""
+        uids, starts, ends, buf = self._uids, self._starts, self._ends, self._buf
+        n_uids, n_starts, n_ends = array("q"), array("q"), array("q")
+        n_buf = bytearray()
+        old_to_new = {}
+        for slot, uid in enumerate(uids):
+            s = starts[slot]
+            if s == _DEAD:
+                continue
+            old_to_new[slot] = len(n_uids)
+            n_uids.append(uid)
+            n_starts.append(len(n_buf))
+            n_buf.extend(buf[s : ends[slot]])
+            n_ends.append(len(n_buf))
+        self._index.remap_slots(old_to_new)
+        self._uids, self._starts, self._ends, self._buf = n_uids, n_starts, n_ends, n_buf
+        self._garbage = 0
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes held in the arrays and buffer."""
+        i = self._index
+        n = len(self._buf) + 8 * (
+            len(self._uids) + len(self._starts) + len(self._ends)
+        )
+        return n + 8 * (len(i._keys) + len(i._slots)) + 100 * len(i._pending)
+
+
+class ChildSetDict(dict):
+    """The plain dict-of-sets store for parent uid -> children.
+
+    Defines the explicit mutators that LightTaxonomyHolder uses, so that
+    CSRChildMap can be swapped in for it.
+    """
+
+    def add_child(self, par_id, uid):
+        self.setdefault(par_id, set()).add(uid)
+
+    def add_children(self, par_id, uids):
+        self.setdefault(par_id, set()).update(uids)
+
+    def discard_child(self, par_id, uid):
+        cs = self.get(par_id)
+        if cs:
+            cs.discard(uid)
+
+    def pop_children(self, par_id):
+        return self.pop(par_id)
+
+    def adopt_child_sets(self, par_ids, child_sets):
+        """add_children for each pair of par_ids and child_sets (sets that were
+        popped from another map). The sets are kept as they are if possible."""
+        if self.keys().isdisjoint(par_ids):
+            self.update(zip(par_ids, child_sets))
+            return
+        for par_id, uids in zip(par_ids, child_sets):
+            self.add_children(par_id, uids)
+
+
+# Codes of the entries of the child log of a parent in a CSRChildMap
+_ADD = 0
+_DISCARD = 1
+_MERGE = 2  # the value is the number of the entries that follow that are merged
+_CODE_MASK = 3
+_OBJ = 4  # flag: the value is the index of a non-integer ID in the list of objects
+
+
+def _zeros(n):
+    return array("q", bytes(8 * n))
+
+
+def _replay_into(s, vals, ops, objs, start, end):
+    """Applies the log entries [start, end) to the set `s`."""
+    if ops.count(_ADD, start, end) == end - start:
+        s.update(vals[start:end])
+        return
+    i = start
+    while i < end:
+        op, v = ops[i], vals[i]
+        if op & _OBJ:
+            v = objs[v]
+        code = op & _CODE_MASK
+        if code == _ADD:
+            s.add(v)
+        elif code == _DISCARD:
+            s.discard(v)
+        else:
+            merged = set()
+            _replay_into(merged, vals, ops, objs, i + 1, i + 1 + v)
+            s.update(merged)
+            i += v
+        i += 1
+
+
+class ChildSet(set):
+    """A set of children popped from a CSRChildMap. `log` is (values, codes, objects),
+    the entries that built the set, so that adopting it rebuilds the same set."""
+
+    __slots__ = ("log",)
+
+
+class CSRChildMap(object):
+    """Parent uid -> set of child uids, held as compressed-sparse-row arrays.
+
+    Rather than the set of each parent, the map keeps the log of the operations
+    on it (add a child, discard one, or merge another set), and a read replays
+    the log into a new set. So the sets that are read iterate in the same order
+    as the sets of a ChildSetDict that had the same operations, and the keys
+    are visited in the order in which they were (re)created, as in a dict.
+
+    Entries are appended to a set of arrays as they arrive. On the next read
+    they are either moved into small per-parent overlay logs or, if there are
+    many of them, merged parent by parent with the CSR arrays: the parent keys
+    (in creation order), an offsets array and the values and codes of the log
+    entries. A parent stays a key until `pop_children` or `del`.
+
+    Mapping reads (`get`, `[]`, `items`) of an integer parent return new sets
+    (changing them does not change the map); `pop_children` returns a ChildSet. Mutation is only done
+    through add_child, add_children, adopt_child_sets, discard_child and
+    pop_children (the same methods as ChildSetDict).
+    """
+
+    def __init__(self):
+        self._new_par = array("q")
+        self._new_val = array("q")
+        self._new_op = bytearray()
+        self._num_before_new = 0  # number of entries that arrived before _new_*
+        self._keys = array("q")
+        self._seqs = array("q")  # creation order of each key (see _seq)
+        self._offsets = array("q", [0])
+        self._vals = array("q")
+        self._ops = bytearray()
+        self._live = bytearray()
+        self._num_live_keys = 0
+        self._sorted_keys = array("q")
+        self._sorted_kis = array("q")
+        # int key -> [seq (-1 for a live key of the CSR arrays), values, codes]
+        self._overlay = {}
+        self._objs = []  # non-integer children of integer parents
+        self._obj_index = {}
+        self._other = ChildSetDict()  # non-integer parents
+        self._other_seqs = {}
+
+    @classmethod
+    def from_csr(cls, keys, offsets, children):
+        """Creates a map from sorted CSR columns (any buffers of int64 values)."""
+        cm = cls()
+        cols = (("_keys", keys), ("_offsets", offsets), ("_vals", children))
+        for attr, col in cols:
+            a = array("q")
+            a.frombytes(memoryview(col).cast("B"))
+            setattr(cm, attr, a)
+        if not cm._offsets:
+            cm._offsets.append(0)
+        nk = len(cm._keys)
+        cm._ops = bytearray(len(cm._vals))
+        cm._seqs = array("q", range(0, 2 * nk, 2))
+        cm._num_before_new = nk
+        cm._live = bytearray(b"\x01" * nk)
+        cm._num_live_keys = nk
+        cm._sorted_keys = array("q", cm._keys)
+        cm._sorted_kis = array("q", range(nk))
+        return cm
+
+    # Mutators
+    def add_child(self, par_id, uid):
+        if not _is_array_key(par_id):
+            self._note_other_key(par_id)
+            self._other.add_child(par_id, uid)
+        elif _is_array_key(uid):
+            self._new_par.append(par_id)
+            self._new_val.append(uid)
+            self._new_op.append(_ADD)
+        else:
+            self._append(par_id, self._obj_handle(uid), _ADD | _OBJ)
+
+    def add_children(self, par_id, uids):
+        """As set.update of the set of par_id (created if need be)."""
+        if not _is_array_key(par_id):
+            self._note_other_key(par_id)
+            self._other.add_children(par_id, uids)
+            return
+        if isinstance(uids, (set, frozenset)):
+            log = getattr(uids, "log", None)
+            if log is None:
+                log = self._log_of_foreign_set(uids)
+            self._append(par_id, len(log[0]), _MERGE)
+            self._append_log(par_id, log)
+            return
+        had_any = False
+        for uid in uids:
+            had_any = True
+            self.add_child(par_id, uid)
+        if not had_any:
+            # an empty update still creates the key
+            self._append(par_id, 0, _MERGE)
+
+    def adopt_child_sets(self, par_ids, child_sets):
+        """As ChildSetDict.adopt_child_sets: the sets are kept as they are if none
+        of par_ids is a key, otherwise they are merged into the sets of par_ids."""
+        par_ids = list(par_ids)
+        if any(p in self for p in par_ids):
+            for par_id, uids in zip(par_ids, child_sets):
+                self.add_children(par_id, uids)
+            return
+        for par_id, uids in zip(par_ids, child_sets):
+            if not _is_array_key(par_id):
+                self._note_other_key(par_id)
+                self._other[par_id] = uids
+                continue
+            log = getattr(uids, "log", None)
+            if log is None:
+                log = self._log_of_foreign_set(uids)
+            self._append_log(par_id, log)
+
+    def discard_child(self, par_id, uid):
+        if not _is_array_key(par_id):
+            self._other.discard_child(par_id, uid)
+            return
+        self._sync()
+        if not self._has_int_key(par_id):
+            return
+        if _is_array_key(uid):
+            self._append(par_id, uid, _DISCARD)
+        elif uid in self._obj_index:
+            self._append(par_id, self._obj_index[uid], _DISCARD | _OBJ)
+
+    def pop_children(self, par_id):
+        if not _is_array_key(par_id):
+            r = self._other.pop_children(par_id)
+            del self._other_seqs[par_id]
+            return r
+        self._sync()
+        segments = self._segments(par_id)
+        if segments is None:
+            raise KeyError(par_id)
+        r = ChildSet()
+        vals, ops = array("q"), bytearray()
+        for v, o, start, end in segments:
+            _replay_into(r, v, o, self._objs, start, end)
+            vals.extend(v[start:end])
+            ops.extend(o[start:end])
+        r.log = (vals, ops, self._objs)
+        self._overlay.pop(par_id, None)
+        ki = self._key_index(par_id)
+        if ki is not None:
+            self._live[ki] = 0
+            self._num_live_keys -= 1
+        return r
+
+    def __delitem__(self, par_id):
+        self.pop_children(par_id)
+
+    # Mapping-style reads
+    def get(self, par_id, default=None):
+        if not _is_array_key(par_id):
+            r = self._other.get(par_id)
+            return default if r is None else r
+        self._sync()
+        segments = self._segments(par_id)
+        if segments is None:
+            return default
+        r = set()
+        for v, o, start, end in segments:
+            _replay_into(r, v, o, self._objs, start, end)
+        return r
+
+    def __getitem__(self, par_id):
+        r = self.get(par_id)
+        if r is None:
+            raise KeyError(par_id)
+        return r
+
+    def __contains__(self, par_id):
+        if not _is_array_key(par_id):
+            return par_id in self._other
+        self._sync()
+        return self._has_int_key(par_id)
+
+    def keys(self):
+        self._sync()
+        others = sorted((seq, n) for n, seq in enumerate(self._other_seqs.values()))
+        other_keys = list(self._other_seqs.keys())
+        j = 0
+        for seq, k in self._int_keys_and_seqs():
+            while j < len(others) and others[j][0] < seq:
+                yield other_keys[others[j][1]]
+                j += 1
+            yield k
+        for seq, n in others[j:]:
+            yield other_keys[n]
+
+    __iter__ = keys
+
+    def items(self):
+        for k in self.keys():
+            yield k, self.get(k)
+
+    def values(self):
+        for el in self.items():
+            yield el[1]
+
+    def __len__(self):
+        self._sync()
+        n = self._num_live_keys + len(self._other)
+        for o in self._overlay.values():
+            if o[0] >= 0:
+                n += 1
+        return n
+
+    def __bool__(self):
+        return len(self) > 0
+
+    __nonzero__ = __bool__
+
+    # Internals
+    def _seq(self):
+        """Creation order of a new key: twice the number of int-keyed entries that
+        arrived before its first entry (minus one for a non-integer key, which
+        comes after those entries)."""
+        return 2 * (self._num_before_new + len(self._new_par))
+
+    def _note_other_key(self, par_id):
+        if par_id not in self._other:
+            self._other_seqs[par_id] = self._seq() - 1
+
+    def _obj_handle(self, uid):
+        h = self._obj_index.get(uid)
+        if h is None:
+            h = len(self._objs)
+            self._objs.append(uid)
+            self._obj_index[uid] = h
+        return h
+
+    def _append(self, par_id, val, op):
+        self._new_par.append(par_id)
+        self._new_val.append(val)
+        self._new_op.append(op)
+
+    def _append_log(self, par_id, log):
+        vals, ops, objs = log
+        n = len(vals)
+        if not n:
+            self._append(par_id, 0, _MERGE)  # the key of an empty set
+            return
+        if objs and any(o & _OBJ for o in ops):
+            for v, o in zip(vals, ops):
+                if o & _OBJ:
+                    v = self._obj_handle(objs[v])
+                self._append(par_id, v, o)
+            return
+        self._new_par.extend(repeat(par_id, n))
+        self._new_val.extend(vals)
+        self._new_op.extend(ops)
+
+    def _log_of_foreign_set(self, uids):
+        """A log that adds the elements of a set that did not come from a CSRChildMap
+        (in its iteration order)."""
+        vals, ops = array("q"), bytearray()
+        objs = []
+        for uid in uids:
+            if _is_array_key(uid):
+                vals.append(uid)
+                ops.append(_ADD)
+            else:
+                vals.append(len(objs))
+                objs.append(uid)
+                ops.append(_ADD | _OBJ)
+        return vals, ops, objs
+
+    def _has_int_key(self, par_id):
+        return par_id in self._overlay or self._key_index(par_id) is not None
+
+    def _key_index(self, par_id):
+        keys = self._sorted_keys
+        i = bisect_left(keys, par_id)
+        if i < len(keys) and keys[i] == par_id:
+            ki = self._sorted_kis[i]
+            if self._live[ki]:
+                return ki
+        return None
+
+    def _segments(self, par_id):
+        """The (values, codes, start, end) pieces of the log of par_id, or None."""
+        r = []
+        ki = self._key_index(par_id)
+        if ki is not None:
+            r.append((self._vals, self._ops, self._offsets[ki], self._offsets[ki + 1]))
+        o = self._overlay.get(par_id)
+        if o is not None:
+            r.append((o[1], o[2], 0, len(o[1])))
+        elif ki is None:
+            return None
+        return r
+
+    def _int_keys_and_seqs(self):
+        live = self._live
+        for ki, k in enumerate(self._keys):
+            if live[ki]:
+                yield self._seqs[ki], k
+        for k, o in list(self._overlay.items()):
+            if o[0] >= 0:
+                yield o[0], k
+
+    def _sync(self):
+        """Moves newly added entries into the overlay logs or the CSR arrays."""
+        num_new = len(self._new_par)
+        if not num_new:
+            return
+        if num_new > len(self._vals) // 8:
+            self._rebuild()
+        else:
+            overlay = self._overlay
+            seq = 2 * self._num_before_new
+            for par_id, val, op in zip(self._new_par, self._new_val, self._new_op):
+                o = overlay.get(par_id)
+                if o is None:
+                    known = self._key_index(par_id) is not None
+                    o = [-1 if known else seq, array("q"), bytearray()]
+                    overlay[par_id] = o
+                o[1].append(val)
+                o[2].append(op)
+                seq += 2
+        self._num_before_new += num_new
+        self._new_par = array("q")
+        self._new_val = array("q")
+        self._new_op = bytearray()
+
+    def _rebuild(self):
+        """Merges the CSR arrays, the overlay logs and the new entries, parent by
+        parent, into new CSR arrays (without a Python object per entry)."""
+        keys, seqs, offsets, live = self._keys, self._seqs, self._offsets, self._live
+        n_keys, n_seqs = array("q"), array("q")
+        base_no = _zeros(len(keys))  # key index -> new key number
+        for ki, k in enumerate(keys):
+            if live[ki]:
+                base_no[ki] = len(n_keys)
+                n_keys.append(k)
+                n_seqs.append(seqs[ki])
+        # new key number of the parents of the overlay and new entries
+        key_no = {}
+        new_seq = 2 * self._num_before_new
+        pars = chain(self._overlay.keys(), self._new_par)
+        seq_of = chain((o[0] for o in self._overlay.values()), count(new_seq, 2))
+        for par_id, seq in zip(pars, seq_of):
+            if par_id in key_no:
+                continue
+            ki = self._key_index(par_id)
+            if ki is not None:
+                key_no[par_id] = base_no[ki]
+            else:
+                key_no[par_id] = len(n_keys)
+                n_keys.append(par_id)
+                n_seqs.append(seq)
+        num_keys = len(n_keys)
+        sizes = _zeros(num_keys)
+        for ki, k in enumerate(keys):
+            if live[ki]:
+                sizes[base_no[ki]] = offsets[ki + 1] - offsets[ki]
+        for par_id, o in self._overlay.items():
+            sizes[key_no[par_id]] += len(o[1])
+        for par_id in self._new_par:
+            sizes[key_no[par_id]] += 1
+        n_offsets = _zeros(num_keys + 1)
+        total = 0
+        for n, size in enumerate(sizes):
+            n_offsets[n] = total
+            total += size
+        n_offsets[num_keys] = total
+        n_vals, n_ops = _zeros(total), bytearray(total)
+        cursor = array("q", n_offsets)
+        vals, ops = self._vals, self._ops
+        for ki, k in enumerate(keys):
+            if live[ki]:
+                no = base_no[ki]
+                start, end = offsets[ki], offsets[ki + 1]
+                c = cursor[no]
+                n_vals[c : c + end - start] = vals[start:end]
+                n_ops[c : c + end - start] = ops[start:end]
+                cursor[no] = c + end - start
+        for par_id, o in self._overlay.items():
+            no = key_no[par_id]
+            c, n = cursor[no], len(o[1])
+            n_vals[c : c + n] = o[1]
+            n_ops[c : c + n] = o[2]
+            cursor[no] = c + n
+        for par_id, val, op in zip(self._new_par, self._new_val, self._new_op):
+            no = key_no[par_id]
+            c = cursor[no]
+            n_vals[c] = val
+            n_ops[c] = op
+            cursor[no] = c + 1
+        del key_no, cursor, sizes, base_no
+        order = sorted(range(num_keys), key=n_keys.__getitem__)
+        self._sorted_keys = array("q", map(n_keys.__getitem__, order))
+        self._sorted_kis = array("q", order)
+        self._keys, self._seqs, self._offsets = n_keys, n_seqs, n_offsets
+        self._vals, self._ops = n_vals, n_ops
+        self._live = bytearray(b"\x01" * num_keys)
+        self._num_live_keys = num_keys
+        self._overlay = {}
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes held in the arrays (not counting the overlay)."""
+        n = len(self._new_par) + len(self._new_val) + len(self._keys) + len(self._seqs)
+        n += len(self._offsets) + len(self._vals)
+        n += len(self._sorted_keys) + len(self._sorted_kis)
+        return 8 * n + len(self._ops) + len(self._new_op) + len(self._live)
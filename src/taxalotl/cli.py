@@ -22,6 +22,7 @@ from .commands import (
     info_on_resources,
     normalize_resources,
     partition_resources,
+    profile_report,
     pull_otifacts,
     status_of_resources,
     unpack_resources,
@@ -33,6 +34,8 @@ from .cmds.partitions import (
     NONTERMINAL_PART_NAMES,
     TERMINAL_PART_NAMES,
 )
+from .profiling import CommandProfile
+from .tax_partition import TAX_SLICE_CACHE
 import logging
 
 LOGLEVEL = os.environ.get("LOGLEVEL", "WARNING").upper()
@@ -47,6 +50,7 @@ res_indep_cmds = [
     "compare-taxonomies",
     "deseparate-taxonomies",
     "diagnose-new-separators",
+    "profile-report",
     "pull-otifacts",
 ]
 # Commands that take any resource ID
@@ -78,70 +82,114 @@ def _validate_level_arg(taxalotl_config, level):
     return True
 
 
+class _NotProfiled(object):
+    """Stands in for CommandProfile when the command is not profiled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
 def main_post_parse(args):
+    if args.which == "profile-report":
+        # reads only the history, so it does not need a taxalotl.conf
+        profile_report(command=args.command, num_runs=args.runs)
+        return 0
     taxalotl_config = TaxalotlConfig(filepath=args.config)
+    if args.which == "all":
+        m = "Currently you must enter a command to run. Use the --help option or see the Tutorial.md\n"
+        sys.stdout.write(m)
+        return 1
     try:
-        # if args.which == 'analyze-update':
-        #     analyze_update(taxalotl_config, args.resources, [args.level])
-        # elif
-        if args.which == "align":
-            align(taxalotl_config, args.resources, [args.level])
-        elif args.which == "clean-partition":
-            clean_resources(taxalotl_config, "partition", args.resources)
-        elif args.which == "clean-separation":
-            clean_resources(taxalotl_config, "separation", [], [args.level])
-        elif args.which == "cache-separator-names":
-            cache_separator_names(taxalotl_config)
-        elif args.which == "compare-taxonomies":
-            compare_taxonomies(taxalotl_config, [args.level])
-        elif args.which == "deseparate-taxonomies":
-            deseparate_taxonomies(taxalotl_config, [args.level])
-        elif args.which == "download":
-            download_resources(taxalotl_config, args.resources)
-        elif args.which == "status":
-            status_of_resources(
-                taxalotl_config,
-                args.resources,
-                ids_only=args.ids_only,
-                by_status=args.by_status,
-                terminal_only=args.terminal,
-            )
-        elif args.which == "unpack":
-            unpack_resources(taxalotl_config, args.resources)
-        elif args.which == "normalize":
-            normalize_resources(taxalotl_config, args.resources)
-        elif args.which == "accumulate-separated-descendants":
-            accumulate_separated_descendants(taxalotl_config, args.resources)
-        elif args.which == "pull-otifacts":
-            pull_otifacts(taxalotl_config)
-        elif args.which == "diagnose-new-separators":
-            _validate_level_arg(taxalotl_config, args.level)
-            diagnose_new_separators(taxalotl_config, [args.level], args.name)
-        elif args.which == "enforce-new-separators":
-            _validate_level_arg(taxalotl_config, args.level)
-            enforce_new_separators(taxalotl_config, args.resources, [args.level])
-        elif args.which == "build-partition-maps":
-            build_partition_maps(taxalotl_config)
-        elif args.which == "partition":
-            if args.level is not None and args.level not in NAME_TO_PARTS_SUBSETS:
-                raise RuntimeError(
-                    '--level should be one of "{}"'.format('", "'.join(PART_NAMES))
+        TAX_SLICE_CACHE.max_bytes = taxalotl_config.slice_cache_max_bytes
+        if args.profile or taxalotl_config.profile:
+            profiler = CommandProfile(args.which, getattr(args, "resources", None))
+        else:
+            profiler = _NotProfiled()
+        with profiler:
+            # if args.which == 'analyze-update':
+            #     analyze_update(taxalotl_config, args.resources, [args.level])
+            # elif
+            if args.which == "align":
+                align(taxalotl_config, args.resources, [args.level])
+            elif args.which == "clean-partition":
+                clean_resources(taxalotl_config, "partition", args.resources)
+            elif args.which == "clean-separation":
+                clean_resources(taxalotl_config, "separation", [], [args.level])
+            elif args.which == "cache-separator-names":
+                cache_separator_names(taxalotl_config)
+            elif args.which == "compare-taxonomies":
+                compare_taxonomies(taxalotl_config, [args.level])
+            elif args.which == "deseparate-taxonomies":
+                deseparate_taxonomies(taxalotl_config, [args.level])
+            elif args.which == "download":
+                download_resources(
+                    taxalotl_config,
+                    args.resources,
+                    jobs=args.jobs,
+                    keep_going=args.keep_going,
                 )
-            partition_resources(taxalotl_config, args.resources, [args.level])
-        elif args.which == "info":
-            if args.level is not None and args.level not in NAME_TO_PARTS_SUBSETS:
-                raise RuntimeError(
-                    '--level should be one of "{}"'.format('", "'.join(PART_NAMES))
+            elif args.which == "status":
+                status_of_resources(
+                    taxalotl_config,
+                    args.resources,
+                    ids_only=args.ids_only,
+                    by_status=args.by_status,
+                    terminal_only=args.terminal,
+                    verify=args.verify,
+                )
+            elif args.which == "unpack":
+                unpack_resources(
+                    taxalotl_config,
+                    args.resources,
+                    jobs=args.jobs,
+                    keep_going=args.keep_going,
+                )
+            elif args.which == "normalize":
+                normalize_resources(
+                    taxalotl_config,
+                    args.resources,
+                    jobs=args.jobs,
+                    keep_going=args.keep_going,
+                )
+            elif args.which == "accumulate-separated-descendants":
+                accumulate_separated_descendants(taxalotl_config, args.resources)
+            elif args.which == "pull-otifacts":
+                pull_otifacts(taxalotl_config)
+            elif args.which == "diagnose-new-separators":
+                _validate_level_arg(taxalotl_config, args.level)
+                diagnose_new_separators(taxalotl_config, [args.level], args.name)
+            elif args.which == "enforce-new-separators":
+                _validate_level_arg(taxalotl_config, args.level)
+                enforce_new_separators(
+                    taxalotl_config, args.resources, [args.level], jobs=args.jobs
+                )
+            elif args.which == "build-partition-maps":
+                build_partition_maps(taxalotl_config)
+            elif args.which == "partition":
+                if args.level is not None and args.level not in NAME_TO_PARTS_SUBSETS:
+                    raise RuntimeError(
+                        '--level should be one of "{}"'.format('", "'.join(PART_NAMES))
+                    )
+                partition_resources(
+                    taxalotl_config,
+                    args.resources,
+                    [args.level],
+                    single_pass=args.single_pass,
+                    jobs=args.jobs,
+                )
+            elif args.which == "info":
+                if args.level is not None and args.level not in NAME_TO_PARTS_SUBSETS:
+                    raise RuntimeError(
+                        '--level should be one of "{}"'.format('", "'.join(PART_NAMES))
+                    )
+                info_on_resources(taxalotl_config, args.resources, [args.level])
+            else:
+                raise NotImplementedError(
+                    '"{}" action not implemented yet'.format(args.which)
                 )
-            info_on_resources(taxalotl_config, args.resources, [args.level])
-        elif args.which == "all":
-            m = "Currently you must enter a command to run. Use the --help option or see the Tutorial.md\n"
-            sys.stdout.write(m)
-            return 1
-        else:
-            raise NotImplementedError(
-                '"{}" action not implemented yet'.format(args.which)
-            )
     except Exception as x:
         if taxalotl_config.crash_with_stacktraces:
             raise
@@ -155,12 +203,39 @@ def _add_level_arg(parser, req=False):
     )
 
 
+def _add_keep_going_arg(parser):
+    parser.add_argument(
+        "--keep-going",
+        action="store_true",
+        default=False,
+        help="after a resource fails, go on with the resources that do not depend "
+        "on it (the first error is still reported)",
+    )
+
+
+def _add_jobs_arg(parser):
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes (threads, for downloads) to use for "
+        "independent parts of the work",
+    )
+
+
 def main():
     import argparse
 
     description = "The main CLI for taxalotl"
     p = argparse.ArgumentParser(description=description)
     p.add_argument("--config", type=str, help="the taxalotl.conf filepath (optional)")
+    p.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="add the time, memory and I/O of the command to ~/.taxalotl_profiles "
+        "(see profile-report)",
+    )
     p.add_argument(
         "--show-completions",
         action="store_true",
@@ -183,6 +258,21 @@ def main():
         "pull-otifacts", help="refresh list of taxonomic artifacts from OTifacts repo"
     )
     pull_otifacts_p.set_defaults(which="pull-otifacts")
+    # PROFILE-REPORT
+    profile_p = subp.add_parser(
+        "profile-report",
+        help="summarize the time, memory and I/O of recent runs of each command",
+    )
+    profile_p.add_argument(
+        "--command", default=None, help="only report on the runs of this command"
+    )
+    profile_p.add_argument(
+        "--runs",
+        type=int,
+        default=10,
+        help="number of recent runs of each command to compare (default 10)",
+    )
+    profile_p.set_defaults(which="profile-report")
     # STATUS
     status_p = subp.add_parser(
         "status", help="report the status of a resource (or all resources)"
@@ -205,6 +295,13 @@ def main():
         default=False,
         help="Report only on the terminalized resource of each type.",
     )
+    status_p.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="rebuild the recorded status of every resource from its files "
+        "before reporting",
+    )
     status_p.set_defaults(which="status")
     # deseparate
     deseparate_p = subp.add_parser(
@@ -232,12 +329,16 @@ def main():
     download_p.add_argument(
         "resources", nargs="+", help="IDs of the resources to download"
     )
+    _add_jobs_arg(download_p)
+    _add_keep_going_arg(download_p)
     download_p.set_defaults(which="download")
     # UNPACK
     unpack_p = subp.add_parser(
         "unpack", help="unpack an resource (downloads if necessary)"
     )
     unpack_p.add_argument("resources", nargs="+", help="IDs of the resources to unpack")
+    _add_jobs_arg(unpack_p)
+    _add_keep_going_arg(unpack_p)
     unpack_p.set_defaults(which="unpack")
     # NORMALIZE
     normalize_p = subp.add_parser(
@@ -246,6 +347,8 @@ def main():
     normalize_p.add_argument(
         "resources", nargs="+", help="IDs of the resources to normalize"
     )
+    _add_jobs_arg(normalize_p)
+    _add_keep_going_arg(normalize_p)
     normalize_p.set_defaults(which="normalize")
     # PARTITION
     partition_p = subp.add_parser("partition", help="Breaks the resource taxon")
@@ -253,6 +356,14 @@ def main():
         "resources", nargs="+", help="IDs of the resources to partitition"
     )
     _add_level_arg(partition_p)
+    partition_p.add_argument(
+        "--single-pass",
+        action="store_true",
+        default=False,
+        help="read the normalized taxonomy once and write every level of the "
+        "partition (cannot be combined with --level)",
+    )
+    _add_jobs_arg(partition_p)
     partition_p.set_defaults(which="partition")
 
     # INFO
@@ -283,6 +394,7 @@ def main():
         "resources", nargs="*", help="IDs of the resources to separate"
     )
     _add_level_arg(enf_sep_p)
+    _add_jobs_arg(enf_sep_p)
     enf_sep_p.set_defaults(which="enforce-new-separators")
     # Align
     align_p = subp.add_parser(
@@ -333,6 +445,7 @@ def main():
         univ = frozenset(
             [
                 "--config",
+                "--profile",
             ]
         )
         sel_cmd = None
@@ -391,7 +504,7 @@ def main():
                 if sel_cmd == "status":
                     if "-i" not in a and "--ids-only" not in a:
                         comp_list.extend(["-i", "--ids-only"])
-                    for x in ["--by-status", "--terminal"]:
+                    for x in ["--by-status", "--terminal", "--verify"]:
                         if x not in a:
                             comp_list.extend([x])
                 elif sel_cmd == "partition":
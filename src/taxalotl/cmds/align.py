@@ -11,6 +11,7 @@ import logging
 from ..config import TaxalotlConfig
 from ..cmds.partitions import PART_NAMES
 from ..resource_wrapper import TaxonomyWrapper
+from ..tax_partition import TAX_SLICE_CACHE
 from ..taxonomic_ranks import SPECIES_SORTING_NUMBER
 from ..util import get_true_false_repsonse, VirtCommand
 
@@ -39,6 +40,7 @@ def align_resource(
     for part_name in level_list:
         with VirtCommand("align", res_id=res.id, level=part_name):
             align_for_level(taxalotl_config, ott_res, res, part_name)
+        TAX_SLICE_CACHE.evict_if_over_budget()
 
 
 def _register_name(tup_list, name_to_ott_id_list, leaf, name, ott_id):
@@ -48,15 +50,10 @@ def _register_name(tup_list, name_to_ott_id_list, leaf, name, ott_id):
 
 
 def _get_findable_names(leaf, tree, name_to_ott_id_list, nd_filter, include_synonyms):
-    if (
-        nd_filter == NodeFilter.SPECIES
-        and leaf.best_rank_sort_number != SPECIES_SORTING_NUMBER
-    ):
+    brsn = tree.best_rank_sort_number
+    if nd_filter == NodeFilter.SPECIES and brsn[leaf.id] != SPECIES_SORTING_NUMBER:
         return []
-    if (
-        leaf.best_rank_sort_number > SPECIES_SORTING_NUMBER
-        and nd_filter == NodeFilter.SP_OR_BELOW
-    ):
+    if brsn[leaf.id] > SPECIES_SORTING_NUMBER and nd_filter == NodeFilter.SP_OR_BELOW:
         return []
     if nd_filter == NodeFilter.TIP and leaf.children_refs:
         return []
@@ -66,12 +63,12 @@ def _get_findable_names(leaf, tree, name_to_ott_id_list, nd_filter, include_syno
         for syn in leaf.synonyms:
             _register_name(r, name_to_ott_id_list, leaf, syn.name, leaf.id)
     if nd_filter == NodeFilter.SP_OR_BELOW:
-        while leaf.best_rank_sort_number < SPECIES_SORTING_NUMBER:
+        while brsn[leaf.id] < SPECIES_SORTING_NUMBER:
             try:
                 leaf = tree.id_to_taxon[leaf.par_id]
             except:
                 break
-            if leaf.best_rank_sort_number <= SPECIES_SORTING_NUMBER:
+            if brsn[leaf.id] <= SPECIES_SORTING_NUMBER:
                 _register_name(r, name_to_ott_id_list, leaf, leaf.name, leaf.id)
                 if include_synonyms:
                     for syn in leaf.synonyms:
@@ -156,8 +153,7 @@ def align_trees_for_level(
     tree_l = non_incert_trees + incert_trees
     for tree in tree_l:
         attach_synonyms_and_find_strict_name_matches(res, tree, part_name, sp_ott_ls)
-        for nd in tree.postorder():
-            nd.match_status = None
+        tree.match_status.clear()
 
     _new_match_stat(
         tree_l, sp_ott_ls, MatchStatus.VALID_SP_OTT_VALID_SP, NodeFilter.SPECIES, False
@@ -208,10 +204,11 @@ def align_trees_for_level(
         True,
     )
     for tree in tree_l:
+        brsn, match_status = tree.best_rank_sort_number, tree.match_status
         for nd in tree.postorder():
             if (
-                nd.best_rank_sort_number <= SPECIES_SORTING_NUMBER
-                and nd.match_status is None
+                brsn[nd.id] <= SPECIES_SORTING_NUMBER
+                and match_status.get(nd.id) is None
             ):
                 print("Still unmatched: {}".format(str(nd)))
 
@@ -221,15 +218,17 @@ def _new_match_stat(tree_l, ott_lls, match_stat, nd_filter, check_synonyms):
         mark_found_unfound_name_matches(
             tree, ott_lls, nd_filter=nd_filter, check_synonyms=check_synonyms
         )
+        match_status = tree.match_status
         for nd in tree.postorder():
-            if nd.match_status is None and nd.matched_to_name is not None:
-                nd.match_status = match_stat
-                if nd.name != nd.matched_to_name:
+            matched_to_name = tree.matched_to_name[nd.id]
+            if match_status.get(nd.id) is None and matched_to_name is not None:
+                match_status[nd.id] = match_stat
+                if nd.name != matched_to_name:
                     m = '{} match for "{}" (valid = "{}")'
-                    print(m.format(match_stat.name, nd.matched_to_name, nd.name))
+                    print(m.format(match_stat.name, matched_to_name, nd.name))
                 else:
                     m = '{} match for "{}"'
-                    print(m.format(match_stat.name, nd.matched_to_name))
+                    print(m.format(match_stat.name, matched_to_name))
 
 
 class MatchStatus(IntFlag):
@@ -263,37 +262,41 @@ def attach_synonyms_and_find_strict_name_matches(res, tree, part_name, ott_lls):
 def mark_found_unfound_name_matches(
     tree, ott_lls, nd_filter=NodeFilter.TIP, check_synonyms=False
 ):
+    brsn = tree.best_rank_sort_number
+    all_found, all_unfound = tree.found_names, tree.unfound_names
     for nd in tree.postorder():
         if nd_filter == NodeFilter.TIP:
             do_name_check = not nd.children_refs
             do_des_union = not do_name_check
         elif nd_filter == NodeFilter.SPECIES:
-            do_name_check = nd.best_rank_sort_number == SPECIES_SORTING_NUMBER
-            do_des_union = nd.best_rank_sort_number > SPECIES_SORTING_NUMBER
+            do_name_check = brsn[nd.id] == SPECIES_SORTING_NUMBER
+            do_des_union = brsn[nd.id] > SPECIES_SORTING_NUMBER
         else:
             assert nd_filter == NodeFilter.SP_OR_BELOW
-            do_name_check = nd.best_rank_sort_number <= SPECIES_SORTING_NUMBER
+            do_name_check = brsn[nd.id] <= SPECIES_SORTING_NUMBER
             do_des_union = bool(nd.children_refs)
-        nd.found_names, nd.unfound_names = set(), set()
-        nd.matched_to_name = None
+        found_names, unfound_names = set(), set()
+        matched_to_name = None
         if do_name_check:
             if nd.name in ott_lls:
-                nd.found_names.add(nd.name)
-                nd.matched_to_name = nd.name
+                found_names.add(nd.name)
+                matched_to_name = nd.name
             else:
                 if check_synonyms:
                     for syn in nd.synonyms:
                         if syn.name in ott_lls:
-                            nd.found_names.add(syn.name)
-                            nd.matched_to_name = syn.name
+                            found_names.add(syn.name)
+                            matched_to_name = syn.name
                             break
-            if nd.matched_to_name is None:
-                nd.unfound_names.add(nd.name)
+            if matched_to_name is None:
+                unfound_names.add(nd.name)
         if do_des_union:
             if nd.children_refs:
                 for c in nd.children_refs:
-                    nd.found_names.update(c.found_names)
-                    nd.unfound_names.update(c.unfound_names)
+                    found_names.update(all_found[c.id])
+                    unfound_names.update(all_unfound[c.id])
+        all_found[nd.id], all_unfound[nd.id] = found_names, unfound_names
+        tree.matched_to_name[nd.id] = matched_to_name
 
 
 def separate_based_on_tip_overlap(
@@ -322,7 +325,8 @@ def separate_based_on_tip_overlap(
         attach_synonyms_and_find_strict_name_matches(
             res, slice_tree, higher_part_name, ott_lls
         )
-        root_found = slice_tree.root.found_names
+        found, unfound = slice_tree.found_names, slice_tree.unfound_names
+        root_found = found[slice_tree.root.id]
         pf = tot_leaves.intersection(root_found)
         if pf:
             m = "Leaves {} found in multiple trees for {} at {}"
@@ -337,12 +341,12 @@ def separate_based_on_tip_overlap(
         mainly_overlap = []
         if len(root_found) > 0:
             curr_node = slice_tree.root
-            curr_found_names = copy.copy(curr_node.found_names)
+            curr_found_names = copy.copy(found[curr_node.id])
             while True:
                 next_node = None
                 some_overlap = []
                 for c in curr_node.children_refs:
-                    if c.found_names == curr_found_names:
+                    if found[c.id] == curr_found_names:
                         _LOG.info(
                             "Moving tipward from {} to {}".format(
                                 curr_node.name, c.name
@@ -351,17 +355,15 @@ def separate_based_on_tip_overlap(
                         next_node = c
                         break
                     else:
-                        if c.found_names:
+                        if found[c.id]:
                             some_overlap.append(c)
-                            if not c.unfound_names:
+                            if not unfound[c.id]:
                                 only_overlap.append(c)
-                            elif len(c.found_names) > len(c.unfound_names):
+                            elif len(found[c.id]) > len(unfound[c.id]):
                                 mainly_overlap.append(c)
                             m = "  {} has {} relevant names and {} irrelevant"
                             _LOG.info(
-                                m.format(
-                                    c.name, len(c.found_names), len(c.unfound_names)
-                                )
+                                m.format(c.name, len(found[c.id]), len(unfound[c.id]))
                             )
                 if next_node:
                     curr_node = next_node
@@ -376,7 +378,7 @@ def separate_based_on_tip_overlap(
                 msg_list = ["Perform separation by"]
                 for node in to_move:
                     m = mtmplate.format(
-                        node.name, len(node.found_names), len(node.unfound_names)
+                        node.name, len(found[node.id]), len(unfound[node.id])
                     )
                     msg_list.append(m)
                 msg_list.append("?  Enter y to confirm:")
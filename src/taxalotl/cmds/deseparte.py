@@ -12,7 +12,7 @@ from ..tax_partition import (
     MISC_DIRNAME,
     OUTP_TAXONOMY_DIRNAME,
 )
-from ..util import OutFile, OutDir, get_frag_from_dir
+from ..util import OutFile, OutDir, get_frag_from_dir, open_input
 
 _LOG = logging.getLogger(__name__)
 
@@ -76,9 +76,9 @@ def _find_destination_fp(res_id, fn, dir1, dir2):
 
 def _move_all_but_first_line(inp_fp, dest_fp):
     _LOG.debug('Copying content from "{}"  to "{}"'.format(inp_fp, dest_fp))
-    seen_lines = open(dest_fp, "r", encoding="utf-8").readlines()
+    seen_lines = open_input(dest_fp).readlines()
     seen_lines = set(seen_lines)
-    with open(inp_fp, "r", encoding="utf-8") as inp:
+    with open_input(inp_fp) as inp:
         with OutFile(dest_fp, mode="a") as outp:
             for n, line in enumerate(inp):
                 if n == 0:
@@ -63,6 +63,8 @@ class VirtualTaxonomyToRootSlice(PartitionedTaxDirBase):
                 uf = os.path.split(self.fragment)[0]
                 mu = get_virtual_tax_to_root_slice(res, fragment=uf)
                 self.misc_uncle = mu
+            # released by _flush
+            TAX_SLICE_CACHE.pin(self.misc_uncle.cache_key)
 
     def get_vttrs_for_fragment(self, fragment):
         ck = (VirtualTaxonomyToRootSlice, self.src_id, fragment)
@@ -72,6 +74,7 @@ class VirtualTaxonomyToRootSlice(PartitionedTaxDirBase):
     def taxon_partition(self):
         if self._taxon_partition is None:
             tp = get_taxon_partition(self.res, self.fragment)
+            TAX_SLICE_CACHE.pin(tp.cache_key)
             self._taxon_partition = tp
         return self._taxon_partition
 
@@ -127,6 +130,8 @@ class VirtualTaxonomyToRootSlice(PartitionedTaxDirBase):
             tp = self._taxon_partition
             self._taxon_partition = None
             TAX_SLICE_CACHE.try_del((tp.__class__, self.src_id, tp.fragment))
+        if self.misc_uncle is not None:
+            TAX_SLICE_CACHE.unpin(self.misc_uncle.cache_key)
         self._has_flushed = True
 
     def remove_self_from_cache(self):
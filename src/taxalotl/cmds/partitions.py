@@ -7,13 +7,17 @@ import logging
 
 from peyutil import read_as_json
 
+from ..manifest import StageManifest, hash_files_below, hash_json, read_manifest
 from ..tax_partition import (
+    ACCUM_DES_FILENAME,
     INP_TAXONOMY_DIRNAME,
     MISC_DIRNAME,
     GEN_MAPPING_FILENAME,
+    get_roots_for_subset,
     get_taxon_partition,
     use_tax_partitions,
 )
+from ..util import find_input_file
 
 _LOG = logging.getLogger(__name__)
 _LIFE = "Life"
@@ -199,6 +203,43 @@ def has_any_partition_dirs(path_pref, res_id):
     return False
 
 
+def _separated_res_ids(sep_filepath):
+    """IDs of the resources with taxa in the dirs of the separators in the
+    __sep__.json file at sep_filepath."""
+    from .dynamic_partitioning import _escape_odd_char
+
+    res_ids = set()
+    dirname = os.path.dirname(sep_filepath)
+    for sep in read_as_json(sep_filepath).values():
+        sep_dir = os.path.join(dirname, _escape_odd_char(sep["uniqname"]))
+        inp_dir = os.path.join(sep_dir, INP_TAXONOMY_DIRNAME)
+        if os.path.isdir(inp_dir):
+            res_ids.update(os.listdir(inp_dir))
+    return res_ids
+
+
+def find_partitioned_res_ids(path_pref, separated_ids=None):
+    """Returns the set of IDs for which has_any_partition_dirs(path_pref, ID) is
+    True, in one walk of path_pref.
+
+    If a set `separated_ids` is given, the IDs of the resources that have taxa in
+    the directory of a separator (listed in a __sep__.json file) are added to it.
+    """
+    from ..commands import NEW_SEP_FILENAME
+
+    res_ids = set()
+    if not os.path.isdir(path_pref):
+        return res_ids
+    for dirname, subdirs, filenames in os.walk(path_pref):
+        # a __misc__/__inputs__/ID dir is found as an __inputs__ dir below __misc__
+        if dirname != path_pref and INP_TAXONOMY_DIRNAME in subdirs:
+            res_ids.update(os.listdir(os.path.join(dirname, INP_TAXONOMY_DIRNAME)))
+        if separated_ids is not None and NEW_SEP_FILENAME in filenames:
+            sep_fp = os.path.join(dirname, NEW_SEP_FILENAME)
+            separated_ids.update(_separated_res_ids(sep_fp))
+    return res_ids
+
+
 def find_partition_dirs_for_taxonomy(path_pref, res_id):
     return [i for i in iter_existing_tax_dirs(path_pref, res_id)]
 
@@ -281,12 +322,144 @@ def do_partition(res, part_name_to_split):
         return
     tp = get_taxon_partition(res, fragment)
     if not par_frag:
-        tp.external_input_fp = os.path.join(
-            res.partition_source_dir, res.taxon_filename
+        tp.external_input_fp = find_input_file(
+            os.path.join(res.partition_source_dir, res.taxon_filename)
         )
     tp.do_partition(mapping)
 
 
+def get_expected_partition_manifests(res):
+    """Returns a dict of part name -> StageManifest (without outputs) for the
+    inputs that splitting each level of `res` would use now.
+
+    The Life level reads the normalized files. Every other level reads files
+    written by the split of its parent level, so it records the digest of the
+    parent's manifest rather than hashes of files.
+    """
+    master_map = res.get_primary_partition_map()
+    norm_records = res.get_normalized_file_records()
+    expected = {}
+    for part_name in PREORDER_PART_LIST:
+        part_keys = NAME_TO_PARTS_SUBSETS[part_name]
+        mapping = [(k, master_map[k]) for k in part_keys if k in master_map]
+        used = {
+            "fragment": PART_NAME_TO_FRAGMENT[part_name],
+            "partition_map": hash_json(mapping),
+        }
+        par_name = get_parent_part_name(part_name)
+        if par_name is None:
+            inputs = copy.deepcopy(norm_records)
+            expected[part_name] = StageManifest("partition", inputs=inputs, used=used)
+        else:
+            used["parent"] = expected[par_name].digest
+            expected[part_name] = StageManifest("partition", used=used)
+    return expected
+
+
+def write_partition_manifest(res, part_name, expected=None):
+    """Records the hashes of the files written by splitting `part_name` for
+    `res` in the __misc__ dir of the level.
+
+    Returns the manifest or None (writing nothing) if the split wrote no files.
+    The outputs are only a record; splitting the next level consumes some of them.
+    """
+    if expected is None:
+        expected = get_expected_partition_manifests(res)[part_name]
+    fragment = PART_NAME_TO_FRAGMENT[part_name]
+    out_dirs = [res.get_misc_taxon_dir_for_part(fragment)]
+    for subname in NAME_TO_PARTS_SUBSETS[part_name]:
+        d = res.get_taxon_dir_for_part(os.path.join(fragment, subname))
+        if d not in out_dirs:
+            out_dirs.append(d)
+    pd = res.partitioned_filepath
+    outputs = {}
+    for d in out_dirs:
+        for rel, rec in hash_files_below(d).items():
+            outputs[os.path.relpath(os.path.join(d, rel), pd)] = rec
+    if not outputs:
+        return None
+    expected.outputs = outputs
+    expected.write(out_dirs[0])
+    return expected
+
+
+def remove_stale_partitions(res):
+    """Returns the set of names of the levels that have been split for `res`
+    from its current inputs, so that they do not need to be split again.
+
+    A split consumes the input that it read, so a level that is out of date
+    can not be split again in place. If any level is out of date, all of the
+    partition artifacts of `res` are removed and an empty set is returned.
+    Levels split before manifests were written are assumed to be up to date.
+    """
+    if not res.has_been_partitioned():
+        return set()
+    up_to_date, stale = set(), []
+    for part_name, em in get_expected_partition_manifests(res).items():
+        fragment = PART_NAME_TO_FRAGMENT[part_name]
+        m = read_manifest(res.get_misc_taxon_dir_for_part(fragment))
+        if m is not None:
+            if m.digest == em.digest:
+                up_to_date.add(part_name)
+            else:
+                stale.append(part_name)
+        elif res.has_been_partitioned_for_fragment(fragment):
+            msg = "No manifest for the {} partition of {}. Recording its files..."
+            _LOG.info(msg.format(part_name, res.id))
+            if write_partition_manifest(res, part_name, em) is not None:
+                up_to_date.add(part_name)
+    if stale:
+        msg = "Inputs of the {} partition(s) of {} have changed. Removing them..."
+        _LOG.info(msg.format(", ".join(stale), res.id))
+        res.remove_partition_artifacts()
+        res.config.state_db.forget(res.id, "partitioned", "separated")
+        return set()
+    return up_to_date
+
+
+def get_parent_part_name(part_name):
+    """Returns the name of the level that is split to create `part_name` (or None)."""
+    par_frag = NAME_TO_PARENT_FRAGMENT[part_name]
+    return os.path.split(par_frag)[-1] if par_frag else None
+
+
+def validate_partition_output(res, part_name_to_split):
+    """Checks that each taxon in the __accum_des__.json written by splitting
+    `part_name_to_split` is a root (in __roots__.json) of the subdir that it was moved to.
+
+    Raises a RuntimeError listing the problems.
+    """
+    fragment = PART_NAME_TO_FRAGMENT[part_name_to_split]
+    des_fp = os.path.join(res.get_misc_taxon_dir_for_part(fragment), ACCUM_DES_FILENAME)
+    if not os.path.exists(des_fp):
+        return
+    errs = []
+    frag_to_roots = {}
+    for uid, d in read_as_json(des_fp).items():
+        dest = d.get("fragment")
+        if dest is None:
+            continue
+        if os.path.split(dest)[0] != fragment:
+            m = "{} moved from {} to {} which is not a subdir"
+            errs.append(m.format(uid, fragment, dest))
+            continue
+        roots = frag_to_roots.get(dest)
+        if roots is None:
+            roots = get_roots_for_subset(
+                res.get_taxon_dir_for_part(dest), res.get_misc_taxon_dir_for_part(dest)
+            )
+            frag_to_roots[dest] = roots
+        try:
+            uid = int(uid)
+        except:
+            pass
+        if uid not in roots:
+            errs.append("{} moved to {} but not in its roots".format(uid, dest))
+    if errs:
+        m = "Partition of {} for {} has {} error(s): {}"
+        raise RuntimeError(m.format(fragment, res.id, len(errs), "\n".join(errs)))
+
+
 def check_partition(res, part_name_to_split):
     par_frag = NAME_TO_PARENT_FRAGMENT[part_name_to_split]
     part_keys = NAME_TO_PARTS_SUBSETS[part_name_to_split]
@@ -308,8 +481,8 @@ def check_partition(res, part_name_to_split):
             get_taxon_partition(res, os.path.join(fragment, k)) for k in pop_subdirs
         ]
         unpart = get_taxon_partition(res, _LIFE)
-        unpart.external_input_fp = os.path.join(
-            res.partition_source_dir, res.taxon_filename
+        unpart.external_input_fp = find_input_file(
+            os.path.join(res.partition_source_dir, res.taxon_filename)
         )
         check_partition_union(fragment, misc, subs, unpart)
 
@@ -7,6 +7,7 @@ import logging
 
 from peyutil import write_as_json
 
+from ..profiling import StageTimer
 from ..util import OutFile, OutDir
 from ..taxonomic_ranks import (
     ABOVE_GENUS_SORTING_NUMBER,
@@ -242,10 +243,12 @@ def semanticize_names(tax_con_sem_node, name, name_dict, node=None):
 def semanticize_and_serialize_tax_part(
     taxolotl_config, res, fragment, out_dir, tax_part, tax_forest
 ):
-    sem_graph = semanticize_tax_part(
-        taxolotl_config, res, fragment, tax_part, tax_forest
-    )
-    serialize_sem_graph(taxolotl_config, sem_graph, out_dir)
+    with StageTimer("semanticize"):
+        sem_graph = semanticize_tax_part(
+            taxolotl_config, res, fragment, tax_part, tax_forest
+        )
+    with StageTimer("serialize"):
+        serialize_sem_graph(taxolotl_config, sem_graph, out_dir)
     return sem_graph
 
 
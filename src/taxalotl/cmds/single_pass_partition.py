@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""Partitions a resource into every level of BASE_PARTITIONS_DICT in one pass.
+
+`do_partition` splits one level at a time, so each level reads its parent's
+taxonomy file and rewrites the remainder. `partition_in_one_pass` reads the
+normalized taxonomy once, sends each taxon to the deepest fragment that it
+belongs to (using the resource's partition map), and then writes all of the
+__inputs__, __misc__, __roots__.json and __accum_des__.json files.
+
+The files written hold the same records as the level-by-level loop
+(including the synonyms.tsv that the loop leaves in the __inputs__ dir of a
+partitioned fragment). Lines are written in the order of the normalized file
+rather than in the order that the loop happens to move the taxa.
+
+Where a root of one fragment is nested inside the subtree of a root of a sibling
+fragment, the loop's result depends on the order in which it moves the siblings.
+partition_in_one_pass finds such roots while it assigns the taxa, and then
+returns False (before writing anything) so that the level loop is used.
+"""
+from __future__ import print_function
+
+import logging
+import os
+from contextlib import ExitStack
+
+from peyutil import assure_dir_exists
+
+from ..ott_schema import HEADER_TO_LINE_PARSER, partition_ott_by_root_id
+from ..tax_partition import (
+    ACCUM_DES_FILENAME,
+    ROOTS_FILENAME,
+    get_write_taxon_header,
+    write_taxon_json,
+)
+from ..taxon import Taxon
+from ..util import AtomicOutFile, find_input_file
+from .partitions import BASE_PARTITIONS_DICT, NAME_TO_PARTS_SUBSETS, _LIFE
+
+_LOG = logging.getLogger(__name__)
+
+
+class _FragPlan(object):
+    """Where the taxa of one fragment go, and what was routed through it."""
+
+    def __init__(self, res, fragment, parent):
+        self.fragment = fragment
+        self.parent = parent
+        self.root_to_child = {}
+        # True if the level loop would split this fragment into subdirs + __misc__
+        self.is_partitioned = False
+        self.root_ids = []  # taxa that entered this fragment as roots
+        self.des_moved = []  # (uid, child plan) for the roots moved to a child
+        self.num_taxa = 0
+        self.tax_dir = res.get_taxon_dir_for_part(fragment)
+        self.misc_tax_dir = res.get_misc_taxon_dir_for_part(fragment)
+        # roots of the fragments that are siblings of self or of an ancestor
+        self.uncle_roots = set()
+
+    def find_uncle_roots(self):
+        child, anc = self, self.parent
+        while anc is not None:
+            for uid, c in anc.root_to_child.items():
+                if c is not child:
+                    self.uncle_roots.add(uid)
+            child, anc = anc, anc.parent
+
+    def descend(self, uid):
+        """Returns the plan for `uid` given that its parent is held by self."""
+        cur = self
+        while cur.is_partitioned:
+            child = cur.root_to_child.get(uid)
+            if child is None:
+                break
+            cur.des_moved.append((uid, child))
+            child.root_ids.append(uid)
+            cur = child
+        return cur
+
+    @property
+    def holding_tax_dir(self):
+        """Directory of the taxonomy file for the taxa that stop at this fragment."""
+        return self.misc_tax_dir if self.is_partitioned else self.tax_dir
+
+
+def _build_plans(res, name, subd, parent, master_map, plans):
+    fragment = os.path.join(parent.fragment, name) if parent else name
+    plan = _FragPlan(res, fragment, parent)
+    plans.append(plan)
+    if not subd:
+        return plan
+    part_keys = NAME_TO_PARTS_SUBSETS[name]
+    mapping = [(k, master_map[k]) for k in part_keys if k in master_map]
+    if not mapping:
+        return plan
+    plan.is_partitioned = True
+    for subname, subroots in mapping:
+        child = _build_plans(res, subname, subd[subname], plan, master_map, plans)
+        for r in subroots:
+            plan.root_to_child[r] = child
+    return plan
+
+
+class _OnePassReader(object):
+    """Collects the taxa and synonyms of the normalized taxonomy.
+
+    Has the attributes and methods that partition_ott_by_root_id uses, and mirrors
+    the checks of PartitioningLightTaxHolder.read_taxon_line.
+    """
+
+    def __init__(self, tax_fp, synonyms_fp, treat_syn_as_taxa):
+        self.tax_fp = tax_fp
+        self.input_synonyms_filepath = synonyms_fp
+        self.treat_syn_as_taxa = treat_syn_as_taxa
+        self.taxon_header = ""
+        self.syn_header = ""
+        self.uid_order = []
+        self.id_to_line = {}
+        self.id_to_par = {}
+        self.syn_pairs = []
+
+    def read_taxon_line(self, uid, par_id, line):
+        if par_id:
+            try:
+                par_id = int(par_id)
+            except:
+                pass
+        if uid in self.id_to_line:
+            raise ValueError("Repeated uid {} in line {}".format(uid, line))
+        self.id_to_line[uid] = line
+        self.id_to_par[uid] = par_id
+        self.uid_order.append(uid)
+
+    def add_synonym(self, accept_id, syn_id, line):
+        if self.treat_syn_as_taxa:
+            assert syn_id is not None
+            self.read_taxon_line(syn_id, None, line)
+        else:
+            self.syn_pairs.append((accept_id, line))
+
+
+class _NestedRootsError(ValueError):
+    pass
+
+
+def _assign_taxa(reader, life_plan):
+    """Returns a dict of uid -> _FragPlan holding that taxon.
+
+    Raises _NestedRootsError if the root of a fragment is held by a fragment that
+    is not its ancestor (because it is in the subtree of a root of a sibling).
+    """
+    id_to_par = reader.id_to_par
+    plan_of = {}
+    for uid in reader.uid_order:
+        chain = []
+        cur = uid
+        base = life_plan
+        while True:
+            if cur in plan_of:
+                base = plan_of[cur]
+                break
+            chain.append(cur)
+            if len(chain) > len(id_to_par):
+                raise ValueError("Cycle in the parent IDs at uid {}".format(uid))
+            par_id = id_to_par[cur]
+            if par_id is None or par_id == "" or par_id not in id_to_par:
+                break
+            cur = par_id
+        for el in reversed(chain):
+            base = base.descend(el)
+            if el in base.uncle_roots:
+                m = "Root {} is in the subtree of a root of a sibling of its fragment"
+                raise _NestedRootsError(m.format(el))
+            plan_of[el] = base
+    return plan_of
+
+
+def partition_in_one_pass(res):
+    """Writes all of the partition files of `res` from its normalized taxonomy.
+
+    Returns False (having done nothing) if the one-pass mode does not apply:
+    if some of the partitions already exist, the resource has its own parser, or
+    the roots of sibling fragments are nested (see the module docstring).
+    """
+    if res.partition_parsing_fn is not partition_ott_by_root_id:
+        _LOG.info("{} uses its own partition parser".format(res.id))
+        return False
+    if res.has_been_partitioned():
+        _LOG.info("{} has already been (partly) partitioned".format(res.id))
+        return False
+    master_map = res.get_primary_partition_map()
+    plans = []
+    life_plan = _build_plans(
+        res, _LIFE, BASE_PARTITIONS_DICT[_LIFE], None, master_map, plans
+    )
+    if not life_plan.is_partitioned:
+        _LOG.info("No {} mapping for {}".format(res.id, _LIFE))
+        return True
+    for plan in plans:
+        plan.find_uncle_roots()
+    src_dir = res.partition_source_dir
+    syn_fp = None
+    if res.synonyms_filename:
+        syn_fp = find_input_file(os.path.join(src_dir, res.synonyms_filename))
+    reader = _OnePassReader(
+        find_input_file(os.path.join(src_dir, res.taxon_filename)),
+        syn_fp,
+        res.synonyms_filename is None,
+    )
+    _LOG.info('reading "{}" for a one-pass partition'.format(reader.tax_fp))
+    partition_ott_by_root_id(reader)
+    try:
+        plan_of = _assign_taxa(reader, life_plan)
+    except _NestedRootsError as x:
+        m = "{} for {}. It will be partitioned level by level."
+        _LOG.info(m.format(x, res.id))
+        return False
+    _write_taxa(res, reader, plan_of)
+    _write_synonyms(res, reader, plan_of, life_plan)
+    _write_roots_and_des(res, reader, plans, life_plan)
+    return True
+
+
+def _write_taxa(res, reader, plan_of):
+    header = get_write_taxon_header(res)
+    with ExitStack() as stack:
+        plan_to_out = {}
+        for uid in reader.uid_order:
+            plan = plan_of[uid]
+            out = plan_to_out.get(plan)
+            if out is None:
+                d = plan.holding_tax_dir
+                assure_dir_exists(d)
+                fp = os.path.join(d, res.taxon_filename)
+                out = stack.enter_context(AtomicOutFile(fp))
+                out.write(header)
+                plan_to_out[plan] = out
+            plan.num_taxa += 1
+            out.write(reader.id_to_line[uid])
+        for plan in plan_to_out.keys():
+            m = 'Wrote {} tax records to "{}"'
+            _LOG.info(m.format(plan.num_taxa, plan.holding_tax_dir))
+
+
+def _write_synonyms(res, reader, plan_of, life_plan):
+    """Writes each synonym to the __inputs__ dir of every fragment that its
+    accepted taxon passed through.
+
+    As in the level loop, nothing is written for the synonyms left in the
+    __misc__ part of a level (or that have no accepted taxon).
+    """
+    if not res.synonyms_filename or not reader.syn_pairs:
+        return
+    uid_to_pos = {uid: n for n, uid in enumerate(reader.uid_order)}
+    # in the order of the taxa, as _write_syn_d_as_tsv does
+    held = [p for p in reader.syn_pairs if p[0] in plan_of]
+    held.sort(key=lambda p: uid_to_pos[p[0]])
+    with ExitStack() as stack:
+        plan_to_out = {}
+        for accept_id, line in held:
+            plan = plan_of[accept_id]
+            while plan is not life_plan:
+                out = plan_to_out.get(plan)
+                if out is None:
+                    assure_dir_exists(plan.tax_dir)
+                    fp = os.path.join(plan.tax_dir, res.synonyms_filename)
+                    out = stack.enter_context(AtomicOutFile(fp))
+                    out.write(reader.syn_header)
+                    plan_to_out[plan] = out
+                out.write(line)
+                plan = plan.parent
+
+
+def _write_roots_and_des(res, reader, plans, life_plan):
+    inp_parser = HEADER_TO_LINE_PARSER[reader.taxon_header]
+    part_parser = HEADER_TO_LINE_PARSER[get_write_taxon_header(res)]
+
+    def _as_dict(uid, plan):
+        # levels below Life read lines back from the files written above.
+        lp = inp_parser if plan is life_plan else part_parser
+        return Taxon(reader.id_to_line[uid], line_parser=lp).to_serializable_dict()
+
+    for plan in plans:
+        roots = {}
+        if plan.root_ids:
+            for uid in plan.root_ids:
+                roots[uid] = _as_dict(uid, plan.parent)
+            write_taxon_json(roots, os.path.join(plan.tax_dir, ROOTS_FILENAME))
+        if not plan.is_partitioned:
+            continue
+        if roots:
+            write_taxon_json(roots, os.path.join(plan.misc_tax_dir, ROOTS_FILENAME))
+        if plan.des_moved:
+            des = {}
+            for uid, child in plan.des_moved:
+                d = _as_dict(uid, plan)
+                d["fragment"] = child.fragment
+                des[uid] = d
+            fp = os.path.join(plan.misc_tax_dir, ACCUM_DES_FILENAME)
+            write_taxon_json(des, fp)
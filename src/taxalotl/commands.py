@@ -16,17 +16,23 @@ from .cmds.deseparte import deseparate_taxonomies_in_dir
 from .cmds.partitions import (
     do_partition,
     GEN_MAPPING_FILENAME,
+    get_expected_partition_manifests,
+    get_parent_part_name,
     get_part_dir_from_part_name,
     NAME_TO_PARTS_SUBSETS,
     PART_NAMES,
     PREORDER_PART_LIST,
+    remove_stale_partitions,
     TERMINAL_PART_NAMES,
+    validate_partition_output,
     write_info_for_res,
+    write_partition_manifest,
 )
 from .tax_partition import (
     get_taxonomies_for_dir,
     INP_TAXONOMY_DIRNAME,
     MISC_DIRNAME,
+    TAX_SLICE_CACHE,
     use_tax_partitions,
 )
 from .cmds.dynamic_partitioning import (
@@ -36,6 +42,11 @@ from .cmds.dynamic_partitioning import (
 
 # from .cmds.analyze_update import analyze_update_to_resources
 from .cmds.align import align_resource
+from .cmds.single_pass_partition import partition_in_one_pass
+from .download import fetch_resources
+from .jobs import Job, run_jobs
+from .profiling import StageTimer, get_profile_log, write_profile_report
+from .state_db import forget_missing_stages, rebuild_state_db
 from .util import unlink, VirtCommand, OutFile
 import logging
 
@@ -66,7 +77,11 @@ def align(taxalotl_config, id_list, level_list):
 #     analyze_update_to_resources(taxalotl_config, earlier, later, level_list)
 
 
-def download_resources(taxalotl_config, id_list):
+def download_resources(taxalotl_config, id_list, jobs=1, keep_going=False):
+    """Asks for the approval of each resource's license and then downloads the
+    approved resources, up to `jobs` files at a time (see fetch_resources for
+    `keep_going`)."""
+    to_fetch = []
     for rid in id_list:
         rw = taxalotl_config.get_terminalized_res_by_id(rid, "download")
         lic_urls, lic_tou = taxalotl_config.get_known_license_info(rw)
@@ -100,11 +115,19 @@ def download_resources(taxalotl_config, id_list):
             if rw.has_been_downloaded():
                 m = "{} was already present at {}"
                 _LOG.info(m.format(rw.id, rw.download_filepath))
-            else:
-                rw.download()
+                taxalotl_config.state_db.record(rw.id, "downloaded")
+            elif rw not in to_fetch:
+                to_fetch.append(rw)
+    if to_fetch:
+        try:
+            fetch_resources(to_fetch, num_workers=jobs, keep_going=keep_going)
+        finally:
+            for rw in to_fetch:
+                if rw.has_been_downloaded():
+                    taxalotl_config.state_db.record(rw.id, "downloaded")
 
 
-def _group_by_status(res, id_list):
+def _group_by_status(res, id_list, stages_by_res):
     nd_list = []
     dnu_list = []
     unn_list = []
@@ -113,15 +136,16 @@ def _group_by_status(res, id_list):
     p_list = []
     for i in id_list:
         r = res[i]
+        stages = stages_by_res.get(r.id, ())
         if r.is_abstract:
             a_list.append(i)
-        elif r.has_been_partitioned():
+        elif "partitioned" in stages:
             p_list.append(i)
-        elif r.has_been_normalized():
+        elif "normalized" in stages:
             n_list.append(i)
-        elif r.has_been_unpacked():
+        elif "unpacked" in stages:
             unn_list.append(i)
-        elif r.has_been_downloaded():
+        elif "downloaded" in stages:
             dnu_list.append(i)
         else:
             nd_list.append(i)
@@ -150,8 +174,24 @@ You probably need to run the pull-otifacts command. If that does NOT solve the p
 
 
 def status_of_resources(
-    taxalotl_config, id_list, ids_only=False, by_status=False, terminal_only=False
+    taxalotl_config,
+    id_list,
+    ids_only=False,
+    by_status=False,
+    terminal_only=False,
+    verify=False,
 ):
+    """Reports the status of the resources, as recorded in the state DB.
+
+    With `verify` (or if there is no state DB yet) the DB is first rebuilt from
+    the files of all of the resources. Otherwise, the recorded stages whose files
+    are gone are forgotten (see forget_missing_stages).
+    """
+    sdb = taxalotl_config.state_db
+    if verify or not sdb.has_been_built():
+        stages_by_res = rebuild_state_db(taxalotl_config)
+    else:
+        stages_by_res = forget_missing_stages(taxalotl_config, sdb.stages_by_res())
     terminalize = True
     if not id_list:
         id_list = get_list_of_all_resources(taxalotl_config)
@@ -167,7 +207,7 @@ def status_of_resources(
         id_list = x
     res = taxalotl_config.resources_mgr.resources
     if by_status:
-        t_and_id_list = _group_by_status(res, id_list)
+        t_and_id_list = _group_by_status(res, id_list, stages_by_res)
     else:
         t_and_id_list = [["", id_list]]
     # correct a wart in which "ott" is separated from its version numbers by "ott-id-list"
@@ -203,50 +243,136 @@ def status_of_resources(
             if terminalize:
                 ntrw = taxalotl_config.get_resource_by_id(rid)
                 if ntrw.id not in written:
-                    ntrw.write_status(out_stream, indent="")
+                    st = stages_by_res.get(ntrw.id, set())
+                    ntrw.write_status(out_stream, indent="", stages=st)
                 written.add(ntrw.id)
                 trw = taxalotl_config.get_terminalized_res_by_id(rid, "")
                 if trw is not ntrw and trw.id not in written:
-                    trw.write_status(out_stream, indent="  ")
+                    st = stages_by_res.get(trw.id, set())
+                    trw.write_status(out_stream, indent="  ", stages=st)
                     written.add(trw.id)
             else:
                 rw = taxalotl_config.get_resource_by_id(rid)
                 indent = "  " if rw.base_id in par_id_set else ""
                 # out_stream.write('\n\nrid={}\n'.format(rid))
                 if rw.id not in written:
-                    rw.write_status(out_stream, indent=indent)
+                    st = stages_by_res.get(rw.id, set())
+                    rw.write_status(out_stream, indent=indent, stages=st)
                     written.add(rw.id)
                 if rw.is_abstract:
                     par_id_set.add(rw.id)
 
 
-def unpack_resources(taxalotl_config, id_list):
-    for rid in id_list:
-        rw = taxalotl_config.get_terminalized_res_by_id(rid, "unpack")
-        if not rw.has_been_downloaded():
-            m = "{} will be downloaded first..."
-            _LOG.info(m.format(rw.id))
-            download_resources(taxalotl_config, [rw.id])
-        if rw.has_been_unpacked():
-            m = "{} was already present at {}"
-            _LOG.info(m.format(rw.id, rw.unpacked_filepath))
-        else:
+def _unpack_resource(taxalotl_config, rid):
+    rw = taxalotl_config.get_terminalized_res_by_id(rid, "unpack")
+    if rw.has_been_unpacked():
+        m = "{} was already present at {}"
+        _LOG.info(m.format(rw.id, rw.unpacked_filepath))
+    else:
+        with StageTimer("unpack"):
             rw.unpack()
+    taxalotl_config.state_db.record(rw.id, "unpacked")
 
 
-def normalize_resources(taxalotl_config, id_list):
+def _normalize_resource(taxalotl_config, rid):
+    with VirtCommand(name="normalize", res_id=rid):
+        rw = taxalotl_config.get_terminalized_res_by_id(rid, "normalize")
+        sdb = taxalotl_config.state_db
+        if rw.normalization_is_up_to_date():
+            m = "{} was already normalized at {}"
+            _LOG.info(m.format(rw.id, rw.normalized_filedir))
+            sdb.record(rw.id, "normalized")
+            return
+        if rw.has_been_normalized():
+            m = "{} has changed since it was normalized. Normalizing again..."
+            _LOG.info(m.format(rw.id))
+            sdb.forget(rw.id, "normalized")
+            rw.remove_normalize_artifacts()
+        with StageTimer("normalize"):
+            rw.normalize()
+        rw.write_normalize_manifest()
+        sdb.record(rw.id, "normalized")
+
+
+def _declared_dependencies(taxalotl_config, rw):
+    """Terminalized resources in the depends_on of rw or of a resource it inherits
+    from."""
+    deps = []
+    for anc in taxalotl_config.get_all_ancs(rw):
+        for dep_id in anc.depends_on or []:
+            dep = taxalotl_config.get_terminalized_res_by_id(dep_id)
+            if dep.id != rw.id and dep not in deps:
+                deps.append(dep)
+    return deps
+
+
+def _resource_jobs(taxalotl_config, id_list, stage):
+    """Returns the Jobs that unpack (stage="unpack") or normalize the resources in
+    id_list, and the IDs of the resources that have to be downloaded first.
+
+    A normalize job depends on the unpack job of its resource (unless normalize
+    reads the archive) and on the job that prepares each of its declared
+    dependencies (see ResourceWrapper.dependency_stage); those jobs are added too.
+    """
+    job_list, to_download = [], []
+    keys = set()
+
+    def _add(rid, stage):
+        rw = taxalotl_config.get_terminalized_res_by_id(rid, stage)
+        key = (stage, rw.id)
+        if key in keys:
+            return key
+        keys.add(key)
+        deps = []
+        if stage == "normalize":
+            for dep in _declared_dependencies(taxalotl_config, rw):
+                deps.append(_add(dep.id, dep.dependency_stage))
+            if not rw.reads_archive_members():
+                deps.append(_add(rw.id, "unpack"))
+            elif not rw.has_been_downloaded():
+                to_download.append(rw.id)
+            func = _normalize_resource
+        else:
+            if not rw.has_been_unpacked() and not rw.has_been_downloaded():
+                to_download.append(rw.id)
+            func = _unpack_resource
+        job_list.append(Job(key, func, (taxalotl_config, rw.id), deps))
+        return key
+
     for rid in id_list:
-        with VirtCommand(name="analyze-update", res_id=rid):
-            rw = taxalotl_config.get_terminalized_res_by_id(rid, "normalize")
-            if not rw.has_been_unpacked():
-                m = "{} will be unpacked first..."
-                _LOG.info(m.format(rw.id))
-                unpack_resources(taxalotl_config, [rw.id])
-            if rw.has_been_normalized():
-                m = "{} was already normalized at {}"
-                _LOG.info(m.format(rw.id, rw.normalized_filedir))
-            else:
-                rw.normalize()
+        _add(rid, stage)
+    return job_list, to_download
+
+
+def _run_resource_jobs(taxalotl_config, id_list, stage, jobs, keep_going):
+    job_list, to_download = _resource_jobs(taxalotl_config, id_list, stage)
+    if to_download:
+        m = "{} will be downloaded first..."
+        _LOG.info(m.format(", ".join(to_download)))
+        download_resources(
+            taxalotl_config, to_download, jobs=jobs, keep_going=keep_going
+        )
+    run_jobs(job_list, num_workers=jobs, keep_going=keep_going)
+
+
+def unpack_resources(taxalotl_config, id_list, jobs=1, keep_going=False):
+    """Unpacks the resources (downloading them first if necessary), up to `jobs`
+    at a time in worker processes."""
+    _run_resource_jobs(taxalotl_config, id_list, "unpack", jobs, keep_going)
+
+
+def normalize_resources(taxalotl_config, id_list, jobs=1, keep_going=False):
+    """Normalizes the resources, and the resources that they depend on.
+
+    Each resource is unpacked (or downloaded) first if necessary. With jobs > 1,
+    up to `jobs` resources are unpacked or normalized at a time in worker
+    processes, each as soon as the jobs that it depends on have finished.
+
+    The first failure stops the work (once the running jobs finish) and its
+    exception is raised. With keep_going, the resources that do not depend on a
+    failed one are still normalized, and the first exception is raised at the end.
+    """
+    _run_resource_jobs(taxalotl_config, id_list, "normalize", jobs, keep_going)
 
 
 def _iter_norm_term_res_internal_level_pairs(
@@ -282,13 +408,96 @@ def info_on_resources(taxalotl_config, id_list, level_list):
         write_info_for_res(out_stream, res, part_name_to_split)
 
 
-def partition_resources(taxalotl_config, id_list, level_list):
+def partition_resources(
+    taxalotl_config, id_list, level_list, single_pass=False, jobs=1
+):
+    if single_pass:
+        if level_list != [None]:
+            raise RuntimeError("--single-pass can not be used with --level")
+        id_list = [
+            rid
+            for rid in id_list
+            if not _partition_resource_in_one_pass(taxalotl_config, rid)
+        ]
+    if jobs > 1:
+        _partition_resources_in_parallel(taxalotl_config, id_list, level_list, jobs)
+        return
+    id_to_up_to_date = {}
     for res, part_name_to_split in _iter_norm_term_res_internal_level_pairs(
         taxalotl_config, id_list, level_list, "partition"
     ):
-        with VirtCommand("partition", res_id=res.id, level=part_name_to_split):
-            with use_tax_partitions():
+        up_to_date = id_to_up_to_date.get(res.id)
+        if up_to_date is None:
+            up_to_date = remove_stale_partitions(res)
+            id_to_up_to_date[res.id] = up_to_date
+        _partition_level(taxalotl_config, res.id, part_name_to_split, up_to_date)
+
+
+def _partition_level(taxalotl_config, res_id, part_name_to_split, up_to_date=()):
+    """Splits one level of a resource, unless it is in `up_to_date` (the levels
+    that remove_stale_partitions found to be current).
+    """
+    res = taxalotl_config.get_terminalized_res_by_id(res_id, "partition")
+    if part_name_to_split in up_to_date:
+        m = "Partition of {} for {} is up to date."
+        _LOG.info(m.format(part_name_to_split, res.id))
+        taxalotl_config.state_db.record(res.id, "partitioned")
+        return
+    with VirtCommand("partition", res_id=res.id, level=part_name_to_split):
+        with use_tax_partitions():
+            with StageTimer("partition"):
                 do_partition(res, part_name_to_split)
+        write_partition_manifest(res, part_name_to_split)
+    taxalotl_config.state_db.record(res.id, "partitioned")
+
+
+def _partition_resources_in_parallel(taxalotl_config, id_list, level_list, jobs):
+    """Splits each level in a worker process as soon as the level above it is done.
+
+    Sibling levels (and different resources) are split concurrently.
+    """
+    job_list = []
+    key_to_res = {}
+    id_to_up_to_date = {}
+    for res, part_name in _iter_norm_term_res_internal_level_pairs(
+        taxalotl_config, id_list, level_list, "partition"
+    ):
+        up_to_date = id_to_up_to_date.get(res.id)
+        if up_to_date is None:
+            up_to_date = frozenset(remove_stale_partitions(res))
+            id_to_up_to_date[res.id] = up_to_date
+        # level lists are in preorder, so any ancestor level has been added
+        anc = get_parent_part_name(part_name)
+        while anc is not None and (res.id, anc) not in key_to_res:
+            anc = get_parent_part_name(anc)
+        deps = [] if anc is None else [(res.id, anc)]
+        key = (res.id, part_name)
+        key_to_res[key] = res
+        args = (taxalotl_config, res.id, part_name, up_to_date)
+        job_list.append(Job(key, _partition_level, args, deps))
+
+    def _validate(job, result):
+        res_id, part_name = job.key
+        validate_partition_output(key_to_res[job.key], part_name)
+
+    run_jobs(job_list, num_workers=jobs, on_success=_validate)
+
+
+def _partition_resource_in_one_pass(taxalotl_config, rid):
+    """Returns False if the resource has to be partitioned level-by-level."""
+    res = taxalotl_config.get_terminalized_res_by_id(rid, "partition")
+    if not res.has_been_normalized():
+        normalize_resources(taxalotl_config, [rid])
+    remove_stale_partitions(res)
+    with VirtCommand("partition", res_id=res.id):
+        with StageTimer("partition"):
+            one_pass = partition_in_one_pass(res)
+        if not one_pass:
+            return False
+        for part_name, em in get_expected_partition_manifests(res).items():
+            write_partition_manifest(res, part_name, em)
+    taxalotl_config.state_db.record(res.id, "partitioned")
+    return True
 
 
 def exec_or_runtime_error(invocation, working_dir="."):
@@ -310,6 +519,13 @@ def git_pull_otifacts(otifacts_dir):
     exec_or_runtime_error(["git", "pull"], working_dir=otifacts_dir)
 
 
+def profile_report(command=None, num_runs=10):
+    """Writes a summary of the profiles of the recent runs of each command (see
+    profiling.py) to out_stream."""
+    records = get_profile_log().read_records()
+    write_profile_report(records, out_stream, command=command, num_runs=num_runs)
+
+
 def pull_otifacts(taxalotl_config):
     dest_dir = taxalotl_config.resources_dir
     taxalotl_dir = os.path.split(os.path.abspath(dest_dir))[0]
@@ -360,14 +576,63 @@ def diagnose_new_separators(taxalotl_config, level_list, name):
                     with OutFile(fp) as outs:
                         write_as_json(sd.as_dict(), outs, sort_keys=True, indent=2)
                         _LOG.info("new separators written to {}".format(fp))
+        TAX_SLICE_CACHE.evict_if_over_budget()
 
 
-def enforce_new_separators(taxalotl_config, id_list, level_list):
+def enforce_new_separators(taxalotl_config, id_list, level_list, jobs=1):
     if level_list == [None]:
         level_list = list(PREORDER_PART_LIST) + list(TERMINAL_PART_NAMES)
+    if jobs > 1:
+        _enforce_new_separators_in_parallel(taxalotl_config, id_list, level_list, jobs)
+        return
     with use_tax_partitions():
         for part_name in level_list:
             perform_separation(taxalotl_config, part_name, id_list, NEW_SEP_FILENAME)
+            TAX_SLICE_CACHE.evict_if_over_budget()
+
+
+def _enforce_new_separators_in_parallel(taxalotl_config, id_list, level_list, jobs):
+    """Separates each resource in its own worker (a resource's separations only
+    touch that resource's files, but the levels of one resource must be done in order).
+    """
+    ott_res = taxalotl_config.get_terminalized_res_by_id(
+        "ott", "enforce-new-separators"
+    )
+    if not ott_res.has_been_partitioned():
+        partition_resources(taxalotl_config, ["ott"], PREORDER_PART_LIST, jobs=jobs)
+    sep_mapping_fp = os.path.join(ott_res.partitioned_filepath, SEP_MAPPING)
+    if not os.path.isfile(sep_mapping_fp):
+        cache_separator_names(taxalotl_config)
+    resource_ids = list(id_list)
+    if not resource_ids:
+        for part_name in level_list:
+            top_dir = get_part_dir_from_part_name(ott_res, part_name)
+            if os.path.isdir(os.path.join(top_dir, INP_TAXONOMY_DIRNAME)):
+                for rid in get_taxonomies_for_dir(top_dir):
+                    if rid not in resource_ids:
+                        resource_ids.append(rid)
+    job_list = []
+    for rid in resource_ids:
+        args = (taxalotl_config, rid, level_list, not id_list)
+        job_list.append(Job(rid, _separate_resource, args))
+    run_jobs(job_list, num_workers=jobs)
+
+
+def _separate_resource(taxalotl_config, rid, level_list, only_where_present):
+    ott_res = taxalotl_config.get_terminalized_res_by_id(
+        "ott", "enforce-new-separators"
+    )
+    with use_tax_partitions():
+        for part_name in level_list:
+            if only_where_present:
+                top_dir = get_part_dir_from_part_name(ott_res, part_name)
+                inp_dir = os.path.join(top_dir, INP_TAXONOMY_DIRNAME)
+                if not os.path.isdir(inp_dir):
+                    continue
+                if rid not in get_taxonomies_for_dir(top_dir):
+                    continue
+            perform_separation(taxalotl_config, part_name, [rid], NEW_SEP_FILENAME)
+            TAX_SLICE_CACHE.evict_if_over_budget()
 
 
 def build_partition_maps(taxalotl_config):
@@ -490,6 +755,7 @@ def clean_resources(taxalotl_config, action, id_list, levels=None):
                 fragment = taxalotl_config.get_fragment_from_part_name(part_name)
                 pd = os.path.join(d, fragment)
                 remove_sep_artifacts_and_empty_dirs(pd)
+            taxalotl_config.state_db.forget_stage_for_all("separated")
         elif action == "build-partition-maps":
             if os.path.exists(fp):
                 unlink(fp)
@@ -505,6 +771,7 @@ def clean_resources(taxalotl_config, action, id_list, levels=None):
             if rw.has_been_partitioned():
                 _LOG.info("Cleaning partition artifact for {}...".format(rid))
                 rw.remove_partition_artifacts()
+                taxalotl_config.state_db.forget(rw.id, "partitioned", "separated")
             else:
                 _LOG.info(
                     "{} had not been partitioned. Skipping clean step...".format(rid)
@@ -513,6 +780,7 @@ def clean_resources(taxalotl_config, action, id_list, levels=None):
             if rw.has_been_normalized():
                 _LOG.info("Cleaning normalize artifact for {}...".format(rid))
                 rw.remove_normalize_artifacts()
+                taxalotl_config.state_db.forget(rw.id, "normalized")
             else:
                 _LOG.info(
                     "{} had not been normalized. Skipping clean step...".format(rid)
@@ -537,6 +805,7 @@ def accumulate_separated_descendants(taxalotl_config, id_list):
             for d in postorder:
                 _LOG.info("accumulate_separated_descendants for {}".format(d))
                 res.accumulate_separated_descendants(d)
+                TAX_SLICE_CACHE.evict_if_over_budget()
 
 
 def perform_separation(taxalotl_config, part_name, id_list, sep_fn):
@@ -566,3 +835,4 @@ def perform_separation(taxalotl_config, part_name, id_list, sep_fn):
             perform_dynamic_separation(
                 ott_res, res=rw, part_key=part_name, separation_by_ott=active_seps
             )
+        taxalotl_config.state_db.record(rw.id, "separated")
@@ -3,7 +3,7 @@ from __future__ import print_function
 
 import os
 import logging
-from .util import OutDir
+from .util import COMPRESSION_SUFFIXES, OutDir
 
 _LOG = logging.getLogger(__name__)
 
@@ -15,6 +15,20 @@ def _none_for_missing_config_get(config, section, option, default=None):
         return default
 
 
+_BYTE_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_byte_count(s):
+    """Returns the number of bytes in `s` (an int with an optional K, M or G suffix)."""
+    s = s.strip().upper()
+    if s.endswith("B"):
+        s = s[:-1]
+    mult = _BYTE_SUFFIXES.get(s[-1:], 1)
+    if mult != 1:
+        s = s[:-1]
+    return int(float(s) * mult)
+
+
 class TaxalotlConfig(object):
     def __init__(
         self,
@@ -73,12 +87,59 @@ class TaxalotlConfig(object):
         self.partitioned_dir = partsd
         self.resources_dir = resd
         self._resources_mgr = None
+        self._state_db = None
         cws = _none_for_missing_config_get(cfg, "behavior", "crash_with_stacktraces")
         if cws:
             cws = cfg.getboolean("behavior", "crash_with_stacktraces")
         self.crash_with_stacktraces = bool(cws)
+        cps = _none_for_missing_config_get(cfg, "behavior", "compact_partition_storage")
+        if cps:
+            cps = cfg.getboolean("behavior", "compact_partition_storage")
+        self.compact_partition_storage = bool(cps)
+        cns = _none_for_missing_config_get(cfg, "behavior", "compact_normalize_storage")
+        if cns:
+            cns = cfg.getboolean("behavior", "compact_normalize_storage")
+        self.compact_normalize_storage = bool(cns)
+        nww = _none_for_missing_config_get(cfg, "behavior", "normalize_write_workers")
+        self.normalize_write_workers = max(1, int(nww)) if nww else 1
+        nwc = _none_for_missing_config_get(
+            cfg, "behavior", "normalize_write_compression"
+        )
+        if nwc and nwc not in COMPRESSION_SUFFIXES:
+            m = 'Unknown normalize_write_compression "{}" (expecting one of: {})'
+            raise ValueError(m.format(nwc, ", ".join(COMPRESSION_SUFFIXES)))
+        self.normalize_write_compression = nwc if nwc else None
+        nfa = _none_for_missing_config_get(cfg, "behavior", "normalize_from_archive")
+        if nfa:
+            nfa = cfg.getboolean("behavior", "normalize_from_archive")
+        self.normalize_from_archive = bool(nfa)
+        dct = _none_for_missing_config_get(cfg, "behavior", "decompress_threads")
+        self.decompress_threads = max(1, int(dct)) if dct else 1
+        scb = _none_for_missing_config_get(cfg, "behavior", "slice_cache_max_bytes")
+        self.slice_cache_max_bytes = parse_byte_count(scb) if scb else None
+        prof = _none_for_missing_config_get(cfg, "behavior", "profile")
+        if prof:
+            prof = cfg.getboolean("behavior", "profile")
+        self.profile = bool(prof)
         assert self.resources_mgr is not None
 
+    @property
+    def state_db(self):
+        if self._state_db is None:
+            from .state_db import StateDB
+
+            self._state_db = StateDB(self.processed_dir)
+        return self._state_db
+
+    def __getstate__(self):
+        # Pickled (e.g. for worker processes) with the values as they are now, so
+        #   that those set after the file was read (from the command line) are kept.
+        #   The resources (and the state DB) are opened again when they are needed.
+        state = dict(self.__dict__)
+        state["_resources_mgr"] = None
+        state["_state_db"] = None
+        return state
+
     def get_separator_dict(self):
         from .commands import SEP_MAPPING, cache_separator_names
         from peyutil import read_as_json
@@ -154,7 +215,7 @@ class TaxalotlConfig(object):
             return self.resources_mgr.resources[res_id]
         except Exception:
             if self.resources_mgr.generic_handler_can_be_used(res_id):
-                from .resource_manager import GenericTaxonomyWrapper
+                from .resource_wrapper import GenericTaxonomyWrapper
 
                 return GenericTaxonomyWrapper(res_id, config=self)
             raise ValueError("Unknown resource ID '{}'".format(res_id))
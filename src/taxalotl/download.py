@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""Streaming, resumable downloads.
+
+Each file is written in DOWNLOAD_CHUNK_SIZE pieces to a ".part" file next to its
+destination and renamed once it is complete (and matches its checksum, if one is
+known). An interrupted download resumes from the end of its .part file with an
+HTTP Range request or an FTP REST command.
+"""
+import ftplib
+import hashlib
+import logging
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .jobs import Job, run_jobs
+from .profiling import StageTimer, count_bytes_written
+from .util import unlink
+
+_LOG = logging.getLogger(__name__)
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+DOWNLOAD_TIMEOUT = 60  # seconds without any data before a download is abandoned
+PART_SUFFIX = ".part"
+_DIGEST_LENGTH_TO_ALGORITHM = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}
+
+
+def parse_checksum(checksum):
+    """Returns (algorithm, hex digest) for "sha256:<hex>" or a bare hex digest.
+
+    The algorithm of a bare digest is guessed from its length.
+    """
+    if ":" in checksum:
+        algorithm, digest = checksum.split(":", 1)
+        algorithm = algorithm.strip().lower()
+    else:
+        digest = checksum
+        algorithm = _DIGEST_LENGTH_TO_ALGORITHM.get(len(digest.strip()))
+    if algorithm not in hashlib.algorithms_available:
+        raise ValueError('Unrecognized checksum "{}"'.format(checksum))
+    return algorithm, digest.strip().lower()
+
+
+def _open_part(part_fp, offset, algorithm):
+    """Opens part_fp to be appended to after its first `offset` bytes.
+
+    Returns the file object and a hash object (or None) that has been fed those
+    bytes.
+    """
+    hasher = hashlib.new(algorithm) if algorithm else None
+    if not offset:
+        return open(part_fp, "wb"), hasher
+    outp = open(part_fp, "r+b")
+    if hasher is not None:
+        remaining = offset
+        while remaining:
+            buf = outp.read(min(remaining, DOWNLOAD_CHUNK_SIZE))
+            if not buf:
+                break
+            hasher.update(buf)
+            remaining -= len(buf)
+    outp.seek(offset)
+    outp.truncate()
+    return outp, hasher
+
+
+def _fetch_http(url, part_fp, offset, algorithm, chunk_size):
+    headers = {"Range": "bytes={}-".format(offset)} if offset else {}
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        resp = urllib.request.urlopen(req, timeout=DOWNLOAD_TIMEOUT)
+    except urllib.error.HTTPError as x:
+        if x.code != 416 or not offset:
+            raise
+        total = x.headers.get("Content-Range", "").rpartition("/")[-1]
+        if total.isdigit() and int(total) != offset:
+            m = "{} is longer than {}. Restarting..."
+            _LOG.info(m.format(part_fp, url))
+            return _fetch_http(url, part_fp, 0, algorithm, chunk_size)
+        # The .part file already holds the whole file.
+        outp, hasher = _open_part(part_fp, offset, algorithm)
+        outp.close()
+        return hasher
+    with resp:
+        if offset:
+            content_range = resp.headers.get("Content-Range", "")
+            if resp.status != 206:
+                _LOG.info("{} does not support resuming. Restarting...".format(url))
+                offset = 0
+            elif not content_range.startswith("bytes {}-".format(offset)):
+                m = 'Unexpected Content-Range "{}" when resuming {} at byte {}'
+                raise RuntimeError(m.format(content_range, url, offset))
+        expected = resp.headers.get("Content-Length")
+        outp, hasher = _open_part(part_fp, offset, algorithm)
+        num_read = 0
+        with outp:
+            while True:
+                buf = resp.read(chunk_size)
+                if not buf:
+                    break
+                outp.write(buf)
+                if hasher is not None:
+                    hasher.update(buf)
+                num_read += len(buf)
+    if expected is not None and num_read != int(expected):
+        m = "Download of {} stopped after {} of {} bytes"
+        raise RuntimeError(m.format(url, num_read, expected))
+    return hasher
+
+
+def _fetch_ftp(url, part_fp, offset, algorithm, chunk_size):
+    split = urllib.parse.urlsplit(url)
+    path = urllib.parse.unquote(split.path)
+    ftp = ftplib.FTP(timeout=DOWNLOAD_TIMEOUT)
+    try:
+        ftp.connect(split.hostname, split.port or ftplib.FTP_PORT)
+        user = urllib.parse.unquote(split.username or "anonymous")
+        ftp.login(user, urllib.parse.unquote(split.password or "anonymous@"))
+        ftp.voidcmd("TYPE I")
+        try:
+            size = ftp.size(path)
+        except ftplib.error_perm:
+            size = None
+        if size is not None and offset > size:
+            offset = 0
+        outp, hasher = _open_part(part_fp, offset, algorithm)
+        with outp:
+            if size is not None and offset == size:
+                return hasher
+
+            def _write(buf):
+                outp.write(buf)
+                if hasher is not None:
+                    hasher.update(buf)
+
+            rest = offset or None
+            ftp.retrbinary("RETR {}".format(path), _write, chunk_size, rest=rest)
+        ftp.quit()
+    finally:
+        ftp.close()
+    if size is not None and os.path.getsize(part_fp) != size:
+        m = "Download of {} stopped after {} of {} bytes"
+        raise RuntimeError(m.format(url, os.path.getsize(part_fp), size))
+    return hasher
+
+
+def download_file(url, filepath, checksum=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Streams url to filepath, resuming from filepath + PART_SUFFIX if it exists.
+
+    If `checksum` is given (see parse_checksum) and the downloaded bytes do not
+    match it, the .part file is removed and a RuntimeError is raised.
+    """
+    algorithm, digest = parse_checksum(checksum) if checksum else (None, None)
+    par_dir = os.path.dirname(filepath)
+    if par_dir and not os.path.isdir(par_dir):
+        os.makedirs(par_dir)
+    part_fp = filepath + PART_SUFFIX
+    offset = os.path.getsize(part_fp) if os.path.exists(part_fp) else 0
+    if offset:
+        m = "Resuming download from {} to {} at byte {}"
+        _LOG.info(m.format(url, filepath, offset))
+    else:
+        _LOG.debug("Starting download from {} to {}".format(url, filepath))
+    start = time.time()
+    with StageTimer("download"):
+        if urllib.parse.urlsplit(url).scheme == "ftp":
+            hasher = _fetch_ftp(url, part_fp, offset, algorithm, chunk_size)
+        else:
+            hasher = _fetch_http(url, part_fp, offset, algorithm, chunk_size)
+    count_bytes_written(os.path.getsize(part_fp) - offset)
+    if hasher is not None and hasher.hexdigest() != digest:
+        unlink(part_fp)
+        m = "The {} checksum of the download from {} was {} instead of {}"
+        raise RuntimeError(m.format(algorithm, url, hasher.hexdigest(), digest))
+    os.replace(part_fp, filepath)
+    m = "Download from {} to {} completed ({} bytes in {:.1f} seconds)."
+    _LOG.info(m.format(url, filepath, os.path.getsize(filepath), time.time() - start))
+    return filepath
+
+
+def fetch_resources(res_wrappers, num_workers=1, keep_going=False):
+    """Downloads the files of each resource wrapper and then calls its
+    finish_download method.
+
+    The files (of all of the resources) are fetched concurrently by up to
+    num_workers threads. Files that are already present are not fetched again. A
+    resource is not finished if any of its files fail to download. No more files
+    are started after a failure, unless keep_going is True (see jobs.run_jobs).
+    """
+    jobs = []
+    fetch_keys = set()
+    for rw in res_wrappers:
+        deps = []
+        for url, filepath, checksum in rw.download_tasks():
+            key = ("fetch", filepath)
+            deps.append(key)
+            if key in fetch_keys:
+                continue
+            fetch_keys.add(key)
+            if os.path.exists(filepath):
+                jobs.append(Job(key, os.path.exists, (filepath,)))
+            else:
+                jobs.append(Job(key, download_file, (url, filepath, checksum)))
+        jobs.append(Job(("finish", rw.id), rw.finish_download, depends_on=deps))
+    return run_jobs(
+        jobs, num_workers=num_workers, use_threads=True, keep_going=keep_going
+    )
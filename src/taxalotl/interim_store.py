@@ -0,0 +1,741 @@
+#!/usr/bin/env python
+"""Compact, array-backed columns for an InterimTaxonomyData (compact_storage=True).
+
+Normalizing NCBI or GBIF builds a dict keyed by source ID for each of the
+parent, children, rank and name of every taxon (plus the synonyms), so each
+taxon costs several dict entries, int objects and strings. Here every ID is
+mapped once to a dense slot (IdRemap) and each column keeps its values in
+per-slot storage:
+  * IdColumn - ID -> ID (or None) in an array('q') (to_par),
+  * RankColumn - ID -> pooled rank name as an array('H') of codes (to_rank),
+  * NameIndex / NameColumn - the names packed as UTF-8 in one buffer, found
+    through an open-addressing table (name_to_ids) and by entry number (to_name),
+  * ObjectColumn / ChildListColumn - any Python object per slot (to_flags,
+    to_children; new child lists of integer parents are ChildIds, which hold
+    integer IDs in an array('q')),
+  * SynonymColumn - the synonyms as a log of arrays (synonyms).
+
+Each column is a MutableMapping with the same behavior as the dict it replaces,
+except that a key that is deleted and then set again keeps its first position
+in the iteration order. Lists that are read from a column (children, the IDs
+of a repeated name, synonyms) are kept, so they can be changed in place.
+"""
+from array import array
+from itertools import repeat
+
+from .array_store import _is_array_key, _SortedIntIndex
+from .string_pool import RANK_NAMES, rank_code
+
+try:
+    from collections.abc import Mapping, MutableMapping, MutableSequence
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from collections import Mapping, MutableMapping, MutableSequence
+
+_INT64_MIN = -(2**63)
+_INT64_MAX = 2**63 - 1
+# Codes of an array('q') value column that are not IDs
+_ABSENT = _INT64_MIN  # (NameIndex) the entry is not a key
+_NONE = _INT64_MIN + 1
+_OTHER = _INT64_MIN + 2  # the value is a Python object held in a dict
+# Non-negative integer IDs below this are found by indexing an array (4 bytes per ID)
+_MAX_DIRECT_ID = 1 << 26
+_MISSING = object()
+
+
+def _is_int_value(v):
+    return v.__class__ is int and _OTHER < v <= _INT64_MAX
+
+
+class IdRemap(object):
+    """Assigns a dense slot (0, 1, 2...) to each ID in the order the IDs are first seen.
+
+    Non-negative integer IDs below _MAX_DIRECT_ID are looked up in an array('i'),
+    other integers in a _SortedIntIndex and any other key (None, a str ID) in a dict.
+    """
+
+    def __init__(self):
+        self._direct = array("i")  # ID -> 1 + slot, 0 for no slot
+        self._sorted = _SortedIntIndex()
+        self._other = {}
+        self._ids = array("q")  # slot -> integer ID
+        self._other_ids = {}  # slot -> non-integer ID
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get_slot(self, uid):
+        """The slot of `uid`, or None."""
+        if uid.__class__ is int:
+            if 0 <= uid < _MAX_DIRECT_ID:
+                d = self._direct
+                if uid < len(d):
+                    s = d[uid]
+                    if s:
+                        return s - 1
+                return None
+            if _is_array_key(uid):
+                return self._sorted.get(uid)
+        return self._other.get(uid)
+
+    def slot(self, uid):
+        """The slot of `uid`. A new slot is assigned if `uid` has none."""
+        d = self._direct
+        if uid.__class__ is int and 0 <= uid < len(d) and d[uid]:
+            return d[uid] - 1
+        s = self.get_slot(uid)
+        if s is not None:
+            return s
+        s = len(self._ids)
+        if uid.__class__ is int and 0 <= uid < _MAX_DIRECT_ID:
+            d = self._direct
+            if uid >= len(d):
+                n = max(uid + 1, len(d) + (len(d) >> 1)) - len(d)
+                d.frombytes(bytes(n * d.itemsize))
+            d[uid] = s + 1
+            self._ids.append(uid)
+        elif uid.__class__ is int and _is_array_key(uid):
+            self._sorted[uid] = s
+            self._ids.append(uid)
+        else:
+            self._other[uid] = s
+            self._other_ids[s] = uid
+            self._ids.append(0)
+        return s
+
+    def key(self, slot):
+        """The ID of a slot."""
+        if self._other_ids and slot in self._other_ids:
+            return self._other_ids[slot]
+        return self._ids[slot]
+
+
+# States of a slot in a column
+_UNSEEN = 0
+_DELETED = 1
+_LIVE = 2
+
+
+class _SlotColumn(MutableMapping):
+    """ID -> value mapping with the values in per-slot storage of an IdRemap.
+
+    Subclasses hold the values and define _reserve(n) (make room for n slots),
+    _fetch(slot), _store(slot, value) and _drop(slot).
+    """
+
+    def __init__(self, ids):
+        self._ids = ids
+        self._order = array("i")  # slots, in the order their keys were first added
+        self._seen = bytearray()  # slot -> _UNSEEN, _DELETED or _LIVE
+        self._num = 0
+
+    def _live_slot(self, key):
+        ids = self._ids
+        if key.__class__ is int and 0 <= key < len(ids._direct):
+            slot = ids._direct[key] - 1
+        else:
+            slot = ids.get_slot(key)
+            if slot is None:
+                return None
+        if 0 <= slot < len(self._seen) and self._seen[slot] == _LIVE:
+            return slot
+        return None
+
+    def _slot_for_set(self, key):
+        """The slot of `key`, with the key counted and put in the order if it is new."""
+        slot = self._ids.slot(key)
+        seen = self._seen
+        if slot >= len(seen):
+            n = max(len(self._ids), len(seen) + (len(seen) >> 3))
+            seen.extend(bytes(n - len(seen)))
+            self._reserve(n)
+        state = seen[slot]
+        if state != _LIVE:
+            self._num += 1
+            if state == _UNSEEN:
+                self._order.append(slot)
+            seen[slot] = _LIVE
+        return slot
+
+    def __getitem__(self, key):
+        slot = self._live_slot(key)
+        if slot is None:
+            raise KeyError(key)
+        return self._fetch(slot)
+
+    def get(self, key, default=None):
+        slot = self._live_slot(key)
+        if slot is None:
+            return default
+        return self._fetch(slot)
+
+    def __contains__(self, key):
+        return self._live_slot(key) is not None
+
+    def __setitem__(self, key, value):
+        self._store(self._slot_for_set(key), value)
+
+    def __delitem__(self, key):
+        slot = self._live_slot(key)
+        if slot is None:
+            raise KeyError(key)
+        self._drop(slot)
+        self._seen[slot] = _DELETED
+        self._num -= 1
+
+    def __len__(self):
+        return self._num
+
+    def __iter__(self):
+        key, seen = self._ids.key, self._seen
+        for slot in self._order:
+            if seen[slot] == _LIVE:
+                yield key(slot)
+
+    def items(self):
+        key, seen, fetch = self._ids.key, self._seen, self._fetch
+        for slot in self._order:
+            if seen[slot] == _LIVE:
+                yield key(slot), fetch(slot)
+
+    def values(self):
+        for el in self.items():
+            yield el[1]
+
+
+class IdColumn(_SlotColumn):
+    """ID -> ID (or None) column. Integer values are held in an array('q')."""
+
+    def __init__(self, ids):
+        _SlotColumn.__init__(self, ids)
+        self._values = array("q")
+        self._other_values = {}
+
+    def _reserve(self, n):
+        v = self._values
+        v.frombytes(bytes((n - len(v)) * v.itemsize))
+
+    def _fetch(self, slot):
+        v = self._values[slot]
+        if v == _NONE:
+            return None
+        if v == _OTHER:
+            return self._other_values[slot]
+        return v
+
+    def _store(self, slot, value):
+        if value is None:
+            code = _NONE
+        elif _is_int_value(value):
+            code = value
+        else:
+            code = _OTHER
+            self._other_values[slot] = value
+        if code != _OTHER and self._values[slot] == _OTHER:
+            del self._other_values[slot]
+        self._values[slot] = code
+
+    def _drop(self, slot):
+        if self._values[slot] == _OTHER:
+            del self._other_values[slot]
+        self._values[slot] = 0
+
+
+_OTHER_RANK = 0xFFFF
+
+
+class RankColumn(_SlotColumn):
+    """ID -> rank name column, held as the string_pool codes of the ranks."""
+
+    def __init__(self, ids):
+        _SlotColumn.__init__(self, ids)
+        self._codes = array("H")
+        self._other_values = {}
+
+    def _reserve(self, n):
+        c = self._codes
+        c.frombytes(bytes((n - len(c)) * c.itemsize))
+
+    def _fetch(self, slot):
+        c = self._codes[slot]
+        if c == _OTHER_RANK:
+            return self._other_values[slot]
+        return RANK_NAMES[c]
+
+    def _store(self, slot, value):
+        code = rank_code(value) if isinstance(value, str) else _OTHER_RANK
+        if code >= _OTHER_RANK:
+            code = _OTHER_RANK
+            self._other_values[slot] = value
+        elif self._codes[slot] == _OTHER_RANK:
+            del self._other_values[slot]
+        self._codes[slot] = code
+
+    def _drop(self, slot):
+        if self._codes[slot] == _OTHER_RANK:
+            del self._other_values[slot]
+        self._codes[slot] = 0
+
+
+class NameIndex(MutableMapping):
+    """name -> ID (or list of IDs) map with the names packed in one buffer.
+
+    Each entry is a name appended as UTF-8 to a bytearray. Keys are found through
+    an open-addressing hash table of entry numbers. An integer ID is kept in an
+    array('q'); a list of IDs (or any other value) is kept as the object, so that
+    a list that is read can be changed in place. A deleted key stays in the table
+    and is reused if the name is set again. Entries made by store_text are not
+    keys; they hold the other text of a NameColumn.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._starts = array("q", [0])  # entry n is _buf[_starts[n]:_starts[n + 1]]
+        self._values = array("q")  # ID, _OTHER (see _objects) or _ABSENT (not a key)
+        self._objects = {}  # entry -> value that is not an integer ID
+        self._table = array("i", [-1]) * 64
+        self._num_in_table = 0
+        self._num_keys = 0
+
+    def _append(self, b):
+        self._buf.extend(b)
+        self._starts.append(len(self._buf))
+        self._values.append(_ABSENT)
+        return len(self._values) - 1
+
+    def _find(self, name):
+        """(entry or -1, table position, encoded name) for `name`."""
+        b = name.encode("utf-8")
+        table, starts, buf = self._table, self._starts, self._buf
+        mask = len(table) - 1
+        lb = len(b)
+        i = hash(name) & mask
+        while True:
+            e = table[i]
+            if e < 0:
+                return e, i, b
+            s = starts[e]
+            if starts[e + 1] - s == lb and buf[s : s + lb] == b:
+                return e, i, b
+            i = (i + 1) & mask
+
+    def _add_key(self, name, found=None):
+        e, i, b = found or self._find(name)
+        if e < 0:
+            e = self._append(b)
+            self._table[i] = e
+            self._num_in_table += 1
+            if 2 * self._num_in_table > len(self._table):
+                self._rehash()
+        if self._values[e] == _ABSENT:
+            self._num_keys += 1
+        return e
+
+    def _rehash(self):
+        table = array("i", [-1]) * (2 * len(self._table))
+        mask = len(table) - 1
+        starts, buf = self._starts, self._buf
+        for e in self._table:
+            if e < 0:
+                continue
+            i = hash(buf[starts[e] : starts[e + 1]].decode("utf-8")) & mask
+            while table[i] >= 0:
+                i = (i + 1) & mask
+            table[i] = e
+        self._table = table
+
+    def _fetch(self, e):
+        v = self._values[e]
+        if v == _OTHER:
+            return self._objects[e]
+        return v
+
+    def _set_value(self, e, value):
+        if _is_int_value(value):
+            self._objects.pop(e, None)
+            self._values[e] = value
+        else:
+            self._objects[e] = value
+            self._values[e] = _OTHER
+
+    def register(self, name, uid):
+        """As peyutil.add_or_append_to_dict(self, name, uid). Returns the entry of
+        `name` and True if it was already a key."""
+        e, i, b = self._find(name)
+        if e >= 0 and self._values[e] != _ABSENT:
+            x = self._fetch(e)
+            if isinstance(x, list):
+                x.append(uid)
+            else:
+                self._set_value(e, [x, uid])
+            return e, True
+        e = self._add_key(name, (e, i, b))
+        self._set_value(e, uid)
+        return e, False
+
+    def store_text(self, text):
+        """Appends `text` as an entry that is not a key. Returns the entry."""
+        return self._append(text.encode("utf-8"))
+
+    def text(self, entry):
+        starts = self._starts
+        return self._buf[starts[entry] : starts[entry + 1]].decode("utf-8")
+
+    def __getitem__(self, name):
+        e = self._find(name)[0]
+        if e < 0 or self._values[e] == _ABSENT:
+            raise KeyError(name)
+        return self._fetch(e)
+
+    def __contains__(self, name):
+        e = self._find(name)[0]
+        return e >= 0 and self._values[e] != _ABSENT
+
+    def __setitem__(self, name, value):
+        self._set_value(self._add_key(name), value)
+
+    def __delitem__(self, name):
+        e = self._find(name)[0]
+        if e < 0 or self._values[e] == _ABSENT:
+            raise KeyError(name)
+        self._objects.pop(e, None)
+        self._values[e] = _ABSENT
+        self._num_keys -= 1
+
+    def __len__(self):
+        return self._num_keys
+
+    def __iter__(self):
+        values = self._values
+        for e in sorted(e for e in self._table if e >= 0):
+            if values[e] != _ABSENT:
+                yield self.text(e)
+
+
+class NameColumn(_SlotColumn):
+    """ID -> name column; each name is an entry of a NameIndex."""
+
+    def __init__(self, ids, name_index):
+        _SlotColumn.__init__(self, ids)
+        self._index = name_index
+        self._entries = array("q")
+        self._other_values = {}
+
+    def register(self, uid, name):
+        """Sets the name of `uid` and adds `uid` to the IDs of the name in the
+        NameIndex. Returns True if another ID already had that name."""
+        entry, repeated = self._index.register(name, uid)
+        slot = self._slot_for_set(uid)
+        self._other_values.pop(slot, None)
+        self._entries[slot] = entry
+        return repeated
+
+    def _reserve(self, n):
+        v = self._entries
+        v.frombytes(bytes((n - len(v)) * v.itemsize))
+
+    def _fetch(self, slot):
+        e = self._entries[slot]
+        if e == _OTHER:
+            return self._other_values[slot]
+        return self._index.text(e)
+
+    def _store(self, slot, value):
+        if isinstance(value, str):
+            self._other_values.pop(slot, None)
+            self._entries[slot] = self._index.store_text(value)
+        else:
+            self._other_values[slot] = value
+            self._entries[slot] = _OTHER
+
+    def _drop(self, slot):
+        self._other_values.pop(slot, None)
+        self._entries[slot] = 0
+
+
+class ObjectColumn(_SlotColumn):
+    """ID -> any Python object, held in a list indexed by slot."""
+
+    def __init__(self, ids):
+        _SlotColumn.__init__(self, ids)
+        self._values = []
+
+    def _reserve(self, n):
+        self._values.extend(repeat(None, n - len(self._values)))
+
+    def _fetch(self, slot):
+        return self._values[slot]
+
+    def _store(self, slot, value):
+        self._values[slot] = value
+
+    def _drop(self, slot):
+        self._values[slot] = None
+
+
+class ChildIds(MutableSequence):
+    """List of child IDs held in an array('q') while every ID is an integer that
+    fits in it; the first other ID (e.g. a string) turns it into a list."""
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids=()):
+        self._ids = array("q")
+        self.extend(ids)
+
+    def _to_list(self):
+        if self._ids.__class__ is array:
+            self._ids = list(self._ids)
+
+    def append(self, value):
+        try:
+            self._ids.append(value)
+        except (TypeError, OverflowError):
+            self._to_list()
+            self._ids.append(value)
+
+    def extend(self, values):
+        values = list(values)
+        n = len(self._ids)
+        try:
+            self._ids.extend(values)
+        except (TypeError, OverflowError):
+            del self._ids[n:]  # the IDs that array.extend took before failing
+            self._to_list()
+            self._ids.extend(values)
+
+    def insert(self, index, value):
+        try:
+            self._ids.insert(index, value)
+        except (TypeError, OverflowError):
+            self._to_list()
+            self._ids.insert(index, value)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            if self._ids.__class__ is array:
+                try:
+                    value = array("q", value)
+                except (TypeError, OverflowError):
+                    self._to_list()
+        else:
+            try:
+                self._ids[index] = value
+                return
+            except (TypeError, OverflowError):
+                self._to_list()
+        self._ids[index] = value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ChildIds(self._ids[index])
+        return self._ids[index]
+
+    def __delitem__(self, index):
+        del self._ids[index]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def remove(self, value):
+        self._ids.remove(value)
+
+    def __eq__(self, other):
+        if isinstance(other, (ChildIds, list, tuple, array)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        r = self.__eq__(other)
+        return r if r is NotImplemented else not r
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "ChildIds({!r})".format(list(self._ids))
+
+
+class ChildListColumn(ObjectColumn):
+    """ID -> list of child IDs. `setdefault(par_id, [])` for an integer par_id
+    stores (and returns) an empty ChildIds rather than the list, so the integer
+    IDs that are appended to it are held in an array('q') rather than as int
+    objects (other IDs are kept as in a list)."""
+
+    def setdefault(self, key, default=None):
+        slot = self._live_slot(key)
+        if slot is not None:
+            return self._values[slot]
+        if key.__class__ is int and default.__class__ is list and not default:
+            default = ChildIds()
+        self[key] = default
+        return default
+
+
+_IN_LOG = 1
+_IN_LIST = 2
+# Log positions that are not in the index of the log by slot before it is rebuilt
+_MIN_LOG_TAIL = 4096
+
+
+class SynonymColumn(_SlotColumn):
+    """valid ID -> list of (name, name type, synonym ID) tuples.
+
+    add() appends a synonym to a log of arrays (the name packed as UTF-8, the
+    name type as a code, the synonym ID in an array('q')). Reading the list of
+    an ID through the mapping API builds it from the log and keeps it, so that
+    it can be changed in place; peek() and read_only_view() read without keeping it.
+    """
+
+    def __init__(self, ids):
+        _SlotColumn.__init__(self, ids)
+        self._state = bytearray()  # per slot: 0, _IN_LOG or _IN_LIST
+        self._lists = {}  # slot -> list, for _IN_LIST
+        self._log_slots = array("i")  # -1 once the list of the slot is built
+        self._log_buf = bytearray()
+        self._log_starts = array("q", [0])
+        self._log_types = array("H")
+        self._log_syn_ids = array("q")
+        self._log_other_syn_ids = {}  # log position -> synonym ID that is not an int
+        self._type_names = []
+        self._type_codes = {}
+        self._by_slot = None  # (offsets, positions) of the log sorted by slot
+        self._num_indexed = 0
+
+    def _reserve(self, n):
+        self._state.extend(bytes(n - len(self._state)))
+
+    def _fetch(self, slot):
+        if self._state[slot] == _IN_LOG:
+            self._lists[slot] = self._from_log(slot, take=True)
+            self._state[slot] = _IN_LIST
+        return self._lists[slot]
+
+    def _store(self, slot, value):
+        if self._state[slot] == _IN_LOG:
+            self._from_log(slot, take=True)
+        self._lists[slot] = value
+        self._state[slot] = _IN_LIST
+
+    def _drop(self, slot):
+        if self._state[slot] == _IN_LOG:
+            self._from_log(slot, take=True)
+        self._lists.pop(slot, None)
+        self._state[slot] = 0
+
+    def add(self, valid_id, name, name_type, syn_id=None):
+        """Appends (name, name_type, syn_id) to the synonyms of valid_id."""
+        slot = self._slot_for_set(valid_id)
+        if self._state[slot] == _IN_LIST:
+            self._lists[slot].append((name, name_type, syn_id))
+            return
+        self._state[slot] = _IN_LOG
+        pos = len(self._log_slots)
+        self._log_slots.append(slot)
+        self._log_buf.extend(name.encode("utf-8"))
+        self._log_starts.append(len(self._log_buf))
+        code = self._type_codes.get(name_type)
+        if code is None:
+            code = len(self._type_names)
+            self._type_names.append(name_type)
+            self._type_codes[name_type] = code
+        self._log_types.append(code)
+        if syn_id is None:
+            self._log_syn_ids.append(_NONE)
+        elif _is_int_value(syn_id):
+            self._log_syn_ids.append(syn_id)
+        else:
+            self._log_syn_ids.append(_OTHER)
+            self._log_other_syn_ids[pos] = syn_id
+
+    def _index_log(self):
+        """Builds offsets and positions so that the log positions of slot s are
+        positions[offsets[s]:offsets[s + 1]]."""
+        log_slots = self._log_slots
+        offsets = array("q", bytes(8 * (len(self._state) + 1)))
+        for s in log_slots:
+            if s >= 0:
+                offsets[s + 1] += 1
+        total = 0
+        for n in range(1, len(offsets)):
+            total += offsets[n]
+            offsets[n] = total
+        cursor = array("q", offsets)
+        positions = array("q", bytes(8 * total))
+        for pos, s in enumerate(log_slots):
+            if s >= 0:
+                positions[cursor[s]] = pos
+                cursor[s] += 1
+        self._by_slot = (offsets, positions)
+        self._num_indexed = len(log_slots)
+
+    def _log_positions(self, slot):
+        log_slots = self._log_slots
+        tail = len(log_slots) - self._num_indexed
+        if self._by_slot is None or tail > max(_MIN_LOG_TAIL, self._num_indexed // 4):
+            self._index_log()
+            tail = 0
+        offsets, positions = self._by_slot
+        r = []
+        if slot + 1 < len(offsets):
+            r = [p for p in positions[offsets[slot] : offsets[slot + 1]]]
+        if tail:
+            r.extend(range(self._num_indexed, len(log_slots)))
+        return [p for p in r if log_slots[p] == slot]
+
+    def _from_log(self, slot, take=False):
+        """The list of synonyms of `slot` in the log; with take=True, the entries
+        are removed from the log."""
+        r = []
+        starts, buf, types = self._log_starts, self._log_buf, self._log_types
+        syn_ids = self._log_syn_ids
+        for p in self._log_positions(slot):
+            sid = syn_ids[p]
+            if sid == _NONE:
+                sid = None
+            elif sid == _OTHER:
+                sid = self._log_other_syn_ids[p]
+            name = buf[starts[p] : starts[p + 1]].decode("utf-8")
+            r.append((name, self._type_names[types[p]], sid))
+            if take:
+                self._log_slots[p] = -1
+        return r
+
+    def peek(self, valid_id, default=None):
+        """The synonyms of valid_id (like get) without keeping the list."""
+        slot = self._live_slot(valid_id)
+        if slot is None:
+            return default
+        if self._state[slot] == _IN_LOG:
+            return self._from_log(slot)
+        return self._lists[slot]
+
+    def read_only_view(self):
+        """A Mapping over the same synonyms that reads with peek."""
+        return _PeekView(self)
+
+
+class _PeekView(Mapping):
+    def __init__(self, column):
+        self._column = column
+
+    def __getitem__(self, key):
+        r = self._column.peek(key, _MISSING)
+        if r is _MISSING:
+            raise KeyError(key)
+        return r
+
+    def __contains__(self, key):
+        return key in self._column
+
+    def __iter__(self):
+        return iter(self._column)
+
+    def __len__(self):
+        return len(self._column)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""Runs jobs that depend on each other, optionally in a pool of worker processes
+(or threads, for jobs that mostly wait on I/O).
+
+Each worker process gets its own (empty) TAX_SLICE_CACHE. The history records
+that the workers create are sent back with the result of each job, and the
+parent process adds them to ~/.taxalotl_history. So are the profile counts (bytes
+read and written, and stage times) of each job, for the command's profile.
+The traceback of a job that fails in a worker is sent back and logged.
+
+The time that each job takes is logged when it finishes, and the slowest jobs are
+listed once they all have.
+"""
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+import logging
+import time
+import traceback
+
+from .profiling import count_worker_counts, counts_since, snapshot_counts
+from .util import get_history
+
+_LOG = logging.getLogger(__name__)
+_NUM_SLOWEST_REPORTED = 10
+
+
+class Job(object):
+    def __init__(self, key, func, args=(), depends_on=()):
+        self.key = key
+        self.func = func
+        self.args = tuple(args)
+        self.depends_on = tuple(depends_on)
+
+    def __repr__(self):
+        return "Job({}, depends_on={})".format(repr(self.key), self.depends_on)
+
+
+def _init_worker(slice_cache_max_bytes=None):
+    from .tax_partition import TAX_SLICE_CACHE
+    from .util import clear_filepaths_overwritten, use_worker_history
+
+    TAX_SLICE_CACHE.clear_all_without_flush()
+    TAX_SLICE_CACHE.max_bytes = slice_cache_max_bytes
+    clear_filepaths_overwritten()
+    use_worker_history()
+
+
+def _run_job_in_worker(func, args):
+    start = time.perf_counter()
+    counts = snapshot_counts()
+    try:
+        result = func(*args)
+    except Exception as x:
+        # the traceback is lost when the exception is pickled, so send it along
+        x.worker_traceback = traceback.format_exc()
+        raise
+    elapsed = time.perf_counter() - start
+    return result, get_history().pop_records(), elapsed, counts_since(counts)
+
+
+def _run_job_in_thread(func, args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, None, time.perf_counter() - start, None
+
+
+class _JobQueue(object):
+    def __init__(self, jobs):
+        self.waiting = list(jobs)
+        keys = set()
+        for job in self.waiting:
+            if job.key in keys:
+                raise ValueError("Repeated job key {}".format(repr(job.key)))
+            keys.add(job.key)
+        for job in self.waiting:
+            for d in job.depends_on:
+                if d not in keys:
+                    m = "Job {} depends on an unknown job {}"
+                    raise ValueError(m.format(repr(job.key), repr(d)))
+        self.num_jobs = len(self.waiting)
+        self.results = {}
+        self.failed = {}
+        self.skipped = set()
+        self.elapsed = {}
+
+    def pop_ready(self):
+        """Returns the jobs whose dependencies have all succeeded.
+
+        Jobs that depend on a failed or skipped job are moved to self.skipped.
+        """
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            still_waiting = []
+            for job in self.waiting:
+                if any(d in self.failed or d in self.skipped for d in job.depends_on):
+                    m = "Skipping {} because a job that it depends on failed"
+                    _LOG.error(m.format(repr(job.key)))
+                    self.skipped.add(job.key)
+                    changed = True
+                elif all(d in self.results for d in job.depends_on):
+                    ready.append(job)
+                else:
+                    still_waiting.append(job)
+            self.waiting = still_waiting
+        return ready
+
+    def record(
+        self, job, result=None, exception=None, on_success=None, elapsed=None, tb=None
+    ):
+        if elapsed is not None:
+            self.elapsed[job.key] = elapsed
+        if exception is None and on_success is not None:
+            try:
+                on_success(job, result)
+            except Exception as x:
+                exception = x
+                tb = traceback.format_exc()
+        if exception is None:
+            self.results[job.key] = result
+            if elapsed is not None:
+                _LOG.info("Job {} finished in {:.2f} s".format(repr(job.key), elapsed))
+        else:
+            if tb:
+                _LOG.error("Job {} failed:\n{}".format(repr(job.key), tb.rstrip()))
+            else:
+                _LOG.error("Job {} failed: {!r}".format(repr(job.key), exception))
+            self.failed[job.key] = exception
+
+    def log_timings(self):
+        if len(self.elapsed) < 2:
+            return
+        by_time = sorted(self.elapsed.items(), key=lambda i: i[1], reverse=True)
+        m = "Slowest of {} jobs:".format(len(by_time))
+        for key, elapsed in by_time[:_NUM_SLOWEST_REPORTED]:
+            m += "\n  {:9.2f} s  {}".format(elapsed, repr(key))
+        _LOG.info(m)
+
+    def finish(self):
+        """Returns the results, or raises the exception of the first job that
+        failed."""
+        self.log_timings()
+        if self.failed:
+            num_done = len(self.results) + len(self.failed) + len(self.skipped)
+            m = "{} job(s) failed ({}), {} job(s) were skipped and {} were not run"
+            f = ", ".join([repr(i) for i in self.failed.keys()])
+            num_not_run = self.num_jobs - num_done
+            _LOG.error(m.format(len(self.failed), f, len(self.skipped), num_not_run))
+            raise next(iter(self.failed.values()))
+        if self.waiting:
+            k = ", ".join([repr(i.key) for i in self.waiting])
+            raise RuntimeError("Jobs with cyclic dependencies: {}".format(k))
+        return self.results
+
+
+def run_jobs(jobs, num_workers=1, on_success=None, use_threads=False, keep_going=False):
+    """Runs each Job in `jobs` once the jobs listed in its depends_on have succeeded.
+
+    With num_workers > 1 the jobs run in a pool of that many processes (so their
+    func and args must be picklable). on_success(job, result) is called in this
+    process after each job; an exception from it counts as a failure of the job.
+    With use_threads, the pool is of threads in this process instead.
+
+    Returns a dict of key -> result. When a job fails, no more jobs are started
+    (the jobs already running in the pool are finished) and the exception of the
+    failed job is raised. With keep_going, the jobs that do not depend on a
+    failed job still run, and the exception of the first failure is raised once
+    they have finished.
+    """
+    queue = _JobQueue(jobs)
+    if num_workers is None or num_workers <= 1:
+        ready = queue.pop_ready()
+        while ready:
+            for job in ready:
+                start = time.perf_counter()
+                try:
+                    result = job.func(*job.args)
+                except Exception as x:
+                    queue.record(job, exception=x, tb=traceback.format_exc())
+                else:
+                    elapsed = time.perf_counter() - start
+                    queue.record(job, result, on_success=on_success, elapsed=elapsed)
+                if queue.failed and not keep_going:
+                    return queue.finish()
+            ready = queue.pop_ready()
+        return queue.finish()
+    if use_threads:
+        pool = ThreadPoolExecutor(max_workers=num_workers)
+        run_in_pool = _run_job_in_thread
+    else:
+        from .tax_partition import TAX_SLICE_CACHE
+
+        pool = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(TAX_SLICE_CACHE.max_bytes,),
+        )
+        run_in_pool = _run_job_in_worker
+    with pool:
+        running = {}
+        while True:
+            if keep_going or not queue.failed:
+                for job in queue.pop_ready():
+                    _LOG.info("Starting job {}".format(repr(job.key)))
+                    fut = pool.submit(run_in_pool, job.func, job.args)
+                    running[fut] = job
+            if not running:
+                break
+            done = wait(running, return_when=FIRST_COMPLETED)[0]
+            for fut in done:
+                job = running.pop(fut)
+                try:
+                    result, records, elapsed, counts = fut.result()
+                except Exception as x:
+                    tb = getattr(x, "worker_traceback", None) or traceback.format_exc()
+                    queue.record(job, exception=x, tb=tb)
+                else:
+                    get_history().add_records(records)
+                    count_worker_counts(counts)
+                    queue.record(job, result, on_success=on_success, elapsed=elapsed)
+    return queue.finish()
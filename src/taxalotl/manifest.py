@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""Content-hash manifests that let normalize and partition skip up-to-date work.
+
+A stage writes a small __manifest__.json next to its outputs. It holds the
+SHA-256 of each input and output file, along with the size and mtime that the
+file had when it was hashed, so that an unchanged file is recognized from a
+stat call rather than by reading it again. The `digest` of a manifest is a
+hash of the content of the inputs and of anything else the stage used (e.g.
+the partition map), so a later stage can chain its own inputs to it.
+"""
+import hashlib
+import json
+import logging
+import os
+
+from peyutil import read_as_json, write_as_json
+
+from .taxonomy_index import INDEX_SUFFIX
+from .util import AtomicOutFile, open_input
+
+_LOG = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "__manifest__.json"
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def hash_file(filepath):
+    h = hashlib.sha256()
+    with open_input(filepath, "rb") as inp:
+        while True:
+            block = inp.read(_HASH_BLOCK_SIZE)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_json(obj):
+    """SHA-256 of the canonical (sorted keys, no whitespace) JSON form of `obj`."""
+    s = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+def file_record(filepath):
+    st = os.stat(filepath)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": hash_file(filepath),
+    }
+
+
+def _files_below(path):
+    """Returns a list of (relative path, path) for the files at or below `path`.
+
+    The relative path of `path` itself is "" if it is a file. Manifests and
+    taxonomy indices (which are rebuilt as needed) are skipped.
+    """
+    if not os.path.exists(path):
+        return []
+    if not os.path.isdir(path):
+        return [("", path)]
+    r = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for fn in sorted(filenames):
+            if fn == MANIFEST_FILENAME or fn.endswith(INDEX_SUFFIX):
+                continue
+            fp = os.path.join(dirpath, fn)
+            r.append((os.path.relpath(fp, path), fp))
+    return r
+
+
+def hash_files_below(path):
+    """Returns a dict of relative path -> record for the files at or below `path`."""
+    return {rel: file_record(fp) for rel, fp in _files_below(path)}
+
+
+class StageManifest(object):
+    """The files that a stage read and wrote, and the other things that it used.
+
+    `inputs` and `outputs` map a path (relative to the input or output dir) to a
+    file record. `used` maps a name to a JSON-able value (typically a hash).
+    """
+
+    def __init__(self, stage, inputs=None, used=None, outputs=None):
+        self.stage = stage
+        self.inputs = inputs if inputs else {}
+        self.used = used if used else {}
+        self.outputs = outputs if outputs else {}
+        # True if a record had only its mtime updated by a *_match call
+        self.refreshed = False
+
+    @property
+    def digest(self):
+        """Hash of the content of the inputs and the things used (not the outputs)."""
+        return hash_json(
+            {
+                "stage": self.stage,
+                "inputs": {k: v["sha256"] for k, v in self.inputs.items()},
+                "used": self.used,
+            }
+        )
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "digest": self.digest,
+            "inputs": self.inputs,
+            "used": self.used,
+            "outputs": self.outputs,
+        }
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with AtomicOutFile(os.path.join(directory, MANIFEST_FILENAME)) as outp:
+            write_as_json(self.as_dict(), outp, indent=1, sort_keys=True)
+        self.refreshed = False
+
+    def _records_match(self, records, path):
+        """True if the files at or below `path` are the ones hashed in `records`.
+
+        Only the files whose size and mtime do not match their record are read.
+        """
+        current = _files_below(path)
+        if len(current) != len(records):
+            return False
+        for rel, fp in current:
+            rec = records.get(rel)
+            if rec is None:
+                return False
+            st = os.stat(fp)
+            if st.st_size != rec["size"]:
+                return False
+            if st.st_mtime_ns == rec["mtime_ns"]:
+                continue
+            if hash_file(fp) != rec["sha256"]:
+                return False
+            # touched, but not changed
+            rec["mtime_ns"] = st.st_mtime_ns
+            self.refreshed = True
+        return True
+
+    def inputs_match(self, path):
+        return self._records_match(self.inputs, path)
+
+    def outputs_match(self, path):
+        return self._records_match(self.outputs, path)
+
+
+def read_manifest(directory):
+    """Returns the StageManifest in `directory` or None if there is not one."""
+    fp = os.path.join(directory, MANIFEST_FILENAME)
+    if not os.path.isfile(fp):
+        return None
+    try:
+        d = read_as_json(fp)
+        return StageManifest(
+            d["stage"], inputs=d["inputs"], used=d["used"], outputs=d["outputs"]
+        )
+    except Exception:
+        _LOG.warning('Ignoring unreadable manifest "{}"'.format(fp))
+        return None
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from __future__ import print_function
 from .ott_schema import InterimTaxonomyData
+from .string_pool import intern_rank
 from peyotl.phylo.tree import parse_newick
 import logging
 import os
@@ -22,7 +23,7 @@ def normalize_newick(unpacked_fp, normalized_fp, resource_wrapper):
             )
         if "=" in label:
             rank, name = [i.strip() for i in label.split("=")]
-            itd.to_rank[taxon_id] = rank
+            itd.to_rank[taxon_id] = intern_rank(rank)
         else:
             name = label
         itd.register_id_and_name(taxon_id, name)
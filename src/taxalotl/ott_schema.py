@@ -5,8 +5,8 @@ from __future__ import print_function
 
 import tempfile
 import shutil
+from concurrent.futures import Future
 import csv
-import io
 import os
 
 from peyutil import (
@@ -15,8 +15,12 @@ from peyutil import (
     shorter_fp_form,
     write_as_json,
 )
+from .string_pool import intern_str
 from .taxon import Taxon
-from .util import OutFile
+from .taxonomy_columns import parse_taxonomy_columns, read_taxonomy_header
+from .taxonomy_index import lookup_taxonomy_lines, open_mapped_taxonomy
+from .profiling import StageTimer
+from .util import COMPRESSION_SUFFIXES, OutFile, open_input
 import logging
 
 _LOG = logging.getLogger("taxalotl")
@@ -42,7 +46,7 @@ def _parse_synonyms(tax_part):  # type (TaxonPartition) -> None
         return
     _LOG.debug('parsing synonyms from "{}" ...'.format(syn_fp))
     try:
-        with io.open(syn_fp, "r", encoding="utf-8") as inp:
+        with open_input(syn_fp, decompress=True) as inp:
             iinp = iter(inp)
             try:
                 tax_part.syn_header = next(iinp)
@@ -83,7 +87,7 @@ def _parse_taxa(tax_part):  # type (TaxonPartition) -> None
         return
     ptp = shorter_fp_form(complete_taxon_fp)
     _LOG.debug('parsing taxa from "{}" ...'.format(ptp))
-    with io.open(complete_taxon_fp, "r", encoding="utf-8") as inp:
+    with open_input(complete_taxon_fp, decompress=True) as inp:
         iinp = iter(inp)
         try:
             tax_part.taxon_header = next(iinp)
@@ -109,9 +113,186 @@ def _parse_taxa(tax_part):  # type (TaxonPartition) -> None
                 raise
 
 
-def partition_ott_by_root_id(tax_part):  # type (TaxonPartition) -> None
+def _map_taxa(tax_part):  # type (TaxonPartition) -> bool
+    """Gives tax_part mmap-backed views of its taxonomy file instead of parsing it.
+
+    Returns False if the file can't be indexed (see taxonomy_index).
+    """
+    complete_taxon_fp = tax_part.tax_fp
+    if not os.path.exists(complete_taxon_fp):
+        return False
+    mapped = open_mapped_taxonomy(complete_taxon_fp)
+    if mapped is None:
+        return False
+    _LOG.debug('mapped taxa from "{}"'.format(shorter_fp_form(complete_taxon_fp)))
+    tax_part.taxon_header = mapped.header
+    tax_part.set_mapped_taxa(mapped)
+    return True
+
+
+def partition_ott_by_root_id(
+    tax_part, read_only=False
+):  # type (TaxonPartition, bool) -> None
     _parse_synonyms(tax_part)
-    _parse_taxa(tax_part)
+    if not (read_only and _map_taxa(tax_part)):
+        _parse_taxa(tax_part)
+
+
+# Rows encoded before each write to the output
+_WRITE_BATCH_ROWS = 8192
+_WRITE_BUFFER_SIZE = 1 << 22
+# Pieces per worker process when the writing is split (see _plan_taxonomy_pieces)
+_PIECES_PER_WORKER = 8
+# Tables shared with the forked worker processes of the writers
+_WRITER_TABLES = None
+_NO_NAME = object()
+
+
+class _TaxonomyRowEncoder(object):
+    """Formats the rows of taxonomy.tsv, in the order of write_ott_taxonomy_tsv."""
+
+    def __init__(
+        self,
+        id_to_par,
+        id_to_children,
+        id_to_rank,
+        id_to_name,
+        id_to_flags,
+        has_syn_dict,
+        extinct_known,
+    ):
+        self.id_to_par = id_to_par
+        self.id_to_children = id_to_children
+        self.id_to_rank = id_to_rank
+        self.id_to_name = id_to_name
+        self.id_to_flags = id_to_flags
+        self.has_syn_dict = has_syn_dict
+        self.extinct_known = extinct_known
+        self.syn_id_order = []
+        self.num_tips = 0
+        self.num_internals = 0
+
+    def encode(self, stack, emit, max_nodes=-1):
+        """Pops IDs from stack (pushing the IDs of their children) until it is
+        empty or max_nodes IDs were popped, and calls emit(bytes) with batches
+        of the UTF-8 rows of those IDs."""
+        has_syn_dict, syn_id_order = self.has_syn_dict, self.syn_id_order
+        id_to_name, id_to_par = self.id_to_name, self.id_to_par
+        id_to_rank, id_to_children = self.id_to_rank, self.id_to_children
+        id_to_flags, extinct_known = self.id_to_flags, self.extinct_known
+        rows = []
+        while stack and max_nodes != 0:
+            max_nodes -= 1
+            curr_id = stack.pop()
+            if curr_id in has_syn_dict:
+                syn_id_order.append(curr_id)
+            name = id_to_name.get(curr_id, _NO_NAME)
+            if name is _NO_NAME:
+                _LOG.warning('Could not find a name for ID "{}"'.format(curr_id))
+                continue
+            try:
+                par_id = id_to_par.get(curr_id)
+                spar_id = "" if par_id is None else str(par_id)
+                rank = id_to_rank.get(curr_id, "")
+                children = id_to_children.get(curr_id)
+                if children:
+                    self.num_internals += 1
+                    stack.extend(children)
+                else:
+                    self.num_tips += 1
+                flags = id_to_flags.get(curr_id, "") if id_to_flags else ""
+                if flags and not isinstance(flags, str):
+                    flags = ",".join(flags)
+                if extinct_known and extinct_known.get(curr_id):
+                    flags = "{},extinct".format(flags) if flags else "extinct"
+                fields = (str(curr_id), spar_id, name, rank, flags, "\n")
+                try:
+                    rows.append("\t|\t".join(fields))
+                except:
+                    _LOG.exception("error serializing {}".format(repr(fields[:-1])))
+            except:
+                _LOG.error("Error writing taxon_id {}".format(curr_id))
+                raise
+            if len(rows) >= _WRITE_BATCH_ROWS:
+                emit("".join(rows).encode("utf-8"))
+                rows = []
+        if rows:
+            emit("".join(rows).encode("utf-8"))
+
+
+def _plan_taxonomy_pieces(encoder, root_ids, min_pieces):
+    """Splits the writing of the trees below root_ids into a list of pieces in
+    output order: (True, ID) for the subtree of ID, or (False, (bytes, IDs with
+    synonyms)) for a row that was encoded while splitting. Subtrees are split
+    (their root row encoded here, followed by their children's subtrees in DFS
+    order) level by level until there are at least min_pieces subtrees or no
+    more to split.
+    """
+    pieces = [(True, i) for i in root_ids]
+    while True:
+        num_subtrees = sum(1 for p in pieces if p[0])
+        if num_subtrees >= min_pieces:
+            return pieces
+        expanded, split = [], False
+        for is_subtree, val in pieces:
+            if not is_subtree:
+                expanded.append((is_subtree, val))
+                continue
+            chunks, stack = [], [val]
+            encoder.syn_id_order = []
+            encoder.encode(stack, chunks.append, max_nodes=1)
+            if chunks or encoder.syn_id_order:
+                expanded.append((False, (b"".join(chunks), encoder.syn_id_order)))
+            if stack:
+                split = True
+                expanded.extend((True, c) for c in reversed(stack))
+        pieces = expanded
+        if not split:
+            return pieces
+
+
+def _results_in_order(pool, calls, window):
+    """Yields the results of calls (a sequence of (func, arg) or (None, result)),
+    computed in pool with at most `window` of them waiting to be yielded."""
+    from collections import deque
+
+    pending = deque()
+    for func, arg in calls:
+        if func is None:
+            fut = Future()
+            fut.set_result(arg)
+        else:
+            fut = pool.submit(func, arg)
+        pending.append(fut)
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _fork_pool(num_workers):
+    """A pool of forked worker processes (which see _WRITER_TABLES), or None if
+    fork is not available."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        ctx = multiprocessing.get_context("fork")
+    except ValueError:
+        return None
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx)
+
+
+def _encode_taxonomy_subtree_in_worker(root_id):
+    encoder = _TaxonomyRowEncoder(*_WRITER_TABLES)
+    chunks = []
+    encoder.encode([root_id], chunks.append)
+    return (
+        b"".join(chunks),
+        encoder.syn_id_order,
+        encoder.num_tips,
+        encoder.num_internals,
+    )
 
 
 def write_ott_taxonomy_tsv(
@@ -125,82 +306,125 @@ def write_ott_taxonomy_tsv(
     has_syn_dict,
     details_log,
     extinct_known=None,
+    num_workers=1,
+    compression=None,
 ):
     """If has_syn_dict is provided, then a list of the IDs that occur in that dict
     is returned in the order that the IDs were written to taxonomy file. This
     allows for the synonyms.tsv file to be written in a similar order, which makes browsing it
     easier.
+
+    Rows are encoded and written in batches. With num_workers > 1 the subtrees
+    are encoded in that many forked processes and written in the same order.
+    `compression` is passed to OutFile.
     """
+    global _WRITER_TABLES
     if extinct_known is None:
         extinct_known = {}
     if has_syn_dict is None:
         has_syn_dict = {}
-    syn_id_order = []
-    num_tips_written = 0
-    num_internals_written = 0
+    tables = (
+        id_to_par,
+        id_to_children,
+        id_to_rank,
+        id_to_name,
+        id_to_flags,
+        has_syn_dict,
+        extinct_known,
+    )
+    encoder = _TaxonomyRowEncoder(*tables)
     rn = list(root_nodes)
     rn.sort()
     header = INP_FLAGGED_OTT_TAXONOMY_HEADER
-    with OutFile(out_fp) as out:
-        out.write(header)
-        # need to print id, parent id, and name
-        for root_id in rn:
-            stack = [root_id]
-            while stack:
-                curr_id = stack.pop()
-                if curr_id in has_syn_dict:
-                    syn_id_order.append(curr_id)
-                try:
-                    name = id_to_name[curr_id]
-                except KeyError:
-                    _LOG.warning('Could not find a name for ID "{}"'.format(curr_id))
-                    continue
+    with OutFile(
+        out_fp, mode="wb", buffering=_WRITE_BUFFER_SIZE, compression=compression
+    ) as out:
+        out.write(header.encode("utf-8"))
+        pool = _fork_pool(num_workers) if num_workers > 1 else None
+        if pool is None:
+            for root_id in rn:
+                encoder.encode([root_id], out.write)
+        else:
+            with pool:
+                pieces = _plan_taxonomy_pieces(
+                    encoder, rn, _PIECES_PER_WORKER * num_workers
+                )
+                syn_id_order = []
+                calls = [
+                    (_encode_taxonomy_subtree_in_worker, val)
+                    if is_subtree
+                    else (None, val + (0, 0))
+                    for is_subtree, val in pieces
+                ]
+                _WRITER_TABLES = tables
                 try:
-                    par_id = id_to_par.get(curr_id)
-                    if par_id is None:
-                        spar_id = ""
-                    else:
-                        spar_id = str(par_id)
-                    rank = id_to_rank.get(curr_id, "")
-                    children = id_to_children.get(curr_id)
-                    if children:
-                        num_internals_written += 1
-                        stack.extend(children)
-                    else:
-                        num_tips_written += 1
-                    flags = id_to_flags.get(curr_id, "")
-                    if flags and not isinstance(flags, str):
-                        flags = ",".join(flags)
-                    ev = extinct_known.get(curr_id)
-                    if ev:
-                        if flags:
-                            flags = "{},extinct".format(flags)
-                        else:
-                            flags = "extinct"
-                    fields = [str(curr_id), spar_id, name, rank, flags, ""]
-                    try:
-                        out.write("{}\n".format("\t|\t".join(fields)))
-                    except:
-                        _LOG.exception("error serializing {}".format(repr(fields)))
-                except:
-                    _LOG.error("Error writing taxon_id {}".format(curr_id))
-                    raise
-    details_log["num_tips_written"] = num_tips_written
-    details_log["num_internals_written"] = num_internals_written
-    return syn_id_order
-
-
-def write_ott_synonyms_tsv(out_fp, id_to_name_name_type_list, id_order, details_log):
+                    window = 2 * num_workers
+                    for r in _results_in_order(pool, calls, window):
+                        text, syn_ids, num_tips, num_internals = r
+                        out.write(text)
+                        syn_id_order.extend(syn_ids)
+                        encoder.num_tips += num_tips
+                        encoder.num_internals += num_internals
+                finally:
+                    _WRITER_TABLES = None
+            encoder.syn_id_order = syn_id_order
+    details_log["num_tips_written"] = encoder.num_tips
+    details_log["num_internals_written"] = encoder.num_internals
+    return encoder.syn_id_order
+
+
+def _encode_synonym_rows(id_to_name_name_type_list, id_order):
+    """(UTF-8 rows of synonyms.tsv for the IDs in id_order, # of synonyms)"""
+    rows = []
+    for nd_id in id_order:
+        snd_id = str(nd_id)
+        for name, name_type, syn_id in id_to_name_name_type_list[nd_id]:
+            rows.append("{}\t|\t{}\t|\t{}\t|\t\n".format(snd_id, name, name_type))
+    return "".join(rows).encode("utf-8"), len(rows)
+
+
+def _encode_synonym_rows_in_worker(id_order):
+    return _encode_synonym_rows(_WRITER_TABLES, id_order)
+
+
+def write_ott_synonyms_tsv(
+    out_fp,
+    id_to_name_name_type_list,
+    id_order,
+    details_log,
+    num_workers=1,
+    compression=None,
+):
+    """Writes the synonyms of the IDs in id_order, in batches of IDs (encoded in
+    num_workers forked processes if num_workers > 1)."""
+    global _WRITER_TABLES
     num_syn_written = 0
-    with OutFile(out_fp) as out:
-        out.write(INP_OTT_SYNONYMS_HEADER)
-        for nd_id in id_order:
-            syn_list = id_to_name_name_type_list[nd_id]
-            for name, name_type, syn_id in syn_list:
-                num_syn_written += 1
-                out.write(
-                    "{}\n".format("\t|\t".join([str(nd_id), name, name_type, ""]))
-                )
+    batches = [
+        id_order[i : i + _WRITE_BATCH_ROWS]
+        for i in range(0, len(id_order), _WRITE_BATCH_ROWS)
+    ]
+    with OutFile(
+        out_fp, mode="wb", buffering=_WRITE_BUFFER_SIZE, compression=compression
+    ) as out:
+        out.write(INP_OTT_SYNONYMS_HEADER.encode("utf-8"))
+        pool = None
+        if num_workers > 1 and len(batches) > 1:
+            pool = _fork_pool(num_workers)
+        if pool is None:
+            for batch in batches:
+                text, n = _encode_synonym_rows(id_to_name_name_type_list, batch)
+                out.write(text)
+                num_syn_written += n
+        else:
+            with pool:
+                calls = [(_encode_synonym_rows_in_worker, b) for b in batches]
+                _WRITER_TABLES = id_to_name_name_type_list
+                try:
+                    for text, n in _results_in_order(pool, calls, 2 * num_workers):
+                        out.write(text)
+                        num_syn_written += n
+                finally:
+                    _WRITER_TABLES = None
     details_log["num_synonyms_written"] = num_syn_written
     details_log["num_ids_with_synonyms_written"] = len(id_order)
 
@@ -221,7 +445,7 @@ def read_taxonomy_to_get_id_to_name(tax_dir, id_coercion=int):
     i = 0
     fp = os.path.join(tax_dir, "taxonomy.tsv")
     try:
-        with io.open(fp, "r", encoding="utf-8") as inp:
+        with open_input(fp) as inp:
             reader = csv.reader(inp, delimiter="\t")
             header = next(reader)
             uidx = header.index("uid")
@@ -262,7 +486,7 @@ def raw_src_string_to_dict(raw):
             sid = int_or_str(sid)
         except:
             pass
-        d.setdefault(src, set()).add(sid)
+        d.setdefault(intern_str(src), set()).add(sid)
     return d
 
 
@@ -296,7 +520,7 @@ def full_ott_line_parser(taxon, line):
         taxon.uniqname = ls[5]
     if len(ls) > 7:
         if ls[6]:
-            taxon.flags = set(ls[6].split(","))
+            taxon.flags = ls[6]
 
 
 def tax_wikidata_parser(taxon, line):
@@ -351,7 +575,7 @@ def flag_after_rank_parser(taxon, line):
     if ls[3]:
         taxon.rank = ls[3]
     if ls[4]:
-        taxon.flags = set(ls[4].split(","))
+        taxon.flags = ls[4]
 
 
 HEADER_TO_LINE_PARSER = {
@@ -365,6 +589,11 @@ HEADER_TO_LINE_PARSER = {
 
 # noinspection PyTypeChecker
 def read_taxonomy_to_get_id_to_fields(tax_dir):
+    """Returns a read-only mapping of uid -> Taxon for tax_dir's taxonomy.tsv.
+
+    The file is read into columns, and each Taxon is built when it is looked up
+    (see taxonomy_columns.TaxaByUid).
+    """
     fp = os.path.join(tax_dir, "taxonomy.tsv")
     fields = [
         "uid",
@@ -380,70 +609,155 @@ def read_taxonomy_to_get_id_to_fields(tax_dir):
     if not os.path.exists(fp):
         return {}
     try:
-        with io.open(fp, "r", encoding="utf-8") as inp:
-            iinp = iter(inp)
-            header = next(iinp)
-            assert header == expected_header
-            id_to_obj = {}
-            for n, line in enumerate(iinp):
-                obj = Taxon(line, line_num=1 + n)
-                oid = obj.id
-                assert oid not in id_to_obj
-                id_to_obj[oid] = obj
-            return id_to_obj
+        assert read_taxonomy_header(fp) == expected_header
+        cols = parse_taxonomy_columns(fp, columns=fields[:-1] + ["line"])
+        return {} if cols is None else cols.taxa_by_uid()
     except:
         _LOG.exception("Error reading {}".format(fp))
         raise
 
 
 def read_taxonomy_to_get_single_taxon(tax_dir, root_id):
-    sri = str(root_id)
+    return read_taxonomy_to_get_taxa(tax_dir, [root_id]).get(root_id)
+
+
+def read_taxonomy_to_get_taxa(tax_dir, uids):
+    """Returns a dict of uid -> Taxon for the `uids` found in tax_dir's taxonomy.tsv.
+
+    The lines are found through the file's uid index (see taxonomy_index); files
+    that can't be indexed are scanned.
+    """
     fp = os.path.join(tax_dir, "taxonomy.tsv")
-    fields = [
-        "uid",
-        "parent_uid",
-        "name",
-        "rank",
-        "sourceinfo",
-        "uniqname",
-        "flags",
-        "\n",
-    ]
-    expected_header = "\t|\t".join(fields)
     try:
-        with io.open(fp, "r", encoding="utf-8") as inp:
-            iinp = iter(inp)
-            header = next(iinp)
-            assert header == expected_header
-            for n, line in enumerate(iinp):
-                if not line.startswith(sri):
-                    continue
-                obj = Taxon(line, line_num=1 + n)
-                if root_id == obj.id:
-                    return obj
+        looked_up = lookup_taxonomy_lines(fp, uids)
+        if looked_up is None:
+            return _scan_taxonomy_for_taxa(fp, uids)
+        header, uid_to_pos_line = looked_up
+        assert header == FULL_OTT_HEADER
+        r = {}
+        for uid, (pos, line) in uid_to_pos_line.items():
+            r[uid] = Taxon(line, line_num=1 + pos)
+        return r
     except:
         _LOG.exception("Error reading {}".format(fp))
         raise
 
 
+def _scan_taxonomy_for_taxa(fp, uids):
+    wanted = set(uids)
+    prefixes = tuple(set(str(i) for i in wanted))
+    r = {}
+    with open_input(fp) as inp:
+        iinp = iter(inp)
+        header = next(iinp)
+        assert header == FULL_OTT_HEADER
+        for n, line in enumerate(iinp):
+            if not line.startswith(prefixes):
+                continue
+            obj = Taxon(line, line_num=1 + n)
+            if obj.id in wanted:
+                r[obj.id] = obj
+                if len(r) == len(wanted):
+                    break
+    return r
+
+
+# del_ids compacts child lists longer than this once, rather than calling remove
+_MAX_REMOVE_SCAN = 32
+# Above this number of removals from one list, _remove_first_occurrences
+#   compacts the list in one pass rather than calling remove for each
+_MAX_REMOVE_CALLS = 4
+
+
+def _remove_first_occurrences(seq, to_remove):
+    """Removes the first occurrence of each (distinct) element of to_remove from
+    the list (or array) seq, as seq.remove(el) for each el would (ignoring the
+    elements that are not in seq), in one pass if there are many of them."""
+    if len(to_remove) <= _MAX_REMOVE_CALLS:
+        for el in set(to_remove):
+            try:
+                seq.remove(el)
+            except ValueError:
+                pass
+        return
+    to_remove = set(to_remove)
+    kept = []
+    for el in seq:
+        if el in to_remove:
+            to_remove.discard(el)
+        else:
+            kept.append(el)
+    if len(kept) != len(seq):
+        del seq[:]
+        seq.extend(kept)
+
+
+def interim_tax_data_for(res_wrapper):
+    """A new InterimTaxonomyData, with the storage, number of writer processes and
+    compression of the output that the config asks for."""
+    try:
+        config = res_wrapper.config
+        compact = bool(config.compact_normalize_storage)
+        write_workers = config.normalize_write_workers
+        write_compression = config.normalize_write_compression
+    except (AttributeError, RuntimeError):
+        compact, write_workers, write_compression = False, 1, None
+    itd = InterimTaxonomyData(compact_storage=compact)
+    itd.write_workers = write_workers
+    itd.write_compression = write_compression
+    return itd
+
+
 class InterimTaxonomyData(object):
-    def __init__(self):
+    """The taxa of a resource while it is being normalized.
+
+    With compact_storage=True the per-ID maps are the array-backed columns of
+    interim_store (one dense slot per ID) rather than dicts.
+    """
+
+    def __init__(self, compact_storage=False):
         self.about = {}
         self.details_log = {}
         self.forwards = {}  # from old ID to new ID
-        self.to_par = {}  # ID -> parent ID or None
-        self.to_children = {}  # ID to list of children IDs
-        self.to_rank = {}  # ID -> rank string
+        self.compact_storage = compact_storage
+        if compact_storage:
+            from .interim_store import (
+                ChildListColumn,
+                IdColumn,
+                IdRemap,
+                NameColumn,
+                NameIndex,
+                ObjectColumn,
+                RankColumn,
+                SynonymColumn,
+            )
+
+            ids = IdRemap()
+            self.to_par = IdColumn(ids)
+            self.to_children = ChildListColumn(ids)
+            self.to_rank = RankColumn(ids)
+            self.name_to_ids = NameIndex()
+            self.to_name = NameColumn(ids, self.name_to_ids)
+            self.to_flags = ObjectColumn(ids)
+            self.synonyms = SynonymColumn(ids)
+        else:
+            self.to_par = {}  # ID -> parent ID or None
+            self.to_children = {}  # ID to list of children IDs
+            self.to_rank = {}  # ID -> rank (pooled, see string_pool.intern_rank)
+            self.to_name = {}  # ID -> name
+            self.name_to_ids = {}  # name to ID or list of IDs
+            self.to_flags = {}  # ID -> flags
+            self.synonyms = {}
         self.root_nodes = set()  # set of IDs
-        self.to_name = {}  # ID -> name
-        self.name_to_ids = {}  # name to
-        self.to_flags = {}  # ID -> flags
-        self.synonyms = {}
         self.repeated_names = set()
         self.extinct_known = None
         self.syn_id_to_valid = None
         self.extra_blob = None
         self.names_interpreted_as_changes = False
+        # number of processes encoding the output of write_to_dir, and compression
+        #   of its .tsv files (a key of util.COMPRESSION_SUFFIXES or None)
+        self.write_workers = 1
+        self.write_compression = None
 
     def finalize(self):
         self.details_log["num_forwards"] = len(self.forwards)
@@ -452,13 +766,21 @@ class InterimTaxonomyData(object):
         self.details_log["num_ids_with_synonyms"] = len(self.synonyms)
 
     def register_id_and_name(self, taxon_id, name):
-        self.to_name[taxon_id] = name
-        if add_or_append_to_dict(self.name_to_ids, name, taxon_id):
+        if self.compact_storage:
+            repeated = self.to_name.register(taxon_id, name)
+        else:
+            self.to_name[taxon_id] = name
+            repeated = add_or_append_to_dict(self.name_to_ids, name, taxon_id)
+        if repeated:
             self.repeated_names.add(name)
 
     def register_synonym(self, valid_id, syn_name, name_type, syn_id=None):
         assert valid_id != syn_id
-        self.synonyms.setdefault(valid_id, []).append((syn_name, name_type, syn_id))
+        if self.compact_storage:
+            self.synonyms.add(valid_id, syn_name, name_type, syn_id)
+        else:
+            el = (syn_name, name_type, syn_id)
+            self.synonyms.setdefault(valid_id, []).append(el)
 
     def fix_synonym(self, valid_id, old_valid, syn_id):
         assert valid_id != old_valid
@@ -484,59 +806,82 @@ class InterimTaxonomyData(object):
             self.synonyms,
             self.details_log,
             self.extinct_known,
+            num_workers=self.write_workers,
+            compression=self.write_compression,
         )
 
     def write_to_dir(self, destination):
-        # Write out in OTT form
-        d = tempfile.mkdtemp()
-        fn = [
-            "taxonomy.tsv",
-            "synonyms.tsv",
-            "forwards.tsv",
-            "about.json",
-            "details.json",
-        ]
-        try:
-            syn_order = self.write_ott_taxonomy_tsv(os.path.join(d, "taxonomy.tsv"))
-            write_ott_synonyms_tsv(
-                os.path.join(d, "synonyms.tsv"),
-                self.synonyms,
-                syn_order,
-                self.details_log,
-            )
-            if self.forwards:
-                write_ott_forwards(os.path.join(d, "forwards.tsv"), self.forwards)
-
-            about_fp = os.path.join(d, "about.json")
-            with OutFile(about_fp) as about_outs:
-                write_as_json(self.about, about_outs, indent=2)
-            self.finalize()
-            write_ncbi_details_json(os.path.join(d, "details.json"), self.details_log)
-        except:
-            for f in fn:
-                tf = os.path.join(d, f)
-                if os.path.exists(tf):
-                    try:
-                        os.remove(tf)
-                    except:
-                        pass
+        with StageTimer("write"):
+            # Write out in OTT form
+            d = tempfile.mkdtemp()
+            suffix = ""
+            if self.write_compression:
+                suffix = COMPRESSION_SUFFIXES[self.write_compression]
+            tax_fn, syn_fn = "taxonomy.tsv" + suffix, "synonyms.tsv" + suffix
+            fn = [
+                tax_fn,
+                syn_fn,
+                "forwards.tsv",
+                "about.json",
+                "details.json",
+            ]
             try:
-                os.rmdir(d)
+                syn_order = self.write_ott_taxonomy_tsv(os.path.join(d, tax_fn))
+                synonyms = self.synonyms
+                if self.compact_storage:
+                    # read the synonym lists without building and keeping all of them
+                    synonyms = synonyms.read_only_view()
+                write_ott_synonyms_tsv(
+                    os.path.join(d, syn_fn),
+                    synonyms,
+                    syn_order,
+                    self.details_log,
+                    num_workers=self.write_workers,
+                    compression=self.write_compression,
+                )
+                if self.forwards:
+                    write_ott_forwards(os.path.join(d, "forwards.tsv"), self.forwards)
+
+                about_fp = os.path.join(d, "about.json")
+                with OutFile(about_fp) as about_outs:
+                    write_as_json(self.about, about_outs, indent=2)
+                self.finalize()
+                write_ncbi_details_json(
+                    os.path.join(d, "details.json"), self.details_log
+                )
             except:
-                pass
-            raise
-        assure_dir_exists(destination)
-        for f in fn:
-            sfp = os.path.join(d, f)
-            if os.path.exists(sfp):
-                dfp = os.path.join(destination, f)
-                shutil.move(sfp, dfp)
-        os.rmdir(d)
+                for f in fn:
+                    tf = os.path.join(d, f)
+                    if os.path.exists(tf):
+                        try:
+                            os.remove(tf)
+                        except:
+                            pass
+                try:
+                    os.rmdir(d)
+                except:
+                    pass
+                raise
+            assure_dir_exists(destination)
+            for f in fn:
+                sfp = os.path.join(d, f)
+                if os.path.exists(sfp):
+                    dfp = os.path.join(destination, f)
+                    shutil.move(sfp, dfp)
+            os.rmdir(d)
 
     def del_ids(self, id_list):
+        """Removes the IDs (and their entries in the child list of their parent).
+
+        IDs are removed from short child lists right away. For longer lists they
+        are collected, and each list is then compacted once (keeping the order of
+        the remaining children), so bulk deletions are linear rather than a
+        list.remove per ID.
+        """
         to_name = self.to_name
         to_par = self.to_par
         to_children = self.to_children
+        par_to_dead = {}
         for taxon_id in id_list:
             if taxon_id in to_name:
                 del to_name[taxon_id]
@@ -546,8 +891,16 @@ class InterimTaxonomyData(object):
             if pid:
                 del to_par[taxon_id]
                 pc = to_children.get(pid)
+                if not pc:
+                    continue
+                if len(pc) > _MAX_REMOVE_SCAN:
+                    par_to_dead.setdefault(pid, []).append(taxon_id)
+                    continue
                 try:
-                    if pc:
-                        pc.remove(taxon_id)
-                except:
+                    pc.remove(taxon_id)
+                except ValueError:
                     pass
+        for pid, dead in par_to_dead.items():
+            pc = to_children.get(pid)
+            if pc:
+                _remove_first_occurrences(pc, dead)
@@ -1,12 +1,12 @@
 from __future__ import print_function
 
-import io
 import logging
 
 from peyutil import shorter_fp_form
 
 from ..resource_wrapper import TaxonomyWrapper
 from ..parsing.darwin_core import normalize_darwin_core_taxonomy
+from ..util import open_input
 
 _LOG = logging.getLogger(__name__)
 
@@ -76,7 +76,7 @@ def partition_col_by_root_id(tax_part):  # type (TaxonPartition) -> None
     assert not syn_fp
     syn_by_id = tax_part._syn_by_id
     ptp = shorter_fp_form(complete_taxon_fp)
-    with io.open(complete_taxon_fp, "r", encoding="utf-8") as inp:
+    with open_input(complete_taxon_fp) as inp:
         iinp = iter(inp)
         tax_part.taxon_header = next(iinp)
         prev_line = None
@@ -104,7 +104,7 @@ def partition_col_by_root_id(tax_part):  # type (TaxonPartition) -> None
                     except:
                         if n == 0:
                             continue
-                    syn_by_id.setdefault(accept_id, []).append((col_id, line))
+                    syn_by_id.add(accept_id, col_id, line)
                 else:
                     tax_part.read_taxon_line(col_id, par_id, line)
             except Exception:
@@ -7,7 +7,6 @@
 #   reference-taxonomy/feed/gbif/process_gbif_taxonomy.py
 from __future__ import print_function
 
-import io
 import os
 import re
 
@@ -17,12 +16,17 @@ import logging
 
 from peyutil import assure_dir_exists
 
-from ..ott_schema import InterimTaxonomyData
+from ..archive import UnpackedMembers
+from ..ott_schema import interim_tax_data_for
+from ..profiling import StageTimer
 from ..resource_wrapper import TaxonomyWrapper
-from ..util import OutFile
+from ..string_pool import intern_rank
+from ..util import OutFile, open_input
 
 _LOG = logging.getLogger(__name__)
 
+GBIF_ARCHIVE_MEMBERS = ("meta.xml", "Taxon.tsv")
+
 # Cases to deal with:
 #  Foo bar
 #  Foo bar Putnam
@@ -86,7 +90,8 @@ def canonical_name(name):
     return canon if haz else name
 
 
-def write_gbif_projection_file(source, destination, fields2index):
+def write_gbif_projection_file(taxon_file, destination, fields2index):
+    """Reads the taxon file object (and closes it) and writes the projection."""
     i = 0
     sci_ind = fields2index["scientificName"]
     tax_id = fields2index["id"]
@@ -95,7 +100,7 @@ def write_gbif_projection_file(source, destination, fields2index):
     tr_ind = fields2index["taxonRank"]
     ts_ind = fields2index["taxonomicStatus"]
     nat_ind = fields2index["nameAccordingTo"]
-    with io.open(source, "r", encoding="utf-8") as infile:
+    with taxon_file as infile:
         with OutFile(destination) as outfile:
             for line in infile:
                 row = line.split("\t")
@@ -146,7 +151,7 @@ def read_gbif_projection(proj_filepath, itd, field_to_index, do_gbif_checks):
     to_ignore = set()
     count = 0
     n_syn = 0
-    with io.open(proj_filepath, "r", encoding="utf-8") as inp:
+    with open_input(proj_filepath) as inp:
         for line_num, row in enumerate(inp):
             fields = row.split("\t")
             # acceptedNameUsageID
@@ -206,7 +211,7 @@ def read_gbif_projection(proj_filepath, itd, field_to_index, do_gbif_checks):
 
             # Past all the filters, time to store
             itd.register_id_and_name(taxon_id, name)
-            to_rank[taxon_id] = rank
+            to_rank[taxon_id] = intern_rank(rank)
             if parent_id_string:
                 par_id = int(parent_id_string)
                 to_par[taxon_id] = par_id
@@ -294,11 +299,10 @@ def add_fake_root(itd):
     itd.root_nodes = {0}
 
 
-# noinspection PyUnusedLocal
-def normalize_darwin_core_taxonomy(source, destination, res_wrapper):
-    assure_dir_exists(destination)
-    manifest_fp = os.path.join(source, "meta.xml")
-    manifest_root = ET.parse(manifest_fp).getroot()
+def _write_darwin_core_projection(source, proj_out):
+    manifest_fp = "meta.xml"
+    with source.open(manifest_fp, binary=True) as manifest_file:
+        manifest_root = ET.parse(manifest_file).getroot()
     core_paths = []
     field2index = {}
     for el in manifest_root.findall("{http://rs.tdwg.org/dwc/text/}core"):
@@ -318,10 +322,20 @@ def normalize_darwin_core_taxonomy(source, destination, res_wrapper):
             )
         )
     taxon_fn = core_paths[0]
+    write_gbif_projection_file(source.open(taxon_fn), proj_out, field2index)
+
+
+# noinspection PyUnusedLocal
+def normalize_darwin_core_taxonomy(source, destination, res_wrapper):
+    """`source` is the dir that the archive was unpacked to, or the ArchiveMembers
+    of the archive (GBIF_ARCHIVE_MEMBERS for GBIF)."""
+    if not hasattr(source, "open"):
+        source = UnpackedMembers(source)
+    assure_dir_exists(destination)
     proj_out = os.path.join(destination, "projection.tsv")
-    if not os.path.exists(proj_out):
-        proj_in = os.path.join(source, taxon_fn)
-        write_gbif_projection_file(proj_in, proj_out, field2index)
+    with source, StageTimer("parse"):
+        if not os.path.exists(proj_out):
+            _write_darwin_core_projection(source, proj_out)
     homemade = {
         "id": 0,
         "parentNameUsageID": 1,
@@ -332,10 +346,11 @@ def normalize_darwin_core_taxonomy(source, destination, res_wrapper):
         "nameAccordingTo": 6,
     }
 
-    itd = InterimTaxonomyData()
-    to_remove, to_ignore, paleos = read_gbif_projection(
-        proj_out, itd, homemade, do_gbif_checks=isinstance(res_wrapper, GBIFWrapper)
-    )
+    itd = interim_tax_data_for(res_wrapper)
+    with StageTimer("parse"):
+        to_remove, to_ignore, paleos = read_gbif_projection(
+            proj_out, itd, homemade, do_gbif_checks=isinstance(res_wrapper, GBIFWrapper)
+        )
     add_fake_root(itd)
     remove_if_tips(itd, to_remove)
     o_to_ignore = find_orphaned(itd)
@@ -354,13 +369,14 @@ _BOLD_NAME = re.compile(r"BOLD[:]([A-Z0-9]+)")
 
 class GBIFWrapper(TaxonomyWrapper):
     schema = {"http://rs.tdwg.org/dwc/"}
+    archive_members = GBIF_ARCHIVE_MEMBERS
 
     def __init__(self, obj, parent=None, refs=None):
         TaxonomyWrapper.__init__(self, obj, parent=parent, refs=refs)
 
     def normalize(self):
         normalize_darwin_core_taxonomy(
-            self.unpacked_filepath, self.normalized_filedir, self
+            self.normalize_source(), self.normalized_filedir, self
         )
 
     def node_should_be_semanticized(self, node):
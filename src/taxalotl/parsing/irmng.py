@@ -10,8 +10,11 @@ import re
 import logging
 
 
-from ..ott_schema import InterimTaxonomyData
+from ..ott_schema import InterimTaxonomyData, interim_tax_data_for
+from ..profiling import StageTimer
 from ..resource_wrapper import TaxonomyWrapper
+from ..string_pool import intern_rank
+from ..util import open_input
 
 _LOG = logging.getLogger(__name__)
 
@@ -37,13 +40,14 @@ def _find_irmng_input_files(source):
     )
 
 
-def read_irmng_file(irmng_file_name):
+def read_irmng_file(irmng_file_name, itd=None):
     # 0 "TAXONID","SCIENTIFICNAME","SCIENTIFICNAMEAUTHORSHIP","GENUS",
     # 4 "SPECIFICEPITHET","FAMILY","TAXONRANK","TAXONOMICSTATUS",
     # 8 "NOMENCLATURALSTATUS","NAMEACCORDINGTO","ORIGINALNAMEUSAGEID",
     # 11 "NAMEPUBLISHEDIN","ACCEPTEDNAMEUSAGEID","PARENTNAMEUSAGE",
     # 14 "PARENTNAMEUSAGEID","TAXONREMARKS","MODIFIED","NOMENCLATURALCODE"
-    itd = InterimTaxonomyData()
+    if itd is None:
+        itd = InterimTaxonomyData()
 
     rows = 0
     to_par = itd.to_par
@@ -54,7 +58,7 @@ def read_irmng_file(irmng_file_name):
     to_tsta_nstat_keep = itd.extra_blob
     itd.syn_id_to_valid = {}
     syn_id_to_valid = itd.syn_id_to_valid
-    with open(irmng_file_name, "r", encoding="utf-8") as csvfile:
+    with open_input(irmng_file_name) as csvfile:
         csvreader = csv.reader(csvfile)
         header = next(csvreader)
         if header[5] != "FAMILY":
@@ -129,7 +133,7 @@ def read_irmng_file(irmng_file_name):
             itd.register_id_and_name(taxon_id, name)
             if parent:
                 to_children.setdefault(parent, []).append(taxon_id)
-            to_rank[taxon_id] = rank
+            to_rank[taxon_id] = intern_rank(rank)
             to_tsta_nstat_keep[taxon_id] = [tstatus, nstatus, False]
             rows += 1
             if rows % 250000 == 0:
@@ -348,7 +352,7 @@ def read_extinct_info(profile_file_name, itd):
     )
     to_par = itd.to_par
     d = {}
-    with open(profile_file_name, "r", encoding="utf-8") as csvfile:
+    with open_input(profile_file_name) as csvfile:
         csvreader = csv.reader(csvfile)
         header = next(csvreader)
         if header[1] != "ISEXTINCT":
@@ -372,9 +376,11 @@ def read_extinct_info(profile_file_name, itd):
 # noinspection PyUnusedLocal
 def normalize_irmng(source, destination, res_wrapper):
     i_file, prof_file = _find_irmng_input_files(source)
-    itd = read_irmng_file(i_file)
+    with StageTimer("parse"):
+        itd = read_irmng_file(i_file, interim_tax_data_for(res_wrapper))
     fix_irmng(itd)
-    read_extinct_info(prof_file, itd)
+    with StageTimer("parse"):
+        read_extinct_info(prof_file, itd)
     res_wrapper.post_process_interim_tax_data(itd)
     itd.write_to_dir(destination)
 
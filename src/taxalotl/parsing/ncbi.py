@@ -1,12 +1,14 @@
 from __future__ import print_function
 
-import io
 import os
 import time
 import logging
 from peyutil import add_or_append_to_dict
-from ..ott_schema import InterimTaxonomyData
+from ..archive import UnpackedMembers
+from ..ott_schema import interim_tax_data_for
+from ..profiling import StageTimer
 from ..resource_wrapper import TaxonomyWrapper
+from ..string_pool import intern_rank
 
 _LOG = logging.getLogger(__name__)
 
@@ -28,6 +30,9 @@ _LOG = logging.getLogger(__name__)
 #  - change skipids from list to dictionary for speed
 
 
+NCBI_ARCHIVE_MEMBERS = ("nodes.dmp", "names.dmp", "merged.dmp")
+
+
 ####################################################################################################
 # utility
 def file_mod_time_to_isotime(fp):
@@ -41,15 +46,15 @@ def epoch_seconds_to_isotime(sec_since_epoch):
 
 
 ####################################################################################################
-def parse_ncbi_names_file(names_fp, itd):
-    """Takes a filepath to an NCBI names.dmp file.
+def parse_ncbi_names_file(names_file, itd):
+    """Takes an NCBI names.dmp file object (which is closed when it has been read).
     Returns tuple
          0 id_to_name: node_id int -> str
          1 names_to_ids: str -> int or [int, ...]
          2 synonyms node_id -> [(name, type of synonym))
     """
     count = 0
-    with io.open(names_fp, "r", encoding="utf-8") as namesf:
+    with names_file as namesf:
         for line in namesf:
             # if you do \t|\t then you don't get the name class right because it is "\t|"
             spls = line.split("\t|")
@@ -85,8 +90,9 @@ def parse_ncbi_names_file(names_fp, itd):
     _LOG.info("number of IDs with synonyms: {}".format(len(itd.synonyms)))
 
 
-def parse_ncbi_nodes_file(nodes_fp, itd):
-    """Takes a filepath to an NCBI nodes.dmp and returns 3 dict mapping an ID to:
+def parse_ncbi_nodes_file(nodes_file, itd):
+    """Takes an NCBI nodes.dmp file object (which is closed when it has been read)
+    and returns 3 dict mapping an ID to:
     - parent ID (can be None or an int)
     - children list (only for internals)
     - rank string (if available
@@ -96,7 +102,7 @@ def parse_ncbi_nodes_file(nodes_fp, itd):
     to_children = itd.to_children  # key is the parent and value is the list of children
     to_rank = itd.to_rank  # key is the node id and the value is the rank
     root_nodes = itd.root_nodes
-    with io.open(nodes_fp, "r", encoding="utf-8") as nodesf:
+    with nodes_file as nodesf:
         for line in nodesf:
             spls = line.split("\t|\t")
             ns = spls[0].strip()
@@ -111,7 +117,7 @@ def parse_ncbi_nodes_file(nodes_fp, itd):
             rank = spls[2].strip()
             to_par[node_id] = par_id
             if rank:
-                to_rank[node_id] = rank
+                to_rank[node_id] = intern_rank(rank)
             to_children.setdefault(par_id, []).append(node_id)
             count += 1
             if count % 100000 == 0:
@@ -119,9 +125,9 @@ def parse_ncbi_nodes_file(nodes_fp, itd):
     _LOG.info("number of lines in nodes file: {}".format(count))
 
 
-def parse_ncbi_merged(fp, itd):
-    if os.path.exists(fp):
-        with io.open(fp, "r", encoding="utf-8") as inp:
+def parse_ncbi_merged(merged_file, itd):
+    if merged_file is not None:
+        with merged_file as inp:
             for line in inp:
                 rs = line.split("\t|")
                 from_id, to_id = int(rs[0]), int(rs[1])
@@ -212,25 +218,32 @@ def deal_with_ncbi_env_samples_names(itd):
 
 
 def normalize_ncbi(source, destination, res_wrapper):
+    """`source` is the dir that taxdump.tar.gz was unpacked to, or the
+    ArchiveMembers (NCBI_ARCHIVE_MEMBERS) of the archive."""
+    if not hasattr(source, "open"):
+        source = UnpackedMembers(source)
     url = res_wrapper.url
-    itd = InterimTaxonomyData()
-    nodes_fp = os.path.join(source, "nodes.dmp")
-    names_fp = os.path.join(source, "names.dmp")
-    merged_fp = os.path.join(source, "merged.dmp")
+    itd = interim_tax_data_for(res_wrapper)
+    with source, StageTimer("parse"):
+        merged_file = None
+        if source.exists("merged.dmp"):
+            merged_file = source.open("merged.dmp")
+        parse_ncbi_merged(merged_file, itd)
+        # names.dmp precedes nodes.dmp in taxdump.tar.gz
+        parse_ncbi_names_file(source.open("names.dmp"), itd)
+        parse_ncbi_nodes_file(source.open("nodes.dmp"), itd)
+        # Make sure there is only 1 root, and that its parent is an empty string
+        assert len(itd.root_nodes) == 1
+        root_id = list(itd.root_nodes)[0]
+        assert itd.to_par[root_id] is None
+        itd.to_par[root_id] = ""
+        nodes_date = epoch_seconds_to_isotime(source.mtime("nodes.dmp"))
     itd.about = {
         "prefix": "ncbi",
         "prefixDefinition": "http://www.ncbi.nlm.nih.gov/Taxonomy/Browser/wwwtax.cgi?id=",
         "description": "NCBI Taxonomy",
-        "source": {"URL": url, "date": file_mod_time_to_isotime(nodes_fp)},
+        "source": {"URL": url, "date": nodes_date},
     }
-    parse_ncbi_merged(merged_fp, itd)
-    parse_ncbi_nodes_file(nodes_fp, itd)
-    # Make sure there is only 1 root, and that its parent is an empty string
-    assert len(itd.root_nodes) == 1
-    root_id = list(itd.root_nodes)[0]
-    assert itd.to_par[root_id] is None
-    itd.to_par[root_id] = ""
-    parse_ncbi_names_file(names_fp, itd)
     # Change the root's name from root to life
     assert itd.to_name[root_id] == "root"
     itd.to_name[root_id] = "life"
@@ -248,12 +261,13 @@ def normalize_ncbi(source, destination, res_wrapper):
 
 class NCBIWrapper(TaxonomyWrapper):
     schema = {"ncbi taxonomy"}
+    archive_members = NCBI_ARCHIVE_MEMBERS
 
     def __init__(self, obj, parent=None, refs=None):
         TaxonomyWrapper.__init__(self, obj, parent=parent, refs=refs)
 
     def normalize(self):
-        normalize_ncbi(self.unpacked_filepath, self.normalized_filedir, self)
+        normalize_ncbi(self.normalize_source(), self.normalized_filedir, self)
 
     def _post_process_tree(self, tree):
         self.collapse_incertae_sedis_by_name_prefix(tree, "unclassified ")
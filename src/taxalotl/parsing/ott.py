@@ -2,14 +2,13 @@
 # from __future__ import print_function
 
 import os
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 import logging
 
 from peyutil import StringIO
 
-from ..ott_schema import (
-    read_taxonomy_to_get_single_taxon,
-)
+from ..ott_schema import read_taxonomy_to_get_taxa
 from ..cmds.partitions import (
     fill_empty_anc_of_mapping,
     MISC_DIRNAME,
@@ -63,20 +62,28 @@ OTT_3_SEPARATION_TAXA = OTT_PARTMAP
 
 
 def ott_fetch_root_taxon_for_partition(res, parts_key, root_id):
+    r = ott_fetch_root_taxa_for_partition(res, parts_key, [root_id])
+    return r.get(root_id) if r is not None else None
+
+
+def ott_fetch_root_taxa_for_partition(res, parts_key, root_ids):
+    """Returns a dict of root_id -> Taxon (from the taxonomy file that holds the
+    roots of `parts_key`), or None if there is no such file.
+    """
     tax_dir = res.get_taxdir_for_root_of_part(parts_key)
     if not tax_dir:
         _LOG.info("No taxon file found for {}".format(parts_key))
         return None
     # _LOG.info('{} root should be in {}'.format(parts_key, tax_dir))
-    taxon_obj = read_taxonomy_to_get_single_taxon(tax_dir, root_id)
-    if not tax_dir:
-        _LOG.info(
-            "Root taxon for {} with ID {} not found in {}".format(
-                parts_key, root_id, tax_dir
+    taxa = read_taxonomy_to_get_taxa(tax_dir, root_ids)
+    for root_id in root_ids:
+        if root_id not in taxa:
+            _LOG.info(
+                "Root taxon for {} with ID {} not found in {}".format(
+                    parts_key, root_id, tax_dir
+                )
             )
-        )
-        return None
-    return taxon_obj
+    return taxa
 
 
 def ott_build_paritition_maps(res):
@@ -301,24 +308,26 @@ def add_confirmed_sep(nns, tree, list_num_id_taxon, sep_name):
     if list_num_id_taxon:
         r = tree.root
         m = 'The current partition subtree "{}" has {} tips below it.'
-        _LOG.info(m.format(r.name_that_is_unique, r.num_tips_below))
+        _LOG.info(m.format(r.name_that_is_unique, tree.num_tips_below[r.id]))
     top_sep_set = set()
+    # Preorder ranges of the subtrees of the separators chosen so far, kept
+    #   sorted and disjoint so that "is obj below a separator" is a bisection.
+    sep_starts, sep_ends = [], []
     for nt, i, obj in list_num_id_taxon:
-        if top_sep_set:
-            already_sep = False
-            for anc_obj in tree.to_root_gen(obj):
-                if anc_obj.id in top_sep_set:
-                    already_sep = True
-                    break
-            if already_sep:
-                continue
+        start, end = tree.subtree_range(obj)
+        pos = bisect_right(sep_starts, start) - 1
+        if pos >= 0 and start < sep_ends[pos]:
+            continue
         if sep_name is None:
             m = '"{}" has {} tips below it.'.format(obj.name_that_is_unique, nt)
             p = "{} Enter (y) to treat is a separator: ".format(m)
-            if get_true_false_repsonse(p, def_value=True):
-                top_sep_set.add(i)
-        else:
-            top_sep_set.add(i)
+            if not get_true_false_repsonse(p, def_value=True):
+                continue
+        top_sep_set.add(i)
+        # any earlier separator inside this subtree is covered by the new range
+        lo, hi = bisect_left(sep_starts, start), bisect_left(sep_starts, end)
+        sep_starts[lo:hi] = [start]
+        sep_ends[lo:hi] = [end]
     if top_sep_set:
         nns.add_separtors_for_tree(tree, top_sep_set)
 
@@ -378,6 +387,7 @@ class OTTaxonomyWrapper(TaxonomyWrapper):
             )
             for tree in tax_forest.trees:
                 tree.add_num_tips_below()
+                num_tips_below = tree.num_tips_below
                 assert ac_src
                 nst = []
                 for i, obj in tree.id_to_taxon.items():
@@ -390,14 +400,14 @@ class OTTaxonomyWrapper(TaxonomyWrapper):
                         if (obn and (len(obn) == lsn and obn.lower() == lsep)) or (
                             obun and (len(obun) == lsn and obun.lower() == lsep)
                         ):
-                            nst.append((obj.num_tips_below, i, obj))
+                            nst.append((num_tips_below[i], i, obj))
                             break
                     else:
                         sk_for_obj = set(get_stable_source_keys(obj))
                         if sk_for_obj.issuperset(ac_src):
-                            if obj.num_tips_below >= MIN_SEP_SIZE:
+                            if num_tips_below[i] >= MIN_SEP_SIZE:
                                 if not obj.rank or (obj.rank not in NON_SEP_RANKS):
-                                    nst.append((obj.num_tips_below, i, obj))
+                                    nst.append((num_tips_below[i], i, obj))
                 nst.sort(reverse=True)
                 add_confirmed_sep(nns, tree, nst, sep_name)
         if len(nns.separators) == 0:
@@ -5,7 +5,6 @@
 from __future__ import print_function
 from unidecode import unidecode
 import csv
-import io
 import os
 import time
 import logging
@@ -15,7 +14,7 @@ from bs4 import BeautifulSoup as Soup
 from peyutil import assure_dir_exists, download_large_file
 
 from ..resource_wrapper import TaxonomyWrapper
-from ..util import OutFile
+from ..util import OutFile, open_input
 
 _LOG = logging.getLogger(__name__)
 DOMAIN = "http://www.theplantlist.org"
@@ -26,7 +25,7 @@ _num_downloads_this_session = 0
 
 def download_csv_for_family(fam_dir, fam_html_fp, url_pref):
     global _num_downloads_this_session
-    fam_html_content = io.open(fam_html_fp, "r", encoding="utf-8").read()
+    fam_html_content = open_input(fam_html_fp).read()
     soup = Soup(fam_html_content, "html.parser")
     csva = soup.find_all("a", attrs={"type": "text/csv"})
     if len(csva) != 1:
@@ -52,7 +51,7 @@ def scrape_families_from_higher_group(out_dir, top_file):
     dirname = os.path.split(top_file)[1] + "_families"
     fam_dir = os.path.join(out_dir, dirname)
     assure_dir_exists(fam_dir)
-    top_content = io.open(top_file, "r", encoding="utf-8").read()
+    top_content = open_input(top_file).read()
     soup = Soup(top_content, "html.parser")
     nametree_list = soup.select("#nametree > li")
     _LOG.debug("will write to {}".format(dirname))
@@ -111,7 +110,7 @@ def normalize_plantlist_file(inp_fp, out_dir, family, maj_group_id):
     }
     illegit_ids = set()
     name_to_id = {}
-    with io.open(inp_fp, "r", encoding="utf-8") as csvfile:
+    with open_input(inp_fp) as csvfile:
         csvreader = csv.reader(csvfile)
         header = next(csvreader)
         _LOG.info("header = {}".format(header))
@@ -232,25 +231,23 @@ class PlantListWrapper(TaxonomyWrapper):
     def __init__(self, obj, parent=None, refs=None):
         TaxonomyWrapper.__init__(self, obj, parent=parent, refs=refs)
 
-    def download(self):
+    def download_tasks(self):
         dd = self.unpacked_filepath
         assure_dir_exists(dd)
         _LOG.info("uf = {}".format(dd))
-        top_files = []
+        tasks = []
         for u in self.url_list:
             pref, suff = os.path.split(u)
             if not suff:
                 pref, suff = os.path.split(pref)
             _LOG.info("p = {} s = {}".format(pref, suff))
             assert suff
-            dfp = os.path.join(dd, suff)
-            top_files.append(dfp)
-            if not os.path.exists(dfp):
-                _LOG.debug("Starting download from {} to {}".format(u, dfp))
-                download_large_file(u, dfp)
-                _LOG.debug("Download from {} to {} completed.".format(u, dfp))
-        for dfp in top_files:
-            scrape_families_from_higher_group(dd, dfp)
+            tasks.append((u, os.path.join(dd, suff), self.checksum_for_url(u)))
+        return tasks
+
+    def finish_download(self):
+        for u, dfp, checksum in self.download_tasks():
+            scrape_families_from_higher_group(self.unpacked_filepath, dfp)
 
     def normalize(self):
         dd = self.unpacked_filepath
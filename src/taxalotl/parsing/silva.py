@@ -5,7 +5,6 @@
 #   Jessica Grant as a part of the reference_taxonomy and OToL efforts.
 from __future__ import print_function
 
-import io
 import os
 import logging
 
@@ -15,14 +14,14 @@ from ..commands import unpack_resources
 from ..ott_schema import InterimTaxonomyData
 from ..cmds.partitions import GEN_MAPPING_FILENAME
 from ..resource_wrapper import TaxonomyWrapper
-from ..util import OutFile
+from ..util import OutFile, open_input
 
 _LOG = logging.getLogger(__name__)
 
 
 def parse_silva_ids(fn):
     preferred = set()
-    with io.open(fn, "r", encoding="utf-8") as inp:
+    with open_input(fn) as inp:
         for line in inp:
             ls = line.strip()
             if ls:
@@ -110,7 +109,7 @@ def parse_silva_taxon_file(expect_tax_fp, preferred_ids, acc_to_trim, itd):
     trim_pref = (fung_pref, animal_pref, pl_pref, mito_pref, chloro_pref)
 
     namepath_to_id_pair = {}
-    with io.open(expect_tax_fp, "r", encoding="utf-8") as inp:
+    with open_input(expect_tax_fp) as inp:
         eh = "primaryAccession\tstart\tstop\tpath\torganism_name\ttaxid\n"
         iinp = iter(inp)
         h = next(iinp)
@@ -209,6 +208,8 @@ def parse_silva_taxon_file(expect_tax_fp, preferred_ids, acc_to_trim, itd):
 class SilvaIdListWrapper(TaxonomyWrapper):
     resource_type = "id list"
     schema = {"id list"}
+    # normalize_silva_taxonomy reads the unpacked list
+    dependency_stage = "unpack"
 
 
 # noinspection PyAbstractClass
@@ -231,7 +232,7 @@ class SilvaToNCBIMappingListWrapper(TaxonomyWrapper):
         }
 
         to_trim = set()
-        with io.open(self.normalized_filepath, "r", encoding="utf-8") as inp:
+        with open_input(self.normalized_filepath) as inp:
             for n, line in enumerate(inp):
                 ls = line.strip()
                 if not ls:
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""Measurements of each CLI command: wall and CPU time, peak memory, bytes read and
+written, and the time spent in named stages (e.g. parse, write, partition, flush).
+
+When profiling is asked for (taxalotlcli --profile, or profile = true in the
+[behavior] section of taxalotl.conf), CommandProfile appends a record with a
+"profile" to ~/.taxalotl_profiles when a command finishes, and the profile-report
+command summarizes those records. That file has one JSON record per line; when it
+grows past 1 MiB it is moved to ~/.taxalotl_profiles.1 (replacing the older one).
+Bytes written are counted as the files written through OutFile (and the other
+writers in util) are closed, and bytes read as the files opened with
+util.open_input are closed. Worker processes send their counts back with the
+result of each job (see jobs.py).
+
+The profiles are kept apart from ~/.taxalotl_history: that file is one JSON list
+that is read and rewritten in full for each record added, and it only gets a
+record for a command that wrote files.
+"""
+import datetime
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+_LOG = logging.getLogger(__name__)
+
+_MAX_PROFILE_LOG_BYTES = 1 << 20
+
+_BYTES_READ = [0]
+_BYTES_WRITTEN = [0]
+_STAGE_SECONDS = {}
+# held while the counts above are changed (files are written by several threads)
+_COUNTS_LOCK = threading.Lock()
+
+
+def count_bytes_read(num_bytes):
+    with _COUNTS_LOCK:
+        _BYTES_READ[0] += num_bytes
+
+
+def count_bytes_written(num_bytes):
+    with _COUNTS_LOCK:
+        _BYTES_WRITTEN[0] += num_bytes
+
+
+class StageTimer(object):
+    """Adds the time spent in the block to the stage `name` of the command's
+    profile. Stages may be nested (e.g. "write" is part of "normalize")."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        with _COUNTS_LOCK:
+            _STAGE_SECONDS[self.name] = _STAGE_SECONDS.get(self.name, 0.0) + elapsed
+
+
+def snapshot_counts():
+    with _COUNTS_LOCK:
+        return {
+            "bytes_read": _BYTES_READ[0],
+            "bytes_written": _BYTES_WRITTEN[0],
+            "stages": dict(_STAGE_SECONDS),
+        }
+
+
+def counts_since(snapshot):
+    """The counts (as from snapshot_counts) accumulated since `snapshot`."""
+    now = snapshot_counts()
+    stages = {}
+    for name, seconds in now["stages"].items():
+        diff = seconds - snapshot["stages"].get(name, 0.0)
+        if diff > 0:
+            stages[name] = diff
+    return {
+        "bytes_read": now["bytes_read"] - snapshot["bytes_read"],
+        "bytes_written": now["bytes_written"] - snapshot["bytes_written"],
+        "stages": stages,
+    }
+
+
+def count_worker_counts(counts):
+    """Adds the counts_since of a job in a worker process to this process."""
+    if not counts:
+        return
+    with _COUNTS_LOCK:
+        _BYTES_READ[0] += counts["bytes_read"]
+        _BYTES_WRITTEN[0] += counts["bytes_written"]
+        for name, seconds in counts["stages"].items():
+            _STAGE_SECONDS[name] = _STAGE_SECONDS.get(name, 0.0) + seconds
+
+
+def _cpu_seconds():
+    # includes the worker processes that have finished
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_rss, child_rss) * scale
+
+
+class CommandProfile(object):
+    """Context manager that records the profile of a command in the history."""
+
+    def __init__(self, name, resources=None):
+        self.name = name
+        self.resources = list(resources) if resources else []
+        self._started = None
+        self._start_wall = None
+        self._start_cpu = None
+        self._start_counts = None
+
+    def __enter__(self):
+        self._started = datetime.datetime.now(datetime.timezone.utc)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = _cpu_seconds()
+        self._start_counts = snapshot_counts()
+        return self
+
+    def profile(self):
+        counts = counts_since(self._start_counts)
+        return {
+            "wall_seconds": round(time.perf_counter() - self._start_wall, 3),
+            "cpu_seconds": round(_cpu_seconds() - self._start_cpu, 3),
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "bytes_read": counts["bytes_read"],
+            "bytes_written": counts["bytes_written"],
+            "stages": {k: round(v, 3) for k, v in counts["stages"].items()},
+        }
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = {
+            "command": self.name,
+            "started": self._started.isoformat(timespec="seconds"),
+            "profile": self.profile(),
+        }
+        if self.resources:
+            record["res_ids"] = self.resources
+        if exc_type is not None:
+            record["failed"] = True
+        get_profile_log().append(record)
+
+
+class ProfileLog(object):
+    """File of command profiles, one JSON record per line.
+
+    Records are appended, so the file is never rewritten. Before a record is
+    added to a file that has more than max_bytes, the file is renamed with a
+    ".1" suffix, so at most two files of about max_bytes are kept.
+    """
+
+    def __init__(self, filepath=None, max_bytes=_MAX_PROFILE_LOG_BYTES):
+        if filepath is None:
+            filepath = os.path.expanduser("~/.taxalotl_profiles")
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+
+    @property
+    def rotated_filepath(self):
+        return self.filepath + ".1"
+
+    def append(self, record):
+        line = json.dumps(record, sort_keys=True) + "\n"
+        try:
+            if os.path.getsize(self.filepath) > self.max_bytes:
+                os.replace(self.filepath, self.rotated_filepath)
+        except OSError:
+            pass  # no file yet
+        try:
+            with io.open(self.filepath, "a", encoding="utf-8") as outp:
+                outp.write(line)
+        except OSError:
+            _LOG.exception("Exception writing the profile log")
+
+    def read_records(self):
+        """Returns the records of the rotated file and then of the current file
+        (oldest first), skipping lines that cannot be parsed."""
+        records = []
+        for fp in (self.rotated_filepath, self.filepath):
+            if not os.path.isfile(fp):
+                continue
+            with io.open(fp, "r", encoding="utf-8") as inp:
+                for line in inp:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        _LOG.warning('Skipping a bad line in "{}"'.format(fp))
+        return records
+
+
+_PROFILE_LOG = ProfileLog()
+
+
+def get_profile_log():
+    return _PROFILE_LOG
+
+
+def _human_bytes(num_bytes):
+    if num_bytes < 1024:
+        return "{} B".format(num_bytes)
+    for unit in ("KiB", "MiB", "GiB"):
+        num_bytes /= 1024.0
+        if num_bytes < 1024 or unit == "GiB":
+            return "{:.1f} {}".format(num_bytes, unit)
+
+
+def _change(latest, earlier):
+    if latest is None or not earlier:
+        return ""
+    med = statistics.median(earlier)
+    if not med:
+        return ""
+    return " ({:+.0f}%)".format(100.0 * (latest - med) / med)
+
+
+_REPORTED_FIELDS = (
+    ("wall", "wall_seconds", "{:.1f} s".format),
+    ("cpu", "cpu_seconds", "{:.1f} s".format),
+    ("peak RSS", "peak_rss_bytes", _human_bytes),
+    ("read", "bytes_read", _human_bytes),
+    ("written", "bytes_written", _human_bytes),
+)
+
+
+def write_profile_report(records, out, command=None, num_runs=10):
+    """Summarizes the profiled runs in `records` (from ProfileLog), by command
+    and resource IDs.
+
+    For each, the latest run is shown along with its change from the median of
+    up to `num_runs` - 1 earlier runs, and the time of each stage of the latest
+    run.
+    """
+    groups = {}
+    for rec in records:
+        if "profile" not in rec or rec.get("failed"):
+            continue
+        if command is not None and rec["command"] != command:
+            continue
+        key = (rec["command"], " ".join(rec.get("res_ids", [])))
+        groups.setdefault(key, []).append(rec)
+    if not groups:
+        out.write("No profiled runs were found (see taxalotlcli --profile).\n")
+        return
+    for key in sorted(groups.keys()):
+        runs = groups[key][-num_runs:]
+        latest, earlier = runs[-1], runs[:-1]
+        cmd, res_ids = key
+        label = "{} {}".format(cmd, res_ids) if res_ids else cmd
+        m = "{}: {} run(s), latest at {}\n"
+        out.write(m.format(label, len(runs), latest["started"]))
+        lp = latest["profile"]
+        for title, field, fmt in _REPORTED_FIELDS:
+            value = lp.get(field)
+            prev = [r["profile"][field] for r in earlier if r["profile"].get(field)]
+            vs = fmt(value) if value is not None else "-"
+            out.write("  {:9} {:>12}{}\n".format(title, vs, _change(value, prev)))
+        stages = sorted(lp.get("stages", {}).items(), key=lambda i: -i[1])
+        for name, seconds in stages:
+            prev = [r["profile"].get("stages", {}).get(name) for r in earlier]
+            prev = [i for i in prev if i]
+            m = "    stage {:12} {:8.1f} s{}\n"
+            out.write(m.format(name, seconds, _change(seconds, prev)))
@@ -1,11 +1,10 @@
 #!/usr/bin/env python
 from __future__ import print_function
 
-import io
 import json
 import os
 from .resource_wrapper import AbstractResourceWrapper
-from .util import OutFile
+from .util import OutFile, open_input
 import logging
 
 _LOG = logging.getLogger(__name__)
@@ -13,7 +12,7 @@ _LOG = logging.getLogger(__name__)
 
 def read_resource_file(fp):
     try:
-        with io.open(fp, "r", encoding="utf-8") as inp:
+        with open_input(fp) as inp:
             return json.load(inp)
     except:
         _LOG.exception('Error reading JSON from "{}"'.format(fp))
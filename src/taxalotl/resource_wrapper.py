@@ -1,16 +1,13 @@
 #!/usr/bin/env python
 from __future__ import print_function
 
-import io
 import os
 import shutil
-import urllib
-import urllib.request
 import logging
+import weakref
 
 from peyutil import (
     assure_dir_exists,
-    download_large_file,
     gunzip,
     gunzip_and_untar,
     unzip,
@@ -22,6 +19,14 @@ from .ott_schema import (
     partition_ott_by_root_id,
     INP_FLAGGED_OTT_TAXONOMY_HEADER,
 )
+from .manifest import (
+    MANIFEST_FILENAME,
+    StageManifest,
+    hash_files_below,
+    read_manifest,
+)
+from .archive import STREAMABLE_FORMATS, ArchiveMembers, UnpackedMembers
+from .download import fetch_resources
 from .newick import normalize_newick
 from .cmds.partitions import (
     find_partition_dirs_for_taxonomy,
@@ -32,7 +37,16 @@ from .cmds.partitions import (
     get_taxon_partition,
 )
 from .tax_partition import TAX_SLICE_CACHE, ROOTS_FILENAME, ACCUM_DES_FILENAME
-from .util import unlink, OutFile, OutDir
+from .util import (
+    COMPRESSION_SUFFIXES,
+    COPY_BUFFER_SIZE,
+    append_file,
+    find_input_file,
+    open_input,
+    unlink,
+    OutFile,
+    OutDir,
+)
 from .cmds.semanticize import SemGraph
 from .wikispecies import parse_wikispecies
 from .wikidata import parse_wikidata
@@ -126,6 +140,45 @@ def copy_id_list_by_linking(unpacked_dirp, normalized_dirp, resource_wrapper):
     copy_file_list_by_linking(unpacked_dirp, normalized_dirp, OTT_TAXONOMY_ID_FILES)
 
 
+def _has_carriage_returns(filepath):
+    """True if the file has a \r anywhere. Such files are copied as text so that
+    their line endings become \n (as they did when they were read whole).
+    """
+    with open_input(filepath, "rb") as inp:
+        while True:
+            buf = inp.read(COPY_BUFFER_SIZE)
+            if not buf:
+                return False
+            if b"\r" in buf:
+                return True
+
+
+def _copy_text_with_header(src_fp, dest_fp, header, old=None, new=None):
+    """Streams src_fp as text to dest_fp after the header, replacing old by new."""
+    with open_input(src_fp) as inp:
+        with OutFile(dest_fp, buffering=COPY_BUFFER_SIZE) as out:
+            out.write(header)
+            while True:
+                buf = inp.read(COPY_BUFFER_SIZE)
+                if not buf:
+                    break
+                out.write(buf.replace(old, new) if old else buf)
+
+
+def write_with_header(src_fp, dest_fp, header):
+    """Writes the header line and then the content of src_fp to dest_fp.
+
+    The content is appended by the kernel where possible, so memory use does not
+    depend on the size of the file.
+    """
+    if _has_carriage_returns(src_fp):
+        _copy_text_with_header(src_fp, dest_fp, header)
+        return
+    with OutFile(dest_fp, mode="wb") as out:
+        out.write(header.encode("utf-8"))
+        append_file(src_fp, out)
+
+
 # noinspection PyUnusedLocal
 def copy_and_add_ott_headers(unpacked_dirp, normalized_dirp, resource_wrapper):
     motf = list(OTT_TAXONOMY_FILENAMES)
@@ -139,11 +192,7 @@ def copy_and_add_ott_headers(unpacked_dirp, normalized_dirp, resource_wrapper):
     for fn, header in special:
         tf = os.path.join(unpacked_dirp, fn)
         if os.path.isfile(tf):
-            content = io.open(tf, "r", encoding="utf-8").read()
-            outfp = os.path.join(normalized_dirp, fn)
-            with OutFile(outfp) as out:
-                out.write(header)
-                out.write(content)
+            write_with_header(tf, os.path.join(normalized_dirp, fn), header)
 
 
 # noinspection PyUnusedLocal
@@ -157,11 +206,17 @@ def normalize_tab_sep_ott(unpacked_dirp, normalized_dirp, resource_wrapper):
         tf = os.path.join(unpacked_dirp, fn)
         if os.path.isfile(tf):
             outfp = os.path.join(normalized_dirp, fn)
-            with io.open(tf, "r", encoding="utf-8") as inp:
-                with OutFile(outfp) as out:
-                    for line in inp:
-                        ls = line.split("\t")
-                        out.write("\t|\t".join(ls))
+            if _has_carriage_returns(tf):
+                _copy_text_with_header(tf, outfp, "", "\t", "\t|\t")
+                continue
+            # a tab is one byte in UTF-8, so it can be replaced block by block
+            with open_input(tf, "rb") as inp:
+                with OutFile(outfp, mode="wb") as out:
+                    while True:
+                        buf = inp.read(COPY_BUFFER_SIZE)
+                        if not buf:
+                            break
+                        out.write(buf.replace(b"\t", b"\t|\t"))
 
 
 def normalize_wikispecies(unpacked_dirp, normalized_dirp, resource_wrapper):
@@ -232,7 +287,7 @@ def normalize_silva_ncbi(unpacked_dirp, normalized_dirp, resource_wrapper):
     if resource_wrapper.schema.lower() == "silva taxmap":
         shutil.copyfile(inpfp, outfp)
     else:
-        with io.open(inpfp, "r", encoding="utf-8") as inp:
+        with open_input(inpfp) as inp:
             with OutFile(outfp) as outp:
                 for line in inp:
                     ls = line.strip()
@@ -271,6 +326,7 @@ _known_res_attr = frozenset(
     [
         "aliases",
         "base_id",  # base ID in inherits from graph
+        "checksum",  # "<algorithm>:<hex digest>" of url (or a dict url -> checksum)
         "copy_status",
         "date",
         "depends_on",
@@ -297,12 +353,15 @@ _known_res_attr = frozenset(
         "version",
     ]
 )
+# checksums describe one artifact, so they are not inherited from the parent resource
+_uninherited_res_attr = frozenset(["checksum"])
 
 
 class FromOTifacts(object):
     def __init__(self):
         self.aliases = None
         self.base_id = None
+        self.checksum = None
         self.copy_status = None
         self.date = None
         self.depends_on = None
@@ -334,6 +393,12 @@ class ResourceWrapper(FromOTifacts):
     _norm_filename = taxon_filename
     synonyms_filename = "synonyms.tsv"
     partition_parsing_fn = staticmethod(partition_ott_by_root_id)
+    # The archive members that normalize reads, for wrappers whose normalize can
+    #   read them from the archive (see normalize_source)
+    archive_members = None
+    # What a resource that lists this one in its depends_on needs done to it
+    #   first: "normalize" or "unpack" (see commands.normalize_resources)
+    dependency_stage = "normalize"
 
     def __init__(self, obj, parent=None, refs=None, config=None):
         FromOTifacts.__init__(self)
@@ -347,7 +412,7 @@ class ResourceWrapper(FromOTifacts):
         self.children = []
         if self.parent:
             parent.children.append(self)
-            for k in _known_res_attr:
+            for k in _known_res_attr - _uninherited_res_attr:
                 pv = getattr(parent, k, None)
                 if obj.get(k) is None and pv is not None:
                     setattr(self, k, pv)
@@ -417,7 +482,7 @@ class ResourceWrapper(FromOTifacts):
         fd = self.normalized_filedir
         if fd is None:
             return None
-        return os.path.join(fd, self._norm_filename)
+        return find_input_file(os.path.join(fd, self._norm_filename))
 
     @property
     def partitioned_filepath(self):
@@ -460,6 +525,91 @@ class ResourceWrapper(FromOTifacts):
     def has_been_partitioned(self):
         return has_any_partition_dirs(self.partitioned_filepath, self.id)
 
+    def reads_archive_members(self):
+        """True if normalize will read its input from the downloaded archive
+        rather than from the unpacked files.
+
+        That requires the normalize_from_archive config option, a wrapper that
+        declares its archive_members, and an archive that has not been unpacked.
+        """
+        return (
+            self.archive_members is not None
+            and self.config.normalize_from_archive
+            and self.format is not None
+            and self.format.lower() in STREAMABLE_FORMATS
+            and not self.has_been_unpacked()
+        )
+
+    def normalize_source(self):
+        """Returns the ArchiveMembers or UnpackedMembers that normalize reads."""
+        if self.reads_archive_members():
+            _LOG.info("Reading {} from {}".format(self.id, self.download_filepath))
+            return ArchiveMembers(
+                self.download_filepath,
+                self.format,
+                self.archive_members,
+                decompress_threads=self.config.decompress_threads,
+                local_filename=self.local_filename,
+            )
+        return UnpackedMembers(self.unpacked_filepath)
+
+    @property
+    def normalize_input_path(self):
+        """The unpacked files, or the archive if normalize reads it directly."""
+        if self.has_been_unpacked() or not self.reads_archive_members():
+            return self.unpacked_filepath
+        return self.download_filepath
+
+    def write_normalize_manifest(self):
+        """Records the hashes of the normalize inputs and the normalized files."""
+        m = StageManifest(
+            "normalize",
+            inputs=hash_files_below(self.normalize_input_path),
+            outputs=hash_files_below(self.normalized_filedir),
+        )
+        m.write(self.normalized_filedir)
+        return m
+
+    def _get_normalize_manifest(self):
+        m = read_manifest(self.normalized_filedir)
+        if m is None:
+            msg = "No manifest for the normalized {}. Recording the current files..."
+            _LOG.info(msg.format(self.id))
+            m = self.write_normalize_manifest()
+        return m
+
+    def normalization_is_up_to_date(self):
+        """False if the normalized files or the unpacked files that they were made
+        from have changed since normalize wrote its manifest.
+
+        Normalizations done before manifests were written are assumed to be
+        up to date. Removing the unpacked files (or the archive that normalize
+        read) does not make them out of date.
+        """
+        if not self.has_been_normalized():
+            return False
+        m = self._get_normalize_manifest()
+        ok = m.outputs_match(self.normalized_filedir)
+        inp = self.normalize_input_path
+        if ok and inp is not None and os.path.exists(inp):
+            # The input "" is the archive that normalize read. Inputs that were
+            #   read some other way than they would be now are not compared.
+            if os.path.isfile(inp) == ("" in m.inputs):
+                ok = m.inputs_match(inp)
+        if ok and m.refreshed:
+            m.write(self.normalized_filedir)
+        return ok
+
+    def get_normalized_file_records(self):
+        """Returns the manifest records (with hashes) of the normalized files."""
+        m = self._get_normalize_manifest()
+        if not m.outputs_match(self.normalized_filedir):
+            # edited since normalize ran. normalize will treat them as out of date.
+            return hash_files_below(self.normalized_filedir)
+        if m.refreshed:
+            m.write(self.normalized_filedir)
+        return m.outputs
+
     def remove_normalize_artifacts(self):
         self._remove_taxonomy_dir(self.normalized_filedir)
 
@@ -479,9 +629,13 @@ class ResourceWrapper(FromOTifacts):
             "about.json",
             "details.json",
             ACCUM_DES_FILENAME,
+            MANIFEST_FILENAME,
         ]
         if self.synonyms_filename:
             f_to_remove.append(self.synonyms_filename)
+        # and the compressed copies that normalize may have written
+        for f in f_to_remove[:]:
+            f_to_remove.extend([f + suffix for suffix in COMPRESSION_SUFFIXES.values()])
         for f in f_to_remove:
             fp = os.path.join(directory, f)
             if os.path.exists(fp):
@@ -509,21 +663,26 @@ class ResourceWrapper(FromOTifacts):
             return misc_dir
         return None
 
-    def download(self):
+    def checksum_for_url(self, url):
+        if isinstance(self.checksum, dict):
+            return self.checksum.get(url)
+        return self.checksum if url == self.url else None
+
+    def download_tasks(self):
+        """Returns a list of (url, filepath, checksum or None) for the files that
+        download fetches."""
         dfp = self.download_filepath
         if dfp is None:
             m = "Resource {} appears to be abstract, therefore not downloadable"
             raise RuntimeError(m.format(self.id))
-        if self.url.startswith("ftp://"):
-            _LOG.debug("Starting FTP download from {} to {}".format(self.url, dfp))
-            with urllib.request.urlopen(self.url) as req:
-                with OutFile(dfp, mode="wb") as outp:
-                    outp.write(req.read())
-            _LOG.debug("Download from {} to {} completed.".format(self.url, dfp))
-        else:
-            _LOG.debug("Starting download from {} to {}".format(self.url, dfp))
-            download_large_file(self.url, dfp)
-            _LOG.debug("Download from {} to {} completed.".format(self.url, dfp))
+        return [(self.url, dfp, self.checksum_for_url(self.url))]
+
+    def finish_download(self):
+        """Called once all of the files of download_tasks have been fetched."""
+        pass
+
+    def download(self, num_workers=1):
+        fetch_resources([self], num_workers=num_workers)
 
     def unpack(self):
         unpack_archive(
@@ -539,9 +698,40 @@ class ResourceWrapper(FromOTifacts):
             raise NotImplementedError(m)
         norm_fn(self.unpacked_filepath, self.normalized_filedir, self)
 
+    def stages_from_files(self, partitioned_ids=None):
+        """The stages (see state_db.STAGES) that this resource's files show it has
+        been through.
+
+        Unless `partitioned_ids` (the IDs of the partitioned resources) is given,
+        this walks the partitioned tree.
+        """
+        stages = set()
+        if self.has_been_downloaded():
+            stages.add("downloaded")
+        if self.has_been_unpacked():
+            stages.add("unpacked")
+        if self.has_been_normalized():
+            stages.add("normalized")
+        if partitioned_ids is None:
+            if self.has_been_partitioned():
+                stages.add("partitioned")
+        elif self.id in partitioned_ids:
+            stages.add("partitioned")
+        return stages
+
     def write_status(
-        self, out, indent="", list_all_artifacts=False, hanging_indent="  "
+        self,
+        out,
+        indent="",
+        list_all_artifacts=False,
+        hanging_indent="  ",
+        stages=None,
     ):
+        """Writes a description of the resource and how far it has been processed.
+
+        `stages` is the set of stages it has been through (e.g. from the state DB);
+        if it is None, they are found from the files.
+        """
         dfp = self.download_filepath
         src_str = "{} ".format(self.source) if self.source else ""
         if dfp is None:
@@ -561,29 +751,32 @@ class ResourceWrapper(FromOTifacts):
         else:
             out.write("(unversioned). ")
         out.write("date={}\n".format(self.date if self.date else "unknown"))
+        if stages is None:
+            stages = self.stages_from_files()
         hi = "{}{}".format(indent, hanging_indent)
-        s = "is at" if self.has_been_downloaded() else "not yet downloaded to"
+        s = "is at" if "downloaded" in stages else "not yet downloaded to"
         down_str = "{}Raw ({} format) {} {}\n".format(hi, self.format, s, dfp)
         ufp = self.unpacked_filepath
-        s = "is at" if self.has_been_unpacked() else "not yet unpacked to"
+        s = "is at" if "unpacked" in stages else "not yet unpacked to"
         unp_str = "{}Raw ({} schema) {} {}\n".format(hi, self.schema, s, ufp)
         nfp = self.normalized_filedir
-        s = "is at" if self.has_been_normalized() else "not yet normalized to"
+        s = "is at" if "normalized" in stages else "not yet normalized to"
         norm_str = "{}OTT formatted form {} {}\n".format(hi, s, nfp)
-        if self.has_been_partitioned():
-            part_str = "{}Has been partitioned at {}\n".format(
-                hi, self.partitioned_filepath
+        if "partitioned" in stages:
+            s = " (and separated)" if "separated" in stages else ""
+            part_str = "{}Has been partitioned{} at {}\n".format(
+                hi, s, self.partitioned_filepath
             )
         else:
             part_str = "{}Has not been partitioned yet.\n".format(hi)
         if list_all_artifacts:
             out.write("{}{}{}{}".format(down_str, unp_str, norm_str, part_str))
         else:
-            if self.has_been_partitioned():
+            if "partitioned" in stages:
                 out.write(part_str)
-            elif self.has_been_normalized():
+            elif "normalized" in stages:
                 out.write(norm_str)
-            elif self.has_been_unpacked():
+            elif "unpacked" in stages:
                 out.write(unp_str)
             else:
                 out.write(down_str)
@@ -634,7 +827,8 @@ class TaxonomyWrapper(ResourceWrapper):
 
     def __init__(self, obj, parent=None, refs=None, config=None):
         ResourceWrapper.__init__(self, obj, parent=parent, refs=refs, config=config)
-        self.part_name_to_tax_part_in_mem = {}
+        # weak, so that TAX_SLICE_CACHE can evict the partitions that are not in use
+        self.part_name_to_tax_part_in_mem = weakref.WeakValueDictionary()
         # print("ET obj = {}".format(obj))
 
     def node_should_be_semanticized(self, node):
@@ -738,7 +932,7 @@ class TaxonomyWrapper(ResourceWrapper):
                 current_partition_key
             )
         tax_part = self.part_name_to_tax_part_in_mem.get(current_partition_key)
-        if tax_part is None:
+        if tax_part is None or tax_part._has_flushed:
             tax_part = get_taxon_partition(self, current_partition_key)
             tax_part.read_inputs_for_read_only()
             self.part_name_to_tax_part_in_mem[current_partition_key] = tax_part
@@ -794,6 +988,7 @@ class TaxonomyWrapper(ResourceWrapper):
             for c in nd.children_refs:
                 c.par_id = new_par_id
                 c.flag_as_incertae_sedis()
+        tree.invalidate_traversal()
 
     def collapse_as_incertae_sedis_interim_tax_data(self, interim_tax_data, prefix):
         if interim_tax_data.names_interpreted_as_changes:
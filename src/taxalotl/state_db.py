@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""A small SQLite database (in the processed dir) of the stages that each resource
+has been through, so that the status command does not have to walk the
+partitioned tree for every resource.
+
+The download, unpack, normalize, partition, separation and clean commands record
+a stage when they finish it (or forget it when they remove its artifacts). The
+database is rebuilt from the filesystem by `status --verify`, or by a status
+command that finds no database. A rebuild counts a partitioned resource as
+separated if it has taxa in the directory of a separator. Other status commands
+forget the recorded stages whose files have been removed (by hand).
+"""
+import logging
+import os
+import sqlite3
+import time
+
+_LOG = logging.getLogger(__name__)
+
+STATE_DB_FILENAME = "taxalotl_state.sqlite3"
+STAGES = ("downloaded", "unpacked", "normalized", "partitioned", "separated")
+_BUSY_TIMEOUT = 60  # seconds to wait for a worker process that is writing
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resource_stage (
+    res_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (res_id, stage)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class StateDB(object):
+    def __init__(self, processed_dir):
+        self.filepath = os.path.join(processed_dir, STATE_DB_FILENAME)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)  # may race
+        conn = sqlite3.connect(self.filepath, timeout=_BUSY_TIMEOUT)
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def has_been_built(self):
+        """True if the database has been filled by walking the filesystem."""
+        if not os.path.isfile(self.filepath):
+            return False
+        conn = self._connect()
+        try:
+            q = "SELECT value FROM meta WHERE key = 'built'"
+            return conn.execute(q).fetchone() is not None
+        finally:
+            conn.close()
+
+    def _write(self, sql, rows):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+            finally:
+                conn.close()
+        except sqlite3.Error as x:
+            m = 'Could not update {} ({}). Run "status --verify" to rebuild it.'
+            _LOG.warning(m.format(self.filepath, x))
+
+    def record(self, res_id, *stages):
+        now = time.time()
+        sql = "INSERT OR REPLACE INTO resource_stage VALUES (?, ?, ?)"
+        self._write(sql, [(res_id, s, now) for s in stages])
+
+    def forget(self, res_id, *stages):
+        sql = "DELETE FROM resource_stage WHERE res_id = ? AND stage = ?"
+        self._write(sql, [(res_id, s) for s in stages])
+
+    def forget_stage_for_all(self, stage):
+        self._write("DELETE FROM resource_stage WHERE stage = ?", [(stage,)])
+
+    def stages_by_res(self):
+        """Returns a dict of resource ID -> set of the stages that it has finished."""
+        if not os.path.isfile(self.filepath):
+            return {}
+        conn = self._connect()
+        try:
+            r = {}
+            q = "SELECT res_id, stage FROM resource_stage"
+            for res_id, stage in conn.execute(q):
+                r.setdefault(res_id, set()).add(stage)
+            return r
+        finally:
+            conn.close()
+
+    def replace_all(self, stages_by_res):
+        now = time.time()
+        rows = [(k, s, now) for k, v in stages_by_res.items() for s in v]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM resource_stage")
+                conn.executemany("INSERT INTO resource_stage VALUES (?, ?, ?)", rows)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('built', ?)", (str(now),)
+                )
+        finally:
+            conn.close()
+
+
+def walk_resource_stages(taxalotl_config):
+    """Returns a dict of resource ID -> set of stages, found from the filesystem.
+
+    The partitioned tree is walked once for all of the resources.
+    """
+    from .cmds.partitions import find_partitioned_res_ids
+
+    separated_ids = set()
+    pd = taxalotl_config.partitioned_dir
+    partitioned_ids = find_partitioned_res_ids(pd, separated_ids=separated_ids)
+    r = {}
+    for rw in taxalotl_config.resources_mgr.resources.values():
+        if rw.is_abstract:
+            continue
+        stages = rw.stages_from_files(partitioned_ids)
+        if "partitioned" in stages and rw.id in separated_ids:
+            stages.add("separated")
+        if stages:
+            r[rw.id] = stages
+    return r
+
+
+def forget_missing_stages(taxalotl_config, stages_by_res):
+    """Checks the stages recorded for each resource against its files, and
+    forgets those whose files are gone (e.g. removed by hand). Returns the
+    stages that remain.
+
+    A recorded partition is looked for with a walk of the partitioned tree that
+    stops at the first dir of the resource, so the whole tree is only walked
+    for a resource whose partitions are gone.
+    """
+    sdb = taxalotl_config.state_db
+    resources = taxalotl_config.resources_mgr.resources
+    r = {}
+    for res_id, stages in stages_by_res.items():
+        rw = resources.get(res_id)
+        if rw is None:
+            r[res_id] = stages
+            continue
+        partitioned_ids = set()
+        if "partitioned" in stages and rw.has_been_partitioned():
+            partitioned_ids.add(res_id)
+        found = rw.stages_from_files(partitioned_ids)
+        if "partitioned" in found:
+            found.add("separated")  # not checked, as that needs a full walk
+        gone = stages - found
+        if gone:
+            m = "The files of the {} stage(s) of {} are gone"
+            _LOG.info(m.format(", ".join(sorted(gone)), res_id))
+            sdb.forget(res_id, *gone)
+        if stages - gone:
+            r[res_id] = stages - gone
+    return r
+
+
+def rebuild_state_db(taxalotl_config):
+    """Refills the state database from the filesystem and returns its content."""
+    sdb = taxalotl_config.state_db
+    _LOG.info("Finding the status of the resources from their files...")
+    start = time.time()
+    found = walk_resource_stages(taxalotl_config)
+    sdb.replace_all(found)
+    m = "{} rebuilt in {:.1f} seconds"
+    _LOG.info(m.format(sdb.filepath, time.time() - start))
+    return found
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Process-wide pool of the small vocabularies of the taxonomy files.
+
+Parsing a line used to give each taxon its own copies of the rank string,
+of every flag and of the source prefixes ("ncbi", "gbif"...) in its
+src_dict, although there are only a few hundred distinct values among
+millions of taxa. The pool keeps one copy of each:
+    ranks: a small int code for each rank. RANK_NAMES[code] is the name
+        and code 0 is "no rank given".
+    flags: a bit per flag name. A set of flags is an int bitmask, and
+        flag_names(mask) is a frozenset shared by every taxon with that mask.
+    source prefixes and other short strings: interned (see sys.intern).
+"""
+import sys
+
+RANK_NAMES = [""]
+FLAG_NAMES = []
+intern_str = sys.intern
+
+
+class _RankCodes(dict):
+    def __missing__(self, rank):
+        code = len(RANK_NAMES)
+        RANK_NAMES.append(intern_str(rank))
+        self[rank] = code
+        return code
+
+
+class _FlagMasks(dict):
+    """Maps the text of a flags field ("a,b") to its bitmask."""
+
+    def __init__(self):
+        dict.__init__(self)
+        self._flag_to_bit = {}
+
+    def bit_for(self, flag):
+        bit = self._flag_to_bit.get(flag)
+        if bit is None:
+            bit = len(FLAG_NAMES)
+            FLAG_NAMES.append(intern_str(flag))
+            self._flag_to_bit[flag] = bit
+        return bit
+
+    def __missing__(self, flags_str):
+        mask = 0
+        for flag in flags_str.split(","):
+            if flag:
+                mask |= 1 << self.bit_for(flag)
+        self[flags_str] = mask
+        return mask
+
+
+class _MaskToNames(dict):
+    def __missing__(self, mask):
+        names = []
+        bit = 0
+        m = mask
+        while m:
+            if m & 1:
+                names.append(FLAG_NAMES[bit])
+            m >>= 1
+            bit += 1
+        r = frozenset(names) if names else None
+        self[mask] = r
+        return r
+
+
+_RANK_CODES = _RankCodes({"": 0})
+_FLAG_MASKS = _FlagMasks()
+_FLAG_MASKS[""] = 0
+_MASK_TO_NAMES = _MaskToNames()
+
+
+def rank_code(rank):
+    """The code of a rank name (0 for None or "")."""
+    return _RANK_CODES[rank] if rank else 0
+
+
+def rank_name(code):
+    """The pooled rank name of a code (None for 0)."""
+    return RANK_NAMES[code] or None
+
+
+def intern_rank(rank):
+    """Returns the pooled copy of a rank name (or `rank` if it is empty)."""
+    return RANK_NAMES[_RANK_CODES[rank]] if rank else rank
+
+
+def flag_mask(flags):
+    """Bitmask of `flags`: either the text of a flags field or an iterable of names."""
+    if not flags:
+        return 0
+    if isinstance(flags, str):
+        return _FLAG_MASKS[flags]
+    mask = 0
+    bit_for = _FLAG_MASKS.bit_for
+    for flag in flags:
+        mask |= 1 << bit_for(flag)
+    return mask
+
+
+def flag_names(mask):
+    """The shared frozenset of the flag names in a bitmask (None for 0)."""
+    return _MASK_TO_NAMES[mask] if mask else None
+
+
+def intern_flag(flag):
+    return FLAG_NAMES[_FLAG_MASKS.bit_for(flag)]
+
+
+def intern_src_prefix(prefix):
+    return intern_str(prefix)
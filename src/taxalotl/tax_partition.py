@@ -1,19 +1,30 @@
 #!/usr/bin/env python
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import os
 from contextlib import contextmanager
-from copy import copy
+from itertools import compress
 import logging
+from types import MappingProxyType
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from collections import Mapping
 
 from peyutil import (
-    assure_dir_exists,
     read_as_json,
     write_as_json,
 )
 
+from .array_store import ChildSetDict, CSRChildMap, IdList, PackedLineMap
 from .ott_schema import HEADER_TO_LINE_PARSER
+from .profiling import StageTimer
 from .taxon import Taxon
+from .taxonomy_index import index_filepath, remove_taxonomy_index
 from .tree import TaxonForest
-from .util import unlink, OutFile
+from .util import unlink, AtomicOutFile, find_input_file
 
 INP_TAXONOMY_DIRNAME = "__inputs__"
 OUTP_TAXONOMY_DIRNAME = "__outputs__"
@@ -24,6 +35,9 @@ TAXONOMY_FN = "taxonomy.tsv"
 SYNONYMS_FN = "synonyms.tsv"
 ACCUM_DES_FILENAME = "__accum_des__.json"
 
+# used by approx_nbytes for a dict entry holding a line (or set of children)
+_APPROX_BYTES_PER_ENTRY = 250
+
 _LOG = logging.getLogger(__name__)
 
 
@@ -60,14 +74,44 @@ def _read_json_and_coerce_to_otttaxon(tax_dir, misc_tax_dir, fn):
     return r
 
 
+_NUM_FLUSH_THREADS = 4
+
+
 # noinspection PyProtectedMember
 class TaxonomySliceCache(object):
-    def __init__(self):
+    """Holds the TaxonPartition and VirtualTaxonomyToRootSlice objects by cache key.
+
+    If max_bytes is set, evict_if_over_budget() evicts the least recently used
+    slices until the approx_nbytes of the slices is within it. A slice with
+    changes is flushed to its partition files (and is read back from them if it
+    is needed again), an unchanged slice is just dropped. Slices that are pinned
+    (see pin and pinned) are never evicted. Nothing is evicted by get or set, so
+    a slice is never written out in the middle of an operation.
+
+    The size of each slice is recorded when it is added and when its owner calls
+    note_resized, so the total is kept up to date without measuring every slice.
+    """
+
+    def __init__(self, max_bytes=None):
         self._ck_to_obj = {}
+        self._ck_to_last_use = {}
+        self._ck_to_nbytes = {}
+        self._ck_to_pins = {}
+        self._use_count = 0
+        self._nbytes = 0
+        self.max_bytes = max_bytes
+        self.num_evicted = 0
+
+    def _touch(self, key):
+        self._use_count += 1
+        self._ck_to_last_use[key] = self._use_count
 
     def get(self, key):
         assert isinstance(key, tuple) and len(key) == 3
-        return self._ck_to_obj.get(key)
+        obj = self._ck_to_obj.get(key)
+        if obj is not None:
+            self._touch(key)
+        return obj
 
     def __setitem__(self, key, vttrs):
         assert isinstance(key, tuple) and len(key) == 3
@@ -75,6 +119,8 @@ class TaxonomySliceCache(object):
         if old_val is not None and old_val is not vttrs:
             assert False, "should not be creating a new object for a cached taxdi!"
         self._ck_to_obj[key] = vttrs
+        self._touch(key)
+        self.note_resized(key)
 
     def __getitem__(self, ck):
         return self._ck_to_obj[ck]
@@ -82,9 +128,23 @@ class TaxonomySliceCache(object):
     def __delitem__(self, ck):
         obj = self._ck_to_obj.get(ck)
         if obj:
-            del self._ck_to_obj[ck]
+            self._forget(ck)
             obj._flush()
 
+    def _forget(self, ck):
+        obj = self._ck_to_obj.pop(ck)
+        self._ck_to_last_use.pop(ck, None)
+        self._ck_to_pins.pop(ck, None)
+        self._nbytes -= self._ck_to_nbytes.pop(ck, 0)
+        return obj
+
+    def _forget_all(self):
+        self._ck_to_obj = {}
+        self._ck_to_last_use = {}
+        self._ck_to_nbytes = {}
+        self._ck_to_pins = {}
+        self._nbytes = 0
+
     def try_del(self, ck):
         try:
             if ck in self._ck_to_obj:
@@ -92,18 +152,33 @@ class TaxonomySliceCache(object):
         except:
             _LOG.exception("caught and suppressed removal of key")
             if ck in self._ck_to_obj:
-                del self._ck_to_obj[ck]
+                self._forget(ck)
 
     def flush(self):
+        """Flushes every slice (the writes of the slices run in a pool of threads)
+        and empties the cache. Raises the last exception of a flush, if any."""
         kv = [(k, v) for k, v in self._ck_to_obj.items()]
-        self._ck_to_obj = {}
+        self._forget_all()
         _ex = None
-        for k, v in kv:
-            try:
-                v._flush()
-            except Exception as x:
-                _LOG.exception("exception in flushing")
-                _ex = x
+        with StageTimer("flush"):
+            if len(kv) < 2:
+                for k, v in kv:
+                    try:
+                        v._flush()
+                    except Exception as x:
+                        _LOG.exception("exception in flushing")
+                        _ex = x
+            else:
+                # Each slice writes and removes files in its own directories only.
+                num_threads = min(len(kv), _NUM_FLUSH_THREADS)
+                with ThreadPoolExecutor(max_workers=num_threads) as pool:
+                    futures = [pool.submit(v._flush) for k, v in kv]
+                    for fut in futures:
+                        try:
+                            fut.result()
+                        except Exception as x:
+                            _LOG.exception("exception in flushing")
+                            _ex = x
         if _ex is not None:
             raise _ex
 
@@ -113,7 +188,75 @@ class TaxonomySliceCache(object):
 
     def clear_without_flush(self, ck):
         if ck in self._ck_to_obj:
-            del self._ck_to_obj[ck]
+            self._forget(ck)
+
+    def clear_all_without_flush(self):
+        """Forgets every slice (used in a forked worker, where the slices belong to the parent)."""
+        self._forget_all()
+
+    def approx_nbytes(self):
+        return self._nbytes
+
+    def note_resized(self, key):
+        """Records the current approx_nbytes of the slice for `key` (called by the
+        slices when taxa have been read or moved)."""
+        obj = self._ck_to_obj.get(key)
+        if obj is None:
+            return
+        est = getattr(obj, "approx_nbytes", None)
+        n = 0 if est is None else est()
+        self._nbytes += n - self._ck_to_nbytes.get(key, 0)
+        self._ck_to_nbytes[key] = n
+
+    def pin(self, key):
+        """Keeps the slice for `key` from being evicted until it is unpinned (as
+        many times as it was pinned)."""
+        if key in self._ck_to_obj:
+            self._ck_to_pins[key] = self._ck_to_pins.get(key, 0) + 1
+
+    def unpin(self, key):
+        n = self._ck_to_pins.get(key, 0) - 1
+        if n > 0:
+            self._ck_to_pins[key] = n
+        else:
+            self._ck_to_pins.pop(key, None)
+
+    @contextmanager
+    def pinned(self, *slices):
+        """Pins the slices for the duration of the block."""
+        keys = [s.cache_key for s in slices]
+        for k in keys:
+            self.pin(k)
+        try:
+            yield
+        finally:
+            for k in keys:
+                self.unpin(k)
+
+    def evict_if_over_budget(self):
+        """Evicts the least recently used slices that are not pinned until the
+        cache is within max_bytes, or no more slices can be evicted.
+
+        Only call this between operations: the caller must not hold a slice that
+        is not pinned.
+        """
+        if self.max_bytes is None:
+            return
+        evicted = True
+        while evicted and self._nbytes > self.max_bytes:
+            # a flushed slice unpins the slices that it held, so look again.
+            evicted = False
+            by_age = sorted(self._ck_to_obj.keys(), key=self._ck_to_last_use.get)
+            for ck in by_age:
+                if self._nbytes <= self.max_bytes:
+                    break
+                if ck in self._ck_to_pins or ck not in self._ck_to_obj:
+                    continue
+                obj = self._forget(ck)
+                _LOG.debug("evicting {} {} from the slice cache".format(ck[1], ck[2]))
+                obj._flush()
+                self.num_evicted += 1
+                evicted = True
 
 
 TAX_SLICE_CACHE = TaxonomySliceCache()
@@ -121,7 +264,13 @@ TAX_SLICE_CACHE = TaxonomySliceCache()
 
 @contextmanager
 def use_tax_partitions():
-    yield TAX_SLICE_CACHE
+    """Yields TAX_SLICE_CACHE and flushes it afterwards. If the block raises, the
+    slices (which may be partly changed) are dropped without being written."""
+    try:
+        yield TAX_SLICE_CACHE
+    except BaseException:
+        TAX_SLICE_CACHE.clear_all_without_flush()
+        raise
     TAX_SLICE_CACHE.flush()
 
 
@@ -147,7 +296,9 @@ class PartitionedTaxDirBase(object):
     @property
     def input_synonyms_filepath(self):
         if self.synonyms_filename:
-            return os.path.join(self.input_taxdir, self.synonyms_filename)
+            return find_input_file(
+                os.path.join(self.input_taxdir, self.synonyms_filename)
+            )
         return None
 
     @property
@@ -268,15 +419,219 @@ class SynonymInterpreter(object):
 
     def interpret(self, uid, syn_id_line_tuple):
         syn_id, line = syn_id_line_tuple
+        start, end, syn_type = self.locate_name_and_type(uid, line)
+        return Synonym(
+            valid_tax_id=uid, name=line[start:end], syn_type=syn_type, syn_id=syn_id
+        )
+
+    def locate_name_and_type(self, uid, line):
+        """Returns (start, end, syn_type) where line[start:end] is the name."""
         sl = line.split("\t|\t")
         suid = sl[self._uid_ind]
-        name = sl[self._name_ind].strip()
+        raw_name = sl[self._name_ind]
+        name = raw_name.strip()
+        start = sum(len(i) for i in sl[: self._name_ind]) + 3 * self._name_ind
+        start += len(raw_name) - len(raw_name.lstrip())
         syn_type = sl[self._type_ind].strip().lower()
         if syn_type not in _VALID_SYN_TYPES:
             m = 'synonym_type "{}" not recognized in for ({}, "{}")'
             raise ValueError(m.format(syn_type, uid, name))
         assert uid == int(suid)
-        return Synonym(valid_tax_id=uid, name=name, syn_type=syn_type, syn_id=syn_id)
+        return start, start + len(name), syn_type
+
+
+_SYN_TYPE_TO_CODE = {}
+_SYN_TYPES = []  # code -> synonym type
+_EMPTY_VIEW = MappingProxyType({})
+
+
+def _syn_type_code(syn_type):
+    code = _SYN_TYPE_TO_CODE.get(syn_type)
+    if code is None:
+        code = len(_SYN_TYPES)
+        _SYN_TYPES.append(syn_type)
+        _SYN_TYPE_TO_CODE[syn_type] = code
+    return code
+
+
+class SynonymStore(Mapping):
+    """accepted uid -> [(syn_id, line), ...] for the synonyms of a slice.
+
+    Each synonym is a row in columns: the line, the span of the name in the
+    line and an interned type code. The rows of an accepted uid are linked
+    (through _next) from _head to _tail. The name span and type are found
+    the first time that the synonyms are parsed, and the parsed synonyms are
+    cached for each set of ignored types until the store is changed.
+    """
+
+    def __init__(self):
+        self._lines = []  # None for the rows that have been deleted
+        self._syn_ids = {}  # row -> syn_id for the rows that have one
+        self._next = array("q")
+        self._name_start = array("q")
+        self._name_end = array("q")
+        self._type_code = array("h")  # -1 until parsed
+        self._head = {}
+        self._tail = {}
+        self._num_dead = 0
+        self._parsed = None  # accepted uid -> frozenset of Synonym objects
+        self._filtered = {}  # frozenset of ignored types -> read-only view
+
+    def _append(self, accept_id, syn_id, line, name_start=-1, name_end=-1, code=-1):
+        row = len(self._lines)
+        self._lines.append(line)
+        if syn_id is not None:
+            self._syn_ids[row] = syn_id
+        self._next.append(-1)
+        self._name_start.append(name_start)
+        self._name_end.append(name_end)
+        self._type_code.append(code)
+        tail = self._tail.get(accept_id)
+        if tail is None:
+            self._head[accept_id] = row
+        else:
+            self._next[tail] = row
+        self._tail[accept_id] = row
+
+    def add(self, accept_id, syn_id, line):
+        self._append(accept_id, syn_id, line)
+        self._clear_parsed()
+
+    def _rows(self, accept_id):
+        row = self._head[accept_id]
+        while row >= 0:
+            yield row
+            row = self._next[row]
+
+    def __getitem__(self, accept_id):
+        sid = self._syn_ids
+        return [(sid.get(r), self._lines[r]) for r in self._rows(accept_id)]
+
+    def __delitem__(self, accept_id):
+        for row in self._rows(accept_id):
+            self._lines[row] = None
+            self._syn_ids.pop(row, None)
+            self._num_dead += 1
+        del self._head[accept_id]
+        del self._tail[accept_id]
+        self._clear_parsed()
+        if self._num_dead > 4096 and 2 * self._num_dead > len(self._lines):
+            self._compact()
+
+    def __contains__(self, accept_id):
+        return accept_id in self._head
+
+    def __iter__(self):
+        return iter(self._head)
+
+    def __len__(self):
+        return len(self._head)
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes held (assuming lines of ~100 characters)."""
+        num_live = len(self._lines) - self._num_dead
+        return 26 * len(self._lines) + 150 * num_live + 200 * len(self._head)
+
+    def _clear_parsed(self):
+        if self._parsed is not None or self._filtered:
+            self._parsed = None
+            self._filtered = {}
+
+    def _compact(self):
+        c = SynonymStore()
+        for accept_id in self._head:
+            for r in self._rows(accept_id):
+                c._append(
+                    accept_id,
+                    self._syn_ids.get(r),
+                    self._lines[r],
+                    self._name_start[r],
+                    self._name_end[r],
+                    self._type_code[r],
+                )
+        c._parsed, c._filtered = self._parsed, self._filtered
+        self.__dict__.update(c.__dict__)
+
+    def _parse_all(self, header):
+        si = SynonymInterpreter(header)
+        lines, starts, ends, codes = (
+            self._lines,
+            self._name_start,
+            self._name_end,
+            self._type_code,
+        )
+        p = {}
+        for accept_id in self._head:
+            ps = set()
+            for r in self._rows(accept_id):
+                line = lines[r]
+                if codes[r] < 0:
+                    start, end, syn_type = si.locate_name_and_type(accept_id, line)
+                    starts[r], ends[r] = start, end
+                    codes[r] = _syn_type_code(syn_type)
+                syn = Synonym(
+                    valid_tax_id=accept_id,
+                    name=line[starts[r] : ends[r]],
+                    syn_type=_SYN_TYPES[codes[r]],
+                    syn_id=self._syn_ids.get(r),
+                )
+                ps.add(syn)
+            p[accept_id] = frozenset(ps)
+        return p
+
+    def parsed(self, header, ignored_syn_types=None):
+        """Returns a read-only view of accepted uid -> frozenset of Synonym objects
+        for the synonyms whose type is not in `ignored_syn_types`."""
+        key = frozenset(ignored_syn_types) if ignored_syn_types else frozenset()
+        view = self._filtered.get(key)
+        if view is not None:
+            return view
+        if self._parsed is None:
+            self._parsed = self._parse_all(header)
+        if key:
+            d = {}
+            for accept_id, syns in self._parsed.items():
+                kept = frozenset(i for i in syns if i.syn_type not in key)
+                if kept:
+                    d[accept_id] = kept
+        else:
+            d = self._parsed
+        view = MappingProxyType(d)
+        self._filtered[key] = view
+        return view
+
+
+def _pop_subtree_preorder(id_to_child_set, root_id):
+    """Pops the child sets of root_id and its descendants from id_to_child_set.
+
+    Returns (tour, internal, child_sets, is_tip). tour lists the uids of the
+    subtree in preorder (visiting children in the iteration order of their set),
+    internal and child_sets are the uids with children and their popped child
+    sets (in preorder), and is_tip[i] is 1 if tour[i] has no children. A subtree
+    is a contiguous range of the tour. The traversal uses a stack rather than
+    recursion, so deep lineages are fine.
+    """
+    pop_children = id_to_child_set.pop_children
+    has_children = id_to_child_set.__contains__
+    children = pop_children(root_id)
+    tour, is_tip = [root_id], bytearray(1)
+    internal, child_sets = [root_id], [children]
+    stack = [iter(children)]
+    while stack:
+        for uid in stack[-1]:
+            tour.append(uid)
+            if has_children(uid):
+                children = pop_children(uid)
+                internal.append(uid)
+                child_sets.append(children)
+                is_tip.append(0)
+                stack.append(iter(children))
+                break
+            is_tip.append(1)
+        else:
+            stack.pop()
+    return tour, internal, child_sets, is_tip
 
 
 # noinspection PyProtectedMember
@@ -291,16 +646,21 @@ class LightTaxonomyHolder(object):
         "_roots",
     ]
 
-    def __init__(self, fragment):
+    def __init__(self, fragment, compact_storage=False):
         self.fragment = fragment
-        self._id_order = []
-        self._id_to_line = {}  # id -> line
-        self._id_to_child_set = {}  # id -> set of child IDs
+        self.compact_storage = compact_storage
+        if compact_storage:
+            self._id_order = IdList()
+            self._id_to_line = PackedLineMap()  # id -> line
+            self._id_to_child_set = CSRChildMap()  # id -> set of child IDs
+        else:
+            self._id_order = []
+            self._id_to_line = {}  # id -> line
+            self._id_to_child_set = ChildSetDict()  # id -> set of child IDs
         self._id_to_el = {}
         self._roots = {}
         self._des_in_other_slices = {}
-        self._syn_by_id = {}  # accepted_id -> list of synonym lines
-        self._parsed_syn_by_id = None
+        self._syn_by_id = SynonymStore()  # accepted_id -> list of synonym lines
         self.taxon_header = None
         self.syn_header = None
         self.treat_syn_as_taxa = False
@@ -312,24 +672,28 @@ class LightTaxonomyHolder(object):
 
     @property
     def synonyms_by_id(self):
-        return copy(self._syn_by_id)
+        """Read-only view of accepted_id -> list of (syn_id, line) pairs."""
+        if self._syn_by_id is None:
+            return _EMPTY_VIEW
+        return MappingProxyType(self._syn_by_id)
 
     def parsed_synonyms_by_id(self, ignored_syn_types=None):
-        if self._parsed_syn_by_id is None:
-            p = {}
-            if self._syn_by_id:
-                si = SynonymInterpreter(self.syn_header)
-                for uid, line_stub_list in self._syn_by_id.items():
-                    ps = set()
-                    for i in line_stub_list:
-                        syn = si.interpret(uid, i)
-                        st = syn.syn_type
-                        if ignored_syn_types is None or st not in ignored_syn_types:
-                            ps.add(syn)
-                    if ps:
-                        p[uid] = ps
-            self._parsed_syn_by_id = p
-        return copy(self._parsed_syn_by_id)
+        """Read-only view of accepted_id -> frozenset of Synonym objects (omitting
+        the types in ignored_syn_types). The result is cached for each set of types."""
+        if not self._syn_by_id:
+            return _EMPTY_VIEW
+        return self._syn_by_id.parsed(self.syn_header, ignored_syn_types)
+
+    def approx_nbytes(self):
+        """Rough estimate of the memory held by the taxa and synonyms."""
+        if self._id_to_line is None:
+            return 0
+        n = 0
+        for store in (self._id_to_line, self._id_to_child_set):
+            nb = getattr(store, "nbytes", None)
+            n += _APPROX_BYTES_PER_ENTRY * len(store) if nb is None else nb
+        n += 8 * len(self._id_order)
+        return n + self._syn_by_id.nbytes
 
     def _del_data(self):
         for el in LightTaxonomyHolder._DATT:
@@ -341,10 +705,16 @@ class LightTaxonomyHolder(object):
         assert old is None or old == line
         self._id_to_line[uid] = line
         self._id_order.append(uid)
-        self._id_to_child_set.setdefault(par_id, set()).add(uid)
+        self._id_to_child_set.add_child(par_id, uid)
 
     add_taxon_from_higher_tax_part = add_taxon
 
+    def set_mapped_taxa(self, mapped_file):
+        """Uses views of a MappedTaxonomyFile in place of the parsed taxon lines."""
+        assert not self._id_to_line
+        self._id_to_line = mapped_file.line_map()
+        self._id_to_child_set = mapped_file.child_map()
+
     def contained_ids(self):
         c = set()
         if self._id_to_child_set:
@@ -384,30 +754,33 @@ class LightTaxonomyHolder(object):
         d = taxon.to_serializable_dict()
         d["fragment"] = dest_part.fragment
         self._des_in_other_slices[par_id] = d
-        self._transfer_subtree_rec(par_id, dest_part)
+        self._move_subtree_taxa(par_id, dest_part)
 
-    def _transfer_subtree_rec(
-        self, par_id, dest_part
-    ):  # type (int, LightTaxonomyHolder) -> None
+    def _move_subtree_taxa(self, par_id, dest_part):
+        """Moves par_id and its descendants to dest_part using their preorder tour.
+
+        Each uid of the tour is sent to dest_part in _id_to_el, the child sets
+        are moved as they are, and the lines are moved in tour order. As with
+        add_taxon, only the tips are added to the _id_order of dest_part.
+        """
         assert self is not dest_part
         assert self.fragment != dest_part.fragment
-        child_set = self._id_to_child_set[par_id]
-        self._id_to_el[par_id] = dest_part
-        line = self._id_to_line.get(par_id)
-        if line is not None:
-            dest_part._id_to_line[par_id] = line
-            del self._id_to_line[par_id]
-        del self._id_to_child_set[par_id]
-        dest_part._id_to_child_set.setdefault(par_id, set()).update(child_set)
-        for child_id in child_set:
-            self._id_to_el[child_id] = dest_part
-            if child_id in self._id_to_child_set:
-                self._transfer_subtree_rec(child_id, dest_part)
-            else:
-                line = self._id_to_line.get(child_id)
-                if line:
-                    dest_part.add_taxon(child_id, par_id, line)
-                    del self._id_to_line[child_id]
+        icm = self._id_to_child_set
+        tour, internal, child_sets, is_tip = _pop_subtree_preorder(icm, par_id)
+        self._id_to_el.update(dict.fromkeys(tour, dest_part))
+        dest_part._id_to_child_set.adopt_child_sets(internal, child_sets)
+        src_lines = self._id_to_line
+        try:
+            moved = dict(zip(tour, map(src_lines.__getitem__, tour)))
+            tips = compress(tour, is_tip)
+        except KeyError:
+            # some uids (e.g. roots that were moved earlier) have no line here
+            moved = {u: ln for u, ln in zip(tour, map(src_lines.get, tour)) if ln}
+            tips = [u for u in compress(tour, is_tip) if u in moved]
+        dest_part._id_to_line.update(moved)
+        dest_part._id_order.extend(tips)
+        for uid in moved.keys():
+            del src_lines[uid]
 
     def move_matched_synonyms(
         self, dest_tax_part
@@ -457,18 +830,36 @@ class LightTaxonomyHolder(object):
             assert syn_id is not None
             self.add_taxon(syn_id, None, line)
         else:
-            self._syn_by_id.setdefault(accept_id, []).append((syn_id, line))
+            self._syn_by_id.add(accept_id, syn_id, line)
+
+
+class ArrayTaxonomyHolder(LightTaxonomyHolder):
+    """A LightTaxonomyHolder that keeps its taxa in typed arrays (see array_store).
+
+    uids are held in array('q') columns, the children of each parent as CSR
+    offset arrays, and the text of the lines in a single buffer.
+    The add_taxon, _transfer_subtree, etc. methods behave as in LightTaxonomyHolder.
+    The child sets that are read iterate in the same order as the sets of the dict
+    (see CSRChildMap), so the files written are the same, byte for byte.
+    """
+
+    def __init__(self, fragment):
+        LightTaxonomyHolder.__init__(self, fragment, compact_storage=True)
 
 
 # noinspection PyProtectedMember
 class PartitioningLightTaxHolder(LightTaxonomyHolder):
-    def __init__(self, fragment):
+    def __init__(self, fragment, compact_storage=False):
         ls = fragment.split("/")
         if len(ls) > 1:
             assert ls[-2] != ls[-1]
-        LightTaxonomyHolder.__init__(self, fragment)
+        LightTaxonomyHolder.__init__(self, fragment, compact_storage=compact_storage)
         self._subdirname_to_tp_roots = {}
-        self._misc_part = LightTaxonomyHolder(os.path.join(fragment, MISC_DIRNAME))
+        misc_frag = os.path.join(fragment, MISC_DIRNAME)
+        if compact_storage:
+            self._misc_part = ArrayTaxonomyHolder(misc_frag)
+        else:
+            self._misc_part = LightTaxonomyHolder(misc_frag)
         self._roots_for_sub = set()
         self._root_to_lth = {}
         self._during_parse_root_to_par = {}
@@ -479,13 +870,18 @@ class PartitioningLightTaxHolder(LightTaxonomyHolder):
                 par_id = int(par_id)
             except:
                 pass
-        self._id_to_child_set.setdefault(par_id, set()).add(uid)
+        self._id_to_child_set.add_child(par_id, uid)
         if uid in self._id_to_line:
             raise ValueError("Repeated uid {} in line {}".format(uid, line))
         self._id_to_line[uid] = line
         if uid in self._roots_for_sub:
             self._during_parse_root_to_par[uid] = par_id
 
+    def approx_nbytes(self):
+        # the sub partitions are in TAX_SLICE_CACHE, so they are not counted here.
+        n = LightTaxonomyHolder.approx_nbytes(self)
+        return n + self._misc_part.approx_nbytes()
+
     def sub_tax_parts(self, include_misc=True):
         ret = [i for i in self._root_to_lth.values()]
         if include_misc:
@@ -507,9 +903,7 @@ class PartitioningLightTaxHolder(LightTaxonomyHolder):
                 self._transfer_subtree(uid, match_el, as_root=True)
             elif uid in self._id_to_line:
                 self._transfer_line(uid, match_el, as_root=True)
-            pc = self._id_to_child_set.get(par_id)
-            if pc:
-                pc.remove(uid)
+            self._id_to_child_set.discard_child(par_id, uid)
             self._id_to_el[uid] = match_el
         assert not self._misc_part._id_to_child_set
         assert not self._misc_part._id_to_line
@@ -558,7 +952,9 @@ class PartitioningLightTaxHolder(LightTaxonomyHolder):
 # noinspection PyProtectedMember
 class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
     def __init__(self, res, fragment):
-        PartitioningLightTaxHolder.__init__(self, fragment)
+        PartitioningLightTaxHolder.__init__(
+            self, fragment, compact_storage=_res_uses_compact_storage(res)
+        )
         PartitionedTaxDirBase.__init__(self, res, fragment)
         self.treat_syn_as_taxa = self.synonyms_filename is None
         self._read_from_fs = False
@@ -567,17 +963,11 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         self._fs_is_partitioned = None
         self._has_flushed = False
         self._external_inp_fp = None
+        self._pinned_keys = []
 
     @property
     def write_taxon_header(self):
-        from .ott_schema import INP_FLAGGED_OTT_TAXONOMY_HEADER, FULL_OTT_HEADER
-        from .parsing.ott import OTTaxonomyWrapper
-
-        return (
-            FULL_OTT_HEADER
-            if isinstance(self.res, OTTaxonomyWrapper)
-            else INP_FLAGGED_OTT_TAXONOMY_HEADER
-        )
+        return get_write_taxon_header(self.res)
 
     @property
     def external_input_fp(self):
@@ -638,6 +1028,9 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         for subname, subroot in list_of_subdirname_and_roots:
             subfrag = os.path.join(self.fragment, subname)
             subtp = get_taxon_partition(self.res, subfrag)
+            # released by _flush, as self moves taxa into subtp until then
+            TAX_SLICE_CACHE.pin(subtp.cache_key)
+            self._pinned_keys.append(subtp.cache_key)
             if subname in having_inp_to_read:
                 subtp._has_unread_tax_inp = True
             self._roots_for_sub.update(subroot)
@@ -648,6 +1041,20 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
             self._partition_from_in_mem()
         else:
             self._read_inputs(do_part_if_reading)
+        self._note_sizes()
+
+    def _note_sizes(self, other=None):
+        """Updates the sizes of self, its sub partitions and `other` in the cache."""
+        TAX_SLICE_CACHE.note_resized(self.cache_key)
+        for subtp, subroot in self._subdirname_to_tp_roots.values():
+            TAX_SLICE_CACHE.note_resized(subtp.cache_key)
+        if other is not None and hasattr(other, "cache_key"):
+            TAX_SLICE_CACHE.note_resized(other.cache_key)
+
+    def move_from_misc_to_new_part(self, other):
+        r = PartitioningLightTaxHolder.move_from_misc_to_new_part(self, other)
+        self._note_sizes(other)
+        return r
 
     def _partition_from_in_mem(self):
         _LOG.info('_partition_from_in_mem for fragment "{}"'.format(self.fragment))
@@ -770,7 +1177,7 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         # Only to be used for accessors
         if not self._read_from_fs:
             assert not self._populated
-            self._read_inputs(do_part_if_reading=False)
+            self._read_inputs(do_part_if_reading=False, read_only=True)
 
     def get_root_ids(self):
         return set(self._roots.keys())
@@ -786,14 +1193,21 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         return id_to_obj
 
     def get_taxa_as_forest(self):
-        return TaxonForest(id_to_taxon=self.get_id_to_ott_taxon(), taxon_partition=self)
+        # The child sets filled while reading the taxa describe the same tree,
+        #   unless taxa have since been moved to other partitions.
+        id_to_children = None if self._has_moved_taxa else self._id_to_child_set
+        return TaxonForest(
+            id_to_taxon=self.get_id_to_ott_taxon(),
+            taxon_partition=self,
+            id_to_children=id_to_children or None,
+        )
 
     def active_tax_dir(self):
         if self._populated:
             return os.path.split(self.tax_fp)[0]
         raise NotImplementedError("active_tax_dir on unpopulated")
 
-    def _read_inputs(self, do_part_if_reading=True):
+    def _read_inputs(self, do_part_if_reading=True, read_only=False):
         self._has_unread_tax_inp = False
 
         if self._external_inp_fp:
@@ -809,7 +1223,10 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
                 self.tax_fp = self.tax_fp_unpartitioned
                 self._read_from_misc = False
         try:
-            self.res.partition_parsing_fn(self)
+            if read_only:
+                self.res.partition_parsing_fn(self, read_only=True)
+            else:
+                self.res.partition_parsing_fn(self)
             read_roots = self._read_roots()
             self._roots.update(read_roots)
             self._des_in_other_slices.update(self.read_acccumulated_des())
@@ -821,6 +1238,7 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
                     self._copy_shared_fields(el)
                     el._populated = True
             self._populated = True
+            TAX_SLICE_CACHE.note_resized(self.cache_key)
         except:
             self._read_from_fs = False
             self._read_from_misc = None
@@ -834,6 +1252,8 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         return get_accum_des_for_subset(self.tax_dir_unpartitioned, self.tax_dir_misc)
 
     def _flush(self):
+        while self._pinned_keys:
+            TAX_SLICE_CACHE.unpin(self._pinned_keys.pop())
         if self._has_flushed:
             _LOG.info(
                 "duplicate flush of TaxonPartition for {} ignored.".format(
@@ -852,7 +1272,10 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         _LOG.info("flushing TaxonPartition for {}".format(self.fragment))
         self.write_if_needed()
         if self._read_from_misc is False and self._read_from_partitioning_scratch:
-            tr = [self.tax_fp_unpartitioned]
+            tr = [
+                self.tax_fp_unpartitioned,
+                index_filepath(self.tax_fp_unpartitioned),
+            ]
             if self.output_synonyms_filepath:
                 tr.append(self.output_synonyms_filepath)
             tr.append(os.path.join(self.tax_dir_unpartitioned, ACCUM_DES_FILENAME))
@@ -883,7 +1306,7 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
         roots_file = os.path.join(out_dir, ROOTS_FILENAME)
         if not dh._id_to_line:
             _LOG.debug("write not needed for {} no records".format(self.fragment))
-            syn_id_order = []
+            syn_id_order = {}
         else:
             syn_id_order = _write_d_as_tsv(
                 self.write_taxon_header, dh._id_to_line, dh._id_order, dest
@@ -906,17 +1329,37 @@ class TaxonPartition(PartitionedTaxDirBase, PartitioningLightTaxHolder):
 def write_taxon_json(obj, filepath):
     out_dir = os.path.split(filepath)[0]
     if out_dir:
-        assure_dir_exists(out_dir)
+        os.makedirs(out_dir, exist_ok=True)
     dtw = {}
     for k, v in obj.items():
         if isinstance(v, Taxon):
             dtw[k] = v.to_serializable_dict()
         else:
             dtw[k] = v
-    with OutFile(filepath) as outs:
+    with AtomicOutFile(filepath) as outs:
         write_as_json(dtw, outs, indent=1)
 
 
+def get_write_taxon_header(res):
+    """Header of the taxonomy.tsv files written to the partitions of `res`."""
+    from .ott_schema import INP_FLAGGED_OTT_TAXONOMY_HEADER, FULL_OTT_HEADER
+    from .parsing.ott import OTTaxonomyWrapper
+
+    return (
+        FULL_OTT_HEADER
+        if isinstance(res, OTTaxonomyWrapper)
+        else INP_FLAGGED_OTT_TAXONOMY_HEADER
+    )
+
+
+def _res_uses_compact_storage(res):
+    """True if the config asks for array-backed (ArrayTaxonomyHolder) storage."""
+    try:
+        return bool(res.config.compact_partition_storage)
+    except (AttributeError, RuntimeError):
+        return False
+
+
 def get_taxon_partition(res, fragment):
     ck = (TaxonPartition, res.id, fragment)
     c = TAX_SLICE_CACHE.get(ck)
@@ -925,48 +1368,58 @@ def get_taxon_partition(res, fragment):
     return TaxonPartition(res, fragment)
 
 
+def _lines_in_id_order(dict_to_write, id_order, written):
+    """Yields the lines for the ids in id_order, then the rest of dict_to_write.
+    The ids are added to `written` (a dict used as an ordered set) as they go."""
+    for i in id_order:
+        el = dict_to_write.get(i)
+        if el is not None:
+            written[i] = None
+            yield el
+    for key, line in dict_to_write.items():
+        if key not in written:
+            written[key] = None
+            yield line
+
+
 def _write_d_as_tsv(header, dict_to_write, id_order, dest_path):
+    """Streams the lines of dict_to_write (those in id_order first) to dest_path.
+
+    Returns the ids written, in order, as the keys of a dict.
+    """
     if not dict_to_write:
         return
-    ret = []
-    pd = os.path.split(dest_path)[0]
-    assure_dir_exists(pd)
+    written = {}
+    os.makedirs(os.path.split(dest_path)[0], exist_ok=True)
+    remove_taxonomy_index(dest_path)
     _LOG.info('Writing {} tax records to "{}"'.format(len(dict_to_write), dest_path))
-    with OutFile(dest_path) as outp:
+    with AtomicOutFile(dest_path) as outp:
         outp.write(header)
-        for i in id_order:
-            el = dict_to_write.get(i)
-            if el is not None:
-                ret.append(i)
-                outp.write(el)
-        oset = frozenset(ret)
-        for key, line in dict_to_write.items():
-            if key not in oset:
-                ret.append(key)
-                outp.write(line)
-    return ret
-
-
-def _write_syn_d_as_tsv(header, dict_to_write, id_order, dest_path):
-    ltw = []
-    for i in id_order:
+        outp.writelines(_lines_in_id_order(dict_to_write, id_order, written))
+    return written
+
+
+def _syn_lines_in_id_order(dict_to_write, written_ids):
+    for i in written_ids:
         synlist = dict_to_write.get(i)
         if synlist is not None:
             for p in synlist:
-                ltw.append(p[1])
-    oset = frozenset(id_order)
-    if dict_to_write:
-        for key, synlist in dict_to_write.items():
-            if key not in oset:
-                for syn_pair in synlist:
-                    ltw.append(syn_pair[1])
-    if not ltw:
+                yield p[1]
+    for key, synlist in dict_to_write.items():
+        if key not in written_ids:
+            for syn_pair in synlist:
+                yield syn_pair[1]
+
+
+def _write_syn_d_as_tsv(header, dict_to_write, written_ids, dest_path):
+    """Streams the synonyms of the ids in written_ids (a dict of the ids in the
+    taxonomy file, as returned by _write_d_as_tsv) and then the rest to dest_path.
+    Nothing is written if there are no synonyms."""
+    if not dict_to_write:
         return
-    x = len(ltw)
-    pd = os.path.split(dest_path)[0]
-    assure_dir_exists(pd)
-    _LOG.info('Writing {} syn. records to "{}"'.format(x, dest_path))
-    with OutFile(dest_path) as outp:
+    os.makedirs(os.path.split(dest_path)[0], exist_ok=True)
+    m = 'Writing syn. records for {} taxa to "{}"'
+    _LOG.info(m.format(len(dict_to_write), dest_path))
+    with AtomicOutFile(dest_path) as outp:
         outp.write(header)
-        for line in ltw:
-            outp.write(line)
+        outp.writelines(_syn_lines_in_id_order(dict_to_write, written_ids))
@@ -3,6 +3,7 @@
 
 from __future__ import print_function
 
+from .string_pool import RANK_NAMES, flag_mask, flag_names, intern_str, rank_code
 from .taxonomic_ranks import _RANK_TO_SORTING_NUMBER
 
 
@@ -10,11 +11,39 @@ from .taxonomic_ranks import _RANK_TO_SORTING_NUMBER
 
 
 class Taxon(object):
+    """A taxon parsed from a line of a taxonomy file (or from a dict).
+
+    Slotted to keep millions of instances small. Values computed by analyses
+    (ranks guessed from the tree, tip counts, name matches...) are kept in
+    side tables of the TaxonTree rather than on the taxon. Rarely used
+    attributes (e.g. those of other schemas) go into an instance dict that
+    is only created when one is set.
+
+    The rank is held as a string_pool code and the flags as a bitmask; the
+    `rank` and `flags` properties return the pooled name and a shared
+    frozenset of the flag names (or None).
+    """
+
+    __slots__ = (
+        "id",
+        "par_id",
+        "name",
+        "_rank",
+        "src_dict",
+        "_flags",
+        "uniqname",
+        "children_refs",
+        "parent_ref",
+        "_synonyms",
+        "line_num",
+        "line",
+        "__dict__",
+    )
     _DATT = ("id", "par_id", "name", "rank", "src_dict", "flags", "uniqname")
 
     def __init__(self, line=None, line_num="<unknown>", line_parser=None, d=None):
-        self.id, self.par_id, self.name, self.rank = None, None, None, None
-        self.src_dict, self.flags, self.uniqname = None, None, None
+        self.id, self.par_id, self.name, self._rank = None, None, None, 0
+        self.src_dict, self._flags, self.uniqname = None, 0, None
         self.children_refs = None
         self._synonyms = None
         if d is not None:
@@ -28,6 +57,23 @@ class Taxon(object):
                 line_parser = full_ott_line_parser
             line_parser(self, line)
 
+    @property
+    def rank(self):
+        return RANK_NAMES[self._rank] or None
+
+    @rank.setter
+    def rank(self, rank):
+        self._rank = rank_code(rank)
+
+    @property
+    def flags(self):
+        return flag_names(self._flags)
+
+    @flags.setter
+    def flags(self, flags):
+        """`flags` is an iterable of flag names or the text of a flags field."""
+        self._flags = flag_mask(flags)
+
     def formatted_src_dict(self):
         if not self.src_dict:
             return
@@ -87,10 +133,7 @@ class Taxon(object):
         self._add_flag("incertae_sedis")
 
     def _add_flag(self, f):
-        if not self.flags:
-            self.flags = {f}
-        else:
-            self.flags.add(f)
+        self._flags |= flag_mask((f,))
 
     def rank_sorting_number(self):
         if (self.rank is None) or self.rank.startswith("no rank"):
@@ -114,7 +157,7 @@ class Taxon(object):
             if k == "flags":
                 v = set(v)
             elif k == "src_dict":
-                v = {sk: set(sv) for sk, sv in v.items()}
+                v = {intern_str(sk): set(sv) for sk, sv in v.items()}
             setattr(self, k, v)
 
     def to_serializable_dict(self):
@@ -144,4 +187,7 @@ class Taxon(object):
         return getattr(self, key, default)
 
     def __getitem__(self, item):
-        return self.__dict__[item]
+        try:
+            return getattr(self, item)
+        except AttributeError:
+            raise KeyError(item)
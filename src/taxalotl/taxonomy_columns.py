@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+"""Bulk, columnar parsing of the OTT-style taxonomy.tsv files.
+
+The file is read in large chunks. A chunk of well-formed lines is split on the
+field separator by a single str.split call, and each field is then a strided
+slice of the result. So the per-line work is just the conversion of the
+columns that the caller asks for, and most of that is done by map() over
+dicts of already-seen values:
+    uid and parent_uid: ints when they parse as ints (else strings); None for
+        a missing parent.
+    rank: a small int code; RANK_NAMES[code] is the string ("" for no rank).
+    flags: an int bitmask (see string_pool).
+    sourceinfo: offsets into one string holding all of the column's values;
+        parsed into a src_dict only on request.
+Chunks that do not have the expected shape (blank lines, lines with an
+unexpected number of fields...) are parsed line by line.
+"""
+from array import array
+from contextlib import contextmanager
+from itertools import accumulate, chain, islice
+import gc
+import logging
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from collections import Mapping
+
+from .string_pool import (
+    _FLAG_MASKS,
+    _RANK_CODES,
+    RANK_NAMES,
+    flag_names,
+    intern_str,
+)
+from .taxon import Taxon
+from .util import open_input
+
+_LOG = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 24
+_SEP = "\t|\t"
+# The field names used for a column in the different headers
+_FIELD_ALIASES = {"src": "sourceinfo"}
+# Columns that are kept as lists of the raw strings
+_STR_COLUMNS = ("name", "uniqname", "aut_id", "aut_yr_id", "nom_status")
+
+
+@contextmanager
+def _gc_paused():
+    """Suspends the cyclic GC while building many (acyclic) containers.
+
+    Otherwise each batch of new dicts and sets triggers a collection that
+    scans everything allocated so far.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class _Layout(object):
+    """Positions of the fields of the lines that follow a header."""
+
+    def __init__(self, header):
+        self.header = header
+        self.trailing_sep = header.endswith(_SEP + "\n")
+        fields = header[:-1].split(_SEP)
+        if self.trailing_sep:
+            fields.pop(-1)
+        self.fields = [_FIELD_ALIASES.get(f, f) for f in fields]
+        self.num_fields = len(fields)
+        # tax_wikidata_parser strips the whitespace around the rank
+        self.strip_rank = "aut_id" in self.fields
+        if self.fields[:3] != ["uid", "parent_uid", "name"]:
+            raise ValueError("Not a taxonomy header: {}".format(repr(header)))
+
+    def split_chunk(self, text, columns):
+        """Returns a list (one element per field) of lists of the field values.
+
+        Only the fields in `columns` (and the uid) are filled in, the others are
+        None. Returns None if the chunk does not have num_fields fields on
+        each line.
+        """
+        p = self.num_fields
+        num_lines = text.count("\n")
+        if not self.trailing_sep:
+            text = text.replace("\n", _SEP + "\n")
+        parts = text.split(_SEP)
+        if len(parts) != p * num_lines + 1 or parts[-1] != "\n":
+            return None
+        # Each line has p fields iff all but the first uid start with the
+        #   newline that ends the line before them (and no field holds another).
+        uid_col = parts[0:-1:p]
+        uid_text = "\0".join(uid_col)
+        num_breaks = num_lines - 1
+        if uid_text.count("\n") != num_breaks:
+            return None
+        if uid_text.count("\0\n") != num_breaks:
+            return None
+        cols = [None] * p
+        cols[0] = "".join(uid_col).split("\n")
+        for c, field in enumerate(self.fields):
+            if c > 0 and field in columns:
+                cols[c] = parts[c:-1:p]
+        return cols
+
+    def split_lines(self, lines, first_row_num, filepath, skip_blank_lines):
+        """Line-by-line version of split_chunk. Missing fields are treated as empty.
+
+        Returns the columns, the lines kept and the line number of each.
+        """
+        p = self.num_fields
+        rows, kept, line_nums = [], [], []
+        for n, line in enumerate(lines):
+            if skip_blank_lines and not line.strip():
+                continue
+            ls = line.split(_SEP)
+            if ls[-1].endswith("\n"):
+                ls[-1] = ls[-1][:-1]
+                if self.trailing_sep and ls[-1] == "":
+                    ls.pop(-1)
+            if len(ls) < 3:
+                m = 'Line {} of "{}" has only {} field(s):\n{}'
+                raise ValueError(m.format(first_row_num + n, filepath, len(ls), line))
+            if len(ls) < p:
+                ls.extend([""] * (p - len(ls)))
+            rows.append(ls[:p])
+            kept.append(line)
+            line_nums.append(first_row_num + n)
+        cols = [list(col) for col in zip(*rows)] if rows else None
+        return cols, kept, line_nums
+
+
+def _empty_positions(col):
+    r = []
+    i = -1
+    try:
+        while True:
+            i = col.index("", i + 1)
+            r.append(i)
+    except ValueError:
+        return r
+
+
+def _to_ids(col, int_ids, missing_is_none=False):
+    """Converts a column of uids (ints if `int_ids` and they parse as ints)."""
+    empty = _empty_positions(col) if missing_is_none else ()
+    if int_ids:
+        if empty:
+            col = list(col)
+            for i in empty:
+                col[i] = "0"
+        try:
+            r = list(map(int, col))
+        except ValueError:
+            from .ott_schema import int_or_str
+
+            r = list(map(int_or_str, col))
+    else:
+        r = list(col)
+    for i in empty:
+        r[i] = None
+    return r
+
+
+class TaxonomyColumns(object):
+    """The requested columns of (part of) a taxonomy.tsv, one entry per taxon.
+
+    uids, par_ids, names, ranks (codes), flags (bitmasks), uniqnames, lines,
+    and src_offsets/src_text are filled for the columns that were requested
+    (the others are None). line_nums[i] is the line number of row i (counting
+    the blank lines that were skipped).
+    """
+
+    def __init__(self, header, columns):
+        self.header = header
+        self.columns = frozenset(columns)
+        self.line_nums = array("q")
+        self.num_rows = 0
+        self.uids = [] if "uid" in columns else None
+        self.par_ids = [] if "parent_uid" in columns else None
+        self.ranks = array("H") if "rank" in columns else None
+        self.flags = [] if "flags" in columns else None
+        self.lines = [] if "line" in columns else None
+        self.str_columns = {c: [] for c in _STR_COLUMNS if c in columns}
+        if "sourceinfo" in columns:
+            self.src_offsets = array("q", [0])
+            self._src_pieces = []
+        else:
+            self.src_offsets = None
+            self._src_pieces = None
+        self._src_text = None
+
+    def __len__(self):
+        return self.num_rows
+
+    @property
+    def names(self):
+        return self.str_columns.get("name")
+
+    @property
+    def uniqnames(self):
+        return self.str_columns.get("uniqname")
+
+    @property
+    def src_text(self):
+        if self._src_text is None and self._src_pieces is not None:
+            self._src_text = "".join(self._src_pieces)
+            self._src_pieces = [self._src_text]
+        return self._src_text
+
+    def _append(self, layout, cols, lines, line_nums, int_ids):
+        n = len(cols[0])
+        fields = layout.fields
+        self.line_nums.extend(line_nums)
+        if self.uids is not None:
+            self.uids.extend(_to_ids(cols[0], int_ids))
+        if self.par_ids is not None:
+            self.par_ids.extend(_to_ids(cols[1], int_ids, missing_is_none=True))
+        for c, dest in self.str_columns.items():
+            if c in fields:
+                dest.extend(cols[fields.index(c)])
+            else:
+                dest.extend([""] * n)
+        if self.ranks is not None:
+            if "rank" in fields:
+                col = cols[fields.index("rank")]
+                if layout.strip_rank:
+                    col = [i.strip() for i in col]
+                self.ranks.extend(map(_RANK_CODES.__getitem__, col))
+            else:
+                self.ranks.extend([0] * n)
+        if self.flags is not None:
+            if "flags" in fields:
+                col = cols[fields.index("flags")]
+                self.flags.extend(map(_FLAG_MASKS.__getitem__, col))
+            else:
+                self.flags.extend([0] * n)
+        if self.src_offsets is not None:
+            if "sourceinfo" in fields:
+                col = cols[fields.index("sourceinfo")]
+            else:
+                col = [""] * n
+            self._src_pieces.append("".join(col))
+            self._src_text = None
+            lengths = chain((self.src_offsets[-1],), map(len, col))
+            self.src_offsets.extend(islice(accumulate(lengths), 1, None))
+        if self.lines is not None:
+            self.lines.extend(lines)
+        self.num_rows += n
+
+    def rank(self, i):
+        return RANK_NAMES[self.ranks[i]] or None
+
+    def flag_names(self, i):
+        return flag_names(self.flags[i])
+
+    def src_string(self, i):
+        return self.src_text[self.src_offsets[i] : self.src_offsets[i + 1]]
+
+    def src_dict(self, i):
+        """The parsed sourceinfo of row i (or None if it is empty)."""
+        from .ott_schema import raw_src_string_to_dict
+
+        s = self.src_string(i)
+        return (raw_src_string_to_dict(s) or None) if s else None
+
+    def src_strings(self):
+        offsets, text = self.src_offsets, self.src_text
+        return [text[b:e] for b, e in zip(offsets, islice(offsets, 1, None))]
+
+    def src_dicts(self):
+        """The parsed sourceinfo of each row (see src_dict)."""
+        with _gc_paused():
+            return _parse_src_strings(self.src_strings())
+
+    def taxa(self):
+        """Returns a list of a Taxon for each row, with the attributes that the
+        line parser for the header sets (for the columns that were read).
+        """
+        with _gc_paused():
+            return self._taxa()
+
+    def _taxa(self):
+        n = self.num_rows
+        none_col = [None] * n
+        uids = self.uids if self.uids is not None else none_col
+        par_ids = self.par_ids if self.par_ids is not None else none_col
+        names = self.names if self.names is not None else none_col
+        lines = self.lines if self.lines is not None else none_col
+        ranks = self.ranks if self.ranks is not None else [0] * n
+        uniqnames = self.uniqnames if self.uniqnames is not None else none_col
+        uniqnames = [i or None for i in uniqnames]
+        flags = self.flags if self.flags is not None else [0] * n
+        if self.src_offsets is not None:
+            src_dicts = _parse_src_strings(self.src_strings())
+        else:
+            src_dicts = none_col
+        extra = [(a, self.str_columns[c]) for a, c in _EXTRA_SET_ATTRS if c in self]
+        new_taxon = Taxon.__new__
+        r = []
+        for uid, par_id, name, rank, src_dict, fl, uniqname, line, line_num in zip(
+            uids,
+            par_ids,
+            names,
+            ranks,
+            src_dicts,
+            flags,
+            uniqnames,
+            lines,
+            self.line_nums,
+        ):
+            t = new_taxon(Taxon)
+            t.id, t.par_id, t.name, t._rank = uid, par_id, name, rank
+            t.src_dict, t._flags, t.uniqname = src_dict, fl, uniqname
+            t.children_refs, t._synonyms = None, None
+            t.line_num, t.line = line_num, line
+            r.append(t)
+        for attr, col in extra:
+            for t, v in zip(r, col):
+                setattr(t, attr, set(v.split(",")) if v else None)
+        return r
+
+    def taxon(self, i):
+        """The Taxon for row i, as taxa() would build it."""
+        t = Taxon.__new__(Taxon)
+        t.id = self.uids[i] if self.uids is not None else None
+        t.par_id = self.par_ids[i] if self.par_ids is not None else None
+        names = self.names
+        t.name = names[i] if names is not None else None
+        t._rank = self.ranks[i] if self.ranks is not None else 0
+        t.src_dict = self.src_dict(i) if self.src_offsets is not None else None
+        t._flags = self.flags[i] if self.flags is not None else 0
+        uniqnames = self.uniqnames
+        t.uniqname = (uniqnames[i] or None) if uniqnames is not None else None
+        t.children_refs, t._synonyms = None, None
+        t.line_num = self.line_nums[i]
+        t.line = self.lines[i] if self.lines is not None else None
+        for attr, c in _EXTRA_SET_ATTRS:
+            if c in self:
+                v = self.str_columns[c][i]
+                setattr(t, attr, set(v.split(",")) if v else None)
+        return t
+
+    def taxa_by_uid(self):
+        """Returns a TaxaByUid for the rows (the uid column must have been read)."""
+        return TaxaByUid(self)
+
+    def __contains__(self, column):
+        return column in self.columns
+
+
+class TaxaByUid(Mapping):
+    """Read-only mapping of uid -> Taxon for the rows of a TaxonomyColumns.
+
+    Each Taxon is built (by TaxonomyColumns.taxon) when it is first looked up,
+    so a caller that needs a few taxa does not pay for all of them. Raises
+    ValueError if a uid is repeated.
+    """
+
+    def __init__(self, columns):
+        self._columns = columns
+        uids = columns.uids
+        self._uid_to_row = dict(zip(uids, range(len(uids))))
+        if len(self._uid_to_row) != len(uids):
+            seen = set()
+            for uid in uids:
+                if uid in seen:
+                    raise ValueError("Repeated uid {}".format(uid))
+                seen.add(uid)
+        self._built = {}
+
+    def __getitem__(self, uid):
+        t = self._built.get(uid)
+        if t is None:
+            t = self._columns.taxon(self._uid_to_row[uid])
+            self._built[uid] = t
+        return t
+
+    def __iter__(self):
+        return iter(self._uid_to_row)
+
+    def __len__(self):
+        return len(self._uid_to_row)
+
+    def __contains__(self, uid):
+        return uid in self._uid_to_row
+
+
+# attribute of Taxon that tax_wikidata_parser sets to a set, and the column it's from
+_EXTRA_SET_ATTRS = (
+    ("aut_id", "aut_id"),
+    ("aut_yrs", "aut_yr_id"),
+    ("nom_status", "nom_status"),
+)
+
+
+def _parse_src_strings(strings):
+    """Returns the raw_src_string_to_dict (or None if empty) of each string.
+
+    The strings with no whitespace or empty elements are split in bulk.
+    """
+    from .ott_schema import int_or_str, raw_src_string_to_dict
+
+    joined = ",".join(filter(None, strings))
+    els = joined.split(",")
+    pairs = ":".join(els).split(":")
+    if len(pairs) != 2 * len(els) or len(joined.split()) > 1 or "" in els:
+        return [(raw_src_string_to_dict(s) or None) if s else None for s in strings]
+    srcs, sids = list(map(intern_str, pairs[0::2])), pairs[1::2]
+    try:
+        sids = list(map(int, sids))
+    except ValueError:
+        sids = list(map(int_or_str, sids))
+    counts = [s.count(",") + 1 if s else 0 for s in strings]
+    it = zip(srcs, [{i} for i in sids])
+    r = [dict(islice(it, n)) if n else None for n in counts]
+    # a source that is repeated in a string was kept once, with one of its IDs
+    for i, (d, n) in enumerate(zip(r, counts)):
+        if d is not None and len(d) != n:
+            r[i] = raw_src_string_to_dict(strings[i])
+    return r
+
+
+def read_taxonomy_header(taxonomy_fp):
+    """Returns the first line of `taxonomy_fp` ("" for an empty file)."""
+    with open_input(taxonomy_fp) as inp:
+        return inp.readline()
+
+
+def _split_lines(text, num_lines):
+    """Splits `text` (that ends with a newline) after each newline."""
+    lines = text.splitlines(True)
+    if len(lines) != num_lines:
+        # splitlines also breaks at other characters (\x1c, \u2028...)
+        lines = text.split("\n")
+        lines.pop(-1)
+        lines = [i + "\n" for i in lines]
+    return lines
+
+
+def _read_chunks(inp, chunk_size):
+    while True:
+        text = inp.read(chunk_size)
+        if not text:
+            return
+        if not text.endswith("\n"):
+            text += inp.readline()
+            if not text.endswith("\n"):
+                text += "\n"
+        yield text
+
+
+def _iter_split_chunks(taxonomy_fp, columns, skip_blank_lines, chunk_size):
+    """Yields (header, layout, columns, lines, line numbers) for each chunk."""
+    with open_input(taxonomy_fp) as inp:
+        header = inp.readline()
+        if not header:
+            return
+        layout = _Layout(header)
+        line_num = 1
+        for text in _read_chunks(inp, chunk_size):
+            cols = layout.split_chunk(text, columns)
+            if cols is not None:
+                lines = None
+                num_lines = len(cols[0])
+                if "line" in columns:
+                    lines = _split_lines(text, num_lines)
+                line_nums = range(line_num, line_num + num_lines)
+            else:
+                num_lines = text.count("\n")
+                all_lines = _split_lines(text, num_lines)
+                cols, lines, line_nums = layout.split_lines(
+                    all_lines, line_num, taxonomy_fp, skip_blank_lines
+                )
+            if cols is not None:
+                yield header, layout, cols, lines, line_nums
+            line_num += num_lines
+
+
+def iter_taxonomy_columns(
+    taxonomy_fp,
+    columns=("uid", "parent_uid"),
+    int_ids=True,
+    skip_blank_lines=False,
+    chunk_size=CHUNK_SIZE,
+):
+    """Yields a TaxonomyColumns for each chunk of `taxonomy_fp`.
+
+    `columns` lists the fields to convert ("line" for the text of the lines).
+    If `int_ids` is False, the uid and parent_uid are left as strings.
+    """
+    for header, layout, cols, lines, line_nums in _iter_split_chunks(
+        taxonomy_fp, columns, skip_blank_lines, chunk_size
+    ):
+        chunk = TaxonomyColumns(header, columns)
+        chunk._append(layout, cols, lines, line_nums, int_ids)
+        yield chunk
+
+
+def parse_taxonomy_columns(
+    taxonomy_fp,
+    columns=("uid", "parent_uid"),
+    int_ids=True,
+    skip_blank_lines=False,
+    chunk_size=CHUNK_SIZE,
+):
+    """Returns one TaxonomyColumns for all of `taxonomy_fp` (see
+    iter_taxonomy_columns), or None if the file is empty.
+    """
+    r = None
+    for header, layout, cols, lines, line_nums in _iter_split_chunks(
+        taxonomy_fp, columns, skip_blank_lines, chunk_size
+    ):
+        if r is None:
+            r = TaxonomyColumns(header, columns)
+        r._append(layout, cols, lines, line_nums, int_ids)
+    return r
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+"""Memory-mapped access to a taxonomy.tsv file through a binary sidecar index.
+
+The index is written next to the taxonomy file (as "taxonomy.tsv.idx") the first
+time that the file is opened read-only or that taxa are looked up in it. It
+records, for every taxon line, the uid, the byte offset and byte length of the
+line, and the parent -> children structure (as CSR arrays). With the index,
+opening a partition is just two mmap calls; lines are only decoded when they are
+looked up.
+
+The index stores the size and mtime of the taxonomy file that it describes, and
+is rebuilt if either differs. Only files with integer uids and parent ids can
+be indexed, for other files `open_mapped_taxonomy` returns None and the caller
+should parse the file as text.
+"""
+from array import array
+from bisect import bisect_left
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from .array_store import CSRChildMap
+from .util import compression_of, open_input
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyCompatibility
+    from collections import MutableMapping
+
+_LOG = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx"
+# The arrays are written in the native byte order, and the magic records which.
+_MAGIC = b"TXIDX1" + (b"LE" if sys.byteorder == "little" else b"BE")
+# magic, tsv size, tsv mtime_ns, header length, # taxa, # roots, # parents, # children
+_HEADER = struct.Struct("=8sqqqqqqq")
+_SEP = b"\t|\t"
+
+
+def index_filepath(taxonomy_fp):
+    return taxonomy_fp + INDEX_SUFFIX
+
+
+def remove_taxonomy_index(taxonomy_fp):
+    ifp = index_filepath(taxonomy_fp)
+    if os.path.exists(ifp):
+        os.unlink(ifp)
+
+
+class TaxonomyIndex(object):
+    """The arrays of a taxonomy.tsv index. Each column is an array('q') or
+    a read-only memoryview of the same format over an mmap of the index file.
+
+    uids, offsets and lengths are in file order; sorted_uids and sorted_pos are
+    the uids in sorted order and the file position of each. The parent -> children
+    map is (par_keys, par_offsets, children), and roots holds the uids of
+    taxa that have no parent_uid.
+    """
+
+    _COLUMNS = (
+        "uids",
+        "offsets",
+        "lengths",
+        "sorted_uids",
+        "sorted_pos",
+        "roots",
+        "par_keys",
+        "par_offsets",
+        "children",
+    )
+
+    def __init__(self, header_len, **columns):
+        self.header_len = header_len
+        for c in TaxonomyIndex._COLUMNS:
+            setattr(self, c, columns[c])
+        self._backing = None
+
+    def __len__(self):
+        return len(self.uids)
+
+    def find(self, uid):
+        """Returns the file position (line number - 1) of `uid` or None."""
+        if not isinstance(uid, int):
+            return None
+        su = self.sorted_uids
+        i = bisect_left(su, uid)
+        if i < len(su) and su[i] == uid:
+            return self.sorted_pos[i]
+        return None
+
+    def write(self, fp, tsv_stat):
+        # Not an AtomicOutFile, as the index is a cache rather than an output of
+        #   the command, but the temporary file is named the same way, so that
+        #   threads indexing the same file do not share one.
+        tmp_fp = "{}.tmp{}-{}".format(fp, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp_fp, "wb") as out:
+                out.write(
+                    _HEADER.pack(
+                        _MAGIC,
+                        tsv_stat.st_size,
+                        tsv_stat.st_mtime_ns,
+                        self.header_len,
+                        len(self.uids),
+                        len(self.roots),
+                        len(self.par_keys),
+                        len(self.children),
+                    )
+                )
+                for c in TaxonomyIndex._COLUMNS:
+                    getattr(self, c).tofile(out)
+            os.replace(tmp_fp, fp)
+        except BaseException:
+            if os.path.exists(tmp_fp):
+                os.unlink(tmp_fp)
+            raise
+
+    @staticmethod
+    def load(fp, tsv_stat):
+        """Returns the index in `fp` if it describes a file with `tsv_stat`, or None."""
+        with open(fp, "rb") as inp:
+            fsize = os.fstat(inp.fileno()).st_size
+            if fsize < _HEADER.size:
+                return None
+            backing = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+        h = _HEADER.unpack_from(backing, 0)
+        magic, size, mtime_ns, header_len, n, n_roots, n_keys, n_children = h
+        if (
+            magic != _MAGIC
+            or size != tsv_stat.st_size
+            or mtime_ns != tsv_stat.st_mtime_ns
+        ):
+            return None
+        lengths = [n, n, n, n, n, n_roots, n_keys, n_keys + 1, n_children]
+        if fsize != _HEADER.size + 8 * sum(lengths):
+            return None
+        all_cols = memoryview(backing)[_HEADER.size :].cast("q")
+        cols, start = {}, 0
+        for c, ln in zip(TaxonomyIndex._COLUMNS, lengths):
+            cols[c] = all_cols[start : start + ln]
+            start += ln
+        ind = TaxonomyIndex(header_len, **cols)
+        ind._backing = backing
+        return ind
+
+    @staticmethod
+    def build(taxonomy_fp):
+        """Scans `taxonomy_fp` and returns its index, or None if it can't be indexed."""
+        uids, offsets, lengths = array("q"), array("q"), array("q")
+        pars, roots = array("q"), array("q")
+        with open_input(taxonomy_fp, "rb") as inp:
+            header = inp.readline()
+            offset = len(header)
+            for line in inp:
+                ls = line.split(_SEP, 2)
+                if len(ls) < 3 or b"\r" in line:
+                    return None
+                try:
+                    uid = int(ls[0])
+                    par_id = int(ls[1]) if ls[1] else None
+                except ValueError:
+                    return None
+                uids.append(uid)
+                offsets.append(offset)
+                lengths.append(len(line))
+                offset += len(line)
+                if par_id is None:
+                    roots.append(uid)
+                else:
+                    pars.append(par_id)
+                    pars.append(uid)
+        n = len(uids)
+        order = sorted(range(n), key=uids.__getitem__)
+        sorted_uids = array("q", [uids[i] for i in order])
+        for i in range(1, n):
+            if sorted_uids[i - 1] == sorted_uids[i]:
+                return None  # repeated uid. The text parser reports the error.
+        edges = sorted(zip(pars[::2], pars[1::2]))
+        par_keys, par_offsets, children = array("q"), array("q"), array("q")
+        prev = None
+        for par_id, uid in edges:
+            if par_id != prev:
+                par_offsets.append(len(children))
+                par_keys.append(par_id)
+                prev = par_id
+            children.append(uid)
+        par_offsets.append(len(children))
+        return TaxonomyIndex(
+            len(header),
+            uids=uids,
+            offsets=offsets,
+            lengths=lengths,
+            sorted_uids=sorted_uids,
+            sorted_pos=array("q", order),
+            roots=roots,
+            par_keys=par_keys,
+            par_offsets=par_offsets,
+            children=children,
+        )
+
+
+def load_or_build_taxonomy_index(taxonomy_fp):
+    """Returns a current TaxonomyIndex for `taxonomy_fp`, writing the sidecar if needed.
+
+    Returns None if the file cannot be indexed (or is compressed).
+    """
+    if compression_of(taxonomy_fp):
+        return None
+    tsv_stat = os.stat(taxonomy_fp)
+    ifp = index_filepath(taxonomy_fp)
+    if os.path.exists(ifp):
+        try:
+            ind = TaxonomyIndex.load(ifp, tsv_stat)
+        except (OSError, ValueError, struct.error):
+            _LOG.exception('Could not read index "{}"'.format(ifp))
+            ind = None
+        if ind is not None:
+            return ind
+        _LOG.debug('Index "{}" is out of date'.format(ifp))
+    ind = TaxonomyIndex.build(taxonomy_fp)
+    if ind is None:
+        _LOG.debug('"{}" cannot be indexed'.format(taxonomy_fp))
+        return None
+    try:
+        ind.write(ifp, tsv_stat)
+    except OSError:
+        _LOG.warning('Could not write index "{}"'.format(ifp))
+    return ind
+
+
+def lookup_taxonomy_lines(taxonomy_fp, uids):
+    """Returns (header, {uid: (position, line)}) for the `uids` in `taxonomy_fp`.
+
+    Uses the sidecar index (building it if needed), so each uid costs a binary
+    search, and each line found a seek and a read (in file order). uids that
+    are not in the file are left out. Returns None if the file can't be indexed.
+    """
+    if os.path.getsize(taxonomy_fp) == 0:
+        return None
+    ind = load_or_build_taxonomy_index(taxonomy_fp)
+    if ind is None:
+        return None
+    found = []
+    for uid in uids:
+        pos = ind.find(uid)
+        if pos is not None:
+            found.append((ind.offsets[pos], ind.lengths[pos], pos, uid))
+    found.sort()
+    r = {}
+    with open_input(taxonomy_fp, "rb", buffering=0) as inp:
+        header = inp.read(ind.header_len).decode("utf-8")
+        for offset, length, pos, uid in found:
+            inp.seek(offset)
+            r[uid] = (pos, inp.read(length).decode("utf-8"))
+    return header, r
+
+
+class MappedTaxonomyFile(object):
+    """A taxonomy.tsv held as an mmap, with lines located by a TaxonomyIndex."""
+
+    def __init__(self, taxonomy_fp, index):
+        self.filepath = taxonomy_fp
+        self.index = index
+        with open(taxonomy_fp, "rb") as inp:
+            self._mm = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = self._mm[: index.header_len].decode("utf-8")
+
+    def line_at(self, pos):
+        off = self.index.offsets[pos]
+        return self._mm[off : off + self.index.lengths[pos]].decode("utf-8")
+
+    def line_map(self):
+        return MappedLineMap(self)
+
+    def child_map(self):
+        """Returns a CSRChildMap of parent -> children as read_taxon_line would
+        build it (roots are the children of the '' parent)."""
+        ind = self.index
+        cm = CSRChildMap.from_csr(ind.par_keys, ind.par_offsets, ind.children)
+        if len(ind.roots):
+            cm.add_children("", ind.roots)
+        return cm
+
+
+def open_mapped_taxonomy(taxonomy_fp):
+    """Returns a MappedTaxonomyFile for `taxonomy_fp` or None if it can't be indexed."""
+    if os.path.getsize(taxonomy_fp) == 0:
+        return None
+    ind = load_or_build_taxonomy_index(taxonomy_fp)
+    if ind is None:
+        return None
+    return MappedTaxonomyFile(taxonomy_fp, ind)
+
+
+class MappedLineMap(MutableMapping):
+    """uid -> line view of a MappedTaxonomyFile. Lines are decoded on access.
+
+    Behaves like the dict that _parse_taxa would fill: iteration is in file order
+    and changes are kept in memory (the file is never written).
+    """
+
+    def __init__(self, mapped_file):
+        self._src = mapped_file
+        self._ind = mapped_file.index
+        self._changed = {}  # uid in the file -> new line
+        self._removed = set()  # uids in the file that have been deleted
+        self._extra = {}  # uids that are not in the file
+
+    @property
+    def nbytes(self):
+        """Approximate number of bytes held outside of the mapped files."""
+        return 250 * (len(self._changed) + len(self._extra)) + 80 * len(self._removed)
+
+    def _pos(self, uid):
+        if uid in self._removed:
+            return None
+        return self._ind.find(uid)
+
+    def __getitem__(self, uid):
+        line = self._extra.get(uid)
+        if line is not None:
+            return line
+        line = self._changed.get(uid)
+        if line is not None:
+            return line
+        pos = self._pos(uid)
+        if pos is None:
+            raise KeyError(uid)
+        return self._src.line_at(pos)
+
+    def __setitem__(self, uid, line):
+        if self._pos(uid) is None:
+            self._extra[uid] = line
+        else:
+            self._changed[uid] = line
+
+    def __delitem__(self, uid):
+        if uid in self._extra:
+            del self._extra[uid]
+            return
+        if self._pos(uid) is None:
+            raise KeyError(uid)
+        self._removed.add(uid)
+        self._changed.pop(uid, None)
+
+    def __contains__(self, uid):
+        return uid in self._extra or self._pos(uid) is not None
+
+    def __iter__(self):
+        removed = self._removed
+        for uid in self._ind.uids:
+            if uid not in removed:
+                yield uid
+        for uid in list(self._extra.keys()):
+            yield uid
+
+    def __len__(self):
+        return len(self._ind) - len(self._removed) + len(self._extra)
+
+    def items(self):
+        removed, changed = self._removed, self._changed
+        for pos, uid in enumerate(self._ind.uids):
+            if uid in removed:
+                continue
+            line = changed.get(uid)
+            yield uid, (self._src.line_at(pos) if line is None else line)
+        for el in list(self._extra.items()):
+            yield el
+
+    def values(self):
+        for el in self.items():
+            yield el[1]
@@ -15,22 +15,26 @@ _LOG = logging.getLogger(__name__)
 
 
 def write_indented_subtree(out, node, indent_level):
-    fmsd = node.formatted_src_dict()
-    f = "flags={}".format(", ".join(node.sorted_flags)) if node.sorted_flags else ""
-    s = "src={}".format(fmsd) if fmsd else ""
     m = "{}{}\t|\tid={}\t|\trank={}\t|\t{}\t|\t{}\n"
-    out.write(
-        m.format(
-            "    " * indent_level, node.name_that_is_unique, node.id, node.rank, s, f
-        )
-    )
-    if node.children_refs:
-        sortable = []
-        for c in node.children_refs:
-            sortable.append((c.name_that_is_unique, c))
-        sortable.sort()
-        for el in sortable:
-            write_indented_subtree(out, el[1], indent_level=1 + indent_level)
+    # Iterative, with a stack of iterators over the sorted children, so that
+    #   deep trees do not hit the recursion limit.
+    to_process = [iter(((None, node),))]
+    while to_process:
+        el = next(to_process[-1], None)
+        if el is None:
+            to_process.pop()
+            continue
+        node = el[1]
+        fmsd = node.formatted_src_dict()
+        sf = node.sorted_flags
+        f = "flags={}".format(", ".join(sf)) if sf else ""
+        s = "src={}".format(fmsd) if fmsd else ""
+        indent = "    " * (indent_level + len(to_process) - 1)
+        out.write(m.format(indent, node.name_that_is_unique, node.id, node.rank, s, f))
+        if node.children_refs:
+            sortable = [(c.name_that_is_unique, c) for c in node.children_refs]
+            sortable.sort()
+            to_process.append(iter(sortable))
 
 
 class TaxonTree(object):
@@ -42,6 +46,17 @@ class TaxonTree(object):
         taxon_partition=None,
     ):
         self.taxon_partition = taxon_partition
+        # Side tables of uid -> value for the analyses of the tree. Taxon is
+        # slotted, so these are not stored as attributes of the taxa.
+        self.best_rank_sort_number = {}
+        self.num_tips_below = {}
+        self.update_status = {}
+        self.found_names = {}
+        self.unfound_names = {}
+        self.matched_to_name = {}
+        self.match_status = {}
+        self._traversal = None
+        self._rank_bounds = None
         self.root = id_to_taxon[root_id]
         self.root.parent_ref = None
         self.id_to_taxon = {}
@@ -61,25 +76,26 @@ class TaxonTree(object):
 
     def write_rank_indented(self, out_stream):
         self.add_best_guess_rank_sort_number()
-        rr = self.root.best_rank_sort_number
-        ranks_sn_set = {i.best_rank_sort_number for i in self.preorder()}
+        brsn = self.best_rank_sort_number
+        ranks_sn_set = {brsn[i.id] for i in self.preorder()}
         ranks_sn_list = list(ranks_sn_set)
         ranks_sn_list.sort()
         rank_sn2indent_n = {i: n for n, i in enumerate(ranks_sn_list)}
         lrsl = len(ranks_sn_list)
+        child_indent = {}
         for n, nd in enumerate(self.preorder()):
             # if n > 20:
             #    return
             if n == 0:
-                nd.child_indent = ""
+                child_indent[nd.id] = ""
                 indent = ""
             else:
                 par = self.get_taxon(nd.par_id)
-                par_pref = par.child_indent
+                par_pref = child_indent[par.id]
                 is_first_child = nd is par.children_refs[0]
                 is_last_child = nd is par.children_refs[-1]
                 pni = len(par_pref)
-                indent_num = 2 * (lrsl - 1 - rank_sn2indent_n[nd.best_rank_sort_number])
+                indent_num = 2 * (lrsl - 1 - rank_sn2indent_n[brsn[nd.id]])
                 indent_num -= pni + 1
                 tail = "-" * indent_num
                 if is_last_child:
@@ -88,71 +104,96 @@ class TaxonTree(object):
                 else:
                     my_prompt = "+" + tail
                     cs = "|"
-                nd.child_indent = "{}{}{}".format(par_pref, cs, " " * indent_num)
+                child_indent[nd.id] = "{}{}{}".format(par_pref, cs, " " * indent_num)
                 indent = "{}{}".format(par_pref, my_prompt)
             out_stream.write("{}{}".format(indent, nd.terse_descrip()))
-        for nd in self.preorder():
-            del nd.child_indent
 
     def does_first_contain_second(self, other_genus, other):
-        while True:
-            if other is other_genus:
-                return True
-            try:
-                other = self.id_to_taxon[other.par_id]
-            except:
-                return False
+        if other is other_genus:
+            return True
+        trav = self._get_traversal()
+        i, j = trav[1].get(other_genus.id), trav[1].get(other.id)
+        if i is None or j is None:
+            return False
+        return i < j < trav[2][i]
 
     def find_genus_for_alpha(self, nd):
-        if nd.best_rank_sort_number == GENUS_SORTING_NUMBER:
-            return nd
-        try:
-            p = self.id_to_taxon[nd.par_id]
-        except:
-            return None
-        # noinspection PyTypeChecker
-        return self.find_genus_for_alpha(p)
+        brsn = self.best_rank_sort_number
+        while brsn.get(nd.id) != GENUS_SORTING_NUMBER:
+            nd = self.id_to_taxon.get(nd.par_id)
+            if nd is None:
+                return None
+        return nd
 
     def add_best_guess_rank_sort_number(self):
+        brsn = self.best_rank_sort_number
         for nd in self.postorder():
-            if hasattr(nd, "best_rank_sort_number"):
+            if nd.id in brsn:
                 continue
             nrr = self.node_rank_sorting_number_range(nd)
-            nd.best_rank_sort_number = nrr[1]
+            brsn[nd.id] = nrr[1]
             if not nd.children_refs:
                 continue
             for c in nd.children_refs:
-                while c.best_rank_sort_number >= nd.best_rank_sort_number:
+                while brsn[c.id] >= brsn[nd.id]:
                     _LOG.warning(
                         "rank conflict {} and child {}, bumping parent up...".format(
                             nd, c
                         )
                     )
-                    nd.best_rank_sort_number += 1
+                    brsn[nd.id] += 1
 
-    def _get_highest_child_rank(self, nd):
-        if not nd.children_refs:
-            return None
-        hr = None
-        for c in nd.children_refs:
-            csn = c.rank_sorting_number()
-            if csn is None:
-                csn = self._get_highest_child_rank(c)
-            if csn is None:
+    def _get_rank_bounds(self):
+        """Returns the (des_bound, anc_bound) arrays, indexed by preorder position.
+
+        des_bound[i] is one more than the highest rank sorting number among the
+        closest ranked descendants of preorder[i] (None if there are none) and
+        anc_bound[i] is the sorting number of its closest ranked ancestor, minus
+        1 for each unranked taxon between them (None if there is none). Each is
+        filled in one pass and cached with the traversal arrays.
+        """
+        if self._rank_bounds is not None:
+            return self._rank_bounds
+        preorder, pre_index = self._get_traversal()[:2]
+        rsn = [nd.rank_sorting_number() for nd in preorder]
+        num_nodes = len(preorder)
+        des_bound = [None] * num_nodes
+        for i in range(num_nodes - 1, -1, -1):
+            crs = preorder[i].children_refs
+            if not crs:
+                continue
+            hr = None
+            for c in crs:
+                j = pre_index[c.id]
+                csn = rsn[j]
+                if csn is None:
+                    csn = des_bound[j]
+                if csn is not None and (hr is None or csn + 1 > hr):
+                    hr = csn + 1
+            des_bound[i] = hr
+        anc_bound = [None] * num_nodes
+        id_to_taxon = self.id_to_taxon
+        for i, nd in enumerate(preorder):
+            par = id_to_taxon.get(nd.par_id)
+            j = None if par is None else pre_index.get(par.id)
+            if j is None:
                 continue
-            if hr is None or csn + 1 > hr:
-                hr = csn + 1
-        return hr
+            psn = rsn[j]
+            if psn is None:
+                psn = anc_bound[j]
+                if psn is not None:
+                    psn -= 1
+            anc_bound[i] = psn
+        self._rank_bounds = (des_bound, anc_bound)
+        return self._rank_bounds
+
+    def _get_highest_child_rank(self, nd):
+        i = self._get_traversal()[1][nd.id]
+        return self._get_rank_bounds()[0][i]
 
     def _get_lowest_anc_rank_sorting_number(self, nd):
-        try:
-            par = self.id_to_taxon[nd.par_id]
-        except:
-            return None
-        psn = par.rank_sorting_number()
-        if psn is None:
-            return self._get_lowest_anc_rank_sorting_number(par) - 1
-        return psn
+        i = self._get_traversal()[1][nd.id]
+        return self._get_rank_bounds()[1][i]
 
     def node_rank_sorting_number_range(self, nd):
         rsn = nd.rank_sorting_number()
@@ -163,7 +204,6 @@ class TaxonTree(object):
             csn = MINIMUM_SORTING_NUMBER - 1
         asn = self._get_lowest_anc_rank_sorting_number(nd)
         if asn is None:
-            asn = self._get_lowest_anc_rank_sorting_number(nd)
             raise ValueError("no rank or anc rank for {}".format(repr(nd)))
         return asn - 1, csn + 1
 
@@ -191,9 +231,53 @@ class TaxonTree(object):
     def get_taxon(self, uid):
         return self.id_to_taxon.get(uid)
 
+    def invalidate_traversal(self):
+        """Must be called after the children_refs of a node in the tree change."""
+        self._traversal = None
+        self._rank_bounds = None
+
+    def _get_traversal(self):
+        """Returns the (preorder, pre_index, subtree_end, depth) arrays.
+
+        preorder is the list of taxa in preorder (children in children_refs
+        order), pre_index maps a uid to its position in preorder, and the
+        subtree of preorder[i] is preorder[i:subtree_end[i]]. They are built
+        on first use and cached until invalidate_traversal is called.
+        """
+        if self._traversal is not None:
+            return self._traversal
+        preorder, depth = [], []
+        to_process = [(self.root, 0)]
+        while to_process:
+            nd, d = to_process.pop()
+            preorder.append(nd)
+            depth.append(d)
+            if nd.children_refs:
+                cd = d + 1
+                to_process.extend((c, cd) for c in reversed(nd.children_refs))
+        pre_index = {nd.id: n for n, nd in enumerate(preorder)}
+        # The subtree of a node ends where the subtree of its last child ends.
+        subtree_end = list(range(1, 1 + len(preorder)))
+        for n in range(len(preorder) - 1, -1, -1):
+            crs = preorder[n].children_refs
+            if crs:
+                subtree_end[n] = subtree_end[pre_index[crs[-1].id]]
+        self._traversal = (preorder, pre_index, subtree_end, depth)
+        return self._traversal
+
+    def subtree_range(self, taxon):
+        """(start, end) such that preorder()[start:end] is the subtree of `taxon`."""
+        trav = self._get_traversal()
+        i = trav[1][taxon.id]
+        return i, trav[2][i]
+
+    def depth(self, taxon):
+        """Number of edges between `taxon` and the root of the tree."""
+        trav = self._get_traversal()
+        return trav[3][trav[1][taxon.id]]
+
     def postorder(self) -> Taxon:
-        for t in reversed(list(self.preorder())):
-            yield t
+        return reversed(self._get_traversal()[0])
 
     def leaves(self) -> Taxon:
         for nd in self.preorder():
@@ -201,35 +285,19 @@ class TaxonTree(object):
                 yield nd
 
     def preorder(self) -> Taxon:
-        curr = self.root
-        if not curr:
-            return
-        yield curr
-        to_process = []
-        if curr.children_refs:
-            to_process.append(list(curr.children_refs))
-        while to_process:
-            cl = to_process[-1]
-            if not cl:
-                to_process.pop(-1)
-            else:
-                curr = cl.pop(0)
-                if curr.children_refs:
-                    to_process.append(list(curr.children_refs))
-                yield curr
+        return iter(self._get_traversal()[0])
 
     def add_num_tips_below(self):
+        ntb = self.num_tips_below
         for taxon in self.postorder():
             if taxon.children_refs is None:
-                taxon.num_tips_below = 1
+                ntb[taxon.id] = 1
             else:
-                taxon.num_tips_below = sum(
-                    [i.num_tips_below for i in taxon.children_refs]
-                )
+                ntb[taxon.id] = sum([ntb[i.id] for i in taxon.children_refs])
 
     def add_update_fields(self):
         for taxon in self.preorder():
-            taxon.update_status = {}
+            self.update_status[taxon.id] = {}
 
     def to_root_gen(self, taxon):
         if taxon is None:
@@ -255,25 +323,31 @@ class TaxonTree(object):
 
 
 class TaxonForest(object):
-    def __init__(self, id_to_taxon, taxon_partition=None):
+    def __init__(self, id_to_taxon, taxon_partition=None, id_to_children=None):
+        """`id_to_children` is an optional map of parent uid -> collection of
+        child uids for the taxa in `id_to_taxon` (such as the child sets of a
+        TaxonPartition). If it is None, it is built from the par_id of each taxon.
+        """
         self.taxon_partition = taxon_partition
-        id_to_par = {}
-        id_to_children = {}
-        for taxon_id, taxon in id_to_taxon.items():
-            id_to_par[taxon_id] = taxon.par_id
-            id_to_children.setdefault(taxon.par_id, set()).add(taxon_id)
-        root_pars = set(id_to_children.keys()) - set(id_to_par.keys())
+        if id_to_children is None:
+            id_to_children = {}
+            for taxon_id, taxon in id_to_taxon.items():
+                id_to_children.setdefault(taxon.par_id, set()).add(taxon_id)
         roots = set()
-        for rp in root_pars:
-            roots.update(id_to_children[rp])
+        for par_id in id_to_children.keys():
+            if par_id not in id_to_taxon:
+                roots.update(id_to_children.get(par_id))
         self.roots = {}
+        self._id_to_tree = {}
         for r in roots:
-            self.roots[r] = TaxonTree(
+            tree = TaxonTree(
                 root_id=r,
                 id_to_children_ids=id_to_children,
                 id_to_taxon=id_to_taxon,
                 taxon_partition=taxon_partition,
             )
+            self.roots[r] = tree
+            self._id_to_tree.update(dict.fromkeys(tree.id_to_taxon, tree))
 
     def write_indented(self, out):
         for r in self.roots.values():
@@ -283,9 +357,16 @@ class TaxonForest(object):
     def trees(self):
         return tuple(self.roots.values())
 
+    def get_tree(self, uid):
+        """The TaxonTree that holds `uid` (or None)."""
+        return self._id_to_tree.get(uid)
+
+    def get_tree_and_taxon(self, uid):
+        """(tree, taxon) for `uid`, or (None, None) if it is not in the forest."""
+        tree = self._id_to_tree.get(uid)
+        if tree is None:
+            return None, None
+        return tree, tree.id_to_taxon[uid]
+
     def get_taxon(self, uid):
-        for v in self.roots.values():
-            t = v.get_taxon(uid)
-            if t is not None:
-                return t
-        return None
+        return self.get_tree_and_taxon(uid)[1]
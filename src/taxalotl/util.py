@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 # from __future__ import print_function
 
+import errno
 import json
 import os
 import io
 import logging
+import shutil
+import threading
+import time
+
+from .profiling import count_bytes_read, count_bytes_written
 
 _LOG = logging.getLogger(__name__)
 
@@ -52,9 +58,25 @@ class TaxalotlHistory(object):
         with io.open(self.hist_filepath, mode="w", encoding="utf-8") as outp:
             json.dump(self.hist_content, outp, indent=2)
 
-    def add_virtual_command(self, name, res_id=None, level=None, wrote_files=None):
+    def add_virtual_command(
+        self, name, res_id=None, level=None, wrote_files=None, seconds=None
+    ):
         if not wrote_files:
             return
+        record = {"command": name}
+        if res_id:
+            record["res_id"] = res_id
+        if level:
+            record["level"] = level
+        if wrote_files:
+            record["wrote_files"] = wrote_files
+        if seconds is not None:
+            record["seconds"] = round(seconds, 3)
+        self.add_records([record])
+
+    def add_records(self, records):
+        if not records:
+            return
         try:
             if self.hist_content is None:
                 self._read_hist()
@@ -63,14 +85,7 @@ class TaxalotlHistory(object):
             pass
         if not self.hist_content:
             self.hist_content = []
-        record = {"command": name}
-        if res_id:
-            record["res_id"] = res_id
-        if level:
-            record["level"] = level
-        if wrote_files:
-            record["wrote_files"] = wrote_files
-        self.hist_content.append(record)
+        self.hist_content.extend(records)
         try:
             self._write_hist()
         except:
@@ -78,9 +93,35 @@ class TaxalotlHistory(object):
             pass
 
 
+class WorkerHistory(TaxalotlHistory):
+    """History for a worker process: records are kept in memory, so that
+    the parent process can add them to ~/.taxalotl_history."""
+
+    def _read_hist(self):
+        if self.hist_content is None:
+            self.hist_content = []
+
+    def _write_hist(self):
+        pass
+
+    def pop_records(self):
+        r = self.hist_content or []
+        self.hist_content = []
+        return r
+
+
 _HISTORY_WRAPPER = TaxalotlHistory()
 
 
+def use_worker_history():
+    global _HISTORY_WRAPPER
+    _HISTORY_WRAPPER = WorkerHistory()
+
+
+def get_history():
+    return _HISTORY_WRAPPER
+
+
 def get_filepaths_overwritten():
     return list(_FILES_WRITTEN)
 
@@ -95,9 +136,11 @@ class VirtCommand(object):
         self.res_id = res_id
         self.level = level
         self.th = _HISTORY_WRAPPER
+        self.start = None
 
     def __enter__(self):
         clear_filepaths_overwritten()
+        self.start = time.perf_counter()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -105,7 +148,11 @@ class VirtCommand(object):
         if not fpo:
             return
         self.th.add_virtual_command(
-            self.name, res_id=self.res_id, level=self.level, wrote_files=fpo
+            self.name,
+            res_id=self.res_id,
+            level=self.level,
+            wrote_files=fpo,
+            seconds=time.perf_counter() - self.start,
         )
         clear_filepaths_overwritten()
 
@@ -117,7 +164,7 @@ class OutDir(object):
     def __enter__(self):
         if not os.path.exists(self.filepath):
             _LOG.info("Creating directory {}".format(self.filepath))
-            os.makedirs(self.filepath)
+            os.makedirs(self.filepath, exist_ok=True)  # may race with a worker
             _FILES_WRITTEN.append(self.filepath)
         return self.filepath
 
@@ -125,19 +172,108 @@ class OutDir(object):
         pass
 
 
+# compression name -> suffix of the files written with it (see OutFile)
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "bz2": ".bz2", "xz": ".xz"}
+
+
+# Writes to a compressed stream are collected in a buffer of this size (at least)
+#   before they are compressed.
+COMPRESSED_WRITE_BUFFER_SIZE = 1 << 22
+
+
+def _compressed_file_class(compression):
+    if compression == "gzip":
+        import gzip
+
+        return gzip.GzipFile
+    if compression == "bz2":
+        import bz2
+
+        return bz2.BZ2File
+    if compression == "xz":
+        import lzma
+
+        return lzma.LZMAFile
+    m = 'Unknown compression "{}" (expecting one of: {})'
+    raise ValueError(m.format(compression, ", ".join(COMPRESSION_SUFFIXES)))
+
+
+def _open_compressed(filepath, mode, encoding, compression, buffering=-1):
+    cls = _compressed_file_class(compression)
+    kwargs = {"compresslevel": 6} if compression == "gzip" else {}
+    stream = cls(filepath, mode.replace("t", "").replace("b", "") + "b", **kwargs)
+    # The compressor is called once per write, so many small writes are slow.
+    buffer_size = max(buffering, COMPRESSED_WRITE_BUFFER_SIZE)
+    stream = io.BufferedWriter(stream, buffer_size=buffer_size)
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def compression_of(filepath):
+    """The compression (a key of COMPRESSION_SUFFIXES) that the name of
+    `filepath` shows, or None."""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if filepath.endswith(suffix):
+            return compression
+    return None
+
+
+def find_input_file(filepath):
+    """Returns filepath, or the name of a compressed copy of it (filepath and a
+    suffix from COMPRESSION_SUFFIXES) if only that exists."""
+    if not os.path.exists(filepath):
+        for suffix in COMPRESSION_SUFFIXES.values():
+            if os.path.exists(filepath + suffix):
+                return filepath + suffix
+    return filepath
+
+
+def _file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
 class OutFile(object):
-    def __init__(self, filepath, mode="w", encoding="utf-8"):
+    """Context manager for an output stream. `buffering` is passed to io.open;
+    with a `compression` (a key of COMPRESSION_SUFFIXES) the stream compresses
+    what is written to it. The bytes written are counted in the command's
+    profile (see profiling.py) when the stream is closed."""
+
+    def __init__(
+        self, filepath, mode="w", encoding="utf-8", buffering=-1, compression=None
+    ):
         self.filepath = filepath
         self.mode = mode
         self.encoding = encoding
+        self.buffering = buffering
+        self.compression = compression
         self.out_stream = None
+        self.start_size = 0
 
     def __enter__(self):
-        if "b" in self.mode:
-            self.out_stream = io.open(self.filepath, mode=self.mode)
+        if "a" in self.mode:
+            self.start_size = _file_size(self.filepath)
+        if self.compression:
+            self.out_stream = _open_compressed(
+                self.filepath,
+                self.mode,
+                self.encoding,
+                self.compression,
+                buffering=self.buffering,
+            )
+        elif "b" in self.mode:
+            self.out_stream = io.open(
+                self.filepath, mode=self.mode, buffering=self.buffering
+            )
         else:
             self.out_stream = io.open(
-                self.filepath, mode=self.mode, encoding=self.encoding
+                self.filepath,
+                mode=self.mode,
+                encoding=self.encoding,
+                buffering=self.buffering,
             )
         _FILES_WRITTEN.append(self.filepath)
         return self.out_stream
@@ -146,6 +282,182 @@ class OutFile(object):
         if self.out_stream is not None:
             self.out_stream.close()
             self.out_stream = None
+            count_bytes_written(_file_size(self.filepath) - self.start_size)
+
+
+class _CountingFileIO(io.FileIO):
+    """A FileIO opened for reading that counts the bytes read from it in the
+    command's profile when it is closed."""
+
+    def __init__(self, filepath):
+        io.FileIO.__init__(self, filepath, "r")
+        self.bytes_read = 0
+
+    def readinto(self, b):
+        n = io.FileIO.readinto(self, b)
+        if n:
+            self.bytes_read += n
+        return n
+
+    def read(self, size=-1):
+        data = io.FileIO.read(self, size)
+        if data:
+            self.bytes_read += len(data)
+        return data
+
+    def readall(self):
+        data = io.FileIO.readall(self)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        if not self.closed:
+            count_bytes_read(self.bytes_read)
+            self.bytes_read = 0
+        io.FileIO.close(self)
+
+
+class _DecompressedInput(io.BufferedReader):
+    """Buffered reads of the decompressed content of a file, which is closed
+    with the reader (the decompressing readers do not close a file object)."""
+
+    def __init__(self, compressed_file, raw, buffer_size):
+        io.BufferedReader.__init__(self, compressed_file, buffer_size=buffer_size)
+        self._raw = raw
+
+    def close(self):
+        try:
+            io.BufferedReader.close(self)
+        finally:
+            self._raw.close()
+
+
+def open_input(filepath, mode="r", encoding="utf-8", buffering=-1, decompress=False):
+    """Opens `filepath` for reading, as io.open does (mode is "r" or "rb"). The
+    bytes read from the file are counted in the command's profile (see
+    profiling.py) when the stream is closed.
+
+    With `decompress`, a file whose name ends with a suffix in
+    COMPRESSION_SUFFIXES is decompressed as it is read.
+    """
+    raw = _CountingFileIO(filepath)
+    binary = "b" in mode
+    compression = compression_of(filepath) if decompress else None
+    if buffering == 0 and not compression:
+        if not binary:
+            raw.close()
+            raise ValueError("can't have unbuffered text I/O")
+        return raw
+    if buffering < 2:
+        buffering = io.DEFAULT_BUFFER_SIZE
+    stream = io.BufferedReader(raw, buffer_size=buffering)
+    if compression:
+        cls = _compressed_file_class(compression)
+        if compression == "gzip":
+            cf = cls(fileobj=stream, mode="rb")
+        else:
+            cf = cls(stream, "rb")
+        stream = _DecompressedInput(cf, stream, buffering)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+class AtomicOutFile(OutFile):
+    """Like OutFile, but writes through a large buffer to a temporary file that is
+    renamed to filepath when the block exits without an exception (and removed
+    if there is one). Readers never see a partly written file. The name of the
+    temporary file has the process and thread IDs, so that threads writing the
+    same filepath do not share one.
+    """
+
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, filepath, mode="w", encoding="utf-8"):
+        OutFile.__init__(self, filepath, mode=mode, encoding=encoding)
+        self.tmp_filepath = None
+
+    def __enter__(self):
+        self.tmp_filepath = "{}.tmp{}-{}".format(
+            self.filepath, os.getpid(), threading.get_ident()
+        )
+        if "b" in self.mode:
+            self.out_stream = io.open(
+                self.tmp_filepath, mode=self.mode, buffering=self.BUFFER_SIZE
+            )
+        else:
+            self.out_stream = io.open(
+                self.tmp_filepath,
+                mode=self.mode,
+                encoding=self.encoding,
+                buffering=self.BUFFER_SIZE,
+            )
+        _FILES_WRITTEN.append(self.filepath)
+        return self.out_stream
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.out_stream is None:
+            return
+        self.out_stream.close()
+        self.out_stream = None
+        if exc_type is None:
+            os.replace(self.tmp_filepath, self.filepath)
+            count_bytes_written(_file_size(self.filepath))
+        elif os.path.exists(self.tmp_filepath):
+            os.unlink(self.tmp_filepath)
+
+
+COPY_BUFFER_SIZE = 1 << 20
+_MAX_KERNEL_COPY = 1 << 30
+# errors from copy_file_range or sendfile that mean "not for these files"
+_KERNEL_COPY_UNSUPPORTED = frozenset(
+    [errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF]
+)
+
+
+def _kernel_copy_funcs():
+    r = []
+    if hasattr(os, "copy_file_range"):
+        r.append(lambda i, o, n: os.copy_file_range(i, o, min(n, _MAX_KERNEL_COPY)))
+    if hasattr(os, "sendfile"):
+        r.append(lambda i, o, n: os.sendfile(o, i, None, min(n, _MAX_KERNEL_COPY)))
+    return r
+
+
+def _kernel_copy(in_fd, out_fd, count):
+    """Copies up to `count` bytes from the position of in_fd to out_fd without
+    reading them into this process. Returns the number of bytes copied (0 if
+    the OS cannot do that for these files)."""
+    for func in _kernel_copy_funcs():
+        copied = 0
+        try:
+            while copied < count:
+                n = func(in_fd, out_fd, count - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as x:
+            if copied or x.errno not in _KERNEL_COPY_UNSUPPORTED:
+                raise
+    return 0
+
+
+def append_file(src_filepath, out):
+    """Appends the content of the file at src_filepath to the binary stream `out`.
+
+    The bytes are copied by the kernel (copy_file_range or sendfile) where that
+    is possible, and otherwise through a COPY_BUFFER_SIZE buffer, so the memory
+    used does not depend on the size of the file.
+    """
+    out.flush()
+    with open_input(src_filepath, "rb") as inp:
+        size = os.fstat(inp.fileno()).st_size
+        copied = _kernel_copy(inp.fileno(), out.fileno(), size)
+        count_bytes_read(copied)
+        if copied < size:
+            inp.seek(copied)
+            shutil.copyfileobj(inp, out, COPY_BUFFER_SIZE)
 
 
 def get_frag_from_dir(taxalotl_conf, tax_dir):
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from .ott_schema import tax_wikidata_parser, TAXWIKIDATA_HEADER
-from .taxon import Taxon
+from .ott_schema import TAXWIKIDATA_HEADER
+from .taxonomy_columns import iter_taxonomy_columns, read_taxonomy_header
 import logging
 from qwikidata.entity import WikidataItem
 
@@ -64,23 +64,50 @@ def wikid_ent_is_taxon(item: WikidataItem) -> bool:
     return ret
 
 
+# the fields of TAXWIKIDATA_HEADER (its "src" is read as "sourceinfo")
+_WIKIDATA_COLUMNS = (
+    "uid",
+    "parent_uid",
+    "name",
+    "rank",
+    "aut_id",
+    "aut_yr_id",
+    "nom_status",
+    "sourceinfo",
+    "line",
+)
+_WIKIDATA_TAXON_ATTRS = (
+    "id",
+    "par_id",
+    "name",
+    "rank",
+    "aut_id",
+    "aut_yrs",
+    "nom_status",
+    "src_dict",
+)
+
+
+def _wikidata_taxon_content(taxon):
+    return tuple(getattr(taxon, a) for a in _WIKIDATA_TAXON_ATTRS)
+
+
 def _parse_taxonomy_file(taxonomy_fp):
-    lp = tax_wikidata_parser
+    assert read_taxonomy_header(taxonomy_fp) == TAXWIKIDATA_HEADER
     id_2_taxon = {}
-    with open(taxonomy_fp, "r") as inp:
-        lit = iter(inp)
-        fl = next(lit)
-        assert fl == TAXWIKIDATA_HEADER
-        for n, line in enumerate(lit):
-            ls = line.strip()
-            if not ls:
-                continue
-            if n % 10000 == 0 and n > 0:
-                _LOG.debug(' read taxon {:<7} from "{}" ...'.format(n, taxonomy_fp))
-            obj = Taxon(line, line_parser=lp)
+    for chunk in iter_taxonomy_columns(
+        taxonomy_fp,
+        columns=_WIKIDATA_COLUMNS,
+        int_ids=False,
+        skip_blank_lines=True,
+    ):
+        m = ' read taxon {:<7} from "{}" ...'
+        _LOG.debug(m.format(len(id_2_taxon), taxonomy_fp))
+        for obj in chunk.taxa():
             if obj.id in id_2_taxon:
                 _LOG.warning(f"Duplicate taxon ID: {obj.id}")
-                if obj.__dict__ != id_2_taxon[obj.id].__dict__:
+                prev = id_2_taxon[obj.id]
+                if _wikidata_taxon_content(obj) != _wikidata_taxon_content(prev):
                     m = f"Duplicate taxon ID: {obj.id} with differing content."
                     raise RuntimeError(m)
             id_2_taxon[obj.id] = obj
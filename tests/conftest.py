@@ -0,0 +1,179 @@
+"""Fixtures shared by the tests: a TaxalotlConfig in a temporary directory and
+small synthetic taxonomies in the OTT interim format."""
+import json
+import os
+import random
+
+import pytest
+
+from taxalotl import TaxalotlConfig
+from taxalotl.cmds.partitions import (
+    BASE_PARTITIONS_DICT,
+    GEN_MAPPING_FILENAME,
+    MISC_DIRNAME,
+    PREORDER_PART_LIST,
+    do_partition,
+)
+from taxalotl.ott_schema import INP_FLAGGED_OTT_TAXONOMY_HEADER, INP_OTT_SYNONYMS_HEADER
+from taxalotl.resource_wrapper import GenericTaxonomyWrapper
+from taxalotl.tax_partition import use_tax_partitions
+from taxalotl.util import get_history
+
+_CONF = """[behavior]
+crash_with_stacktraces = true
+[paths]
+base = {}
+raw = %(base)s/raw
+normalized = %(base)s/normalized
+processed = %(base)s/processed
+partitioned = %(base)s/partitioned
+resources = %(base)s/resources
+"""
+
+
+@pytest.fixture(autouse=True)
+def history_in_tmp_path(tmp_path, monkeypatch):
+    """The history records of the commands run by a test go to tmp_path rather
+    than ~/.taxalotl_history."""
+    fp = str(tmp_path / "taxalotl_history")
+    monkeypatch.setattr(get_history(), "hist_filepath", fp)
+    monkeypatch.setattr(get_history(), "hist_content", None)
+    return fp
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """Returns a function that creates a TaxalotlConfig whose dirs are in a new
+    subdir `name` of tmp_path."""
+
+    def _make(name="base"):
+        base = tmp_path / name
+        os.makedirs(str(base / "resources"))
+        conf_fp = str(base / "taxalotl.conf")
+        with open(conf_fp, "w") as outp:
+            outp.write(_CONF.format(base))
+        return TaxalotlConfig(filepath=conf_fp)
+
+    return _make
+
+
+@pytest.fixture
+def taxalotl_config(make_config):
+    return make_config()
+
+
+class SyntheticTaxonomy(object):
+    """A normalized taxonomy with a few random taxa below a taxon for each group of
+    BASE_PARTITIONS_DICT, and a partition map that has each group's taxon as its
+    root."""
+
+    def __init__(self, res_id="synth", n_per_group=5, seed=1):
+        self.res_id = res_id
+        self.rows = []  # (uid, parent uid or None, name, rank)
+        self.mapping = {}
+        self._rnd = random.Random(seed)
+        self._next_id = 10
+        self._add_group(BASE_PARTITIONS_DICT["Life"], None, "Life", n_per_group)
+        self._rnd.shuffle(self.rows)
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _add_group(self, subd, par_id, name, n_per_group):
+        uid = self._new_id()
+        self.rows.append((uid, par_id, name, "no rank"))
+        if name not in ("Life", MISC_DIRNAME):
+            self.mapping[name] = [uid]
+        for k, sub in subd.items():
+            sub_name = k if k != MISC_DIRNAME else name + "_misc"
+            self._add_group(sub, uid, sub_name, n_per_group)
+        pool = [uid]
+        for i in range(n_per_group):
+            c = self._new_id()
+            par_id = self._rnd.choice(pool)
+            rank = self._rnd.choice(["species", "genus", ""])
+            self.rows.append((c, par_id, "{} sp{}".format(name, c), rank))
+            pool.append(c)
+
+    def children_of(self, uid):
+        return [r[0] for r in self.rows if r[1] == uid]
+
+    def write(self, config):
+        """Writes the taxonomy.tsv, synonyms.tsv and partition map to the dirs of
+        `config`; returns the resource wrapper."""
+        nd = os.path.join(config.normalized_dir, self.res_id)
+        os.makedirs(nd, exist_ok=True)
+        with open(os.path.join(nd, "taxonomy.tsv"), "w") as out:
+            out.write(INP_FLAGGED_OTT_TAXONOMY_HEADER)
+            for uid, par_id, name, rank in self.rows:
+                p = "" if par_id is None else str(par_id)
+                out.write("\t|\t".join([str(uid), p, name, rank, "", ""]) + "\n")
+        types = ["synonym", "common name", "authority", "misspelling"]
+        with open(os.path.join(nd, "synonyms.tsv"), "w") as out:
+            out.write(INP_OTT_SYNONYMS_HEADER)
+            for i, row in enumerate(self.rows[::5]):
+                for j in range(i % 3):
+                    fields = [str(row[0]), " {} syn{} ".format(row[2], j)]
+                    fields.extend([types[(i + j) % 4], ""])
+                    out.write("\t|\t".join(fields) + "\n")
+        pd = config.partitioned_dir
+        os.makedirs(pd, exist_ok=True)
+        with open(os.path.join(pd, GEN_MAPPING_FILENAME), "w") as out:
+            json.dump({self.res_id: self.mapping}, out)
+        return GenericTaxonomyWrapper(self.res_id, config)
+
+
+@pytest.fixture
+def synthetic_taxonomy():
+    return SyntheticTaxonomy
+
+
+def partition_level_by_level(res):
+    """Splits each level of res in turn, as the partition command does."""
+    for part_name in PREORDER_PART_LIST:
+        with use_tax_partitions():
+            do_partition(res, part_name)
+
+
+@pytest.fixture
+def level_by_level():
+    return partition_level_by_level
+
+
+def snapshot_dir(d):
+    """Returns relative path -> content for the files below d. JSON files are
+    parsed; for other files, the header line and the sorted other lines are kept."""
+    r = {}
+    for root, dirs, files in os.walk(d):
+        for f in files:
+            fp = os.path.join(root, f)
+            with open(fp) as inp:
+                if f.endswith(".json"):
+                    content = json.load(inp)
+                else:
+                    lines = inp.readlines()
+                    content = (lines[0] if lines else None, sorted(lines[1:]))
+            r[os.path.relpath(fp, d)] = content
+    return r
+
+
+@pytest.fixture
+def dir_snapshot():
+    return snapshot_dir
+
+
+def read_dir_bytes(d):
+    """Returns relative path -> bytes for the files below d."""
+    r = {}
+    for root, dirs, files in os.walk(d):
+        for f in files:
+            fp = os.path.join(root, f)
+            with open(fp, "rb") as inp:
+                r[os.path.relpath(fp, d)] = inp.read()
+    return r
+
+
+@pytest.fixture
+def dir_bytes():
+    return read_dir_bytes
@@ -0,0 +1,49 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from taxalotl.archive import ArchiveMembers
+
+_CONTENT = {
+    "res/taxonomy.tsv": "1\t|\t\t|\tLife\n",
+    "res/synonyms.tsv": "1\t|\tAll\n",
+}
+
+
+def _write_archive(d, archive_format):
+    src = os.path.join(d, "src")
+    os.makedirs(os.path.join(src, "res"))
+    for name, content in _CONTENT.items():
+        with io.open(os.path.join(src, name), "w", encoding="utf-8") as outp:
+            outp.write(content)
+    if archive_format == "zip":
+        fp = os.path.join(d, "res.zip")
+        with zipfile.ZipFile(fp, "w") as zf:
+            for name in sorted(_CONTENT):
+                zf.write(os.path.join(src, name), name)
+    else:
+        fp = os.path.join(d, "res.tgz")
+        with tarfile.open(fp, "w:gz") as tf:
+            for name in sorted(_CONTENT):
+                tf.add(os.path.join(src, name), name)
+    return fp
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar+gzip"])
+def test_members_are_read_in_any_order(tmp_path, archive_format):
+    fp = _write_archive(str(tmp_path), archive_format)
+    # taxonomy.tsv comes after synonyms.tsv in the archive
+    with ArchiveMembers(fp, archive_format, _CONTENT) as members:
+        for name in ("res/taxonomy.tsv", "res/synonyms.tsv"):
+            assert members.exists(name)
+            with members.open(name) as inp:
+                assert inp.read() == _CONTENT[name]
+
+
+def test_an_unsupported_format_is_a_value_error(tmp_path):
+    fp = _write_archive(str(tmp_path), "zip")
+    with pytest.raises(ValueError, match="rar"):
+        ArchiveMembers(fp, "rar", _CONTENT)
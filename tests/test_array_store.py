@@ -0,0 +1,68 @@
+import random
+from array import array
+
+import pytest
+
+from taxalotl.array_store import ChildSetDict, CSRChildMap
+
+
+def _random_ops(seed, num_ops):
+    """Applies the same random operations to a pair of ChildSetDicts and a pair of
+    CSRChildMaps (moving sets between the two maps of a pair) and checks that the
+    keys and sets are visited in the same order."""
+    rnd = random.Random(seed)
+    dicts, maps = [ChildSetDict(), ChildSetDict()], [CSRChildMap(), CSRChildMap()]
+    for step in range(num_ops):
+        i = rnd.randrange(2)
+        src, dest = (dicts[i], maps[i]), (dicts[1 - i], maps[1 - i])
+        x = rnd.random()
+        par_id = rnd.choice([rnd.randint(0, 60), rnd.randint(0, 3000), "", "p"])
+        if x < 0.55:
+            uid = rnd.randint(0, 5000) if rnd.random() < 0.97 else "s{}".format(step)
+            for m in src:
+                m.add_child(par_id, uid)
+        elif x < 0.62:
+            uids = [rnd.randint(0, 5000) for _ in range(rnd.randint(0, 4))]
+            for m in src:
+                m.add_children(par_id, list(uids))
+        elif x < 0.7:
+            keys = list(src[0].keys())
+            if keys:
+                par_id = rnd.choice(keys)
+                uid = rnd.choice(list(src[0].get(par_id)) or [0])
+                for m in src:
+                    m.discard_child(par_id, uid)
+        elif x < 0.85:
+            keys = list(src[0].keys())
+            if keys:
+                par_ids = rnd.sample(keys, min(len(keys), rnd.randint(1, 3)))
+                popped = [[m.pop_children(p) for p in par_ids] for m in src]
+                assert [list(c) for c in popped[1]] == [list(c) for c in popped[0]]
+                if rnd.random() < 0.5:
+                    # as the subtree of par_ids moves, or merged into other sets
+                    new = iter(rnd.sample(range(61), len(par_ids)))
+                    par_ids = [next(new) if isinstance(p, int) else p for p in par_ids]
+                for m, child_sets in zip(dest, popped):
+                    m.adopt_child_sets(par_ids, child_sets)
+        else:
+            for d, m in zip(dicts, maps):
+                assert list(m.keys()) == list(d.keys())
+                assert len(m) == len(d)
+                for k in d.keys():
+                    assert list(m[k]) == list(d[k])
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_csr_child_map_visits_what_a_dict_of_sets_visits(seed):
+    _random_ops(seed, 2000)
+
+
+def test_csr_child_map_from_csr_columns():
+    cm = CSRChildMap.from_csr(
+        array("q", [3, 8]), array("q", [0, 2, 3]), array("q", [10, 11, 12])
+    )
+    cm.add_children("", [3])
+    assert list(cm.keys()) == [3, 8, ""]
+    assert cm[3] == {10, 11}
+    assert cm.pop_children(8) == {12}
+    assert 8 not in cm and len(cm) == 2
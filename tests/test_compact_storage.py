@@ -0,0 +1,19 @@
+"""The array-backed storage options must write the same files as the dicts."""
+import pytest
+
+
+@pytest.mark.parametrize("seed", [1, 7, 11])
+def test_compact_partition_storage_writes_the_same_bytes(
+    make_config, synthetic_taxonomy, level_by_level, dir_bytes, seed
+):
+    tax = synthetic_taxonomy(n_per_group=12, seed=seed)
+    dict_cfg, compact_cfg = make_config("dicts"), make_config("compact")
+    compact_cfg.compact_partition_storage = True
+    level_by_level(tax.write(dict_cfg))
+    level_by_level(tax.write(compact_cfg))
+    by_dicts = dir_bytes(dict_cfg.partitioned_dir)
+    compact = dir_bytes(compact_cfg.partitioned_dir)
+    assert len(by_dicts) > 50
+    assert sorted(compact.keys()) == sorted(by_dicts.keys())
+    for rel, content in by_dicts.items():
+        assert compact[rel] == content, rel
@@ -0,0 +1,117 @@
+"""The batched removals of del_ids must leave the child lists that removing the
+IDs one at a time leaves."""
+import random
+
+import pytest
+
+from taxalotl.interim_store import ChildIds
+from taxalotl.ott_schema import (
+    _MAX_REMOVE_CALLS,
+    _MAX_REMOVE_SCAN,
+    InterimTaxonomyData,
+    _remove_first_occurrences,
+)
+
+
+def _remove_one_at_a_time(seq, to_remove):
+    for el in set(to_remove):
+        try:
+            seq.remove(el)
+        except ValueError:
+            pass
+
+
+def _del_ids_one_at_a_time(itd, id_list):
+    """del_ids as it was before long child lists were compacted once."""
+    for taxon_id in id_list:
+        if taxon_id in itd.to_name:
+            del itd.to_name[taxon_id]
+        if taxon_id in itd.to_children:
+            del itd.to_children[taxon_id]
+        pid = itd.to_par.get(taxon_id)
+        if pid:
+            del itd.to_par[taxon_id]
+            pc = itd.to_children.get(pid)
+            try:
+                if pc:
+                    pc.remove(taxon_id)
+            except ValueError:
+                pass
+
+
+_LENGTHS = (0, 3, _MAX_REMOVE_SCAN - 1, _MAX_REMOVE_SCAN, _MAX_REMOVE_SCAN + 1, 100)
+
+
+@pytest.mark.parametrize("container", [list, ChildIds])
+@pytest.mark.parametrize("length", _LENGTHS)
+def test_remove_first_occurrences_matches_remove(container, length):
+    rnd = random.Random(length)
+    for num_removed in (1, _MAX_REMOVE_CALLS, _MAX_REMOVE_CALLS + 1, length + 3):
+        for _ in range(20):
+            # duplicates in the list and in to_remove, and IDs that are not listed
+            seq = [rnd.randrange(length // 2 + 2) for _ in range(length)]
+            to_remove = [rnd.randrange(length + 4) for _ in range(num_removed)]
+            expected = container(seq)
+            _remove_one_at_a_time(expected, to_remove)
+            got = container(seq)
+            _remove_first_occurrences(got, to_remove)
+            assert got == expected
+            assert got.__class__ is container
+
+
+def _make_data(compact, lengths, rnd):
+    """Parents 1..len(lengths) below root 0; parent p has lengths[p - 1] child
+    entries (some of them listed twice). Returns the data and the child IDs."""
+    child_id = 1000
+    children = []
+    by_par = {}
+    for pid, length in enumerate(lengths, start=1):
+        by_par[pid] = []
+        while len(by_par[pid]) < length:
+            if by_par[pid] and rnd.random() < 0.1:
+                by_par[pid].append(rnd.choice(by_par[pid]))
+                continue
+            by_par[pid].append(child_id)
+            children.append(child_id)
+            child_id += 1
+    itd = InterimTaxonomyData(compact_storage=compact)
+    itd.register_id_and_name(0, "root")
+    itd.root_nodes.add(0)
+    for pid, cids in by_par.items():
+        itd.register_id_and_name(pid, "p{}".format(pid))
+        itd.to_par[pid] = 0
+        itd.to_children.setdefault(0, []).append(pid)
+        for cid in cids:
+            itd.register_id_and_name(cid, "c{}".format(cid))
+            itd.to_par[cid] = pid
+            itd.to_children.setdefault(pid, []).append(cid)
+    return itd, children
+
+
+def _state(itd, ids):
+    return (
+        {i: list(itd.to_children[i]) for i in ids if i in itd.to_children},
+        {i: itd.to_par[i] for i in ids if i in itd.to_par},
+        {i: itd.to_name[i] for i in ids if i in itd.to_name},
+    )
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_del_ids_matches_removing_one_at_a_time(compact, seed):
+    lengths = (3, _MAX_REMOVE_SCAN - 1, _MAX_REMOVE_SCAN, _MAX_REMOVE_SCAN + 1, 100)
+    rnd = random.Random(seed)
+    itd, children = _make_data(compact, lengths, rnd)
+    ref, _ = _make_data(compact, lengths, random.Random(seed))
+    all_ids = list(range(len(lengths) + 1)) + children
+    # a child that its parent does not list
+    itd.to_par[999] = ref.to_par[999] = 4
+    to_del = rnd.sample(children, len(children) // 2)
+    to_del += [999, 2, 123456, to_del[0]]  # a parent, an unknown ID, a repeat
+    to_del += rnd.sample(children, 10)
+    itd.del_ids(to_del)
+    _del_ids_one_at_a_time(ref, to_del)
+    assert _state(itd, all_ids + [999]) == _state(ref, all_ids + [999])
+    # the lists at and above _MAX_REMOVE_SCAN lost children
+    for pid in (3, 4, 5):
+        assert len(itd.to_children[pid]) < lengths[pid - 1]
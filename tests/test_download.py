@@ -0,0 +1,238 @@
+"""Downloads from local stand-in HTTP and FTP servers (also used by
+scripts/bench_download.py)."""
+import hashlib
+import http.server
+import os
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+from taxalotl.download import PART_SUFFIX, download_file, fetch_resources
+
+
+def _send(server, write, fo, start, end):
+    """Sends bytes [start, end) of fo, at most server.bytes_per_second per second."""
+    fo.seek(start)
+    remaining = end - start
+    while remaining:
+        buf = fo.read(min(remaining, 1 << 16))
+        write(buf)
+        remaining -= len(buf)
+        if server.bytes_per_second:
+            time.sleep(len(buf) / float(server.bytes_per_second))
+
+
+class RangeHTTPHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the files below server.root, honoring "Range: bytes=N-" unless
+    server.ignore_range is set. The Range headers are kept in server.requests."""
+
+    def do_GET(self):
+        rel = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        fp = os.path.join(self.server.root, rel.lstrip("/"))
+        if not os.path.isfile(fp):
+            self.send_error(404)
+            return
+        size = os.path.getsize(fp)
+        start = 0
+        rh = self.headers.get("Range")
+        self.server.requests.append(rh)
+        if rh and not self.server.ignore_range:
+            start = int(rh.split("=")[1].split("-")[0])
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            cr = "bytes {}-{}/{}".format(start, size - 1, size)
+            self.send_header("Content-Range", cr)
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(size - start))
+        self.end_headers()
+        with open(fp, "rb") as fo:
+            _send(self.server, self.wfile.write, fo, start, size)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInFTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of an anonymous FTP server for ftplib and urllib: USER, PASS,
+    TYPE, CWD, SIZE, PASV, REST, RETR and QUIT (every file is in the root dir).
+    The REST offsets are kept in server.requests."""
+
+    def reply(self, line):
+        self.wfile.write("{}\r\n".format(line).encode("ascii"))
+
+    def handle(self):
+        root, rest, data_sock = self.server.root, 0, None
+        self.reply("220 stand-in")
+        for raw in self.rfile:
+            cmd, _, arg = raw.decode("ascii").strip().partition(" ")
+            cmd = cmd.upper()
+            fp = os.path.join(root, arg.lstrip("/"))
+            if cmd == "USER":
+                self.reply("331 ok")
+            elif cmd == "PASS":
+                self.reply("230 ok")
+            elif cmd in ("TYPE", "CWD"):
+                self.reply("200 ok" if cmd == "TYPE" else "250 ok")
+            elif cmd == "SIZE":
+                self.reply("213 {}".format(os.path.getsize(fp)))
+            elif cmd == "PASV":
+                data_sock = socket.socket()
+                data_sock.bind(("127.0.0.1", 0))
+                data_sock.listen(1)
+                port = data_sock.getsockname()[1]
+                hp = "127,0,0,1,{},{}".format(port >> 8, port & 0xFF)
+                self.reply("227 Entering Passive Mode ({})".format(hp))
+            elif cmd == "REST":
+                rest = int(arg)
+                self.server.requests.append(rest)
+                self.reply("350 ok")
+            elif cmd == "RETR":
+                self.reply("150 ok")
+                conn = data_sock.accept()[0]
+                with open(fp, "rb") as fo:
+                    _send(self.server, conn.sendall, fo, rest, os.path.getsize(fp))
+                conn.close()
+                data_sock.close()
+                rest = 0
+                self.reply("226 done")
+            elif cmd == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+
+
+def start_servers(root, bytes_per_second=None):
+    """Starts the stand-in HTTP and FTP servers for the files in root. Returns the
+    servers; the URL prefix of each is its `url` attribute."""
+    r = []
+    for scheme, handler in (("http", RangeHTTPHandler), ("ftp", StandInFTPHandler)):
+        s = _Server(("127.0.0.1", 0), handler)
+        s.root = root
+        s.bytes_per_second = bytes_per_second
+        s.ignore_range = False
+        s.requests = []
+        s.url = "{}://127.0.0.1:{}/".format(scheme, s.server_address[1])
+        threading.Thread(target=s.serve_forever, daemon=True).start()
+        r.append(s)
+    return r
+
+
+_SIZE = 300000
+
+
+@pytest.fixture
+def served(tmp_path):
+    """(http server, ftp server, name of a served file, its content, its checksum)"""
+    src = tmp_path / "src"
+    src.mkdir()
+    content = os.urandom(_SIZE)
+    (src / "f.tar.gz").write_bytes(content)
+    checksum = "sha256:" + hashlib.sha256(content).hexdigest()
+    servers = start_servers(str(src))
+    yield servers[0], servers[1], "f.tar.gz", content, checksum
+    for s in servers:
+        s.shutdown()
+        s.server_close()
+
+
+def _write_part(dest, content):
+    with open(dest + PART_SUFFIX, "wb") as outp:
+        outp.write(content)
+
+
+@pytest.mark.parametrize("scheme", ["http", "ftp"])
+def test_download_resumes_from_the_part_file(tmp_path, served, scheme):
+    http_server, ftp_server, name, content, checksum = served
+    server = http_server if scheme == "http" else ftp_server
+    dest = str(tmp_path / "out" / name)
+    os.makedirs(os.path.dirname(dest))
+    _write_part(dest, content[: _SIZE // 3])
+    download_file(server.url + name, dest, checksum=checksum, chunk_size=4096)
+    with open(dest, "rb") as inp:
+        assert inp.read() == content
+    assert not os.path.exists(dest + PART_SUFFIX)
+    if scheme == "http":
+        assert server.requests == ["bytes={}-".format(_SIZE // 3)]
+    else:
+        assert server.requests == [_SIZE // 3]
+
+
+@pytest.mark.parametrize("scheme", ["http", "ftp"])
+def test_a_complete_part_file_is_not_fetched_again(tmp_path, served, scheme):
+    http_server, ftp_server, name, content, checksum = served
+    server = http_server if scheme == "http" else ftp_server
+    dest = str(tmp_path / name)
+    _write_part(dest, content)
+    # the stand-in HTTP server answers 416 (range not satisfiable)
+    download_file(server.url + name, dest, checksum=checksum)
+    with open(dest, "rb") as inp:
+        assert inp.read() == content
+
+
+def test_a_server_that_ignores_range_restarts_the_download(tmp_path, served):
+    http_server, ftp_server, name, content, checksum = served
+    http_server.ignore_range = True
+    dest = str(tmp_path / name)
+    _write_part(dest, b"x" * 1000)
+    download_file(http_server.url + name, dest, checksum=checksum)
+    with open(dest, "rb") as inp:
+        assert inp.read() == content
+    assert http_server.requests == ["bytes=1000-"]
+
+
+@pytest.mark.parametrize("scheme", ["http", "ftp"])
+def test_a_bad_checksum_is_rejected(tmp_path, served, scheme):
+    http_server, ftp_server, name, content, checksum = served
+    server = http_server if scheme == "http" else ftp_server
+    dest = str(tmp_path / name)
+    with pytest.raises(RuntimeError, match="checksum"):
+        download_file(server.url + name, dest, checksum="sha256:" + "0" * 64)
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + PART_SUFFIX)
+
+
+class _Resource(object):
+    def __init__(self, rid, tasks):
+        self.id = rid
+        self.tasks = tasks
+        self.finished = False
+
+    def download_tasks(self):
+        return self.tasks
+
+    def finish_download(self):
+        self.finished = True
+
+
+def test_fetch_resources_with_jobs(tmp_path, served):
+    http_server, ftp_server, name, content, checksum = served
+    dest = str(tmp_path / "dest")
+    res = []
+    for i in range(4):
+        server = http_server if i % 2 else ftp_server
+        fp = os.path.join(dest, "r{}".format(i), name)
+        res.append(_Resource("r{}".format(i), [(server.url + name, fp, checksum)]))
+    # a file that is already present is not fetched again
+    os.makedirs(os.path.join(dest, "r0"))
+    with open(os.path.join(dest, "r0", name), "wb") as outp:
+        outp.write(b"present")
+    fetch_resources(res, num_workers=3)
+    for i, rw in enumerate(res):
+        assert rw.finished
+        with open(rw.tasks[0][1], "rb") as inp:
+            assert inp.read() == (b"present" if i == 0 else content)
@@ -0,0 +1,127 @@
+"""A resource normalized with compact_storage=True must be written as it is with
+the dicts."""
+import gzip
+import io
+import os
+import shutil
+
+from taxalotl import TaxalotlConfig
+from taxalotl.interim_store import ChildIds
+from taxalotl.ott_schema import InterimTaxonomyData, interim_tax_data_for
+
+
+def _fill(itd, tax):
+    """Registers the taxa of `tax` as a parser would, then removes a few of them."""
+    for uid, par_id, name, rank in tax.rows:
+        itd.register_id_and_name(uid, name)
+        if par_id is None:
+            itd.root_nodes.add(uid)
+        else:
+            itd.to_par[uid] = par_id
+            itd.to_children.setdefault(par_id, []).append(uid)
+        if rank:
+            itd.to_rank[uid] = rank
+        if uid % 7 == 0:
+            itd.to_flags[uid] = "extinct"
+        if uid % 5 == 0:
+            itd.register_synonym(uid, "{} syn".format(name), "synonym")
+    # a child ID that is not an integer, below an integer parent
+    par_id = next(r[0] for r in tax.rows if r[1] is None)
+    itd.register_id_and_name("x1", "Child x1")
+    itd.to_par["x1"] = par_id
+    itd.to_children.setdefault(par_id, []).append("x1")
+    tips = [r[0] for r in tax.rows if r[1] is not None and not tax.children_of(r[0])]
+    itd.del_ids(tips[::4])
+
+
+def _read_dir(d):
+    r = {}
+    for fn in os.listdir(d):
+        with io.open(os.path.join(d, fn), "rb") as inp:
+            r[fn] = inp.read()
+    return r
+
+
+def test_compact_storage_writes_what_the_dicts_write(tmp_path, synthetic_taxonomy):
+    tax = synthetic_taxonomy(n_per_group=10, seed=3)
+    written = []
+    for compact in (False, True):
+        itd = InterimTaxonomyData(compact_storage=compact)
+        _fill(itd, tax)
+        d = str(tmp_path / ("compact" if compact else "dicts"))
+        itd.write_to_dir(d)
+        written.append(_read_dir(d))
+    by_dicts, compact = written
+    assert b"x1\t|\t" in by_dicts["taxonomy.tsv"]
+    assert compact == by_dicts
+
+
+def test_forked_writers_write_what_one_process_writes(tmp_path, synthetic_taxonomy):
+    tax = synthetic_taxonomy(n_per_group=40, seed=4)
+    written = []
+    for num_workers in (1, 3):
+        itd = InterimTaxonomyData(compact_storage=True)
+        _fill(itd, tax)
+        itd.write_workers = num_workers
+        d = str(tmp_path / str(num_workers))
+        itd.write_to_dir(d)
+        written.append(_read_dir(d))
+    assert written[1] == written[0]
+
+
+def test_the_compression_option_writes_gzipped_files(
+    tmp_path, make_config, synthetic_taxonomy
+):
+    tax = synthetic_taxonomy(res_id="cof-synth", n_per_group=10, seed=6)
+    make_config("gz")
+    conf_fp = str(tmp_path / "gz" / "taxalotl.conf")
+    with open(conf_fp) as inp:
+        conf = inp.read()
+    with open(conf_fp, "w") as outp:
+        opt = "normalize_write_compression = gzip"
+        outp.write(conf.replace("[behavior]\n", "[behavior]\n{}\n".format(opt)))
+    gz_cfg = TaxalotlConfig(filepath=conf_fp)
+    assert gz_cfg.normalize_write_compression == "gzip"
+    written = []
+    for name, cfg in (("plain", make_config("plain")), ("gz", gz_cfg)):
+        itd = interim_tax_data_for(tax.write(cfg))
+        _fill(itd, tax)
+        d = str(tmp_path / "out" / name)
+        itd.write_to_dir(d)
+        written.append(_read_dir(d))
+    plain, compressed = written
+    assert sorted(compressed.keys()) == sorted(
+        fn + ".gz" if fn.endswith(".tsv") else fn for fn in plain.keys()
+    )
+    for fn, content in plain.items():
+        if fn.endswith(".tsv"):
+            assert gzip.decompress(compressed[fn + ".gz"]) == content, fn
+        else:
+            assert compressed[fn] == content, fn
+
+
+def test_gzipped_normalized_files_are_partitioned(
+    make_config, synthetic_taxonomy, level_by_level, dir_bytes
+):
+    tax = synthetic_taxonomy(n_per_group=8, seed=7)
+    plain_cfg, gz_cfg = make_config("plain"), make_config("gz")
+    level_by_level(tax.write(plain_cfg))
+    rw = tax.write(gz_cfg)
+    for fn in ("taxonomy.tsv", "synonyms.tsv"):
+        fp = os.path.join(rw.normalized_filedir, fn)
+        with open(fp, "rb") as inp, gzip.open(fp + ".gz", "wb") as outp:
+            shutil.copyfileobj(inp, outp)
+        os.unlink(fp)
+    assert rw.has_been_normalized()
+    level_by_level(rw)
+    assert dir_bytes(gz_cfg.partitioned_dir) == dir_bytes(plain_cfg.partitioned_dir)
+
+
+def test_child_ids_take_ids_that_are_not_integers():
+    c = ChildIds([3, 1])
+    c.append(2)
+    c.extend([5, "a", 6])
+    c.remove(1)
+    assert c == [3, 2, 5, "a", 6]
+    c.append(2**70)
+    assert list(c) == [3, 2, 5, "a", 6, 2**70]
@@ -0,0 +1,126 @@
+"""The manifests let normalize and partition skip work whose inputs have not
+changed, and redo the work whose inputs have."""
+import json
+import os
+
+from taxalotl.commands import partition_resources
+from taxalotl.manifest import MANIFEST_FILENAME, read_manifest
+from taxalotl.util import get_history
+
+
+def _without_mtimes(obj):
+    if isinstance(obj, dict):
+        return {k: _without_mtimes(v) for k, v in obj.items() if k != "mtime_ns"}
+    return obj
+
+
+def _comparable(written):
+    r = {}
+    for rel, content in written.items():
+        if rel.endswith(MANIFEST_FILENAME):
+            content = _without_mtimes(json.loads(content.decode("utf-8")))
+        r[rel] = content
+    return r
+
+
+def _partition_runs():
+    records = get_history().hist_content or []
+    return [r for r in records if r["command"] == "partition"]
+
+
+def _manifest_dirs(d):
+    return sorted(r for r, ds, fs in os.walk(d) if MANIFEST_FILENAME in fs)
+
+
+def _rename_a_taxon(rw, new_name):
+    """Edits the normalized taxonomy.tsv of rw in place; returns the old name."""
+    with open(rw.normalized_filepath, "r") as inp:
+        lines = inp.readlines()
+    fields = lines[-1].split("\t|\t")
+    old_name, fields[2] = fields[2], new_name
+    lines[-1] = "\t|\t".join(fields)
+    with open(rw.normalized_filepath, "w") as outp:
+        outp.writelines(lines)
+    return old_name
+
+
+def test_an_unchanged_rerun_writes_nothing(make_config, synthetic_taxonomy, dir_bytes):
+    tax = synthetic_taxonomy(res_id="cof-synth", n_per_group=6, seed=2)
+    cfg = make_config()
+    tax.write(cfg)
+    partition_resources(cfg, [tax.res_id], [None])
+    num_runs = len(_partition_runs())
+    assert num_runs > 5
+    assert _manifest_dirs(cfg.partitioned_dir)
+    before = dir_bytes(cfg.partitioned_dir)
+    norm_before = dir_bytes(cfg.normalized_dir)
+    partition_resources(cfg, [tax.res_id], [None])
+    assert len(_partition_runs()) == num_runs
+    assert dir_bytes(cfg.partitioned_dir) == before
+    assert dir_bytes(cfg.normalized_dir) == norm_before
+
+
+def test_an_edited_normalized_file_is_partitioned_again(
+    make_config, synthetic_taxonomy, dir_bytes
+):
+    tax = synthetic_taxonomy(res_id="cof-synth", n_per_group=6, seed=3)
+    cfg = make_config("edited")
+    rw = tax.write(cfg)
+    partition_resources(cfg, [tax.res_id], [None])
+    num_runs = len(_partition_runs())
+    old_name = _rename_a_taxon(rw, "Renamed taxon")
+    partition_resources(cfg, [tax.res_id], [None])
+    assert len(_partition_runs()) == 2 * num_runs
+    # what a first partition of the edited file writes
+    fresh_cfg = make_config("fresh")
+    fresh_rw = tax.write(fresh_cfg)
+    assert _rename_a_taxon(fresh_rw, "Renamed taxon") == old_name
+    partition_resources(fresh_cfg, [tax.res_id], [None])
+    edited = _comparable(dir_bytes(cfg.partitioned_dir))
+    assert edited == _comparable(dir_bytes(fresh_cfg.partitioned_dir))
+    assert any(b"Renamed taxon" in c for c in edited.values() if isinstance(c, bytes))
+    old = "\t|\t{}\t|\t".format(old_name).encode("utf-8")
+    assert not any(old in c for c in edited.values() if isinstance(c, bytes))
+
+
+def test_a_normalization_without_a_manifest_is_kept(
+    taxalotl_config, synthetic_taxonomy, dir_bytes
+):
+    tax = synthetic_taxonomy(res_id="cof-synth", n_per_group=4, seed=4)
+    rw = tax.write(taxalotl_config)
+    nd = rw.normalized_filedir
+    written = dir_bytes(nd)
+    assert read_manifest(nd) is None
+    assert rw.normalization_is_up_to_date()
+    # the manifest records the files as they are, and they are not changed
+    m = read_manifest(nd)
+    assert sorted(m.outputs.keys()) == sorted(written.keys())
+    after = dir_bytes(nd)
+    del after[MANIFEST_FILENAME]
+    assert after == written
+    assert rw.normalization_is_up_to_date()
+    _rename_a_taxon(rw, "Renamed taxon")
+    assert not rw.normalization_is_up_to_date()
+
+
+def test_partitions_without_manifests_are_kept(
+    taxalotl_config, synthetic_taxonomy, dir_bytes
+):
+    tax = synthetic_taxonomy(res_id="cof-synth", n_per_group=4, seed=5)
+    tax.write(taxalotl_config)
+    pd = taxalotl_config.partitioned_dir
+    partition_resources(taxalotl_config, [tax.res_id], [None])
+    num_runs = len(_partition_runs())
+    manifests = _manifest_dirs(pd)
+    digests = [read_manifest(d).digest for d in manifests]
+    written = dir_bytes(pd)
+    for d in manifests:
+        os.unlink(os.path.join(d, MANIFEST_FILENAME))
+    partition_resources(taxalotl_config, [tax.res_id], [None])
+    assert len(_partition_runs()) == num_runs
+    assert _manifest_dirs(pd) == manifests
+    # the outputs recorded now lack the files that lower levels consumed
+    assert [read_manifest(d).digest for d in manifests] == digests
+    for rel, content in dir_bytes(pd).items():
+        if not rel.endswith(MANIFEST_FILENAME):
+            assert written[rel] == content, rel
@@ -0,0 +1,105 @@
+"""The streaming normalizers of OTT-format resources must write what the original
+code (which read each file into memory) wrote."""
+import io
+import os
+
+import pytest
+
+from taxalotl.resource_wrapper import (
+    INP_OTT_SYNONYMS_HEADER,
+    INP_OTT_TAXONOMY_HEADER,
+    copy_and_add_ott_headers,
+    normalize_tab_sep_ott,
+)
+from taxalotl.util import COPY_BUFFER_SIZE, OutFile
+
+
+def _old_copy_and_add_ott_headers(unpacked_dirp, normalized_dirp):
+    for fn, header in (
+        ("taxonomy.tsv", INP_OTT_TAXONOMY_HEADER),
+        ("synonyms.tsv", INP_OTT_SYNONYMS_HEADER),
+    ):
+        content = io.open(os.path.join(unpacked_dirp, fn), "r", encoding="utf-8").read()
+        with OutFile(os.path.join(normalized_dirp, fn)) as out:
+            out.write(header)
+            out.write(content)
+
+
+def _old_normalize_tab_sep_ott(unpacked_dirp, normalized_dirp):
+    tf = os.path.join(unpacked_dirp, "taxonomy.tsv")
+    with io.open(tf, "r", encoding="utf-8") as inp:
+        with OutFile(os.path.join(normalized_dirp, "taxonomy.tsv")) as out:
+            for line in inp:
+                out.write("\t|\t".join(line.split("\t")))
+
+
+def _rows(sep, n, newline):
+    r = []
+    for i in range(1, n + 1):
+        row = (str(i), str(i // 3), "Taxon {} Lé.".format(i), "species", "")
+        r.append(sep.join(row) + sep + newline)
+    return "".join(r)
+
+
+def _write_inputs(d, sep, newline, with_header, late_cr):
+    os.makedirs(d)
+    for fn, header in (
+        ("taxonomy.tsv", INP_OTT_TAXONOMY_HEADER),
+        ("synonyms.tsv", INP_OTT_SYNONYMS_HEADER),
+    ):
+        content = _rows(sep, 50, newline)
+        if with_header:
+            content = header + content
+        if late_cr:
+            # a \r after the first block of the file
+            content += "x" * COPY_BUFFER_SIZE + "\r\n" + _rows(sep, 3, "\r")
+        with io.open(os.path.join(d, fn), "w", encoding="utf-8", newline="") as out:
+            out.write(content)
+
+
+def _read_bytes(d):
+    r = {}
+    for fn in os.listdir(d):
+        with io.open(os.path.join(d, fn), "rb") as inp:
+            r[fn] = inp.read()
+    return r
+
+
+@pytest.mark.parametrize(
+    "newline,with_header,late_cr",
+    [
+        ("\n", False, False),
+        ("\n", True, False),
+        ("\r\n", False, False),
+        ("\n", False, True),
+    ],
+)
+def test_copy_and_add_ott_headers_matches_the_original(
+    tmp_path, newline, with_header, late_cr
+):
+    unpacked = str(tmp_path / "raw")
+    _write_inputs(unpacked, "\t|\t", newline, with_header, late_cr)
+    old_dir, new_dir = str(tmp_path / "old"), str(tmp_path / "new")
+    os.makedirs(old_dir)
+    _old_copy_and_add_ott_headers(unpacked, old_dir)
+    copy_and_add_ott_headers(unpacked, new_dir, None)
+    new = _read_bytes(new_dir)
+    for fn, content in _read_bytes(old_dir).items():
+        assert new[fn] == content, fn
+    assert not os.path.samefile(
+        os.path.join(unpacked, "taxonomy.tsv"), os.path.join(new_dir, "taxonomy.tsv")
+    )
+
+
+@pytest.mark.parametrize(
+    "newline,late_cr", [("\n", False), ("\r\n", False), ("\n", True)]
+)
+def test_normalize_tab_sep_ott_matches_the_original(tmp_path, newline, late_cr):
+    unpacked = str(tmp_path / "raw")
+    _write_inputs(unpacked, "\t", newline, False, late_cr)
+    old_dir, new_dir = str(tmp_path / "old"), str(tmp_path / "new")
+    os.makedirs(old_dir)
+    _old_normalize_tab_sep_ott(unpacked, old_dir)
+    normalize_tab_sep_ott(unpacked, new_dir, None)
+    new = _read_bytes(new_dir)
+    assert new["taxonomy.tsv"] == _read_bytes(old_dir)["taxonomy.tsv"]
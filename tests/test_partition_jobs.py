@@ -0,0 +1,54 @@
+"""Partitioning with worker processes (--jobs) must use the config of the command,
+and write what one process writes."""
+import json
+import pickle
+
+import pytest
+
+from taxalotl.commands import partition_resources
+from taxalotl.manifest import MANIFEST_FILENAME
+
+
+def _without_mtimes(obj):
+    if isinstance(obj, dict):
+        return {k: _without_mtimes(v) for k, v in obj.items() if k != "mtime_ns"}
+    return obj
+
+
+def test_a_pickled_config_keeps_the_values_set_at_runtime(taxalotl_config):
+    taxalotl_config.compact_partition_storage = True
+    taxalotl_config.profile = True
+    taxalotl_config.slice_cache_max_bytes = 1 << 20
+    sdb = taxalotl_config.state_db
+    assert taxalotl_config.state_db is sdb
+    cfg = pickle.loads(pickle.dumps(taxalotl_config))
+    assert cfg.compact_partition_storage
+    assert cfg.profile
+    assert cfg.slice_cache_max_bytes == 1 << 20
+    assert cfg.resources_dir == taxalotl_config.resources_dir
+    assert cfg.resources_mgr is not None
+    assert cfg.state_db is not sdb and cfg.state_db.filepath == sdb.filepath
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_partition_with_jobs_writes_what_one_process_writes(
+    make_config, synthetic_taxonomy, dir_bytes, compact
+):
+    tax = synthetic_taxonomy(res_id="cof-synth", n_per_group=12, seed=5)
+    written = []
+    for jobs in (1, 3):
+        cfg = make_config("jobs{}".format(jobs))
+        cfg.compact_partition_storage = compact
+        tax.write(cfg)
+        partition_resources(cfg, [tax.res_id], [None], jobs=jobs)
+        written.append(dir_bytes(cfg.partitioned_dir))
+    assert len(written[0]) > 50
+    assert sorted(written[1].keys()) == sorted(written[0].keys())
+    for rel, content in written[0].items():
+        if rel.endswith(MANIFEST_FILENAME):
+            # the files were written at different times
+            content = _without_mtimes(json.loads(content.decode("utf-8")))
+            other = _without_mtimes(json.loads(written[1][rel].decode("utf-8")))
+            assert other == content, rel
+        else:
+            assert written[1][rel] == content, rel
@@ -0,0 +1,57 @@
+import os
+
+from taxalotl.profiling import ProfileLog
+
+
+def test_profile_log_appends_and_rotates(tmp_path):
+    log = ProfileLog(str(tmp_path / "profiles"), max_bytes=200)
+    records = [{"command": "normalize", "n": i, "pad": "x" * 40} for i in range(20)]
+    for rec in records:
+        log.append(rec)
+    assert os.path.getsize(log.filepath) <= 200 + 100
+    assert os.path.getsize(log.rotated_filepath) <= 200 + 100
+    read = log.read_records()
+    assert read == records[-len(read) :]
+    assert len(read) > 2
+    with open(log.filepath, "a") as outp:
+        outp.write("{not json\n")
+    log.append(records[0])
+    assert log.read_records()[-1] == records[0]
+
+
+def test_bytes_written_by_threads_are_all_counted():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from taxalotl.profiling import count_bytes_written, snapshot_counts
+
+    start = snapshot_counts()["bytes_written"]
+
+    def write(n):
+        for i in range(n):
+            count_bytes_written(3)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(write, [20000] * 4))
+    assert snapshot_counts()["bytes_written"] - start == 3 * 20000 * 4
+
+
+def test_bytes_read_through_open_input_are_counted(tmp_path, monkeypatch):
+    from taxalotl.profiling import CommandProfile, get_profile_log
+    from taxalotl.util import open_input
+
+    fp = str(tmp_path / "in.tsv")
+    with open(fp, "w") as outp:
+        outp.write("line\n" * 100000)
+    size = os.path.getsize(fp)
+    log = get_profile_log()
+    monkeypatch.setattr(log, "filepath", str(tmp_path / "profiles"))
+    with CommandProfile("read") as cp:
+        with open_input(fp) as inp:
+            assert sum(1 for line in inp) == 100000
+        with open_input(fp, "rb") as inp:
+            assert len(inp.read()) == size
+        with open_input(fp, "rb", buffering=0) as inp:
+            inp.seek(size - 10)
+            assert inp.read(100) == b"line\n" * 2
+        assert cp.profile()["bytes_read"] == 2 * size + 10
+    assert log.read_records()[-1]["profile"]["bytes_read"] == 2 * size + 10
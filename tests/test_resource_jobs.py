@@ -0,0 +1,80 @@
+"""normalize_resources runs the jobs of the resources after those of the resources
+that they depend on, and --keep-going skips only the dependents of a failure."""
+import json
+import os
+
+import pytest
+
+from taxalotl.commands import normalize_resources
+from taxalotl.util import get_history
+
+# id -> depends_on
+_DEPENDS_ON = {"a": [], "b": ["a"], "c": ["b"], "d": []}
+
+
+def _write_resources(config, bad=()):
+    """Writes "headerless ott" resources that are already unpacked; normalizing a
+    resource in `bad` fails (its taxonomy.tsv is not UTF-8)."""
+    res = {}
+    for rid, deps in _DEPENDS_ON.items():
+        res[rid] = {
+            "resource_type": "external taxonomy",
+            "schema": "headerless ott",
+            "format": "tar+gzip",
+            "url": "http://example.org/{}.tgz".format(rid),
+        }
+        if deps:
+            res[rid]["depends_on"] = deps
+        d = os.path.join(config.raw_downloads_dir, rid)
+        os.makedirs(d)
+        with open(os.path.join(d, "taxonomy.tsv"), "wb") as outp:
+            if rid in bad:
+                outp.write(b"1\t|\t\t|\tN\xff\t|\tspecies\t|\t\r\n")
+            else:
+                outp.write("1\t|\t\t|\tLife {}\t|\tno rank\t|\t\n".format(rid).encode())
+    with open(os.path.join(config.resources_dir, "test.json"), "w") as outp:
+        json.dump(res, outp)
+    # read the resources dir again
+    config._resources_mgr = None
+
+
+def _normalize_runs():
+    """IDs of the resources in the order their normalize runs ended (a failed run
+    is also listed if it wrote files)."""
+    records = get_history().hist_content or []
+    return [r["res_id"] for r in records if r["command"] == "normalize"]
+
+
+def _normalized(config):
+    by_res = config.state_db.stages_by_res()
+    return sorted(rid for rid, stages in by_res.items() if "normalized" in stages)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_resources_are_normalized_after_their_dependencies(taxalotl_config, jobs):
+    _write_resources(taxalotl_config)
+    normalize_resources(taxalotl_config, ["c", "d"], jobs=jobs)
+    done = _normalize_runs()
+    assert sorted(done) == ["a", "b", "c", "d"]
+    assert _normalized(taxalotl_config) == ["a", "b", "c", "d"]
+    assert done.index("a") < done.index("b") < done.index("c")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_keep_going_skips_only_the_dependents_of_a_failure(taxalotl_config, jobs):
+    _write_resources(taxalotl_config, bad=("b",))
+    with pytest.raises(UnicodeDecodeError):
+        normalize_resources(taxalotl_config, ["c", "d"], jobs=jobs, keep_going=True)
+    assert _normalized(taxalotl_config) == ["a", "d"]
+    # c, which depends on the failed b, was not started
+    assert "c" not in _normalize_runs()
+    c = taxalotl_config.get_resource_by_id("c")
+    assert not os.path.exists(c.normalized_filedir)
+
+
+def test_without_keep_going_the_first_failure_stops_the_run(taxalotl_config):
+    _write_resources(taxalotl_config, bad=("a",))
+    with pytest.raises(UnicodeDecodeError):
+        normalize_resources(taxalotl_config, ["c"])
+    assert _normalized(taxalotl_config) == []
+    assert not {"b", "c"}.intersection(_normalize_runs())
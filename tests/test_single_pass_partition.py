@@ -0,0 +1,35 @@
+import os
+
+from taxalotl.cmds.single_pass_partition import partition_in_one_pass
+
+
+def test_one_pass_writes_the_same_records_as_the_level_loop(
+    make_config, synthetic_taxonomy, level_by_level, dir_snapshot
+):
+    tax = synthetic_taxonomy(n_per_group=8, seed=3)
+    # taxa whose parent is missing
+    tax.rows.append((999991, 888888, "orphan", "species"))
+    tax.rows.append((999992, 999991, "orphan child", "species"))
+    # a group without roots, and one whose root is not in the taxonomy
+    tax.mapping["Glaucophyta"] = []
+    tax.mapping["Rhodophyta"] = [123456789]
+    del tax.mapping["Bryozoa"]
+    loop_cfg, one_cfg = make_config("loop"), make_config("one")
+    level_by_level(tax.write(loop_cfg))
+    assert partition_in_one_pass(tax.write(one_cfg))
+    # the taxa of a file are written in another order, so the lines are compared
+    loop = dir_snapshot(loop_cfg.partitioned_dir)
+    one = dir_snapshot(one_cfg.partitioned_dir)
+    assert len(loop) > 50
+    assert sorted(one.keys()) == sorted(loop.keys())
+    for rel, content in loop.items():
+        assert one[rel] == content, rel
+
+
+def test_one_pass_refuses_nested_sibling_roots(taxalotl_config, synthetic_taxonomy):
+    tax = synthetic_taxonomy()
+    # a Fungi root in the subtree of the Metazoa root
+    tax.mapping["Fungi"].append(tax.children_of(tax.mapping["Metazoa"][0])[0])
+    res = tax.write(taxalotl_config)
+    assert not partition_in_one_pass(res)
+    assert os.listdir(taxalotl_config.partitioned_dir) == ["__mapping__.json"]
@@ -0,0 +1,70 @@
+from taxalotl.cmds.partitions import PREORDER_PART_LIST, do_partition
+from taxalotl.tax_partition import (
+    TAX_SLICE_CACHE,
+    TaxonomySliceCache,
+    use_tax_partitions,
+)
+
+
+class _Slice(object):
+    def __init__(self, cache, name, nbytes):
+        self.cache_key = (_Slice, "r", name)
+        self.nbytes = nbytes
+        self.flushed = False
+        cache[self.cache_key] = self
+
+    def approx_nbytes(self):
+        return self.nbytes
+
+    def _flush(self):
+        self.flushed = True
+
+
+def test_cache_keeps_a_running_total_and_evicts_only_when_asked():
+    cache = TaxonomySliceCache(max_bytes=250)
+    a, b, c = [_Slice(cache, n, 100) for n in "abc"]
+    assert cache.approx_nbytes() == 300
+    assert cache.get(a.cache_key) is a  # a is now the most recently used
+    assert not any(s.flushed for s in (a, b, c))
+    c.nbytes = 50
+    cache.note_resized(c.cache_key)
+    assert cache.approx_nbytes() == 250
+    c.nbytes = 200
+    cache.note_resized(c.cache_key)
+    with cache.pinned(b):
+        cache.evict_if_over_budget()
+        # b is the least recently used, but it is pinned
+        assert not b.flushed and c.flushed and not a.flushed
+    assert cache.approx_nbytes() == 200
+    cache.pin(a.cache_key)
+    cache.pin(a.cache_key)
+    cache.unpin(a.cache_key)
+    cache.max_bytes = 0
+    cache.evict_if_over_budget()
+    assert b.flushed and not a.flushed
+    assert cache.approx_nbytes() == 100
+    cache.clear_without_flush(a.cache_key)
+    assert cache.approx_nbytes() == 0
+
+
+def test_evicting_between_levels_writes_what_the_level_loop_writes(
+    make_config, synthetic_taxonomy, level_by_level, dir_bytes
+):
+    tax = synthetic_taxonomy(n_per_group=8, seed=5)
+    loop_cfg, evict_cfg = make_config("loop"), make_config("evict")
+    level_by_level(tax.write(loop_cfg))
+    res = tax.write(evict_cfg)
+    TAX_SLICE_CACHE.max_bytes = 1
+    try:
+        with use_tax_partitions():
+            for part_name in PREORDER_PART_LIST:
+                do_partition(res, part_name)
+                TAX_SLICE_CACHE.evict_if_over_budget()
+        assert TAX_SLICE_CACHE.num_evicted > 0
+    finally:
+        TAX_SLICE_CACHE.max_bytes = None
+    loop = dir_bytes(loop_cfg.partitioned_dir)
+    evicted = dir_bytes(evict_cfg.partitioned_dir)
+    assert sorted(evicted.keys()) == sorted(loop.keys())
+    for rel, content in loop.items():
+        assert evicted[rel] == content, rel
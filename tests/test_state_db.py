@@ -0,0 +1,87 @@
+"""The status read from the state DB must match `status --verify` (which finds
+the stages from the files) after each command, and after files are removed by
+hand."""
+import io
+import json
+import os
+import shutil
+
+import pytest
+
+from taxalotl import commands
+from taxalotl.cmds.partitions import find_partition_dirs_for_taxonomy
+from taxalotl.commands import (
+    clean_resources,
+    normalize_resources,
+    partition_resources,
+    status_of_resources,
+)
+from taxalotl.state_db import walk_resource_stages
+
+
+def _write_resources(config, synthetic_taxonomy):
+    """"a" is normalized (as a synthetic taxonomy) and "b" is unpacked."""
+    res = {}
+    for rid in ("a", "b"):
+        res[rid] = {
+            "resource_type": "external taxonomy",
+            "schema": "headerless ott",
+            "format": "tar+gzip",
+            "url": "http://example.org/{}.tgz".format(rid),
+        }
+    with open(os.path.join(config.resources_dir, "test.json"), "w") as outp:
+        json.dump(res, outp)
+    config._resources_mgr = None
+    synthetic_taxonomy(res_id="a", n_per_group=4, seed=1).write(config)
+    d = os.path.join(config.raw_downloads_dir, "b")
+    os.makedirs(d)
+    with open(os.path.join(d, "taxonomy.tsv"), "w") as outp:
+        outp.write("1\t|\t\t|\tLife\t|\tno rank\t|\t\n")
+
+
+@pytest.fixture
+def status_report(monkeypatch):
+    def _report(config, verify=False):
+        buf = io.StringIO()
+        monkeypatch.setattr(commands, "out_stream", buf)
+        status_of_resources(config, [], by_status=True, verify=verify)
+        return buf.getvalue()
+
+    return _report
+
+
+def _remove_partitions_by_hand(config, rid):
+    rw = config.get_resource_by_id(rid)
+    # (the misc dirs are listed twice)
+    for d in set(find_partition_dirs_for_taxonomy(rw.partitioned_filepath, rid)):
+        shutil.rmtree(d)
+
+
+def test_status_from_the_db_matches_verify(
+    taxalotl_config, synthetic_taxonomy, status_report
+):
+    cfg = taxalotl_config
+    _write_resources(cfg, synthetic_taxonomy)
+    first = status_report(cfg)  # there is no DB yet, so it is built
+    assert cfg.state_db.has_been_built()
+    steps = [
+        lambda: normalize_resources(cfg, ["b"]),
+        lambda: partition_resources(cfg, ["a"], [None]),
+        lambda: clean_resources(cfg, "partition", ["a"]),
+        lambda: partition_resources(cfg, ["a"], [None]),
+        lambda: clean_resources(cfg, "normalize", ["b"]),
+        lambda: _remove_partitions_by_hand(cfg, "a"),
+        lambda: shutil.rmtree(cfg.get_resource_by_id("b").unpacked_filepath),
+    ]
+    reports = [first]
+    for step in steps:
+        step()
+        from_db = status_report(cfg)
+        assert cfg.state_db.stages_by_res() == walk_resource_stages(cfg)
+        assert from_db == status_report(cfg, verify=True)
+        reports.append(from_db)
+    # each step changed the status
+    for prev, report in zip(reports, reports[1:]):
+        assert report != prev
+    assert "parititioned:\na:" in reports[2]
+    assert "not downloaded:\nb:" in reports[-1]
@@ -0,0 +1,96 @@
+"""The columnar parser must give the taxa that the per-line parsers give."""
+import io
+
+import pytest
+
+from taxalotl.ott_schema import (
+    FULL_OTT_HEADER,
+    TAXWIKIDATA_HEADER,
+    read_taxonomy_to_get_id_to_fields,
+    tax_wikidata_parser,
+)
+from taxalotl.taxon import Taxon
+from taxalotl.taxonomy_columns import iter_taxonomy_columns, parse_taxonomy_columns
+
+_ATTRS = ("id", "par_id", "name", "rank", "src_dict", "flags", "uniqname", "line")
+_RANKS = ("species", "genus", "no rank - terminal", "")
+_FLAGS = ("", "extinct", "sibling_higher", "extinct,hidden")
+
+
+def _ott_lines(num_taxa):
+    for uid in range(1, num_taxa + 1):
+        par_id = str(uid // 3) if uid >= 3 else ""
+        src = "ncbi:{},gbif:{}".format(uid, 7 * uid) if uid % 5 else ""
+        if uid % 11 == 0:
+            # a repeated source
+            src = "ncbi:{},gbif:3,ncbi:{}".format(uid, 2 * uid)
+        fields = [str(uid), par_id, "Taxon {}".format(uid), _RANKS[uid % 4], src]
+        fields.extend(["U{}".format(uid) if uid % 7 == 0 else "", _FLAGS[uid % 4]])
+        yield "\t|\t".join(fields + ["\n"])
+
+
+def _write(fp, header, lines):
+    with io.open(fp, "w", encoding="utf-8") as outp:
+        outp.write(header)
+        outp.writelines(lines)
+
+
+def _per_line(fp, line_parser=None, skip_blank_lines=False):
+    r = []
+    with io.open(fp, "r", encoding="utf-8") as inp:
+        next(inp)
+        for n, line in enumerate(inp):
+            if skip_blank_lines and not line.strip():
+                continue
+            r.append(Taxon(line, line_num=1 + n, line_parser=line_parser))
+    return r
+
+
+def _content(taxon, attrs=_ATTRS):
+    return tuple(getattr(taxon, a) for a in attrs) + (taxon.line_num,)
+
+
+@pytest.mark.parametrize("chunk_size", [1 << 24, 500])
+def test_ott_taxa_match_the_line_parser(tmp_path, chunk_size):
+    fp = str(tmp_path / "taxonomy.tsv")
+    lines = list(_ott_lines(300))
+    # a line without its trailing fields sends its chunk to the line-by-line path
+    lines[150] = "151\t|\t50\t|\tShort\t|\t\n"
+    _write(fp, FULL_OTT_HEADER, lines)
+    expected = [_content(t) for t in _per_line(fp)]
+    cols = FULL_OTT_HEADER.split("\t|\t")[:-1] + ["line"]
+    parsed = parse_taxonomy_columns(fp, columns=cols, chunk_size=chunk_size)
+    assert [_content(t) for t in parsed.taxa()] == expected
+    assert [_content(parsed.taxon(i)) for i in range(len(parsed))] == expected
+
+
+def test_id_to_fields_is_a_lazy_map_of_the_same_taxa(tmp_path):
+    _write(str(tmp_path / "taxonomy.tsv"), FULL_OTT_HEADER, _ott_lines(50))
+    by_uid = read_taxonomy_to_get_id_to_fields(str(tmp_path))
+    expected = {t.id: _content(t) for t in _per_line(str(tmp_path / "taxonomy.tsv"))}
+    assert len(by_uid) == 50 and set(by_uid) == set(expected)
+    assert {k: _content(v) for k, v in by_uid.items()} == expected
+    assert by_uid[7] is by_uid[7]
+
+
+def test_line_numbers_count_the_skipped_blank_lines(tmp_path):
+    fp = str(tmp_path / "taxonomy.tsv")
+    lines = []
+    for uid in range(1, 40):
+        fields = ["Q{}".format(uid), "Q{}".format(uid // 2), "T{}".format(uid)]
+        fields.extend([" species ", "A1,A2" if uid % 3 else "", "", "", ""])
+        lines.append("\t|\t".join(fields) + "\n")
+        if uid % 10 == 0:
+            lines.append("\n")
+    _write(fp, TAXWIKIDATA_HEADER, lines)
+    attrs = ("id", "par_id", "name", "rank", "aut_id", "line")
+    expected = [
+        _content(t, attrs) for t in _per_line(fp, tax_wikidata_parser, True)
+    ]
+    cols = ("uid", "parent_uid", "name", "rank", "aut_id", "sourceinfo", "line")
+    got = []
+    for chunk in iter_taxonomy_columns(
+        fp, columns=cols, int_ids=False, skip_blank_lines=True, chunk_size=300
+    ):
+        got.extend(_content(t, attrs) for t in chunk.taxa())
+    assert got == expected
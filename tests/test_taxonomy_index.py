@@ -0,0 +1,125 @@
+"""The binary sidecar index of a taxonomy.tsv file."""
+import os
+import random
+import threading
+
+import pytest
+
+from taxalotl.ott_schema import (
+    FULL_OTT_HEADER,
+    _scan_taxonomy_for_taxa,
+    read_taxonomy_to_get_single_taxon,
+    read_taxonomy_to_get_taxa,
+)
+from taxalotl.taxonomy_index import (
+    TaxonomyIndex,
+    index_filepath,
+    load_or_build_taxonomy_index,
+)
+
+
+def _taxon_line(uid, newline="\n"):
+    par_id = str(uid // 3) if uid > 1 else ""
+    flags = "sibling_higher" if uid % 7 == 0 else ""
+    fields = [str(uid), par_id, "n{}".format(uid), "species", "x:{}".format(uid)]
+    return "\t|\t".join(fields + ["", flags, newline])
+
+
+def _write_taxonomy(fp, num_taxa, newline="\n"):
+    with open(fp, "w", encoding="utf-8", newline="") as outp:
+        outp.write(FULL_OTT_HEADER)
+        for uid in range(1, num_taxa + 1):
+            outp.write(_taxon_line(uid, newline))
+
+
+def test_threads_writing_the_same_index_do_not_share_a_temporary_file(tmp_path):
+    fp = str(tmp_path / "taxonomy.tsv")
+    _write_taxonomy(fp, 20000)
+    ind, tsv_stat = TaxonomyIndex.build(fp), os.stat(fp)
+    ifp = index_filepath(fp)
+    errors = []
+
+    def _write():
+        try:
+            ind.write(ifp, tsv_stat)
+        except Exception as x:
+            errors.append(x)
+
+    threads = [threading.Thread(target=_write) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert sorted(os.listdir(str(tmp_path))) == ["taxonomy.tsv", "taxonomy.tsv.idx"]
+    assert list(TaxonomyIndex.load(ifp, tsv_stat).uids) == list(ind.uids)
+
+
+def test_a_failed_write_leaves_no_temporary_file(tmp_path):
+    fp = str(tmp_path / "taxonomy.tsv")
+    _write_taxonomy(fp, 100)
+    ind = TaxonomyIndex.build(fp)
+    ind.children = list(ind.children)  # has no tofile
+    with pytest.raises(AttributeError):
+        ind.write(index_filepath(fp), os.stat(fp))
+    assert os.listdir(str(tmp_path)) == ["taxonomy.tsv"]
+    assert load_or_build_taxonomy_index(fp) is not None
+
+
+def _index_positions(fp):
+    ind = load_or_build_taxonomy_index(fp)
+    return {uid: ind.find(uid) for uid in ind.uids}
+
+
+def test_the_index_is_rebuilt_when_the_file_changes_size(tmp_path):
+    fp = str(tmp_path / "taxonomy.tsv")
+    _write_taxonomy(fp, 50)
+    assert len(load_or_build_taxonomy_index(fp)) == 50
+    with open(fp, "a", encoding="utf-8") as outp:
+        outp.write(_taxon_line(51))
+    assert TaxonomyIndex.load(index_filepath(fp), os.stat(fp)) is None
+    assert len(load_or_build_taxonomy_index(fp)) == 51
+    # and the rebuilt index was written
+    assert TaxonomyIndex.load(index_filepath(fp), os.stat(fp)) is not None
+    assert read_taxonomy_to_get_single_taxon(str(tmp_path), 51).name == "n51"
+
+
+def test_the_index_is_rebuilt_when_the_file_changes_mtime(tmp_path):
+    fp = str(tmp_path / "taxonomy.tsv")
+    _write_taxonomy(fp, 50)
+    before = _index_positions(fp)
+    # swap the lines of 10 and 11 (of the same length), so only the mtime changes
+    with open(fp, "r", encoding="utf-8") as inp:
+        lines = inp.readlines()
+    lines[10], lines[11] = lines[11], lines[10]
+    old_stat = os.stat(fp)
+    with open(fp, "w", encoding="utf-8") as outp:
+        outp.writelines(lines)
+    mtime_ns = old_stat.st_mtime_ns + 1000000000
+    os.utime(fp, ns=(mtime_ns, mtime_ns))
+    assert os.stat(fp).st_size == old_stat.st_size
+    after = _index_positions(fp)
+    assert (after[10], after[11]) == (before[11], before[10])
+    assert read_taxonomy_to_get_single_taxon(str(tmp_path), 10).line == lines[11]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_batch_lookups_return_the_lines_of_single_lookups(tmp_path, newline):
+    tax_dir = str(tmp_path)
+    fp = os.path.join(tax_dir, "taxonomy.tsv")
+    _write_taxonomy(fp, 3000, newline=newline)
+    rnd = random.Random(3)
+    uids = rnd.sample(range(1, 3000), 200) + [0, 3001, 99999]
+    batch = read_taxonomy_to_get_taxa(tax_dir, uids)
+    # files with \r can't be indexed, and are scanned instead
+    assert os.path.exists(index_filepath(fp)) == (newline == "\n")
+    assert sorted(batch.keys()) == sorted(u for u in uids if 0 < u <= 3000)
+    scanned = _scan_taxonomy_for_taxa(fp, uids)
+    for uid in uids:
+        single = read_taxonomy_to_get_single_taxon(tax_dir, uid)
+        if single is None:
+            assert uid not in batch
+            continue
+        assert batch[uid].line == single.line == scanned[uid].line
+        assert batch[uid].line_num == single.line_num == scanned[uid].line_num
+        assert batch[uid].flags == single.flags
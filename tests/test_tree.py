@@ -0,0 +1,129 @@
+"""The cached traversal and rank bound arrays of TaxonTree must agree with plain
+recursive walks of the tree, also after the tree is changed."""
+import random
+
+import pytest
+
+from taxalotl.resource_wrapper import GenericTaxonomyWrapper
+from taxalotl.taxon import Taxon
+from taxalotl.tree import TaxonForest, TaxonTree
+
+_RANKS = ("phylum", "order", "family", "genus", "species", "subspecies", "", "")
+
+
+def _random_tree(seed, num_taxa=300, root_rank="kingdom"):
+    rnd = random.Random(seed)
+    id_to_taxon = {}
+    for uid in range(1, num_taxa + 1):
+        par_id = str(rnd.randint(max(1, uid - 40), uid - 1)) if uid > 1 else ""
+        rank = rnd.choice(_RANKS) if uid > 1 else root_rank
+        fields = [str(uid), par_id, "n{}".format(uid), rank, "", "", "", "\n"]
+        t = Taxon("\t|\t".join(fields))
+        id_to_taxon[t.id] = t
+    return TaxonForest(id_to_taxon).trees[0]
+
+
+def _rec_preorder(nd):
+    r = [nd]
+    for c in nd.children_refs or ():
+        r.extend(_rec_preorder(c))
+    return r
+
+
+def _check_traversals(tree, rnd):
+    expected = _rec_preorder(tree.root)
+    assert list(tree.preorder()) == expected
+    assert list(tree.postorder()) == list(reversed(expected))
+    # every child comes before its parent
+    post_index = {nd.id: n for n, nd in enumerate(tree.postorder())}
+    for nd in expected:
+        for c in nd.children_refs or ():
+            assert post_index[c.id] < post_index[nd.id]
+    for nd in expected:
+        start, end = tree.subtree_range(nd)
+        subtree = _rec_preorder(nd)
+        assert expected[start:end] == subtree
+        assert tree.depth(nd) == len(list(tree.to_root_gen(nd))) - 1
+        ids = {i.id for i in subtree}
+        for other in rnd.sample(expected, 10):
+            assert tree.does_first_contain_second(nd, other) == (other.id in ids)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_traversals_after_collapsing_taxa(taxalotl_config, seed):
+    rnd = random.Random(seed)
+    tree = _random_tree(seed)
+    _check_traversals(tree, rnd)
+    internal = [nd for nd in tree.preorder() if nd.children_refs][1:]
+    to_collapse = rnd.sample(internal, len(internal) // 3)
+    res = GenericTaxonomyWrapper("synth", taxalotl_config)
+    res.collapse_as_incertae_sedis(tree, to_collapse)
+    removed = {nd.id for nd in to_collapse}
+    assert removed.isdisjoint(nd.id for nd in tree.preorder())
+    _check_traversals(tree, rnd)
+
+
+class _RecursiveRankTree(TaxonTree):
+    """The rank search that walks down the subtree and up the ancestors of each
+    node, as TaxonTree did before the rank bounds were cached."""
+
+    def _get_highest_child_rank(self, nd):
+        if not nd.children_refs:
+            return None
+        hr = None
+        for c in nd.children_refs:
+            csn = c.rank_sorting_number()
+            if csn is None:
+                csn = self._get_highest_child_rank(c)
+            if csn is None:
+                continue
+            if hr is None or csn + 1 > hr:
+                hr = csn + 1
+        return hr
+
+    def _get_lowest_anc_rank_sorting_number(self, nd):
+        try:
+            par = self.id_to_taxon[nd.par_id]
+        except KeyError:
+            return None
+        psn = par.rank_sorting_number()
+        if psn is None:
+            return self._get_lowest_anc_rank_sorting_number(par) - 1
+        return psn
+
+
+def _recursive_copy(tree):
+    id_to_children_ids = {}
+    for nd in tree.preorder():
+        if nd.children_refs:
+            id_to_children_ids[nd.id] = [c.id for c in nd.children_refs]
+    return _RecursiveRankTree(tree.root.id, id_to_children_ids, tree.id_to_taxon)
+
+
+def _specimen_typed(tree, nd):
+    try:
+        return tree.node_is_specimen_typed(nd)
+    except ValueError as x:
+        return str(x)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_rank_bounds_match_the_recursive_search(seed):
+    tree = _random_tree(seed)
+    ref = _recursive_copy(tree)
+    ref.add_best_guess_rank_sort_number()
+    tree.add_best_guess_rank_sort_number()
+    assert len(tree.best_rank_sort_number) == len(tree.id_to_taxon)
+    assert tree.best_rank_sort_number == ref.best_rank_sort_number
+    for nd in tree.preorder():
+        assert _specimen_typed(tree, nd) == _specimen_typed(ref, nd)
+
+
+def test_no_ranked_ancestor_is_a_value_error():
+    tree = _random_tree(5, num_taxa=20, root_rank="")
+    nd = next(c for c in tree.root.children_refs if c.rank_sorting_number() is None)
+    with pytest.raises(ValueError, match="no rank or anc rank"):
+        tree.node_rank_sorting_number_range(nd)
+    # the recursive search subtracted 1 from None
+    with pytest.raises(TypeError):
+        _recursive_copy(tree).node_rank_sorting_number_range(nd)
@@ -0,0 +1,52 @@
+import os
+import threading
+
+import pytest
+
+from taxalotl.util import (
+    COMPRESSION_SUFFIXES,
+    AtomicOutFile,
+    OutFile,
+    find_input_file,
+    open_input,
+)
+
+
+def test_threads_writing_one_atomic_file_do_not_share_a_temporary_file(tmp_path):
+    fp = str(tmp_path / "out.tsv")
+    inside = threading.Barrier(2)
+    errors = []
+
+    def write(text):
+        try:
+            with AtomicOutFile(fp) as out:
+                out.write(text * 1000)
+                inside.wait()  # both temporary files are open here
+                out.write("\n")
+        except Exception as x:
+            errors.append(x)
+
+    threads = [threading.Thread(target=write, args=(c,)) for c in "ab"]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    with open(fp) as inp:
+        assert inp.read() in ("a" * 1000 + "\n", "b" * 1000 + "\n")
+    assert os.listdir(str(tmp_path)) == ["out.tsv"]
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSION_SUFFIXES))
+def test_compressed_output_is_read_back(tmp_path, compression):
+    fp = str(tmp_path / "taxonomy.tsv")
+    compressed_fp = fp + COMPRESSION_SUFFIXES[compression]
+    text = "".join("{}\t|\tTaxon {} Lé.\n".format(i, i) for i in range(20000))
+    with OutFile(compressed_fp, compression=compression) as out:
+        for line in text.splitlines(True):
+            out.write(line)
+    assert find_input_file(fp) == compressed_fp
+    with open_input(find_input_file(fp), decompress=True) as inp:
+        assert inp.read() == text
+    with open_input(find_input_file(fp), "rb") as inp:
+        assert inp.read() != text.encode("utf-8")